@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Citation Graph Similarity
+=========================
+Model-free second distance signal for paper_similarity.py, built from the
+reference lists parse_acm_html.py stores in papers_json/<id>.json.
+
+Every reference gets a stable global id (normalized DOI, or a hash of the
+normalized citation text when there is no DOI) in an append-only table, so a
+sparse binary paper x reference matrix P can be extended as papers arrive.
+
+    bibliographic coupling:  cosine(P P^T)        shared references
+    co-citation:             cosine(Q^T Q)        cited together, Q = P[:, corpus DOIs]
+
+Both are sparse matrix products (blocked for coupling, see sparse_similarity),
+so the signal scales with the number of references rather than n².
+
+Usage:
+    python citation_graph.py extract [html ...]   (fill references/doi in papers_json from saved ACM pages)
+    python citation_graph.py build                (reference table + citation_distance.csv)
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+PAPERS_JSON_DIR = "./papers_json"
+PAPERS_HTML_DIR = "./papers_html"
+OUTPUT_DIR = "./output"
+REFERENCE_TABLE_PATH = "./output/reference_ids.json"
+
+# Weight of bibliographic coupling vs co-citation when both are defined for a pair
+COUPLING_WEIGHT = 0.5
+
+# Default weight of the citation distance when blended into semantic distances
+BLEND_WEIGHT = 0.3
+
+DOI_ID_PATTERN = re.compile(r'^\d{7}\.\d{7}$')
+
+
+def reference_key(reference: Dict) -> str:
+    """'doi:10.1145/...' or 'text:<sha1 of normalized citation text>'"""
+    if reference.get('doi'):
+        return f"doi:{reference['doi'].lower()}"
+    text = re.sub(r'[^a-z0-9]+', ' ', (reference.get('text') or '').lower()).strip()
+    return f"text:{hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]}"
+
+
+def paper_doi(paper_id: str, metadata: Optional[Dict] = None) -> Optional[str]:
+    """DOI of a corpus paper: the papers_json 'doi' field, or the DOI encoded in ./pdfs file names"""
+    if metadata and metadata.get('doi'):
+        return metadata['doi'].lower()
+    if DOI_ID_PATTERN.match(paper_id):
+        return f"10.1145/{paper_id}"
+    return None
+
+
+class ReferenceTable:
+    """Append-only {reference key: global id} table; ids never change once assigned"""
+
+    def __init__(self, keys: Optional[List[str]] = None):
+        self.keys: List[str] = list(keys or [])
+        self.ids: Dict[str, int] = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def id_for(self, key: str) -> int:
+        if key not in self.ids:
+            self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return self.ids[key]
+
+    def doi_columns(self) -> Dict[str, int]:
+        """{doi: column} for references identified by DOI"""
+        return {key[4:]: i for i, key in enumerate(self.keys) if key.startswith('doi:')}
+
+    @classmethod
+    def load(cls, path: str = REFERENCE_TABLE_PATH) -> 'ReferenceTable':
+        if not Path(path).exists():
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)['keys'])
+
+    def save(self, path: str = REFERENCE_TABLE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'keys': self.keys}, f, indent=0)
+
+
+def load_reference_lists(json_dir: str = PAPERS_JSON_DIR) -> Dict[str, Dict]:
+    """
+    Reference lists of every paper in papers_json that has them.
+
+    Returns:
+        {paper_id: {'doi': paper DOI or None, 'references': [reference, ...]}}
+    """
+    papers = {}
+    for json_file in sorted(Path(json_dir).glob("*.json")):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        if metadata.get('references'):
+            paper_id = metadata.get('paper_id', json_file.stem)
+            papers[paper_id] = {'doi': paper_doi(paper_id, metadata), 'references': metadata['references']}
+    return papers
+
+
+def build_citation_matrix(reference_lists: Dict[str, List[Dict]],
+                          table: ReferenceTable) -> Tuple[sparse.csr_matrix, List[str]]:
+    """
+    Binary paper x reference matrix, registering unseen references in the table.
+
+    Args:
+        reference_lists: {paper_id: [reference, ...]}
+        table: Global reference id table (extended in place)
+
+    Returns:
+        Tuple of (csr_matrix of shape (n_papers, len(table)), paper ids in row order)
+    """
+    paper_ids = list(reference_lists)
+    rows, cols = [], []
+    for row, paper_id in enumerate(paper_ids):
+        columns = {table.id_for(reference_key(reference)) for reference in reference_lists[paper_id]}
+        rows.extend([row] * len(columns))
+        cols.extend(sorted(columns))
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                               shape=(len(paper_ids), len(table)))
+    return matrix, paper_ids
+
+
+def _cosine_normalize(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return (sparse.diags(1 / np.maximum(norms, 1e-12)).astype(np.float32) @ matrix).tocsr()
+
+
+def coupling_similarity(matrix: sparse.csr_matrix) -> np.ndarray:
+    """Bibliographic coupling: cosine over shared references (blocked sparse products)"""
+    from sparse_similarity import iter_similarity_blocks
+
+    normalized = _cosine_normalize(matrix)
+    similarity = np.zeros((matrix.shape[0], matrix.shape[0]), dtype=np.float32)
+    for start, block in iter_similarity_blocks(normalized):
+        similarity[start:start + len(block)] = block
+    return similarity
+
+
+def cocitation_similarity(matrix: sparse.csr_matrix, dois: List[Optional[str]],
+                          table: ReferenceTable) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Co-citation between corpus papers: cosine over the citing papers that reference both.
+
+    Args:
+        matrix: Paper x reference matrix of the citing papers
+        dois: DOI of each paper the similarity is wanted for (None if unknown)
+        table: Reference id table the matrix columns refer to
+
+    Returns:
+        Tuple of (similarity matrix over dois, bool mask of papers cited at least once)
+    """
+    columns = table.doi_columns()
+    present = [i for i, doi in enumerate(dois) if doi and columns.get(doi, len(table)) < matrix.shape[1]]
+    similarity = np.zeros((len(dois), len(dois)), dtype=np.float32)
+    cited = np.zeros(len(dois), dtype=bool)
+    if not present:
+        return similarity, cited
+
+    cited_by = matrix[:, [columns[dois[i]] for i in present]].T.tocsr()
+    counts = np.asarray(cited_by.sum(axis=1)).ravel()
+    block = (_cosine_normalize(cited_by) @ _cosine_normalize(cited_by).T).toarray()
+    similarity[np.ix_(present, present)] = block
+    cited[present] = counts > 0
+    return similarity, cited
+
+
+def citation_distances(paper_ids: List[str], dois: Optional[Dict[str, str]] = None,
+                       json_dir: str = PAPERS_JSON_DIR,
+                       table_path: Optional[str] = REFERENCE_TABLE_PATH) -> np.ndarray:
+    """
+    Citation distance (1 - blended coupling / co-citation similarity) between papers.
+
+    Args:
+        paper_ids: Papers to compare (papers_json ids or DOI-named ./pdfs ids)
+        dois: Optional {paper_id: DOI} overrides for matching ids to reference lists
+        json_dir: Directory with papers_json reference lists
+        table_path: Reference id table to extend and persist (None: in-memory only)
+
+    Returns:
+        (n, n) distance matrix, NaN where neither signal is defined for a pair
+    """
+    corpus = load_reference_lists(json_dir)
+    table = ReferenceTable.load(table_path) if table_path else ReferenceTable()
+    matrix, citing_ids = build_citation_matrix({pid: info['references'] for pid, info in corpus.items()}, table)
+    if table_path:
+        table.save(table_path)
+
+    # Match requested ids to citing papers by id, then by DOI
+    dois = dict(dois or {})
+    by_doi = {info['doi']: pid for pid, info in corpus.items() if info['doi']}
+    paper_dois = [dois.get(pid) or (corpus[pid]['doi'] if pid in corpus else paper_doi(pid)) for pid in paper_ids]
+    rows = [citing_ids.index(pid) if pid in corpus else citing_ids.index(by_doi[doi]) if doi in by_doi else -1
+            for pid, doi in zip(paper_ids, paper_dois)]
+
+    n = len(paper_ids)
+    has_refs = np.array([row >= 0 for row in rows])
+    coupling = np.zeros((n, n), dtype=np.float32)
+    if has_refs.any():
+        present = np.flatnonzero(has_refs)
+        coupling[np.ix_(present, present)] = coupling_similarity(matrix[[rows[i] for i in present]])
+
+    cocitation, cited = cocitation_similarity(matrix, paper_dois, table)
+
+    coupled = has_refs[:, None] & has_refs[None, :]
+    cocited = cited[:, None] & cited[None, :]
+    similarity = np.where(coupled & cocited, COUPLING_WEIGHT * coupling + (1 - COUPLING_WEIGHT) * cocitation,
+                          np.where(coupled, coupling, cocitation))
+    distances = np.where(coupled | cocited, 1 - similarity, np.nan).astype(np.float64)
+    np.fill_diagonal(distances, 0)
+    return np.clip(distances, 0, 1)
+
+
+def blend_distances(semantic: np.ndarray, citation: np.ndarray, weight: float = BLEND_WEIGHT) -> np.ndarray:
+    """(1 - weight) * semantic + weight * citation where the citation distance is defined"""
+    return np.where(np.isfinite(citation), (1 - weight) * semantic + weight * np.nan_to_num(citation), semantic)
+
+
+def extract_references_into_json(html_paths: List[Path], json_dir: str = PAPERS_JSON_DIR) -> Dict[str, int]:
+    """
+    Fill 'doi' and 'references' of existing papers_json entries from saved ACM pages.
+
+    Pages are matched to papers_json by title, so the reading HTML and sections
+    written by parse_acm_html are left untouched.
+
+    Returns:
+        {paper_id: number of references}
+    """
+    sys.path.insert(0, str(Path(__file__).parent / 'tools'))
+    from parse_acm_html import parse_acm_html
+
+    by_title = {}
+    for json_file in sorted(Path(json_dir).glob("*.json")):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            by_title[json.load(f).get('title', '').strip().lower()] = json_file
+
+    updated = {}
+    for html_path in html_paths:
+        with contextlib.redirect_stdout(io.StringIO()):
+            parsed = parse_acm_html(html_path, html_path.stem)['metadata']
+        json_file = by_title.get(parsed['title'].strip().lower())
+        if not json_file:
+            print(f"  No papers_json entry for {html_path.name} ({parsed['title'][:50]})")
+            continue
+        with open(json_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        metadata['doi'] = parsed['doi']
+        metadata['references'] = parsed['references']
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        updated[metadata.get('paper_id', json_file.stem)] = len(parsed['references'])
+    return updated
+
+
+def saved_acm_pages(html_dir: str = PAPERS_HTML_DIR) -> List[Path]:
+    """Saved ACM DL pages (as opposed to the generated reading HTML) in html_dir"""
+    return [path for path in sorted(Path(html_dir).glob("*.html"))
+            if 'data-core-wrapper' in path.read_text(encoding='utf-8', errors='ignore')]
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+
+    if command == 'extract':
+        html_paths = [Path(arg) for arg in sys.argv[2:]] or saved_acm_pages()
+        print(f"Extracting references from {len(html_paths)} saved ACM page(s)")
+        for paper_id, count in extract_references_into_json(html_paths).items():
+            print(f"  {paper_id}: {count} references")
+        return
+
+    if command != 'build':
+        print(__doc__)
+        return
+
+    corpus = load_reference_lists()
+    if len(corpus) < 2:
+        print("Need at least 2 papers with references (run: python citation_graph.py extract)")
+        return
+
+    paper_ids = list(corpus)
+    distances = citation_distances(paper_ids)
+    table = ReferenceTable.load()
+    print(f"{len(paper_ids)} papers, {len(table)} distinct references")
+
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(distances, index=paper_ids, columns=paper_ids).to_csv(Path(OUTPUT_DIR) / 'citation_distance.csv')
+    print(f"Saved: {Path(OUTPUT_DIR) / 'citation_distance.csv'}")
+
+    upper = np.triu_indices(len(paper_ids), 1)
+    order = np.argsort(distances[upper])
+    print("\nMost strongly coupled pairs:")
+    for k in order[:5]:
+        i, j = upper[0][k], upper[1][k]
+        print(f"  {distances[i, j]:.4f}  {paper_ids[i]} / {paper_ids[j]}")
+
+
+if __name__ == "__main__":
+    main()
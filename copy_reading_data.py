@@ -1,81 +1,244 @@
 #!/usr/bin/env python3
 """
-Firebase에서 reading 데이터 복사
-소스: users/P004/experiments/session_1764994184869
-타겟: users/P004/experiments/session_1764995452822
+Firebase에서 세션 데이터 복사 (reading 등 선택한 필드)
+매핑 파일(CSV)의 여러 user/session 쌍을 한 번에 복사합니다.
+
+매핑 파일 형식 (헤더 필수):
+    source_user,source_session,target_user,target_session
+    P004,session_1764994184869,P004,session_1764995452822
+
+사용법:
+    python copy_reading_data.py <mapping.csv> [--fields=reading,quiz] [--dry-run]
+    python copy_reading_data.py <source_path> <target_path> [--fields=reading] [--dry-run]
+
+- 읽기: 문서를 get_all로 묶어서 병렬로 가져옴 (쌍마다 왕복하지 않음)
+- 쓰기: WriteBatch로 최대 BATCH_SIZE개씩 커밋
+- 체크포인트: 커밋된 (소스, 타겟) 쌍을 <mapping>.checkpoint에 기록, 재실행 시 건너뜀
+- 같은 타겟이 매핑에 두 번 나오면 (소스가 달라도) 실행 전에 오류로 중단
+- 에뮬레이터: FIRESTORE_EMULATOR_HOST=localhost:8080 설정 시 로컬 에뮬레이터 사용
 """
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-# Firebase 초기화
-if not firebase_admin._apps:
-    # 프로젝트 ID만으로 초기화 (Application Default Credentials 사용)
-    firebase_admin.initialize_app(options={
-        'projectId': 'paper-understanding',
-    })
+import firebase_admin
+from firebase_admin import firestore
 
-db = firestore.client()
+# Firestore WriteBatch 최대 작업 수는 500
+BATCH_SIZE = 400
+# get_all 한 번에 요청할 문서 수
+READ_CHUNK_SIZE = 100
+READ_WORKERS = 8
 
-def copy_reading_data():
-    source_path = 'users/P004/experiments/session_1764994184869'
-    target_path = 'users/P004/experiments/session_1764995452822'
+DEFAULT_FIELDS = ['reading']
 
-    print('📖 Reading 데이터 복사 시작...')
-    print(f'소스: {source_path}')
-    print(f'타겟: {target_path}')
-    print()
-
-    try:
-        # 1. 소스 문서에서 reading 필드 읽기
-        source_ref = db.document(source_path)
-        source_doc = source_ref.get()
 
-        if not source_doc.exists:
-            raise Exception('소스 문서를 찾을 수 없습니다.')
+def get_db():
+    # Firebase 초기화
+    if not firebase_admin._apps:
+        # 프로젝트 ID만으로 초기화 (Application Default Credentials 사용)
+        firebase_admin.initialize_app(options={
+            'projectId': 'paper-understanding',
+        })
+    return firestore.client()
+
+
+def session_path(user, session):
+    return f'users/{user}/experiments/{session}'
+
+
+def load_mapping(mapping_path):
+    """매핑 CSV를 (source_path, target_path) 리스트로 읽기 (타겟 중복 시 ValueError)"""
+    pairs = []
+    with open(mapping_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            pairs.append((
+                session_path(row['source_user'].strip(), row['source_session'].strip()),
+                session_path(row['target_user'].strip(), row['target_session'].strip()),
+            ))
+    check_unique_targets(pairs)
+    return pairs
+
+
+def check_unique_targets(pairs):
+    """한 타겟에 여러 소스가 매핑되면 어느 쪽이 남을지 배치 순서에 달려 있으므로 거부"""
+    sources = {}
+    conflicts = []
+    for source, target in pairs:
+        if target in sources and sources[target] != source:
+            conflicts.append(f'{target} ← {sources[target]}, {source}')
+        sources.setdefault(target, source)
+    if conflicts:
+        raise ValueError('같은 타겟에 서로 다른 소스가 매핑되어 있습니다:\n  ' + '\n  '.join(conflicts))
+
+
+def load_checkpoint(checkpoint_path):
+    """커밋된 (source_path, target_path) 집합 (탭 없는 예전 형식 줄은 (None, target_path))"""
+    if not checkpoint_path or not checkpoint_path.exists():
+        return set()
+    done = set()
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                source, _, target = line.rpartition('\t')
+                done.add((source or None, target))
+    return done
+
+
+def is_done(done, source, target):
+    return (source, target) in done or (None, target) in done
+
+
+def append_checkpoint(checkpoint_path, pairs):
+    if not checkpoint_path:
+        return
+    with open(checkpoint_path, 'a', encoding='utf-8') as f:
+        for source, target in pairs:
+            f.write(f'{source}\t{target}\n')
+
+
+def fetch_documents(db, paths):
+    """여러 문서를 병렬로 읽어 {path: snapshot} 반환"""
+    unique_paths = sorted(set(paths))
+    chunks = [unique_paths[i:i + READ_CHUNK_SIZE] for i in range(0, len(unique_paths), READ_CHUNK_SIZE)]
+
+    def fetch_chunk(chunk):
+        refs = [db.document(path) for path in chunk]
+        return [(snap.reference.path, snap) for snap in db.get_all(refs)]
+
+    snapshots = {}
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        for result in pool.map(fetch_chunk, chunks):
+            snapshots.update(result)
+    return snapshots
+
+
+def plan_updates(pairs, snapshots, fields):
+    """쓰기 계획 생성: [(source_path, target_path, update_dict)], 오류 목록"""
+    updates = []
+    errors = []
+
+    for source_path, target_path in pairs:
+        source_doc = snapshots.get(source_path)
+        target_doc = snapshots.get(target_path)
+
+        if source_doc is None or not source_doc.exists:
+            errors.append(f'{source_path}: 소스 문서를 찾을 수 없습니다.')
+            continue
+        if target_doc is None or not target_doc.exists:
+            errors.append(f'{target_path}: 타겟 문서를 찾을 수 없습니다.')
+            continue
 
         source_data = source_doc.to_dict()
-        reading_data = source_data.get('reading')
-
-        if reading_data is None:
-            raise Exception('소스 문서에 reading 필드가 없습니다.')
-
-        print('✓ 소스 데이터 읽기 완료')
-        print('Reading 데이터:')
-        print(json.dumps(reading_data, indent=2, ensure_ascii=False))
-        print()
-
-        # 2. 타겟 문서의 reading 필드 덮어쓰기
-        target_ref = db.document(target_path)
+        update = {field: source_data[field] for field in fields if field in source_data}
+        missing = [field for field in fields if field not in source_data]
+
+        if missing:
+            errors.append(f'{source_path}: 소스 문서에 {", ".join(missing)} 필드가 없습니다.')
+        if update:
+            updates.append((source_path, target_path, update))
+
+    return updates, errors
+
+
+def commit_updates(db, updates, checkpoint_path):
+    """WriteBatch로 묶어서 커밋하고 배치마다 체크포인트 기록"""
+    committed = 0
+    for i in range(0, len(updates), BATCH_SIZE):
+        chunk = updates[i:i + BATCH_SIZE]
+        batch = db.batch()
+        for _, target_path, update in chunk:
+            batch.update(db.document(target_path), update)
+        batch.commit()
+
+        append_checkpoint(checkpoint_path, [(source_path, target_path) for source_path, target_path, _ in chunk])
+        committed += len(chunk)
+        print(f'✓ 배치 커밋 완료: {committed}/{len(updates)}')
+    return committed
+
+
+def copy_reading_data(pairs, fields=None, dry_run=False, checkpoint_path=None, db=None):
+    fields = fields or DEFAULT_FIELDS
+    db = db or get_db()
+
+    check_unique_targets(pairs)
+    done = load_checkpoint(checkpoint_path)
+    pending = [(source, target) for source, target in pairs if not is_done(done, source, target)]
+
+    print('📖 세션 데이터 복사 시작...')
+    print(f'필드: {", ".join(fields)}')
+    print(f'대상: {len(pending)}쌍 (체크포인트로 건너뜀: {len(pairs) - len(pending)}쌍)')
+    if dry_run:
+        print('🔎 Dry-run: 실제로 쓰지 않습니다.')
+    print()
 
-        # 타겟 문서 존재 확인
-        target_doc = target_ref.get()
-        if not target_doc.exists:
-            raise Exception('타겟 문서를 찾을 수 없습니다.')
+    if not pending:
+        print('🎉 복사할 항목이 없습니다.')
+        return 0
 
-        # reading 필드만 업데이트
-        target_ref.update({
-            'reading': reading_data
-        })
-
-        print('✓ 타겟 문서 업데이트 완료')
-        print()
+    # 1. 소스/타겟 문서를 한꺼번에 읽기 (타겟 존재 확인 포함)
+    snapshots = fetch_documents(db, [path for pair in pending for path in pair])
+    print(f'✓ 문서 읽기 완료: {len(snapshots)}개')
 
-        # 3. 확인
-        updated_doc = target_ref.get()
-        updated_data = updated_doc.to_dict()
-        updated_reading = updated_data.get('reading')
+    # 2. 쓰기 계획
+    updates, errors = plan_updates(pending, snapshots, fields)
+    for error in errors:
+        print(f'⚠️  {error}')
 
-        print('✓ 복사 완료!')
-        print('업데이트된 reading 데이터:')
-        print(json.dumps(updated_reading, indent=2, ensure_ascii=False))
+    if dry_run:
+        for _, target_path, update in updates:
+            print(f'  → {target_path}: {", ".join(update)}')
         print()
-        print('🎉 모든 작업이 완료되었습니다.')
+        print(f'🔎 Dry-run 완료: {len(updates)}개 문서가 업데이트될 예정입니다.')
+        return 0
 
+    # 3. 배치 쓰기
+    try:
+        committed = commit_updates(db, updates, checkpoint_path)
     except Exception as e:
         print(f'❌ 오류 발생: {str(e)}')
+        print('체크포인트가 저장되어 있으므로 다시 실행하면 이어서 복사합니다.')
         raise
 
+    print()
+    print(f'🎉 {committed}개 문서 복사 완료 (오류 {len(errors)}건)')
+    return committed
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    dry_run = '--dry-run' in options
+    fields = DEFAULT_FIELDS
+    for option in options:
+        if option.startswith('--fields='):
+            fields = [field.strip() for field in option.split('=', 1)[1].split(',') if field.strip()]
+
+    if len(args) == 2:
+        pairs = [(args[0], args[1])]
+        checkpoint_path = None
+    else:
+        mapping_path = Path(args[0])
+        if not mapping_path.exists():
+            print(f'❌ 매핑 파일을 찾을 수 없습니다: {mapping_path}')
+            sys.exit(1)
+        try:
+            pairs = load_mapping(mapping_path)
+        except ValueError as e:
+            print(f'❌ {e}')
+            sys.exit(1)
+        checkpoint_path = mapping_path.with_name(mapping_path.name + '.checkpoint')
+
+    copy_reading_data(pairs, fields=fields, dry_run=dry_run, checkpoint_path=checkpoint_path)
+
+
 if __name__ == '__main__':
-    copy_reading_data()
+    main()
@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the ingested corpus
+Positional inverted index over titles, abstracts and section text of every
+paper parse_acm_html ingests, with BM25 ranking, "quoted phrase" queries and
+section / paper scoped filters.
+
+The index is a list of immutable segments (one per ingestion batch) of
+memory-mapped numpy arrays, so adding papers never rewrites existing postings
+and a query only touches the postings of its own terms. Re-ingesting a paper
+tombstones its old documents; segments are merged once there are more than
+MAX_SEGMENTS of them.
+
+Usage:
+    python corpus_search.py build [paper_id ...]          (index papers_json + papers_html)
+    python corpus_search.py search "<query>" [k] [--papers]
+    python corpus_search.py remove <paper_id ...>
+    python corpus_search.py merge
+    python corpus_search.py stats
+
+Query syntax:
+    sensor farmers "mood board" section:method paper:chi2025-lbw-01
+"""
+
+import hashlib
+import json
+import re
+import shutil
+import sys
+import time
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from paper_content import PROJECT_DIR, iter_paragraphs, list_paper_ids, load_paper_content, normalize_text
+from sparse_similarity import BM25_B, BM25_K1, STOPWORDS
+
+INDEX_DIR = PROJECT_DIR / 'search_index'
+
+INDEX_VERSION = 1
+
+# Merge all segments into one when an ingestion leaves more than this many
+MAX_SEGMENTS = 8
+
+# Longer tokens are truncated so the term dictionary stays a fixed-width array
+MAX_TERM_LENGTH = 32
+
+SNIPPET_CHARS = 160
+
+QUERY_PATTERN = re.compile(r'"([^"]+)"|(section|paper):(\S+)|(\S+)')
+
+
+def index_tokens(text):
+    """All word tokens (stopwords kept so phrase positions stay exact)"""
+    return [t[:MAX_TERM_LENGTH] for t in re.findall(r'[a-z0-9]+', normalize_text(text or ''))]
+
+
+def strip_numbering(title):
+    """'4.1 Phase 1 - Lab Study' → 'phase 1 - lab study'"""
+    return re.sub(r'^([A-Z]|\d+)(\.\d+)*\.?\s+', '', (title or '').strip()).lower()
+
+
+def paper_units(metadata, content):
+    """
+    Split a parsed paper into searchable units.
+
+    Returns:
+        List of (section, top_section, text): the title, the abstract, then one
+        unit per section / subsection with its paragraphs and tables
+    """
+    units = [('Title', 'Title', metadata.get('title', ''))]
+    if metadata.get('abstract'):
+        units.append(('Abstract', 'Abstract', metadata['abstract']))
+
+    for _, section, top_section, text in iter_paragraphs(content):
+        if units[-1][0] == section and units[-1][1] == top_section:
+            units[-1] = (section, top_section, f"{units[-1][2]}\n{text}")
+        else:
+            units.append((section, top_section, text))
+    return [unit for unit in units if unit[2].strip()]
+
+
+def content_hash(units):
+    return hashlib.sha1(json.dumps(units, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def parse_query(query):
+    """'a "b c" section:x paper:y' → (['a'], [['b', 'c']], 'x', 'y')"""
+    terms, phrases, section, paper = [], [], None, None
+    for phrase, field, value, word in QUERY_PATTERN.findall(query):
+        if phrase:
+            tokens = index_tokens(phrase)
+            if len(tokens) > 1:
+                phrases.append(tokens)
+            else:
+                terms.extend(tokens)
+        elif field == 'section':
+            section = normalize_text(value.replace('_', ' '))
+        elif field == 'paper':
+            paper = value
+        else:
+            terms.extend(index_tokens(word))
+    return terms, phrases, section, paper
+
+
+def _write_strings(path, strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(f'{path}.bin', 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(f'{path}.idx.npy', offsets)
+
+
+class StringColumn:
+    """Variable-length strings in one memory-mapped blob, decoded on access"""
+
+    def __init__(self, path):
+        self.offsets = np.load(f'{path}.idx.npy', mmap_mode='r')
+        self.blob = np.memmap(f'{path}.bin', dtype=np.uint8, mode='r') if self.offsets[-1] else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+
+class SegmentBuilder:
+    """Accumulates documents and writes them as one immutable segment"""
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.term_ids = array('i')
+        self.doc_ids = array('i')
+        self.positions = array('i')
+        # Paper ids and section names are stored once per segment, docs refer to them by index
+        self.papers, self.section_names = {}, {}
+        self.doc_paper, self.doc_section, self.doc_top = array('i'), array('i'), array('i')
+        self.snippets = []
+        self.doc_lengths = array('i')
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add_tokens(self, paper_id, section, top_section, tokens, snippet):
+        doc = len(self.doc_lengths)
+        self.term_ids.extend(self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens)
+        self.doc_ids.extend([doc] * len(tokens))
+        self.positions.extend(range(len(tokens)))
+        self.doc_paper.append(self.papers.setdefault(paper_id, len(self.papers)))
+        self.doc_section.append(self.section_names.setdefault(section, len(self.section_names)))
+        self.doc_top.append(self.section_names.setdefault(top_section, len(self.section_names)))
+        self.snippets.append(snippet)
+        self.doc_lengths.append(len(tokens))
+        return doc
+
+    def add(self, paper_id, section, top_section, text):
+        snippet = re.sub(r'\s+', ' ', text).strip()[:SNIPPET_CHARS]
+        return self.add_tokens(paper_id, section, top_section, index_tokens(text), snippet)
+
+    def write(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        terms = np.array(list(self.vocabulary) or [''], dtype=f'<U{MAX_TERM_LENGTH}')[:len(self.vocabulary)]
+        order = np.argsort(terms, kind='stable')
+        rank = np.empty(len(terms), dtype=np.int32)
+        rank[order] = np.arange(len(terms), dtype=np.int32)
+
+        term = rank[np.frombuffer(self.term_ids, dtype=np.int32)] if len(self.term_ids) else np.zeros(0, np.int32)
+        doc = np.frombuffer(self.doc_ids, dtype=np.int32) if len(self.doc_ids) else np.zeros(0, np.int32)
+        position = np.frombuffer(self.positions, dtype=np.int32) if len(self.positions) else np.zeros(0, np.int32)
+        sort = np.lexsort((position, doc, term))
+        term, doc, position = term[sort], doc[sort], position[sort]
+
+        # One posting per (term, doc); its positions are a contiguous run
+        starts = np.flatnonzero(np.r_[True, (term[1:] != term[:-1]) | (doc[1:] != doc[:-1])]) if len(term) else \
+            np.zeros(0, np.int64)
+        pos_ptr = np.r_[starts, len(position)].astype(np.int64)
+        np.save(path / 'terms.npy', terms[order])
+        np.save(path / 'term_ptr.npy', np.searchsorted(term[starts], np.arange(len(terms) + 1)).astype(np.int64))
+        np.save(path / 'post_docs.npy', doc[starts])
+        np.save(path / 'pos_ptr.npy', pos_ptr)
+        np.save(path / 'positions.npy', position)
+        for name in ('doc_lengths', 'doc_paper', 'doc_section', 'doc_top'):
+            values = getattr(self, name)
+            np.save(path / f'{name}.npy', np.frombuffer(values, dtype=np.int32) if len(values) else np.zeros(0, np.int32))
+        _write_strings(path / 'papers', list(self.papers))
+        _write_strings(path / 'section_names', list(self.section_names))
+        _write_strings(path / 'snippets', self.snippets)
+
+
+class Segment:
+    """Read-only, memory-mapped view of a written segment"""
+
+    def __init__(self, path):
+        path = Path(path)
+        self.name = path.name
+        load = lambda name: np.load(path / f'{name}.npy', mmap_mode='r')
+        self.terms = load('terms')
+        self.term_ptr = load('term_ptr')
+        self.post_docs = load('post_docs')
+        self.pos_ptr = load('pos_ptr')
+        self.positions = load('positions')
+        self.doc_lengths = load('doc_lengths')
+        self.doc_paper = load('doc_paper')
+        self.doc_section = load('doc_section')
+        self.doc_top = load('doc_top')
+        self.papers = StringColumn(path / 'papers')
+        self.section_names = StringColumn(path / 'section_names')
+        self.snippets = StringColumn(path / 'snippets')
+        self.live = np.ones(len(self.doc_lengths), dtype=bool)
+        self._section_masks = {}
+
+    def paper_of(self, doc):
+        return self.papers[int(self.doc_paper[doc])]
+
+    def section_of(self, doc):
+        return self.section_names[int(self.doc_section[doc])]
+
+    def top_section_of(self, doc):
+        return self.section_names[int(self.doc_top[doc])]
+
+    def section_filter(self, docs, scope):
+        """Docs whose section or top-level section name contains scope (numbering ignored)"""
+        if scope not in self._section_masks:
+            self._section_masks[scope] = np.array(
+                [scope in strip_numbering(self.section_names[i]) for i in range(len(self.section_names))], dtype=bool)
+        mask = self._section_masks[scope]
+        if not mask.any():
+            return docs[:0]
+        return docs[mask[np.asarray(self.doc_section)[docs]] | mask[np.asarray(self.doc_top)[docs]]]
+
+    def postings(self, term, doc_range=None):
+        """
+        Postings of a term, optionally restricted to docs in [start, end).
+
+        Returns:
+            Tuple of (posting indices, doc ids, term frequencies), empty when absent
+        """
+        i = int(np.searchsorted(self.terms, term))
+        if i >= len(self.terms) or self.terms[i] != term:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        start, end = int(self.term_ptr[i]), int(self.term_ptr[i + 1])
+        if doc_range is not None:
+            # Docs are sorted within a term, so a paper's docs are one contiguous slice
+            docs = self.post_docs[start:end]
+            start, end = start + int(np.searchsorted(docs, doc_range[0])), start + int(np.searchsorted(docs, doc_range[1]))
+        return (np.arange(start, end), np.asarray(self.post_docs[start:end]),
+                np.diff(np.asarray(self.pos_ptr[start:end + 1])))
+
+    def _positions(self, postings):
+        """(doc, position) of every occurrence in the given postings"""
+        starts = np.asarray(self.pos_ptr)[postings]
+        counts = np.asarray(self.pos_ptr)[postings + 1] - starts
+        offsets = np.repeat(starts - np.r_[0, np.cumsum(counts)[:-1]], counts) + np.arange(counts.sum())
+        return np.repeat(np.asarray(self.post_docs)[postings], counts), np.asarray(self.positions)[offsets]
+
+    def phrase_docs(self, tokens, docs):
+        """The subset of docs (sorted) containing the tokens at consecutive positions"""
+        keys = None
+        for offset, token in enumerate(tokens):
+            index, term_docs, _ = self.postings(token)
+            at = np.minimum(np.searchsorted(term_docs, docs), max(len(term_docs) - 1, 0))
+            present = (term_docs[at] == docs) if len(term_docs) else np.zeros(len(docs), dtype=bool)
+            docs = docs[present]
+            if len(docs) == 0:
+                return docs
+            doc, position = self._positions(index[at[present]])
+            # Phrase start implied by this occurrence, packed with its doc into one key;
+            # postings are doc-ordered with ascending positions, so keys come out sorted
+            keep = position >= offset
+            token_keys = doc[keep].astype(np.int64) << 32 | (position[keep] - offset).astype(np.int64)
+            if keys is not None and len(token_keys):
+                at = np.minimum(np.searchsorted(token_keys, keys), len(token_keys) - 1)
+                token_keys = keys[token_keys[at] == keys]
+            keys = token_keys
+            if len(keys) == 0:
+                return docs[:0]
+        found = keys >> 32
+        return found[np.r_[True, found[1:] != found[:-1]]].astype(docs.dtype)
+
+    def documents(self):
+        """Rebuild (paper, section, top_section, tokens, snippet) of live docs, for merging"""
+        n_terms = len(self.terms)
+        term_of_posting = np.repeat(np.arange(n_terms), np.diff(self.term_ptr))
+        counts = np.diff(np.asarray(self.pos_ptr))
+        term = np.repeat(term_of_posting, counts)
+        doc = np.repeat(np.asarray(self.post_docs), counts)
+        order = np.lexsort((np.asarray(self.positions), doc))
+        term, doc = term[order], doc[order]
+        bounds = np.searchsorted(doc, np.arange(len(self.doc_lengths) + 1))
+        terms = np.asarray(self.terms)
+        for i in np.flatnonzero(self.live):
+            tokens = terms[term[bounds[i]:bounds[i + 1]]].tolist()
+            yield self.paper_of(i), self.section_of(i), self.top_section_of(i), tokens, self.snippets[i]
+
+
+class SearchIndex:
+    """Segmented positional index with a JSON manifest of papers and tombstones"""
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        self.manifest_path = self.index_dir / 'manifest.json'
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'version': INDEX_VERSION, 'next_segment': 0, 'segments': [], 'papers': {}, 'deleted': {}}
+        self._segments = None
+
+    @property
+    def segments(self):
+        if self._segments is None:
+            self._segments = []
+            for name in self.manifest['segments']:
+                segment = Segment(self.index_dir / name)
+                segment.live[self.manifest['deleted'].get(name, [])] = False
+                self._segments.append(segment)
+        return self._segments
+
+    def _save_manifest(self):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        tmp_path.replace(self.manifest_path)
+        self._segments = None
+
+    def _tombstone(self, paper_id):
+        entry = self.manifest['papers'].pop(paper_id, None)
+        if entry:
+            deleted = self.manifest['deleted'].setdefault(entry['segment'], [])
+            deleted.extend(range(*entry['docs']))
+
+    def _new_segment_name(self):
+        name = f"seg_{self.manifest['next_segment']:06d}"
+        self.manifest['next_segment'] += 1
+        return name
+
+    def add_papers(self, papers):
+        """
+        Index papers as a new segment; unchanged papers are skipped, changed ones replaced.
+
+        Args:
+            papers: Iterable of (paper_id, metadata, content) as produced by parse_acm_html
+
+        Returns:
+            Number of papers (re)indexed
+        """
+        builder = SegmentBuilder()
+        entries = {}
+        for paper_id, metadata, content in papers:
+            units = paper_units(metadata, content)
+            digest = content_hash(units)
+            if self.manifest['papers'].get(paper_id, {}).get('hash') == digest:
+                continue
+            start = len(builder)
+            for section, top_section, text in units:
+                builder.add(paper_id, section, top_section, text)
+            entries[paper_id] = {'title': metadata.get('title', ''), 'hash': digest, 'docs': [start, len(builder)]}
+
+        if not entries:
+            return 0
+
+        name = self._new_segment_name()
+        builder.write(self.index_dir / name)
+        for paper_id, entry in entries.items():
+            self._tombstone(paper_id)
+            self.manifest['papers'][paper_id] = {**entry, 'segment': name}
+        self.manifest['segments'].append(name)
+        self._save_manifest()
+
+        if len(self.manifest['segments']) > MAX_SEGMENTS:
+            self.merge()
+        return len(entries)
+
+    def remove_papers(self, paper_ids):
+        removed = [paper_id for paper_id in paper_ids if paper_id in self.manifest['papers']]
+        for paper_id in removed:
+            self._tombstone(paper_id)
+        self._save_manifest()
+        return removed
+
+    def merge(self):
+        """Rewrite all live documents into a single segment and drop the old ones"""
+        old_names = list(self.manifest['segments'])
+        builder = SegmentBuilder()
+        papers = {}
+        for segment in self.segments:
+            for paper_id, section, top_section, tokens, snippet in segment.documents():
+                doc = builder.add_tokens(paper_id, section, top_section, tokens, snippet)
+                papers.setdefault(paper_id, [doc, doc + 1])[1] = doc + 1
+
+        name = self._new_segment_name()
+        builder.write(self.index_dir / name)
+        for paper_id, docs in papers.items():
+            self.manifest['papers'][paper_id].update(segment=name, docs=docs)
+        self.manifest['segments'] = [name]
+        self.manifest['deleted'] = {}
+        self._save_manifest()
+        for old_name in old_names:
+            shutil.rmtree(self.index_dir / old_name, ignore_errors=True)
+
+    def stats(self):
+        live = sum(int(segment.live.sum()) for segment in self.segments)
+        total = sum(len(segment.live) for segment in self.segments)
+        return {
+            'papers': len(self.manifest['papers']),
+            'segments': len(self.segments),
+            'documents': live,
+            'deleted_documents': total - live,
+            'terms': sum(len(segment.terms) for segment in self.segments),
+            'postings': sum(len(segment.post_docs) for segment in self.segments),
+        }
+
+    def search(self, query, k=10, group_papers=False):
+        """
+        BM25-rank section units for a query.
+
+        Args:
+            query: Free terms, "quoted phrases" (must match), section:<name> and paper:<id> filters
+            k: Number of results
+            group_papers: Keep only the best unit per paper
+
+        Returns:
+            List of dicts (paper, title, section, topSection, score, snippet), best first
+        """
+        terms, phrases, section, paper = parse_query(query)
+        scored_terms = sorted({t for t in terms + [t for p in phrases for t in p] if t not in STOPWORDS}
+                              or set(terms + [t for p in phrases for t in p]))
+        if not scored_terms:
+            return []
+
+        segments = self.segments
+        n_docs = sum(int(segment.live.sum()) for segment in segments)
+        if n_docs == 0:
+            return []
+        avg_length = sum(float(np.asarray(segment.doc_lengths)[segment.live].sum()) for segment in segments) / n_docs
+
+        # A paper: filter only reads that paper's slice of its own segment
+        doc_ranges = [None] * len(segments)
+        if paper is not None:
+            entry = self.manifest['papers'].get(paper)
+            if entry is None:
+                return []
+            doc_ranges = [entry['docs'] if segment.name == entry['segment'] else (0, 0) for segment in segments]
+
+        # Per-term postings in every segment, and live document frequencies for idf
+        postings = [[segment.postings(term, doc_range) for term in scored_terms]
+                    for segment, doc_range in zip(segments, doc_ranges)]
+        df = np.zeros(len(scored_terms))
+        for segment, lists, doc_range in zip(segments, postings, doc_ranges):
+            for t, term in enumerate(scored_terms):
+                docs = lists[t][1] if doc_range is None else segment.postings(term)[1]
+                df[t] += segment.live[docs].sum()
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+        candidates = []
+        for segment, lists in zip(segments, postings):
+            hit = np.zeros(len(segment.live), dtype=bool)
+            for _, docs, _ in lists:
+                hit[docs] = True
+            touched = np.flatnonzero(hit & segment.live)
+            if section is not None:
+                touched = segment.section_filter(touched, section)
+            for tokens in phrases:
+                if len(touched):
+                    touched = segment.phrase_docs(tokens, touched)
+            if len(touched) == 0:
+                continue
+
+            lengths = np.asarray(segment.doc_lengths)[touched].astype(np.float64)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(avg_length, 1e-9))
+            scores = np.zeros(len(touched))
+            for t, (_, docs, tfs) in enumerate(lists):
+                if len(docs) == 0:
+                    continue
+                at = np.minimum(np.searchsorted(docs, touched), len(docs) - 1)
+                tf = np.where(docs[at] == touched, tfs[at], 0).astype(np.float64)
+                scores += idf[t] * tf * (BM25_K1 + 1) / (tf + norm)
+
+            # Only the best k docs (or best doc of the best k papers) can make the final list
+            order = np.argsort(-scores, kind='stable')
+            if group_papers:
+                _, first = np.unique(np.asarray(segment.doc_paper)[touched[order]], return_index=True)
+                order = order[np.sort(first)]
+            candidates.extend((float(scores[i]), segment, int(touched[i])) for i in order[:k])
+
+        candidates.sort(key=lambda item: -item[0])
+        results, seen = [], set()
+        for score, segment, doc in candidates:
+            paper_id = segment.paper_of(doc)
+            if group_papers:
+                if paper_id in seen:
+                    continue
+                seen.add(paper_id)
+            results.append({
+                'paper': paper_id,
+                'title': self.manifest['papers'].get(paper_id, {}).get('title', ''),
+                'section': segment.section_of(doc),
+                'topSection': segment.top_section_of(doc),
+                'score': round(score, 4),
+                'snippet': segment.snippets[doc],
+            })
+            if len(results) >= k:
+                break
+        return results
+
+
+def index_paper(paper_id, metadata, content, index_dir=INDEX_DIR):
+    """Add or replace one freshly parsed paper (called from parse_acm_html at ingestion)"""
+    return SearchIndex(index_dir).add_papers([(paper_id, metadata, content)])
+
+
+def build_index(paper_ids=None, index_dir=INDEX_DIR, project_dir=PROJECT_DIR):
+    """Index papers that already have papers_json + papers_html (one segment per call)"""
+    paper_ids = paper_ids or list_paper_ids(project_dir)
+
+    def papers():
+        for paper_id in paper_ids:
+            data = load_paper_content(paper_id, project_dir)
+            yield paper_id, data['metadata'], data['content']
+
+    return SearchIndex(index_dir).add_papers(papers())
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'search', 'remove', 'merge', 'stats'):
+        print(__doc__)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    index = SearchIndex()
+
+    if command == 'build':
+        paper_ids = sys.argv[2:] or list_paper_ids()
+        print(f"\n{'='*60}")
+        print(f"Indexing {len(paper_ids)} paper(s)")
+        print(f"{'='*60}\n")
+        count = build_index(paper_ids)
+        print(f"✓ {count} paper(s) (re)indexed, {len(paper_ids) - count} unchanged")
+        print(f"\n✅ Index saved: {INDEX_DIR}")
+    elif command == 'remove':
+        removed = index.remove_papers(sys.argv[2:])
+        print(f"✓ Removed {len(removed)} paper(s)")
+    elif command == 'merge':
+        index.merge()
+        print(f"✓ Merged into {index.manifest['segments'][0]}")
+    elif command == 'stats':
+        for key, value in index.stats().items():
+            print(f"  {key}: {value}")
+    else:
+        args = [arg for arg in sys.argv[2:] if not arg.startswith('--')]
+        if not args:
+            print(__doc__)
+            sys.exit(1)
+        query = args[0]
+        k = int(args[1]) if len(args) > 1 else 10
+        group_papers = '--papers' in sys.argv[2:]
+
+        start = time.perf_counter()
+        hits = index.search(query, k, group_papers)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if not hits:
+            print("❌ No matches (is the corpus indexed?)")
+            sys.exit(1)
+        for hit in hits:
+            print(f"[{hit['score']:.3f}] {hit['paper']} · {hit['section']}")
+            print(f"        {hit['snippet']}...")
+        print(f"\n⏱️  {elapsed:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Incremental Distance State
+==========================
+Keeps what paper selection needs from the cosine distance matrix without
+recomputing it when ./pdfs changes:
+
+- each paper's k nearest and k farthest papers
+- a heap of candidate pairs for the global farthest pairs
+
+Adding m papers computes only the m x n block of new distances; removing a
+paper recomputes only the rows of papers whose lists drop below k entries.
+Distances come from a kernel whose result for a pair does not depend on which
+other papers are in the block, and ties are broken by paper id, so any
+sequence of updates leaves exactly the state that building from scratch over
+the final papers would give (`verify` checks this).
+
+Usage:
+    python distance_state.py update [--embeddings=output/embeddings.csv | --from-shards] [--k=10]
+    python distance_state.py show [paper_id]
+    python distance_state.py verify
+"""
+
+import heapq
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import count, span
+
+DISTANCE_STATE_PATH = "./output/distance_state.npz"
+
+DEFAULT_K = 10
+# Lists keep this many extra entries so most removals need no recomputation
+SLACK = 10
+# Rows per block when computing distances (bounds the block to BLOCK_ROWS x n)
+BLOCK_ROWS = 256
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length in float64 (zero rows stay zero)"""
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms > 0, norms, 1.0)
+
+
+def cosine_block(A: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    Cosine distances between unit rows of A and B.
+
+    einsum (not BLAS) sums each dot product in the same order whatever the
+    block shape, so a pair's distance is bit-identical however it is computed.
+    """
+    return np.clip(1.0 - np.einsum('id,jd->ij', A, B), 0.0, 2.0)
+
+
+class DistanceState:
+    """Per-paper nearest/farthest lists and a global farthest-pair heap over unit embeddings"""
+
+    def __init__(self, k: int = DEFAULT_K, dim: Optional[int] = None, identity: Optional[dict] = None):
+        self.k = k
+        self.depth = k + SLACK
+        self.identity = identity
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.vectors = np.zeros((0, dim or 0), dtype=np.float64)
+        # id -> [(distance, other id)] best first (farthest keeps negated distances)
+        self.nearest: Dict[str, List[Tuple[float, str]]] = {}
+        self.farthest: Dict[str, List[Tuple[float, str]]] = {}
+        # (-distance, id_a, id_b, serial_a, serial_b) with id_a < id_b. Entries whose
+        # papers were removed (or re-added with another embedding) are skipped lazily
+        self.pair_heap: List[Tuple[float, str, str, int, int]] = []
+        self.serials: Dict[str, int] = {}
+        self.next_serial = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _push_pair(self, distance: float, a: str, b: str):
+        a, b = sorted((a, b))
+        heapq.heappush(self.pair_heap, (-distance, a, b, self.serials[a], self.serials[b]))
+
+    def _live(self, entry: Tuple[float, str, str, int, int]) -> bool:
+        _, a, b, serial_a, serial_b = entry
+        return self.serials.get(a) == serial_a and self.serials.get(b) == serial_b
+
+    def _assign_serials(self, ids: List[str]):
+        for pid in ids:
+            self.serials[pid] = self.next_serial
+            self.next_serial += 1
+
+    def _row_lists(self, pid: str, distances: np.ndarray, others: List[str]):
+        """Exact top-depth nearest and farthest of one paper from its full distance row"""
+        others = np.asarray(others)
+        keep = others != pid
+        distances, others = distances[keep], others[keep]
+        take = min(self.depth, len(others))
+        nearest = np.lexsort((others, distances))[:take]
+        farthest = np.lexsort((others, -distances))[:take]
+        self.nearest[pid] = [(float(distances[i]), str(others[i])) for i in nearest]
+        self.farthest[pid] = [(-float(distances[i]), str(others[i])) for i in farthest]
+        for negated, other in self.farthest[pid]:
+            self._push_pair(-negated, pid, other)
+
+    @span('distance_add')
+    def add(self, ids: List[str], embeddings: np.ndarray, normalized: bool = False):
+        """
+        Add papers (ids must be new). Computes the m x n block of new distances.
+
+        Args:
+            ids: New paper ids
+            embeddings: Their embeddings (m, dim)
+            normalized: The rows are already unit length from normalize()
+        """
+        if not len(ids):
+            return
+        duplicates = [pid for pid in ids if pid in self.rows]
+        if duplicates or len(set(ids)) != len(ids):
+            raise ValueError(f"Papers already in the state: {duplicates[:3] or 'repeated ids'}")
+
+        new = np.asarray(embeddings, dtype=np.float64) if normalized else normalize(embeddings)
+        if len(self.ids) and new.shape[1] != self.vectors.shape[1]:
+            raise ValueError(f"Embedding dim {new.shape[1]} != state dim {self.vectors.shape[1]}")
+
+        first_new = len(self.ids)
+        self.vectors = np.vstack([self.vectors.reshape(len(self.ids), -1), new]) if len(self.ids) else new
+        self.ids.extend(ids)
+        self.rows.update((pid, first_new + i) for i, pid in enumerate(ids))
+        self._assign_serials(ids)
+
+        for start in range(0, len(ids), BLOCK_ROWS):
+            block_ids = ids[start:start + BLOCK_ROWS]
+            block = cosine_block(new[start:start + BLOCK_ROWS], self.vectors)
+            count('distances_computed', block.size)
+            for pid, row in zip(block_ids, block):
+                self._row_lists(pid, row, self.ids)
+
+            # Offer each new paper to the lists of the papers that were already there.
+            # Only offers that can enter a list are made: a full list's last entry
+            # bounds it (ties go through to the exact check in _offer_to)
+            old_ids = self.ids[:first_new]
+            if not old_ids:
+                continue
+            near_last = np.array([self.nearest[pid][-1][0] if len(self.nearest[pid]) == self.depth else np.inf
+                                  for pid in old_ids])
+            far_last = np.array([-self.farthest[pid][-1][0] if len(self.farthest[pid]) == self.depth else -np.inf
+                                 for pid in old_ids])
+            old_block = block[:, :first_new]
+            candidates = (old_block <= near_last) | (old_block >= far_last)
+            # Transposed so each paper sees the newcomers in row order
+            for column, offset in zip(*np.nonzero(candidates.T)):
+                self._offer_to(old_ids[column], block_ids[offset], float(old_block[offset, column]),
+                               first_new + start + offset)
+
+    def _offer_to(self, pid: str, new_id: str, distance: float, new_row: int):
+        """Offer new_id to an existing paper's lists (it already sees papers with rows < new_row)"""
+        seen = new_row - 1  # others pid has been compared with so far
+        for lists, key in ((self.nearest, (distance, new_id)), (self.farthest, (-distance, new_id))):
+            entries = lists[pid]
+            if len(entries) == seen or (entries and key < entries[-1]):
+                entries.insert(_bisect(entries, key), key)
+                del entries[self.depth:]
+                if lists is self.farthest:
+                    self._push_pair(distance, pid, new_id)
+
+    @span('distance_remove')
+    def remove(self, ids: Iterable[str]):
+        """Remove papers; rows whose lists fall below k entries are recomputed"""
+        removed = set(ids)
+        missing = removed - set(self.rows)
+        if missing:
+            raise KeyError(f"Papers not in the state: {sorted(missing)[:3]}")
+        if not removed:
+            return
+
+        keep = [row for row, pid in enumerate(self.ids) if pid not in removed]
+        self.ids = [self.ids[row] for row in keep]
+        self.vectors = self.vectors[keep]
+        self.rows = {pid: row for row, pid in enumerate(self.ids)}
+        for pid in removed:
+            self.nearest.pop(pid)
+            self.farthest.pop(pid)
+            self.serials.pop(pid)
+
+        refill = []
+        for pid in self.ids:
+            for lists in (self.nearest, self.farthest):
+                entries = lists[pid]
+                before = len(entries)
+                entries[:] = [entry for entry in entries if entry[1] not in removed]
+                # The list is still an exact prefix; refill only if it got too short
+                if len(entries) < before and len(entries) < min(self.k, len(self.ids) - 1):
+                    refill.append(pid)
+        refill = list(dict.fromkeys(refill))
+        for start in range(0, len(refill), BLOCK_ROWS):
+            block_ids = refill[start:start + BLOCK_ROWS]
+            rows = [self.rows[pid] for pid in block_ids]
+            block = cosine_block(self.vectors[rows], self.vectors)
+            count('distances_computed', block.size)
+            for pid, row in zip(block_ids, block):
+                self._row_lists(pid, row, self.ids)
+        count('distance_rows_refilled', len(refill))
+
+        # Drop stale heap entries once they make up most of the heap
+        if len(self.pair_heap) > 4 * max(len(self.ids), 1) * self.depth:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self.pair_heap = []
+        for pid, entries in self.farthest.items():
+            for negated, other in entries:
+                a, b = sorted((pid, other))
+                self.pair_heap.append((negated, a, b, self.serials[a], self.serials[b]))
+        heapq.heapify(self.pair_heap)
+
+    def sync(self, ids: List[str], embeddings: np.ndarray) -> Dict[str, int]:
+        """
+        Bring the state to exactly these papers: remove papers that are gone or
+        whose embedding changed, then add the new ones.
+
+        Returns:
+            Dict with added, removed, changed and unchanged counts
+        """
+        new = normalize(embeddings)
+        wanted = dict(zip(ids, range(len(ids))))
+        changed = [pid for pid in ids if pid in self.rows
+                   and not np.array_equal(self.vectors[self.rows[pid]], new[wanted[pid]])]
+        removed = [pid for pid in self.ids if pid not in wanted]
+        self.remove(removed + changed)
+        added = [pid for pid in ids if pid not in self.rows]
+        self.add(added, new[[wanted[pid] for pid in added]], normalized=True)
+        return {'added': len(added) - len(changed), 'removed': len(removed), 'changed': len(changed),
+                'unchanged': len(ids) - len(added)}
+
+    def farthest_pairs(self, n_pairs: int = 1) -> List[Tuple[str, str, float]]:
+        """
+        The n_pairs most distant pairs (n_pairs <= k), most distant first.
+
+        Every pair in a paper's farthest list was pushed to the heap when it
+        entered the list, and the global top pairs always sit in their
+        endpoints' lists, so the heap's live entries contain them.
+        """
+        if n_pairs > self.k:
+            raise ValueError(f"n_pairs must be <= k ({self.k})")
+        pairs = []
+        seen = set()
+        stale = []
+        while self.pair_heap and len(pairs) < n_pairs:
+            item = heapq.heappop(self.pair_heap)
+            if not self._live(item):
+                continue
+            negated, a, b, _, _ = item
+            if (a, b) not in seen:
+                seen.add((a, b))
+                pairs.append((a, b, -negated))
+            stale.append(item)
+        for item in stale:
+            heapq.heappush(self.pair_heap, item)
+        return pairs
+
+    def neighbours(self, pid: str) -> Dict[str, List[Tuple[str, float]]]:
+        """k nearest and k farthest papers of pid as (id, distance)"""
+        return {
+            'nearest': [(other, distance) for distance, other in self.nearest[pid][:self.k]],
+            'farthest': [(other, -negated) for negated, other in self.farthest[pid][:self.k]],
+        }
+
+    @classmethod
+    def build(cls, ids: List[str], embeddings: np.ndarray, k: int = DEFAULT_K,
+              identity: Optional[dict] = None, normalized: bool = False) -> 'DistanceState':
+        """State over these papers from scratch (the reference an incremental state must equal)"""
+        state = cls(k, identity=identity)
+        vectors = np.asarray(embeddings, dtype=np.float64) if normalized else normalize(embeddings)
+        state.ids = list(ids)
+        state.rows = {pid: row for row, pid in enumerate(state.ids)}
+        state._assign_serials(state.ids)
+        state.vectors = vectors
+        for start in range(0, len(ids), BLOCK_ROWS):
+            block = cosine_block(vectors[start:start + BLOCK_ROWS], vectors)
+            for pid, row in zip(state.ids[start:start + BLOCK_ROWS], block):
+                state._row_lists(pid, row, state.ids)
+        return state
+
+    def top_lists(self) -> Dict[str, dict]:
+        """The k-entry lists of every paper (what must match a rebuild)"""
+        return {pid: self.neighbours(pid) for pid in sorted(self.ids)}
+
+    def save(self, path: str = DISTANCE_STATE_PATH):
+        width = max((len(entries) for entries in (*self.nearest.values(), *self.farthest.values())), default=0)
+
+        def pack(lists):
+            others = np.full((len(self.ids), width), -1, dtype=np.int64)
+            distances = np.zeros((len(self.ids), width), dtype=np.float64)
+            for row, pid in enumerate(self.ids):
+                for column, (key, other) in enumerate(lists[pid]):
+                    others[row, column] = self.rows[other]
+                    distances[row, column] = key
+            return others, distances
+
+        near_rows, near_keys = pack(self.nearest)
+        far_rows, far_keys = pack(self.farthest)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, ids=np.array(self.ids, dtype=str), vectors=self.vectors,
+                 near_rows=near_rows, near_keys=near_keys, far_rows=far_rows, far_keys=far_keys,
+                 meta=np.array(json.dumps({'k': self.k, 'depth': self.depth, 'identity': self.identity})))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = DISTANCE_STATE_PATH) -> 'DistanceState':
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            state = cls(meta['k'], identity=meta['identity'])
+            state.depth = meta['depth']
+            state.ids = [str(pid) for pid in data['ids']]
+            state.rows = {pid: row for row, pid in enumerate(state.ids)}
+            state._assign_serials(state.ids)
+            state.vectors = data['vectors']
+
+            def unpack(rows, keys):
+                return {pid: [(float(key), state.ids[other]) for other, key in zip(rows[row], keys[row]) if other >= 0]
+                        for row, pid in enumerate(state.ids)}
+
+            state.nearest = unpack(data['near_rows'], data['near_keys'])
+            state.farthest = unpack(data['far_rows'], data['far_keys'])
+        state._rebuild_heap()
+        return state
+
+
+def _bisect(entries: List[Tuple[float, str]], key: Tuple[float, str]) -> int:
+    low, high = 0, len(entries)
+    while low < high:
+        middle = (low + high) // 2
+        if entries[middle] < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def load_or_create(path: str = DISTANCE_STATE_PATH, k: int = DEFAULT_K,
+                   identity: Optional[dict] = None) -> DistanceState:
+    """Saved state, or an empty one when there is none or it was built with another k/model"""
+    if os.path.exists(path):
+        state = DistanceState.load(path)
+        if state.k == k and (identity is None or state.identity in (None, identity)):
+            state.identity = identity or state.identity
+            return state
+        print(f"Distance state was built with k={state.k}, model {state.identity}; starting over")
+    return DistanceState(k, identity=identity)
+
+
+def load_embeddings(options: dict) -> Tuple[List[str], np.ndarray, Optional[dict]]:
+    if 'from-shards' in options:
+        from embedding_shards import load_extracted_papers, load_merged
+
+        ids = list(load_extracted_papers().index)
+        embeddings, identity = load_merged(ids)
+        return ids, embeddings, identity
+    path = options.get('embeddings') or './output/embeddings.csv'
+    frame = pd.read_csv(path, index_col=0)
+    # Ids such as 3544549.3585740 are read as strings so they keep their digits
+    ids = pd.read_csv(path, usecols=[0], dtype=str).iloc[:, 0].tolist()
+    return ids, frame.to_numpy(dtype=np.float64), None
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('update', 'show', 'verify'):
+        print(__doc__)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    options = dict((arg[2:] + '=').split('=')[:2] for arg in sys.argv[2:] if arg.startswith('--'))
+    args = [arg for arg in sys.argv[2:] if not arg.startswith('--')]
+
+    if command == 'update':
+        ids, embeddings, identity = load_embeddings(options)
+        state = load_or_create(k=int(options.get('k') or DEFAULT_K), identity=identity)
+        stats = state.sync(ids, embeddings)
+        state.save()
+        print(f"{len(state)} papers: {stats['added']} added, {stats['removed']} removed, "
+              f"{stats['changed']} changed, {stats['unchanged']} unchanged")
+
+    state = DistanceState.load()
+    if command == 'verify':
+        reference = DistanceState.build(state.ids, state.vectors, state.k, normalized=True)
+        same_lists = reference.top_lists() == state.top_lists()
+        same_pairs = reference.farthest_pairs(state.k) == state.farthest_pairs(state.k)
+        print(f"Top-{state.k} lists {'match' if same_lists else 'DIFFER from'} a full recompute; "
+              f"farthest pairs {'match' if same_pairs else 'DIFFER'}")
+        sys.exit(0 if same_lists and same_pairs else 1)
+
+    if args:
+        for name, entries in state.neighbours(args[0]).items():
+            print(f"{name}:")
+            for other, distance in entries:
+                print(f"  {distance:.4f}  {other}")
+        return
+    for a, b, distance in state.farthest_pairs(min(5, state.k)):
+        print(f"  {distance:.4f}  {a} / {b}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Embedding Backend Comparison
+============================
+Runs several local embedding backends over the same extracted corpus
+(output/extracted_papers.csv) and compares the distance structures they give:
+
+- Mantel test (Pearson and Spearman) between distance matrices, with a
+  permutation p-value
+- top-k neighbour overlap (with a permutation p-value) and the mean rank
+  correlation of each paper's neighbour list
+- max-pair agreement: whether both pick the same most distant pair, and how
+  far up the other backend's ranking each backend's pair sits
+
+Dense backends cache their embeddings per text in
+output/embedding_comparison/cache/, so re-runs only embed new papers.
+Each permutation relabels one matrix and costs a single float32 gather and
+dot product. Chunks of permutations are spread over worker processes; each
+chunk has its own seed, so the p-values do not depend on the number of workers.
+
+Usage:
+    python embedding_comparison.py [--backends=specter2,specter2_base,tfidf,bm25]
+                                   [--permutations=9999] [--k=5] [--workers=N] [--seed=0]
+
+Backends that cannot be loaded (e.g. no transformers) are skipped.
+Register another backend with @register_backend('name').
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from embedding_shards import content_key, load_extracted_papers
+from instrumentation import configure, count, span
+from sparse_similarity import _ranks, rank_agreement
+
+COMPARISON_DIR = "./output/embedding_comparison"
+
+DEFAULT_BACKENDS = ['specter2', 'specter2_base', 'scibert', 'minilm', 'tfidf', 'bm25']
+DEFAULT_PERMUTATIONS = 9999
+DEFAULT_K = 5
+
+# Permutations per task; each task gets its own child seed
+PERMUTATION_CHUNK = 250
+
+BACKENDS: Dict[str, Callable] = {}
+
+
+def register_backend(name: str):
+    """
+    Register a backend loader. The loader returns (kind, function, identity):
+    kind 'dense' with texts -> embeddings, or 'distances' with papers -> matrix.
+    """
+    def decorator(loader):
+        BACKENDS[name] = loader
+        return loader
+    return decorator
+
+
+def _hf_cls_backend(model_name: str):
+    """CLS embeddings of a plain (adapter-free) transformer, token ids from the token store"""
+    from transformers import AutoModel, AutoTokenizer
+
+    from paper_similarity import get_embeddings
+    from token_store import HFTokenizer, TokenStore
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    store = TokenStore(HFTokenizer(tokenizer))
+    return ('dense', lambda texts: get_embeddings(texts, tokenizer, model, 16, store),
+            {'model': model_name, 'pooling': 'cls'})
+
+
+def _mean_pooled_backend(model_name: str):
+    from question_alignment import SentenceEncoder
+
+    encoder = SentenceEncoder(model_name)
+    return 'dense', encoder.encode, {'model': model_name, 'pooling': 'mean', 'max_length': 256}
+
+
+@register_backend('specter2')
+def _specter2():
+    from embedding_shards import load_backend
+
+    embed, identity = load_backend('specter2', batch_size=16)
+    return 'dense', embed, identity
+
+
+@register_backend('specter2_base')
+def _specter2_base():
+    return _hf_cls_backend('allenai/specter2_base')
+
+
+@register_backend('scibert')
+def _scibert():
+    return _mean_pooled_backend('allenai/scibert_scivocab_uncased')
+
+
+@register_backend('minilm')
+def _minilm():
+    return _mean_pooled_backend('sentence-transformers/all-MiniLM-L6-v2')
+
+
+@register_backend('hashing')
+def _hashing():
+    from embedding_shards import load_backend
+
+    embed, identity = load_backend('hashing')
+    return 'dense', embed, identity
+
+
+def _sparse_backend(scheme: str):
+    from sparse_similarity import build_term_matrix, pairwise_distances
+
+    def distances(papers: pd.DataFrame) -> np.ndarray:
+        texts = [f"{title} {abstract}" for title, abstract in zip(papers['title'], papers['abstract'])]
+        term_matrix, _ = build_term_matrix(texts, scheme=scheme)
+        return pairwise_distances(term_matrix).astype(np.float64)
+
+    return 'distances', distances, {'backend': scheme}
+
+
+@register_backend('tfidf')
+def _tfidf():
+    return _sparse_backend('tfidf')
+
+
+@register_backend('bm25')
+def _bm25():
+    return _sparse_backend('bm25')
+
+
+def cached_embeddings(name: str, embed: Callable, identity: dict, texts: List[str],
+                      cache_dir: str = COMPARISON_DIR) -> Tuple[np.ndarray, int]:
+    """
+    Embeddings of texts, embedding only texts not in the backend's cache.
+
+    Returns:
+        Tuple of (embeddings (n, dim), number of texts embedded now)
+    """
+    path = Path(cache_dir) / 'cache' / f'{name}.npz'
+    cached = {}
+    if path.exists():
+        with np.load(path, allow_pickle=False) as data:
+            if json.loads(str(data['identity'])) == identity:
+                cached = dict(zip(data['keys'], data['embeddings']))
+
+    keys = [content_key(text) for text in texts]
+    missing = list(dict.fromkeys(key for key in keys if key not in cached))
+    if missing:
+        by_key = dict(zip(keys, texts))
+        cached.update(zip(missing, np.asarray(embed([by_key[key] for key in missing]), dtype=np.float32)))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(tmp, keys=np.array(list(cached), dtype=str), embeddings=np.array(list(cached.values())),
+                 identity=np.array(json.dumps(identity, sort_keys=True)))
+        os.replace(tmp, path)
+    count('comparison_texts_embedded', len(missing))
+    return np.array([cached[key] for key in keys]), len(missing)
+
+
+def backend_distances(name: str, papers: pd.DataFrame, cache_dir: str = COMPARISON_DIR) -> Tuple[np.ndarray, dict]:
+    """Distance matrix of one backend over the papers (rows in papers' order)"""
+    from paper_similarity import compute_pairwise_distances
+
+    with span('comparison_backend', backend=name):
+        kind, function, identity = BACKENDS[name]()
+        if kind == 'distances':
+            return function(papers), identity
+        embeddings, embedded = cached_embeddings(name, function, identity, list(papers['specter_input']),
+                                                 cache_dir)
+        print(f"  {name}: {embedded} embedded, {len(papers) - embedded} from cache")
+        return compute_pairwise_distances(embeddings).astype(np.float64), identity
+
+
+# Relabelled inner products: the kernel shared by the Mantel and overlap tests
+
+_WORKER: Dict[str, np.ndarray] = {}
+
+
+def _init_worker(X: np.ndarray, Y: np.ndarray):
+    _WORKER['X'] = X
+    _WORKER['Y'] = Y
+
+
+def permuted_inner_products(X: np.ndarray, Y: np.ndarray, perms: np.ndarray) -> np.ndarray:
+    """sum_ij X[i, j] * Y[p(i), p(j)] for each permutation p (rows of perms)"""
+    values = np.empty(len(perms))
+    for row, p in enumerate(perms):
+        values[row] = np.vdot(X, Y.take(p, axis=0).take(p, axis=1))
+    return values
+
+
+def _permutation_task(seed: np.random.SeedSequence, n_permutations: int) -> np.ndarray:
+    X, Y = _WORKER['X'], _WORKER['Y']
+    rng = np.random.default_rng(seed)
+    perms = np.argsort(rng.random((n_permutations, len(X))), axis=1)
+    return permuted_inner_products(X, Y, perms)
+
+
+def permutation_null(X: np.ndarray, Y: np.ndarray, permutations: int, seed: int = 0,
+                     workers: Optional[int] = None) -> np.ndarray:
+    """
+    Null distribution of sum_ij X[i, j] * Y[p(i), p(j)] over random relabellings p.
+
+    Args:
+        X, Y: Symmetric (n, n) matrices
+        permutations: Number of random permutations
+        seed: Base seed; chunk c always uses child seed c, whatever the worker count
+        workers: Processes (default: CPU count; 1 runs in this process)
+
+    Returns:
+        Array of permutations values
+    """
+    # float32 halves the memory traffic of the gather; the statistics need far less precision
+    X, Y = X.astype(np.float32), Y.astype(np.float32)
+    chunks = [min(PERMUTATION_CHUNK, permutations - start) for start in range(0, permutations, PERMUTATION_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    if workers <= 1:
+        _init_worker(X, Y)
+        return np.concatenate([_permutation_task(s, c) for s, c in zip(seeds, chunks)] or [np.zeros(0)])
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(X, Y)) as pool:
+        return np.concatenate(list(pool.map(_permutation_task, seeds, chunks)))
+
+
+def _p_value(null: np.ndarray, observed: float) -> float:
+    """One-sided (greater-or-equal) permutation p-value with the observed value counted"""
+    return float((1 + np.sum(null >= observed - 1e-6 * max(1.0, abs(observed)))) / (1 + len(null)))
+
+
+def _standardized_upper(D: np.ndarray, spearman: bool) -> np.ndarray:
+    """Symmetric matrix whose upper triangle is D's upper triangle (ranked if spearman) standardized"""
+    n = len(D)
+    upper = np.triu_indices(n, 1)
+    values = _ranks(D[upper]) if spearman else D[upper].astype(np.float64)
+    values = values - values.mean()
+    norm = np.linalg.norm(values)
+    values = values / norm if norm else values
+    matrix = np.zeros((n, n))
+    matrix[upper] = values
+    return matrix + matrix.T
+
+
+def mantel(A: np.ndarray, B: np.ndarray, permutations: int = DEFAULT_PERMUTATIONS, spearman: bool = False,
+           seed: int = 0, workers: Optional[int] = None) -> Dict[str, float]:
+    """
+    Mantel test between two distance matrices over the same papers.
+
+    A relabelling only reorders B's upper-triangle values, so their mean and
+    norm stay fixed and each permuted correlation is one inner product.
+
+    Returns:
+        Dict with r (Pearson, or Spearman on the pair ranks) and its p-value
+    """
+    X = _standardized_upper(A, spearman)
+    Y = _standardized_upper(B, spearman)
+    observed = 0.5 * float(np.sum(X * Y))
+    null = 0.5 * permutation_null(X, Y, permutations, seed, workers) if permutations else np.zeros(0)
+    return {'r': observed, 'p_value': _p_value(null, observed) if permutations else float('nan')}
+
+
+def knn_membership(D: np.ndarray, k: int) -> np.ndarray:
+    """(n, n) 0/1 matrix: M[i, j] = 1 if j is among i's k nearest (ties by index)"""
+    n = len(D)
+    masked = D + np.diag(np.full(n, np.inf))
+    neighbours = np.argsort(masked, axis=1, kind='stable')[:, :k]
+    membership = np.zeros((n, n))
+    membership[np.arange(n)[:, None], neighbours] = 1.0
+    return membership
+
+
+def topk_agreement(A: np.ndarray, B: np.ndarray, k: int = DEFAULT_K, permutations: int = DEFAULT_PERMUTATIONS,
+                   seed: int = 0, workers: Optional[int] = None) -> Dict[str, float]:
+    """
+    Top-k neighbour agreement.
+
+    Returns:
+        Dict with overlap (mean |kNN_A ∩ kNN_B| / k) and its permutation p-value,
+        and rank_correlation: mean Spearman correlation between A's and B's
+        distances over each paper's combined top-k neighbours
+    """
+    n = len(A)
+    k = min(k, n - 1)
+    MA, MB = knn_membership(A, k), knn_membership(B, k)
+    observed = float(np.sum(MA * MB)) / (n * k)
+    null = permutation_null(MA, MB, permutations, seed, workers) / (n * k) if permutations else np.zeros(0)
+
+    correlations = []
+    for i in range(n):
+        union = np.flatnonzero((MA[i] + MB[i]) > 0)
+        if len(union) > 2:
+            correlation = np.corrcoef(_ranks(A[i, union]), _ranks(B[i, union]))[0, 1]
+            if np.isfinite(correlation):
+                correlations.append(correlation)
+    return {
+        'overlap': observed,
+        'overlap_p_value': _p_value(null, observed) if permutations else float('nan'),
+        'rank_correlation': float(np.mean(correlations)) if correlations else float('nan'),
+    }
+
+
+def farthest_pair(D: np.ndarray) -> Tuple[int, int]:
+    upper = np.triu_indices(len(D), 1)
+    best = int(np.argmax(D[upper]))
+    return int(upper[0][best]), int(upper[1][best])
+
+
+def pair_percentile(D: np.ndarray, pair: Tuple[int, int]) -> float:
+    """Share of pairs no farther apart than pair in D (1.0 = D's own farthest pair)"""
+    values = D[np.triu_indices(len(D), 1)]
+    return float(np.mean(values <= D[pair]))
+
+
+def compare(distances: Dict[str, np.ndarray], k: int = DEFAULT_K, permutations: int = DEFAULT_PERMUTATIONS,
+            seed: int = 0, workers: Optional[int] = None) -> pd.DataFrame:
+    """One row of statistics per pair of backends"""
+    rows = []
+    for a, b in combinations(distances, 2):
+        A, B = distances[a], distances[b]
+        started = time.perf_counter()
+        with span('compare_backends', a=a, b=b):
+            pearson = mantel(A, B, permutations, False, seed, workers)
+            spearman = mantel(A, B, permutations, True, seed, workers)
+            topk = topk_agreement(A, B, k, permutations, seed, workers)
+            agreement = rank_agreement(A, B, k)
+        seconds = time.perf_counter() - started
+        pair_a, pair_b = farthest_pair(A), farthest_pair(B)
+        rows.append({
+            'backend_a': a, 'backend_b': b, 'papers': len(A),
+            'mantel_r': pearson['r'], 'mantel_p': pearson['p_value'],
+            'mantel_spearman': spearman['r'], 'mantel_spearman_p': spearman['p_value'],
+            f'top{k}_overlap': topk['overlap'], f'top{k}_overlap_p': topk['overlap_p_value'],
+            f'top{k}_rank_correlation': topk['rank_correlation'],
+            'farthest_pair_match': agreement['farthest_pair_match'],
+            'a_pair_percentile_in_b': pair_percentile(B, pair_a),
+            'b_pair_percentile_in_a': pair_percentile(A, pair_b),
+            'permutations': permutations,
+            'permutations_per_second': 3 * permutations / seconds if seconds else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    configure()
+    options = dict((arg[2:] + '=').split('=')[:2] for arg in sys.argv[1:] if arg.startswith('--'))
+    names = options['backends'].split(',') if options.get('backends') else DEFAULT_BACKENDS
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        print(f"Unknown backend(s): {', '.join(unknown)} (registered: {', '.join(BACKENDS)})")
+        sys.exit(1)
+    permutations = int(options.get('permutations') or DEFAULT_PERMUTATIONS)
+    k = int(options.get('k') or DEFAULT_K)
+    workers = int(options['workers']) if options.get('workers') else None
+    seed = int(options.get('seed') or 0)
+
+    papers = load_extracted_papers()
+    print(f"Comparing {len(names)} backends on {len(papers)} papers")
+
+    distances = {}
+    farthest = []
+    for name in names:
+        try:
+            D, identity = backend_distances(name, papers)
+        except Exception as e:
+            print(f"  ⚠️ {name} skipped: {e}")
+            continue
+        distances[name] = D
+        i, j = farthest_pair(D)
+        farthest.append({'backend': name, 'paper1_id': papers.index[i], 'paper2_id': papers.index[j],
+                         'cosine_distance': D[i, j], 'identity': json.dumps(identity, sort_keys=True)})
+
+    if len(distances) < 2:
+        print("Error: need at least two backends that load")
+        sys.exit(1)
+
+    report = compare(distances, k, permutations, seed, workers)
+    Path(COMPARISON_DIR).mkdir(parents=True, exist_ok=True)
+    report.to_csv(Path(COMPARISON_DIR) / 'comparison.csv', index=False)
+    pd.DataFrame(farthest).to_csv(Path(COMPARISON_DIR) / 'farthest_pairs.csv', index=False)
+
+    print(f"\n{'backends':<28} {'mantel r':>9} {'p':>8} {'spearman':>9} {'p':>8} "
+          f"{'top-k':>6} {'p':>8} {'rank r':>7} {'pair':>5}")
+    for row in report.to_dict('records'):
+        print(f"{row['backend_a'] + ' / ' + row['backend_b']:<28} {row['mantel_r']:>9.3f} {row['mantel_p']:>8.4f} "
+              f"{row['mantel_spearman']:>9.3f} {row['mantel_spearman_p']:>8.4f} {row[f'top{k}_overlap']:>6.2f} "
+              f"{row[f'top{k}_overlap_p']:>8.4f} {row[f'top{k}_rank_correlation']:>7.3f} "
+              f"{'same' if row['farthest_pair_match'] else 'diff':>5}")
+    print(f"\n{permutations} permutations per test "
+          f"({report['permutations_per_second'].mean():,.0f} permutations/s)")
+    print(f"Saved: {COMPARISON_DIR}/comparison.csv, {COMPARISON_DIR}/farthest_pairs.csv")
+
+
+if __name__ == "__main__":
+    main()
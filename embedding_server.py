@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+로컬 SPECTER2 임베딩 서버 (동적 마이크로 배치)
+모델을 한 번만 불러 둔 채로 임베딩 요청을 받아
+- 짧은 시간 창(--window-ms) 안에 들어온 요청들을 한 번의 forward로 묶어 처리
+  (모델이 배치를 처리하는 동안 들어온 요청은 다음 배치로 바로 묶임)
+- 대화형(online) 요청을 대량(bulk) 요청보다 먼저 배치에 넣음
+- 대기 중인 텍스트가 --max-pending을 넘으면 online 요청은 503 + Retry-After로 바로 거절,
+  bulk 요청은 자리가 날 때까지 기다리게 해서 클라이언트 속도를 서버 처리 속도에 맞춤
+- 요청 지연/대기 시간 백분위수, 배치 크기와 채움률을 /metrics 에서 제공
+
+질문 정렬/관리자 페이지의 유사도 조회/새 논문 확인 같은 일회성 도구가 매번
+load_specter2_model 비용을 치르지 않고 같은 모델을 나눠 씁니다.
+
+사용법:
+    python embedding_server.py [port] [--unix=PATH] [--backend=specter2|hashing]
+                               [--max-batch=32] [--window-ms=10] [--max-pending=1024]
+
+요청:
+    POST /embed     {"texts": ["...", ...], "priority": "online" | "bulk"}
+                    (priority 생략 시 max-batch 이하는 online, 그보다 많으면 bulk)
+                    → {"embeddings": [[...], ...], "dim": 768, "identity": {...}}
+    GET  /health    제공 중인 모델 정보 (identity, embedding_shards.py와 같은 형식)
+    GET  /metrics   지연/배치/거절 통계 (JSON)
+
+클라이언트 (표준 라이브러리만 사용):
+    from embedding_server import EmbeddingClient
+    client = EmbeddingClient()     # EMBEDDING_SERVER=http://localhost:8789 또는 unix:/path/to.sock
+    vectors = client.embed(texts)  # 긴 목록은 나눠서 bulk로 보냄, 503이면 잠시 후 재시도
+
+    EMBEDDING_SERVER를 설정하면 section_retrieval.py가 이 서버로 임베딩하고,
+    embedding_shards.py embed --backend=server 로 샤드를 bulk 작업으로 보낼 수 있습니다.
+
+필요한 라이브러리:
+    pip install aiohttp
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import numpy as np
+
+try:
+    from aiohttp import web
+except ImportError:
+    # 클라이언트(EmbeddingClient)는 표준 라이브러리만으로 동작
+    web = None
+
+DEFAULT_PORT = 8789
+DEFAULT_ADDRESS = f'http://localhost:{DEFAULT_PORT}'
+
+MAX_BATCH = 32
+BATCH_WINDOW_MS = 10.0
+MAX_PENDING = 1024
+# 메트릭 계산에 쓰는 최근 요청/배치 수
+METRICS_WINDOW = 2000
+
+# 클라이언트가 한 요청에 보내는 최대 텍스트 수와 503 재시도
+CLIENT_CHUNK = 256
+CLIENT_RETRIES = 20
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+}
+
+
+class Overloaded(Exception):
+    """대기열이 가득 차서 online 요청을 받을 수 없음"""
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+
+
+class Metrics:
+    """요청 지연, 대기 시간, 배치 크기 기록과 요약"""
+
+    def __init__(self, max_batch):
+        self.max_batch = max_batch
+        self.started = time.time()
+        self.requests = {'online': deque(maxlen=METRICS_WINDOW), 'bulk': deque(maxlen=METRICS_WINDOW)}
+        self.queue_waits = deque(maxlen=METRICS_WINDOW)
+        self.batches = deque(maxlen=METRICS_WINDOW)
+        self.counters = {'requests': 0, 'texts': 0, 'batches': 0, 'rejected': 0, 'errors': 0,
+                         'cancelled': 0, 'duplicates_in_batch': 0}
+
+    def record_request(self, priority, n_texts, latency):
+        self.counters['requests'] += 1
+        self.counters['texts'] += n_texts
+        self.requests[priority].append(latency)
+
+    def record_batch(self, size, unique, waits, seconds):
+        self.counters['batches'] += 1
+        self.counters['duplicates_in_batch'] += size - unique
+        self.queue_waits.extend(waits)
+        self.batches.append({'size': size, 'seconds': seconds})
+
+    def summary(self, pending):
+        sizes = [batch['size'] for batch in self.batches]
+        busy = sum(batch['seconds'] for batch in self.batches)
+        histogram = {}
+        for size in sizes:
+            histogram[size] = histogram.get(size, 0) + 1
+        return {
+            **self.counters,
+            'pending': pending,
+            'uptime_s': round(time.time() - self.started, 1),
+            'latency_ms': {priority: {'p50': percentile(list(latencies), 0.5),
+                                      'p95': percentile(list(latencies), 0.95),
+                                      'p99': percentile(list(latencies), 0.99)}
+                           for priority, latencies in self.requests.items()},
+            'queue_wait_ms': {'p50': percentile(list(self.queue_waits), 0.5),
+                              'p95': percentile(list(self.queue_waits), 0.95),
+                              'p99': percentile(list(self.queue_waits), 0.99)},
+            'batch': {
+                'max': self.max_batch,
+                'mean_size': round(sum(sizes) / len(sizes), 2) if sizes else None,
+                # 배치 채움률: 평균 배치 크기 / max-batch
+                'fill': round(sum(sizes) / (len(sizes) * self.max_batch), 3) if sizes else None,
+                'sizes': dict(sorted(histogram.items())),
+                'texts_per_s': round(sum(sizes) / busy, 1) if busy else None,
+            },
+        }
+
+
+class MicroBatcher:
+    """대기열의 텍스트를 max_batch개씩, 가장 오래 기다린 요청 기준 window 초 안에 묶어 embed 호출"""
+
+    def __init__(self, embed, max_batch=MAX_BATCH, window=BATCH_WINDOW_MS / 1000, max_pending=MAX_PENDING,
+                 metrics=None):
+        self.embed = embed
+        self.max_batch = max_batch
+        self.window = window
+        self.max_pending = max_pending
+        # online 요청이 들어올 자리는 항상 한 배치만큼 남겨 둠
+        self.bulk_limit = max(max_pending - max_batch, max_batch)
+        self.metrics = metrics or Metrics(max_batch)
+        self.queues = {'online': deque(), 'bulk': deque()}
+        self.pending = 0
+        self.arrived = asyncio.Event()
+        self.room = asyncio.Condition()
+
+    def _enqueue(self, texts, priority):
+        loop = asyncio.get_running_loop()
+        now = time.perf_counter()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.queues[priority].append((text, future, now))
+            futures.append(future)
+        self.pending += len(texts)
+        self.arrived.set()
+        return futures
+
+    async def submit(self, texts, priority='online'):
+        """텍스트 목록의 임베딩 (입력 순서대로). online은 자리가 없으면 Overloaded"""
+        if priority == 'online':
+            if self.pending + len(texts) > self.max_pending:
+                raise Overloaded(f"{self.pending} texts pending")
+            futures = self._enqueue(texts, 'online')
+        else:
+            futures = []
+            for start in range(0, len(texts), self.max_batch):
+                chunk = texts[start:start + self.max_batch]
+                async with self.room:
+                    await self.room.wait_for(lambda: self.pending + len(chunk) <= self.bulk_limit)
+                futures += self._enqueue(chunk, 'bulk')
+        return await asyncio.gather(*futures)
+
+    def _take_batch(self):
+        batch = []
+        for priority in ('online', 'bulk'):
+            queue = self.queues[priority]
+            while queue and len(batch) < self.max_batch:
+                item = queue.popleft()
+                self.pending -= 1
+                # 연결이 끊겨 취소된 요청은 건너뜀
+                if item[1].done():
+                    self.metrics.counters['cancelled'] += 1
+                    continue
+                batch.append(item)
+        return batch
+
+    async def run(self):
+        while True:
+            await self.arrived.wait()
+            self.arrived.clear()
+            if not self.pending:
+                continue
+
+            # 배치가 차거나 가장 오래 기다린 요청의 시간 창이 끝날 때까지 더 모음
+            oldest = min(queue[0][2] for queue in self.queues.values() if queue)
+            while self.pending < self.max_batch:
+                remaining = oldest + self.window - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self.arrived.clear()
+
+            batch = self._take_batch()
+            async with self.room:
+                self.room.notify_all()
+            if self.pending:
+                self.arrived.set()
+            if batch:
+                await self._process(batch)
+
+    async def _process(self, batch):
+        started = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await asyncio.to_thread(self.embed, texts)
+        except Exception as e:
+            self.metrics.counters['errors'] += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, np.asarray(vectors, dtype=np.float32)))
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+        self.metrics.record_batch(len(batch), len(texts), [started - enqueued for _, _, enqueued in batch],
+                                  time.perf_counter() - started)
+
+
+class EmbeddingService:
+    def __init__(self, backend='specter2', max_batch=MAX_BATCH, window_ms=BATCH_WINDOW_MS,
+                 max_pending=MAX_PENDING):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.window_ms = window_ms
+        self.max_pending = max_pending
+        self.identity = None
+        self.batcher = None
+        self.worker = None
+
+    async def start(self, app):
+        from embedding_shards import load_backend
+
+        embed, self.identity = await asyncio.to_thread(load_backend, self.backend, self.max_batch)
+        self.batcher = MicroBatcher(embed, self.max_batch, self.window_ms / 1000, self.max_pending)
+        self.worker = asyncio.create_task(self.batcher.run())
+        print(f'✓ 모델 준비 완료: {self.identity.get("model", self.identity.get("backend"))} '
+              f'(배치 최대 {self.max_batch}, 시간 창 {self.window_ms:g} ms, 대기 최대 {self.max_pending})')
+
+    async def stop(self, app):
+        if self.worker:
+            self.worker.cancel()
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/embed', self.handle_embed)
+        app.router.add_route('OPTIONS', '/embed', self.handle_options)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+    async def handle_options(self, request):
+        return web.Response(headers=CORS_HEADERS)
+
+    async def handle_health(self, request):
+        return web.json_response({'identity': self.identity, 'max_batch': self.max_batch},
+                                 headers=CORS_HEADERS)
+
+    async def handle_metrics(self, request):
+        return web.json_response(self.batcher.metrics.summary(self.batcher.pending), headers=CORS_HEADERS)
+
+    async def handle_embed(self, request):
+        started = time.perf_counter()
+        body = await request.json()
+        texts = body.get('texts')
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return web.json_response({'error': 'texts must be a list of strings'}, status=400,
+                                     headers=CORS_HEADERS)
+        priority = body.get('priority') or ('online' if len(texts) <= self.max_batch else 'bulk')
+        if priority not in ('online', 'bulk'):
+            return web.json_response({'error': f'unknown priority: {priority}'}, status=400,
+                                     headers=CORS_HEADERS)
+
+        if not texts:
+            return web.json_response({'embeddings': [], 'dim': 0, 'identity': self.identity}, headers=CORS_HEADERS)
+
+        try:
+            vectors = await self.batcher.submit(texts, priority)
+        except Overloaded as e:
+            self.batcher.metrics.counters['rejected'] += 1
+            return web.json_response({'error': f'overloaded ({e})'}, status=503,
+                                     headers={**CORS_HEADERS, 'Retry-After': '1'})
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=500, headers=CORS_HEADERS)
+
+        self.batcher.metrics.record_request(priority, len(texts), time.perf_counter() - started)
+        embeddings = np.array(vectors, dtype=np.float32).reshape(len(texts), -1)
+        return web.json_response({'embeddings': embeddings.tolist(), 'dim': int(embeddings.shape[1]),
+                                  'identity': self.identity}, headers=CORS_HEADERS)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class EmbeddingClient:
+    """embedding_server.py 클라이언트 (keep-alive 연결 하나를 재사용)"""
+
+    def __init__(self, address=None, timeout=300):
+        self.address = address or os.environ.get('EMBEDDING_SERVER') or DEFAULT_ADDRESS
+        self.timeout = timeout
+        self.connection = None
+
+    def _connect(self):
+        if self.address.startswith('unix:'):
+            return UnixHTTPConnection(self.address[len('unix:'):], timeout=self.timeout)
+        url = urlparse(self.address if '://' in self.address else f'http://{self.address}')
+        return http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT, timeout=self.timeout)
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload) if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+        for attempt in range(CLIENT_RETRIES):
+            try:
+                if self.connection is None:
+                    self.connection = self._connect()
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = json.loads(response.read() or b'{}')
+            except (ConnectionError, http.client.HTTPException):
+                # 서버가 keep-alive 연결을 닫았으면 한 번 다시 연결
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+                continue
+            if response.status == 503:
+                time.sleep(float(response.getheader('Retry-After') or 1))
+                continue
+            if response.status != 200:
+                raise RuntimeError(f"Embedding server error {response.status}: {data.get('error')}")
+            return data
+        raise RuntimeError(f"Embedding server still overloaded after {CLIENT_RETRIES} attempts")
+
+    def health(self):
+        return self._request('GET', '/health')
+
+    def metrics(self):
+        return self._request('GET', '/metrics')
+
+    def embed(self, texts, priority=None):
+        """(n, dim) float32 임베딩. CLIENT_CHUNK개씩 나눠서 요청"""
+        texts = list(texts)
+        if priority is None and len(texts) > CLIENT_CHUNK:
+            priority = 'bulk'
+        chunks = []
+        for start in range(0, len(texts), CLIENT_CHUNK):
+            payload = {'texts': texts[start:start + CLIENT_CHUNK]}
+            if priority:
+                payload['priority'] = priority
+            data = self._request('POST', '/embed', payload)
+            chunks.append(np.array(data['embeddings'], dtype=np.float32).reshape(-1, data['dim']))
+        return np.vstack(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    port = int(args[0]) if args else DEFAULT_PORT
+    service = EmbeddingService(
+        backend=options.get('backend', 'specter2'),
+        max_batch=int(options.get('max-batch', MAX_BATCH)),
+        window_ms=float(options.get('window-ms', BATCH_WINDOW_MS)),
+        max_pending=int(options.get('max-pending', MAX_PENDING)),
+    )
+    if 'unix' in options:
+        print(f'🧠 Embedding server: unix:{options["unix"]} (backend: {service.backend})')
+        web.run_app(service.make_app(), path=options['unix'], print=None)
+    else:
+        print(f'🧠 Embedding server: http://localhost:{port}/embed (backend: {service.backend})')
+        web.run_app(service.make_app(), port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Sharded Embedding Runs
+======================
+Splits the extracted-paper list (output/extracted_papers.csv) into shards by a
+hash of each paper's specter_input, so every host or process can embed its own
+shard into a local store. A merge step checks that all shards were produced by
+the same model and writes one embedding matrix plus id index that
+paper_similarity.py (--from-shards) and compute_pairwise_distances consume.
+
+A paper's shard depends only on its content, so adding papers never moves
+existing papers to another shard. Re-running a shard only embeds content that
+is not already in a store from the same model, including stores from a run
+with a different shard count; `run` removes those once the new partition is
+complete.
+
+Usage:
+    python embedding_shards.py plan  --shards=N
+    python embedding_shards.py embed --shard=K --shards=N [--backend=specter2|hashing|server]
+    python embedding_shards.py merge [--partial]
+    python embedding_shards.py run   --shards=N [--backend=...]   (N local processes, then merge)
+
+The hashing backend (feature-hashed token counts, no model download) stands in
+for SPECTER2 when testing the shard/merge workflow offline; the server backend
+sends the shard to a running embedding_server.py (EMBEDDING_SERVER) as bulk work.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from token_store import HFTokenizer, TokenStore
+
+EXTRACTED_PAPERS_PATH = "./output/extracted_papers.csv"
+SHARD_DIR = "./output/embedding_shards"
+MERGED_EMBEDDINGS_PATH = "./output/sharded_embeddings.npy"
+MERGED_INDEX_PATH = "./output/sharded_embeddings.json"
+
+HASHING_DIM = 768
+
+SPECTER2_IDENTITY = {
+    'backend': 'specter2',
+    'model': 'allenai/specter2_base',
+    'adapter': 'allenai/specter2 (proximity)',
+    'max_length': 512,
+    'pooling': 'cls',
+}
+
+
+def content_key(text: str) -> str:
+    """SHA-1 of the embedding input; equal inputs share an embedding"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def shard_of(key: str, n_shards: int) -> int:
+    return int(key[:15], 16) % n_shards
+
+
+def load_extracted_papers(path: str = EXTRACTED_PAPERS_PATH) -> pd.DataFrame:
+    """extracted_papers.csv written by paper_similarity.py (index: paper id)"""
+    # Read as strings: ids such as 3544549.3585740 would otherwise become floats
+    return pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False)
+
+
+def partition(papers: pd.DataFrame, n_shards: int) -> Dict[int, List[str]]:
+    """{shard: [paper ids]} by content hash of specter_input"""
+    shards = {shard: [] for shard in range(n_shards)}
+    for paper_id, text in papers['specter_input'].items():
+        shards[shard_of(content_key(text), n_shards)].append(paper_id)
+    return shards
+
+
+def identity_digest(identity: dict) -> str:
+    return hashlib.sha1(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def hashing_embeddings(token_ids: List[np.ndarray], dim: int = HASHING_DIM) -> np.ndarray:
+    """Signed feature hashing of log-scaled token-id counts, L2-normalised"""
+    embeddings = np.zeros((len(token_ids), dim), dtype=np.float32)
+    for row, ids in enumerate(token_ids):
+        if not len(ids):
+            continue
+        ids = np.asarray(ids, dtype=np.int64)
+        signs = np.where((ids >> 30) & 1, -1.0, 1.0)
+        np.add.at(embeddings[row], ids % dim, signs)
+        embeddings[row] = np.sign(embeddings[row]) * np.log1p(np.abs(embeddings[row]))
+        norm = np.linalg.norm(embeddings[row])
+        if norm:
+            embeddings[row] /= norm
+    return embeddings
+
+
+def load_backend(name: str, batch_size: int = 1) -> Tuple[Callable[[List[str]], np.ndarray], dict]:
+    """
+    Embedding function and model identity for a backend.
+
+    Args:
+        name: 'specter2', 'hashing', or 'server' (a running embedding_server.py,
+            which reports the identity of the model it serves)
+        batch_size: Texts per SPECTER2 forward pass
+
+    Returns:
+        Tuple of (texts -> (n, dim) array, identity dict recorded in every shard)
+    """
+    if name == 'hashing':
+        store = TokenStore('hashing')
+        return ((lambda texts: hashing_embeddings(store.token_ids(texts))),
+                {'backend': 'hashing', 'dim': HASHING_DIM, 'tokenizer': store.tokenizer.identity})
+    if name == 'server':
+        from embedding_server import EmbeddingClient
+
+        client = EmbeddingClient()
+        return (lambda texts: client.embed(texts, priority='bulk')), client.health()['identity']
+    if name != 'specter2':
+        raise ValueError(f"Unknown embedding backend: {name}")
+
+    from paper_similarity import get_embeddings, load_specter2_model
+
+    tokenizer, model = load_specter2_model()
+    store = TokenStore(HFTokenizer(tokenizer))
+    identity = dict(SPECTER2_IDENTITY)
+    # Pin the exact checkpoint when transformers reports it
+    revision = getattr(getattr(model, 'config', None), '_commit_hash', None)
+    if revision:
+        identity['revision'] = revision
+    return (lambda texts: get_embeddings(texts, tokenizer, model, batch_size, store)), identity
+
+
+def shard_path(shard: int, n_shards: int, shard_dir: str = SHARD_DIR) -> Path:
+    return Path(shard_dir) / f"shard-{shard:04d}-of-{n_shards:04d}.npz"
+
+
+def load_shard(path: Path) -> Tuple[dict, List[str], List[str], np.ndarray]:
+    """(meta, paper ids, content keys, embeddings) of one shard store"""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        return meta, list(data['ids']), list(data['keys']), data['embeddings']
+
+
+def save_shard(path: Path, meta: dict, ids: List[str], keys: List[str], embeddings: np.ndarray):
+    """Write atomically so a crashed run never leaves a half-written shard"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp.npz')
+    np.savez(tmp, meta=np.array(json.dumps(meta, sort_keys=True)), ids=np.array(ids, dtype=str),
+             keys=np.array(keys, dtype=str), embeddings=embeddings.astype(np.float32))
+    os.replace(tmp, path)
+
+
+def store_paths(shard_dir: str = SHARD_DIR, n_shards: Optional[int] = None) -> List[Path]:
+    """Shard stores in shard_dir, optionally only those of one partition"""
+    # Skips the .tmp.npz files of stores being written
+    paths = sorted(path for path in Path(shard_dir).glob('shard-*-of-*.npz') if not path.name.endswith('.tmp.npz'))
+    if n_shards is not None:
+        paths = [path for path in paths if path.name.endswith(f"-of-{n_shards:04d}.npz")]
+    return paths
+
+
+def embed_shard(papers: pd.DataFrame, shard: int, n_shards: int, backend: str = 'specter2',
+                shard_dir: str = SHARD_DIR, embed: Optional[Callable] = None,
+                identity: Optional[dict] = None) -> Dict[str, int]:
+    """
+    Embed the papers that fall into one shard.
+
+    Args:
+        papers: Extracted papers (index: paper id, column specter_input)
+        shard: Shard number in [0, n_shards)
+        n_shards: Total number of shards
+        backend: 'specter2' or 'hashing' (ignored when embed/identity are given)
+        shard_dir: Local store directory
+        embed: Optional texts -> embeddings function
+        identity: Model identity for embed
+
+    Returns:
+        Dict with the shard's paper count, newly embedded and reused counts
+    """
+    if not 0 <= shard < n_shards:
+        raise ValueError(f"shard must be in [0, {n_shards}), got {shard}")
+
+    ids = partition(papers, n_shards)[shard]
+    keys = [content_key(papers.at[pid, 'specter_input']) for pid in ids]
+    path = shard_path(shard, n_shards, shard_dir)
+
+    # Reuse stored vectors from the same model, in this shard's store first and then
+    # in any other store (e.g. from a run with another shard count); the model itself
+    # is only loaded when something is left to embed
+    cached = {}
+    others = [other for other in store_paths(shard_dir) if other != path]
+    wanted = set(keys)
+    for store in ([path] if path.exists() else []) + others:
+        if wanted <= cached.keys():
+            break
+        meta, _, old_keys, old_embeddings = load_shard(store)
+        stored = meta['identity']
+        if (stored == identity) if identity else (stored.get('backend') == backend):
+            cached.update((key, vector) for key, vector in zip(old_keys, old_embeddings) if key in wanted)
+            identity = stored
+
+    missing = sorted({key for key in keys if key not in cached})
+    if embed is None and (missing or identity is None):
+        embed, loaded = load_backend(backend)
+        if identity is not None and loaded != identity:
+            cached = {}
+            missing = sorted(set(keys))
+        identity = loaded
+
+    if missing:
+        texts = {content_key(text): text for text in papers.loc[ids, 'specter_input']}
+        vectors = embed([texts[key] for key in missing])
+        cached.update(zip(missing, vectors))
+
+    embeddings = np.array([cached[key] for key in keys], dtype=np.float32).reshape(len(keys), -1)
+    save_shard(path, {'identity': identity, 'shard': shard, 'n_shards': n_shards}, ids, keys, embeddings)
+    return {'papers': len(ids), 'embedded': len(missing), 'reused': len(set(keys)) - len(missing)}
+
+
+def merge_shards(papers: Optional[pd.DataFrame] = None, shard_dir: str = SHARD_DIR,
+                 partial: bool = False, n_shards: Optional[int] = None) -> Tuple[List[str], np.ndarray, dict]:
+    """
+    Combine shard stores into one matrix.
+
+    Args:
+        papers: Extracted papers; fixes the row order and is checked for coverage
+        shard_dir: Directory holding the shard-*.npz stores
+        partial: Allow papers without an embedding (they are left out)
+        n_shards: Only merge the stores of this partition (others are ignored)
+
+    Returns:
+        Tuple of (paper ids, embeddings (n, dim) float32, model identity)
+
+    Raises:
+        ValueError: shards from different models or shard counts, missing shards,
+            conflicting vectors, or (unless partial) papers without an embedding
+    """
+    paths = store_paths(shard_dir, n_shards)
+    if not paths:
+        raise ValueError(f"No shard stores in {shard_dir}")
+
+    shards = [load_shard(path) for path in paths]
+    identities = {identity_digest(meta['identity']): meta['identity'] for meta, *_ in shards}
+    if len(identities) > 1:
+        found = '; '.join(f"{path.name}: {json.dumps(meta['identity'], sort_keys=True)}"
+                          for path, (meta, *_) in zip(paths, shards))
+        raise ValueError(f"Shards were embedded with different models: {found}")
+    identity = next(iter(identities.values()))
+
+    counts = {meta['n_shards'] for meta, *_ in shards}
+    if len(counts) > 1:
+        raise ValueError(f"Shard stores from different partitions: n_shards {sorted(counts)} "
+                         f"(run with --shards=N removes stores of other partitions)")
+    n_shards = counts.pop()
+    absent = sorted(set(range(n_shards)) - {meta['shard'] for meta, *_ in shards})
+    if absent and not partial:
+        raise ValueError(f"Missing shard(s) {absent} of {n_shards}")
+
+    by_key = {}
+    by_id = {}
+    for meta, ids, keys, embeddings in shards:
+        for pid, key, vector in zip(ids, keys, embeddings):
+            if key in by_key and not np.allclose(by_key[key], vector, atol=1e-5):
+                raise ValueError(f"Conflicting embeddings for content {key[:12]} (paper {pid})")
+            by_key[key] = vector
+            by_id[pid] = key
+
+    if papers is None:
+        order = sorted(by_id)
+    else:
+        order = []
+        uncovered = []
+        for pid, text in papers['specter_input'].items():
+            key = content_key(text)
+            if key in by_key:
+                order.append(pid)
+            else:
+                uncovered.append(pid)
+        if uncovered and not partial:
+            raise ValueError(f"{len(uncovered)} paper(s) have no embedding (e.g. {uncovered[:3]}); "
+                             f"re-run their shards or merge with --partial")
+        keys = {pid: content_key(text) for pid, text in papers['specter_input'].items()}
+        by_id = {pid: keys[pid] for pid in order}
+
+    embeddings = np.array([by_key[by_id[pid]] for pid in order], dtype=np.float32)
+    return order, embeddings.reshape(len(order), -1), identity
+
+
+def save_merged(ids: List[str], embeddings: np.ndarray, identity: dict,
+                embeddings_path: str = MERGED_EMBEDDINGS_PATH, index_path: str = MERGED_INDEX_PATH):
+    Path(embeddings_path).parent.mkdir(parents=True, exist_ok=True)
+    np.save(embeddings_path, embeddings)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump({'identity': identity, 'ids': ids, 'dim': int(embeddings.shape[1]) if len(ids) else 0},
+                  f, indent=2)
+
+
+def load_merged(paper_ids: Optional[List[str]] = None, embeddings_path: str = MERGED_EMBEDDINGS_PATH,
+                index_path: str = MERGED_INDEX_PATH) -> Tuple[np.ndarray, dict]:
+    """
+    Merged embeddings, optionally reordered to paper_ids.
+
+    Returns:
+        Tuple of (embeddings, model identity)
+
+    Raises:
+        KeyError: if some of paper_ids are not in the merged index
+    """
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    embeddings = np.load(embeddings_path)
+    if paper_ids is None:
+        return embeddings, index['identity']
+    rows = {pid: row for row, pid in enumerate(index['ids'])}
+    missing = [pid for pid in paper_ids if pid not in rows]
+    if missing:
+        raise KeyError(f"{len(missing)} paper(s) not in the merged embeddings (e.g. {missing[:3]})")
+    return embeddings[[rows[pid] for pid in paper_ids]], index['identity']
+
+
+def run_local(n_shards: int, backend: str, papers_path: str = EXTRACTED_PAPERS_PATH,
+              shard_dir: str = SHARD_DIR) -> bool:
+    """
+    Embed every shard in its own local process. Once all shards succeed, stores
+    from other shard counts (whose vectors the new shards reused) are removed.
+    """
+    processes = [
+        subprocess.Popen([sys.executable, __file__, 'embed', f'--shard={shard}', f'--shards={n_shards}',
+                          f'--backend={backend}', f'--papers={papers_path}', f'--shard-dir={shard_dir}'])
+        for shard in range(n_shards)
+    ]
+    failed = [shard for shard, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        print(f"Shard(s) {failed} failed")
+        return False
+    current = set(store_paths(shard_dir, n_shards))
+    stale = [path for path in store_paths(shard_dir) if path not in current]
+    for path in stale:
+        path.unlink()
+    if stale:
+        print(f"Removed {len(stale)} store(s) from other shard counts")
+    return True
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('plan', 'embed', 'merge', 'run'):
+        print(__doc__)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[2:] if arg.startswith('--') and '=' in arg)
+    papers_path = options.get('papers', EXTRACTED_PAPERS_PATH)
+    shard_dir = options.get('shard-dir', SHARD_DIR)
+    backend = options.get('backend', 'specter2')
+    n_shards = int(options.get('shards', 0))
+    papers = load_extracted_papers(papers_path)
+
+    if command in ('plan', 'embed', 'run') and n_shards < 1:
+        print("Error: --shards=N is required")
+        sys.exit(1)
+
+    if command == 'plan':
+        for shard, ids in partition(papers, n_shards).items():
+            print(f"  shard {shard:4d}: {len(ids)} papers")
+        return
+
+    if command == 'embed':
+        shard = int(options['shard'])
+        stats = embed_shard(papers, shard, n_shards, backend, shard_dir)
+        print(f"Shard {shard}/{n_shards}: {stats['papers']} papers "
+              f"({stats['embedded']} embedded, {stats['reused']} reused) -> {shard_path(shard, n_shards, shard_dir)}")
+        return
+
+    if command == 'run' and not run_local(n_shards, backend, papers_path, shard_dir):
+        sys.exit(1)
+
+    try:
+        ids, embeddings, identity = merge_shards(papers, shard_dir, partial='--partial' in sys.argv[2:],
+                                                 n_shards=n_shards or None)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    save_merged(ids, embeddings, identity)
+    print(f"Merged {len(ids)} papers, dim {embeddings.shape[1] if len(ids) else 0}, "
+          f"model {identity.get('model', identity.get('backend'))}")
+    print(f"Saved: {MERGED_EMBEDDINGS_PATH}, {MERGED_INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
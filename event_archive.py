@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+실험 이벤트 바이너리 아카이브 (.evarc)
+세션 문서의 이벤트 배열을 손실 없이 압축 보관하고, 세션 단위로 바로 읽을 수 있게 합니다.
+
+인코딩:
+    - 문자열 값(participantId, sessionId, condition, paper, phase, 섹션 이름 등)은
+      아카이브 전체에서 공유하는 문자열 사전의 번호로 저장
+    - 이벤트별 키 목록(순서 포함)은 레이아웃 사전의 번호로 저장
+    - timestamp는 세션 안에서 delta + zigzag, 정수 컬럼도 delta 인코딩
+    - 나머지 필드는 이벤트 타입별 컬럼 (scroll_action의 scrollY, sectionBeforeScroll, ...)
+    - 세션 블록마다 zlib 압축 → 세션 하나만 읽을 때 해당 블록만 해제
+
+파일 구조:
+    MAGIC | 세션 블록들 | 헤더(zlib JSON: 문자열 사전, 레이아웃, 세션 인덱스) | 헤더 길이(uint64) | MAGIC
+
+사용법:
+    python event_archive.py pack [archive.evarc]          # Firebase 세션 → 아카이브
+    python event_archive.py unpack <archive.evarc> [sessionKey]
+    python event_archive.py bench [세션 수]               # 합성 세션으로 JSON 대비 크기/속도 비교
+
+export_sessions.py --archive 로 내보내기와 함께 export/events.evarc를 갱신할 수 있습니다.
+"""
+
+import gzip
+import json
+import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b'EVARC01\n'
+COMPRESS_LEVEL = 6
+
+# JSON number 중 float64로 정확히 표현되는 정수 범위
+MAX_EXACT_INT = 2 ** 53
+# delta 계산 시 int64 overflow가 나지 않는 범위
+MAX_DELTA_INT = 2 ** 62
+
+# eventId처럼 세션마다 값이 다른 문자열은 사전 대신 prefix + 정수 delta로 저장
+COUNTER_PATTERN = re.compile(r'^(.*?)(0|[1-9][0-9]{0,17})$', re.S)
+
+# 세션 전체에서 delta 인코딩하는 컬럼 (나머지는 이벤트 타입별 컬럼)
+SESSION_COLUMNS = ('timestamp',)
+
+
+class StringTable:
+    """문자열 ↔ 번호 사전 (추가만 가능해 기존 블록의 번호가 바뀌지 않음)"""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.ids = {value: i for i, value in enumerate(self.values)}
+
+    def id(self, value):
+        if value not in self.ids:
+            self.ids[value] = len(self.values)
+            self.values.append(value)
+        return self.ids[value]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def smallest_uint(values):
+    array = np.asarray(values, dtype=np.uint64)
+    top = int(array.max()) if len(array) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if top <= np.iinfo(dtype).max:
+            return array.astype(dtype)
+    return array
+
+
+def zigzag(values):
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def unzigzag(values):
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).astype(np.int64)) ^ -((values & np.uint64(1)).astype(np.int64))
+
+
+def counter_prefix(values):
+    """모든 값이 '<같은 prefix><정수>' 형태(eventId = sessionId_counter)이면 prefix"""
+    match = COUNTER_PATTERN.match(values[0]) if values else None
+    if not match:
+        return None
+    prefix = match.group(1)
+    for value in values:
+        match = COUNTER_PATTERN.match(value)
+        if not match or match.group(1) != prefix:
+            return None
+    return prefix
+
+
+def value_kind(values):
+    """
+    컬럼 값 종류: S(사전 문자열) P(prefix + 정수) T(사전에 넣지 않는 문자열)
+    B(bool) I(정수) F(숫자, 정수 섞임 가능) J(그 외 JSON)
+    """
+    if all(type(v) is str for v in values):
+        if len(set(values)) <= max(len(values) // 2, 1):
+            return 'S'
+        return 'P' if counter_prefix(values) is not None else 'T'
+    if all(type(v) is bool for v in values):
+        return 'B'
+    if all(type(v) is int and -MAX_DELTA_INT < v < MAX_DELTA_INT for v in values):
+        return 'I'
+    if all(type(v) is float or (type(v) is int and -MAX_EXACT_INT < v < MAX_EXACT_INT) for v in values):
+        return 'F'
+    return 'J'
+
+
+def encode_column(values, strings):
+    """값 목록(None 허용) → (설명자, 버퍼 목록)"""
+    nulls = [v is None for v in values]
+    present = [v for v in values if v is not None]
+    kind = value_kind(present)
+    desc = {'k': kind, 'n': len(values)}
+    buffers = []
+
+    if any(nulls):
+        desc['z'] = 1
+        buffers.append(np.packbits(np.array(nulls, dtype=bool)).tobytes())
+
+    if kind == 'S':
+        array = smallest_uint([strings.id(v) for v in present])
+    elif kind == 'P':
+        prefix = counter_prefix(present)
+        desc['p'] = prefix
+        counters = np.array([int(v[len(prefix):]) for v in present], dtype=np.int64)
+        array = smallest_uint(zigzag(np.diff(counters, prepend=0)))
+    elif kind == 'B':
+        array = np.packbits(np.array(present, dtype=bool))
+    elif kind == 'I':
+        array = smallest_uint(zigzag(np.diff(np.array(present, dtype=np.int64), prepend=0)))
+    elif kind == 'F':
+        array = np.array(present, dtype='<f8')
+        is_int = [type(v) is int for v in present]
+        if any(is_int):
+            desc['i'] = 1
+            buffers.append(np.packbits(np.array(is_int, dtype=bool)).tobytes())
+    else:
+        array = None
+        buffers.append(json.dumps(present, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    if array is not None:
+        desc['d'] = array.dtype.str
+        buffers.append(array.tobytes())
+    desc['s'] = [len(buffer) for buffer in buffers]
+    return desc, buffers
+
+
+def decode_column(desc, buffers, strings):
+    buffers = iter(buffers)
+    n = desc['n']
+    nulls = None
+    if desc.get('z'):
+        nulls = np.unpackbits(np.frombuffer(next(buffers), dtype=np.uint8), count=n).astype(bool)
+    count = n - int(nulls.sum()) if nulls is not None else n
+
+    kind = desc['k']
+    if kind in ('T', 'J'):
+        present = json.loads(next(buffers))
+    elif kind == 'B':
+        present = np.unpackbits(np.frombuffer(next(buffers), dtype=np.uint8), count=count).astype(bool).tolist()
+    elif kind == 'F':
+        is_int = None
+        if desc.get('i'):
+            is_int = np.unpackbits(np.frombuffer(next(buffers), dtype=np.uint8), count=count).astype(bool)
+        present = np.frombuffer(next(buffers), dtype=desc['d']).tolist()
+        if is_int is not None:
+            for i in np.flatnonzero(is_int).tolist():
+                present[i] = int(present[i])
+    else:
+        array = np.frombuffer(next(buffers), dtype=desc['d'])
+        if kind == 'S':
+            table = strings.values
+            present = [table[i] for i in array.tolist()]
+        elif kind == 'P':
+            prefix = desc['p']
+            present = [f'{prefix}{counter}' for counter in np.cumsum(unzigzag(array)).tolist()]
+        else:
+            present = np.cumsum(unzigzag(array)).tolist()
+
+    if nulls is None:
+        return present
+    values = [None] * n
+    for i, value in zip(np.flatnonzero(~nulls).tolist(), present):
+        values[i] = value
+    return values
+
+
+def encode_session(events, strings, layouts):
+    """세션 하나의 이벤트 목록 → 압축된 블록"""
+    layout_ids = []
+    group_ids = []
+    session_values = {key: [] for key in SESSION_COLUMNS}
+    groups = {}
+
+    for event in events:
+        keys = tuple(event)
+        layout_ids.append(layouts.id(keys))
+        event_type = event.get('eventType')
+        group = event_type if type(event_type) is str else ''
+        group_ids.append(strings.id(group))
+        columns = groups.setdefault(group, {})
+        for key in keys:
+            if key in session_values:
+                session_values[key].append(event[key])
+            else:
+                columns.setdefault(key, []).append(event[key])
+
+    columns = [('', '_layout', layout_ids), ('', '_group', group_ids)]
+    columns += [('', key, values) for key, values in session_values.items() if values]
+    for group, group_columns in groups.items():
+        columns += [(group, key, values) for key, values in group_columns.items()]
+
+    manifest = []
+    payload = []
+    for group, key, values in columns:
+        if key in ('_layout', '_group'):
+            array = smallest_uint(values)
+            desc, buffers = {'k': 'U', 'n': len(values), 'd': array.dtype.str}, [array.tobytes()]
+            desc['s'] = [len(buffers[0])]
+        else:
+            desc, buffers = encode_column(values, strings)
+        manifest.append([group, key, desc])
+        payload.extend(buffers)
+
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    block = struct.pack('<I', len(manifest_bytes)) + manifest_bytes + b''.join(payload)
+    return zlib.compress(block, COMPRESS_LEVEL)
+
+
+def decode_session(block, strings, layouts):
+    """압축된 블록 → 이벤트 목록 (키 순서까지 원본과 동일)"""
+    data = zlib.decompress(block)
+    manifest_length = struct.unpack_from('<I', data)[0]
+    manifest = json.loads(data[4:4 + manifest_length])
+    offset = 4 + manifest_length
+
+    layout_ids = group_ids = None
+    session_columns = {}
+    group_columns = {}
+    for group, key, desc in manifest:
+        buffers = []
+        for size in desc['s']:
+            buffers.append(data[offset:offset + size])
+            offset += size
+        if desc['k'] == 'U':
+            values = np.frombuffer(buffers[0], dtype=desc['d']).tolist()
+            if key == '_layout':
+                layout_ids = values
+            else:
+                group_ids = values
+        elif group == '' and key in SESSION_COLUMNS:
+            session_columns[key] = iter(decode_column(desc, buffers, strings))
+        else:
+            group_columns.setdefault(strings.ids[group], {})[key] = iter(decode_column(desc, buffers, strings))
+
+    events = []
+    layout_keys = layouts.values
+    for layout_id, group_id in zip(layout_ids, group_ids):
+        columns = group_columns.get(group_id, {})
+        event = {}
+        for key in layout_keys[layout_id]:
+            column = session_columns.get(key) or columns[key]
+            event[key] = next(column)
+        events.append(event)
+    return events
+
+
+class EventArchive:
+    """아카이브 읽기: 헤더만 읽어 두고 세션 블록은 요청할 때 해제"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'Not an event archive: {self.path}')
+            f.seek(-(8 + len(MAGIC)), os.SEEK_END)
+            header_length = struct.unpack('<Q', f.read(8))[0]
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'Truncated event archive: {self.path}')
+            f.seek(-(8 + len(MAGIC) + header_length), os.SEEK_END)
+            header = json.loads(zlib.decompress(f.read(header_length)))
+
+        self.strings = StringTable(header['strings'])
+        self.layouts = StringTable(tuple(keys) for keys in header['layouts'])
+        self.index = {key: (offset, length, count) for key, offset, length, count in header['sessions']}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, session_key):
+        return session_key in self.index
+
+    def keys(self):
+        return list(self.index)
+
+    def event_count(self, session_key):
+        return self.index[session_key][2]
+
+    def read_block(self, session_key):
+        offset, length, _ = self.index[session_key]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def read_session(self, session_key):
+        """세션 하나의 이벤트 목록 ('participantId/sessionId')"""
+        return decode_session(self.read_block(session_key), self.strings, self.layouts)
+
+    def iter_sessions(self):
+        with open(self.path, 'rb') as f:
+            for session_key, (offset, length, _) in self.index.items():
+                f.seek(offset)
+                yield session_key, decode_session(f.read(length), self.strings, self.layouts)
+
+
+class ArchiveWriter:
+    def __init__(self, strings=None, layouts=None):
+        self.strings = strings or StringTable()
+        self.layouts = layouts or StringTable()
+        self.blocks = {}
+
+    def add_session(self, session_key, events):
+        events = list(events)
+        self.blocks[session_key] = (encode_session(events, self.strings, self.layouts), len(events))
+
+    def add_block(self, session_key, block, count):
+        self.blocks[session_key] = (block, count)
+
+    def write(self, path):
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        sessions = []
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            for session_key, (block, count) in self.blocks.items():
+                sessions.append([session_key, f.tell(), len(block), count])
+                f.write(block)
+            header = zlib.compress(json.dumps({
+                'strings': self.strings.values,
+                'layouts': [list(keys) for keys in self.layouts.values],
+                'sessions': sessions,
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), COMPRESS_LEVEL)
+            f.write(header)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(MAGIC)
+        tmp_path.replace(path)
+        return path
+
+
+def write_archive(path, sessions, update=False):
+    """
+    (sessionKey, events) 목록을 아카이브로 쓰기.
+
+    update=True이고 아카이브가 이미 있으면 기존 사전을 이어 쓰고,
+    교체되지 않는 세션 블록은 압축을 풀지 않고 그대로 복사합니다.
+    """
+    path = Path(path)
+    writer = ArchiveWriter()
+    sessions = list(sessions)
+    if update and path.exists():
+        existing = EventArchive(path)
+        writer = ArchiveWriter(existing.strings, existing.layouts)
+        replaced = {session_key for session_key, _ in sessions}
+        for session_key in existing.keys():
+            if session_key not in replaced:
+                writer.add_block(session_key, existing.read_block(session_key), existing.event_count(session_key))
+
+    for session_key, events in sessions:
+        writer.add_session(session_key, events)
+    return writer.write(path)
+
+
+def synthetic_session(participant_id, session_id, rng, n_events=400):
+    """벤치마크용 세션 (scroll_action 위주, index.html logEvent와 같은 필드)"""
+    sections = ['Abstract', '1 Introduction', '2 Related Work', '2.1 Reading Behaviour', '3 Method',
+                '3.1 Participants', '4 Results', '5 Discussion', '6 Conclusion']
+    condition = rng.choice(['llm', 'no-llm'])
+    paper = rng.choice(['chi2025-lbw-01', 'chi2025-lbw-02', 'chi2025_lbw-03'])
+    now = 1735000000000 + rng.randrange(10 ** 9)
+    section = sections[0]
+    scroll_y = 0
+    events = []
+    for i in range(n_events):
+        gap = rng.randint(50, 8000)
+        now += gap
+        event = {
+            'eventId': f'{session_id}_{i + 1}',
+            'timestamp': now,
+            'eventType': 'scroll_action',
+            'phase': 'reading',
+            'timeSinceLast': gap,
+            'participantId': participant_id,
+            'sessionId': session_id,
+            'condition': condition,
+            'paper': paper,
+        }
+        roll = rng.random()
+        if roll < 0.85:
+            scroll_y = max(0, scroll_y + rng.randint(-300, 900))
+            after = sections[min(len(sections) - 1, scroll_y // 2500)]
+            pause = rng.randint(100, 20000)
+            event.update({
+                'scrollY': scroll_y,
+                'sectionBeforeScroll': section,
+                'sectionAfterScroll': after,
+                'classification': 'reading' if pause > 5000 else 'scanning' if pause > 1500 else 'scrolling',
+                'pauseDuration': pause,
+                'scrollDuration': rng.randint(0, 1200),
+            })
+            section = after
+        elif roll < 0.95:
+            event.update({
+                'eventType': 'focus_switch',
+                'from': 'reading',
+                'to': 'chat',
+                'timeOnPreviousFocus': rng.randint(1000, 60000),
+                'classification': 'reading',
+                'llmDuration': None,
+            })
+        else:
+            event.update({'eventType': 'text_selection', 'selectedText': f'selected text {rng.randrange(1000)}'})
+        events.append(event)
+    return events
+
+
+def run_benchmark(session_count=200):
+    rng = random.Random(0)
+    sessions = [(f'P{i % 100:03d}/session_{i}', synthetic_session(f'P{i % 100:03d}', f'session_{i}', rng))
+                for i in range(session_count)]
+    event_total = sum(len(events) for _, events in sessions)
+
+    workdir = Path(__file__).parent / 'output'
+    workdir.mkdir(exist_ok=True)
+    json_path = workdir / 'bench_events.json'
+    archive_path = workdir / 'bench_events.evarc'
+
+    json_bytes = json.dumps(dict(sessions), ensure_ascii=False).encode('utf-8')
+    json_path.write_bytes(json_bytes)
+    gzip_size = len(gzip.compress(json_bytes, COMPRESS_LEVEL))
+
+    start = time.perf_counter()
+    write_archive(archive_path, sessions)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded_json = json.loads(json_path.read_bytes())
+    json_decode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    archive = EventArchive(archive_path)
+    decoded = dict(archive.iter_sessions())
+    archive_decode_time = time.perf_counter() - start
+
+    lossless = all(json.dumps(decoded[key]) == json.dumps(events) for key, events in sessions)
+    lossless = lossless and len(decoded) == len(decoded_json)
+
+    probe = sessions[session_count // 2][0]
+    start = time.perf_counter()
+    json.loads(json_path.read_bytes())[probe]
+    json_random_time = time.perf_counter() - start
+    start = time.perf_counter()
+    EventArchive(archive_path).read_session(probe)
+    archive_random_time = time.perf_counter() - start
+
+    archive_size = archive_path.stat().st_size
+    print(f"\n{'='*60}")
+    print(f"Event archive benchmark: {session_count} sessions, {event_total} events")
+    print(f"{'='*60}")
+    print(f"  JSON         {len(json_bytes) / 1024:10.1f} KB")
+    print(f"  JSON + gzip  {gzip_size / 1024:10.1f} KB  ({len(json_bytes) / gzip_size:.1f}x)")
+    print(f"  .evarc       {archive_size / 1024:10.1f} KB  ({len(json_bytes) / archive_size:.1f}x)")
+    print(f"\n  encode                 {encode_time * 1000:8.1f} ms")
+    print(f"  decode all   JSON      {json_decode_time * 1000:8.1f} ms")
+    print(f"  decode all   .evarc    {archive_decode_time * 1000:8.1f} ms")
+    print(f"  one session  JSON      {json_random_time * 1000:8.1f} ms")
+    print(f"  one session  .evarc    {archive_random_time * 1000:8.1f} ms")
+    print(f"\n  lossless round trip: {'✅' if lossless else '❌'}")
+
+    json_path.unlink()
+    archive_path.unlink()
+    return lossless
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('pack', 'unpack', 'bench'):
+        print(__doc__)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    if command == 'bench':
+        session_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+        sys.exit(0 if run_benchmark(session_count) else 1)
+
+    if command == 'pack':
+        from copy_reading_data import get_db
+        from export_sessions import iter_session_events, read_all_sessions
+
+        path = Path(sys.argv[2]) if len(sys.argv) > 2 else Path('./export/events.evarc')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        sessions = read_all_sessions(get_db())
+        write_archive(path, [(f'{participant_id}/{session_id}', iter_session_events(data))
+                             for participant_id, session_id, data in sessions])
+        print(f'✅ 아카이브 저장: {path} ({len(sessions)} sessions, {path.stat().st_size / 1024:.1f} KB)')
+        return
+
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    archive = EventArchive(sys.argv[2])
+    if len(sys.argv) > 3:
+        output = archive.read_session(sys.argv[3])
+    else:
+        output = dict(archive.iter_sessions())
+    json.dump(output, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
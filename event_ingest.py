@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+실험 이벤트 배치 수집 서비스
+읽기 페이지가 이벤트를 묶어서 POST하면
+1) eventId로 중복 제거
+2) 로컬 append-only 로그(ingest_log/events.jsonl)에 기록
+3) 주기적으로 세션별 ArrayUnion 업데이트를 WriteBatch로 묶어 Firestore에 반영
+
+Firestore에는 기존과 같은 구조로 씁니다.
+    reading.events   phase == 'reading' 이고 READING_EVENT_TYPES 인 이벤트 (기존 자동 저장과 동일)
+    events           나머지 이벤트
+전체 배열을 읽고 다시 쓰지 않으므로 쓰기 크기가 배치 크기에 비례합니다.
+반영된 위치는 ingest_log/flushed.offset에 저장되어 재시작 시 이어서 반영합니다.
+세션 문서에도 마지막으로 반영한 로그 위치(ingest.log, ingest.offset)를 같은 쓰기로 기록하므로,
+커밋 후 flushed.offset 저장 전에 중단되어도 재반영 시 reading.totalEvents가 중복 증가하지 않습니다.
+
+사용법:
+    python event_ingest.py [port]
+    (FIRESTORE_EMULATOR_HOST=localhost:8080 설정 시 로컬 에뮬레이터 사용)
+
+요청:
+    POST /events   {"events": [ {eventId, participantId, sessionId, ...}, ... ]}
+                   → {"accepted": n, "duplicates": m}
+                   (JSON이 아니거나 이벤트가 객체가 아니면 400 {"error": ...})
+    GET  /stats    수집/반영 통계
+
+필요한 라이브러리:
+    pip install aiohttp firebase-admin
+"""
+
+import asyncio
+import json
+import os
+import sys
+import uuid
+from pathlib import Path
+
+from aiohttp import web
+from firebase_admin import firestore
+
+from copy_reading_data import get_db
+
+LOG_DIR = Path(__file__).parent / 'ingest_log'
+
+# 이 간격(초)마다 또는 대기 이벤트가 FLUSH_EVENTS개 이상이면 Firestore에 반영
+FLUSH_INTERVAL = 5.0
+FLUSH_EVENTS = 500
+# Firestore WriteBatch 최대 작업 수는 500
+BATCH_SIZE = 400
+
+# index.html의 saveEventsToFirebase와 같은 필터
+READING_EVENT_TYPES = {'scroll_action', 'focus_switch', 'tab_switch', 'llm_activity', 'text_selection'}
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+}
+
+
+def event_key(event):
+    """index.html과 같은 중복 판단 키 (eventId, 없으면 timestamp_eventType)"""
+    return event.get('eventId') or f"{event.get('sessionId')}:{event.get('timestamp')}_{event.get('eventType')}"
+
+
+def is_reading_event(event):
+    return event.get('phase') == 'reading' and event.get('eventType') in READING_EVENT_TYPES
+
+
+class EventLog:
+    """append-only JSONL 로그와 Firestore 반영 위치(byte offset)"""
+
+    def __init__(self, log_dir=LOG_DIR):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.log_dir / 'events.jsonl'
+        self.offset_path = self.log_dir / 'flushed.offset'
+        self.path.touch(exist_ok=True)
+
+        # 세션 문서에 기록하는 로그 식별자 (다른 로그의 offset과 구분)
+        id_path = self.log_dir / 'log.id'
+        if not id_path.exists():
+            id_path.write_text(uuid.uuid4().hex)
+        self.log_id = id_path.read_text().strip()
+
+    def append(self, events):
+        """이벤트를 기록하고 각 이벤트의 끝 offset 목록 반환"""
+        lines = [(json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8') for event in events]
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            for line in lines:
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        ends = []
+        for line in lines:
+            offset += len(line)
+            ends.append(offset)
+        return ends
+
+    def read_from(self, offset=0):
+        """offset 이후의 (끝 offset, 이벤트) 목록과 파일 끝 offset"""
+        entries = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if line.endswith(b'\n'):
+                    offset += len(line)
+                    entries.append((offset, json.loads(line)))
+        return entries, offset
+
+    def flushed_offset(self):
+        if not self.offset_path.exists():
+            return 0
+        return int(self.offset_path.read_text().strip() or 0)
+
+    def mark_flushed(self, offset):
+        tmp_path = self.offset_path.with_suffix('.tmp')
+        tmp_path.write_text(str(offset))
+        tmp_path.replace(self.offset_path)
+
+
+def session_path(event):
+    participant_id, session_id = event.get('participantId'), event.get('sessionId')
+    if not participant_id or not session_id:
+        return None
+    return f'users/{participant_id}/experiments/{session_id}'
+
+
+def session_updates(entries, log_id, applied=None):
+    """
+    (끝 offset, 이벤트) 목록을 세션별 ArrayUnion 업데이트로 묶기: [(document_path, update_dict)]
+
+    applied: 문서별로 이미 반영된 이 로그의 offset. 그 이하의 이벤트는 건너뛰어
+    재반영 시 reading.totalEvents를 다시 증가시키지 않음
+    """
+    applied = applied or {}
+    grouped = {}
+    for offset, event in entries:
+        path = session_path(event)
+        if path is None or offset <= applied.get(path, 0):
+            continue
+        reading, other, end = grouped.setdefault(path, ([], [], [0]))
+        (reading if is_reading_event(event) else other).append(event)
+        end[0] = max(end[0], offset)
+
+    updates = []
+    for path, (reading, other, end) in grouped.items():
+        update = {'ingest.log': log_id, 'ingest.offset': end[0]}
+        if reading:
+            reading.sort(key=lambda e: e.get('timestamp') or 0)
+            update['reading.events'] = firestore.ArrayUnion(reading)
+            update['reading.totalEvents'] = firestore.Increment(len(reading))
+            update['reading.lastAutoSave'] = firestore.SERVER_TIMESTAMP
+        if other:
+            update['events'] = firestore.ArrayUnion(other)
+        updates.append((path, update))
+    return updates
+
+
+class IngestService:
+    def __init__(self, db=None, log=None, flush_interval=FLUSH_INTERVAL):
+        self.db = db
+        self.log = log or EventLog()
+        self.flush_interval = flush_interval
+        self.seen = set()
+        self.pending = []
+        # 이전 반영이 커밋 후 중단되었을 수 있으면 문서의 ingest.offset을 확인
+        self.verify = False
+        self.flush_lock = asyncio.Lock()
+        self.flusher = None
+        self.tasks = set()
+        self.stats = {'received': 0, 'accepted': 0, 'duplicates': 0, 'flushed': 0, 'commits': 0, 'flush_errors': 0,
+                      'bad_requests': 0}
+
+    def recover(self):
+        """로그에서 중복 판단용 키를 복원하고, 아직 반영되지 않은 이벤트를 대기열에 넣기"""
+        flushed = self.log.flushed_offset()
+        entries, _ = self.log.read_from(0)
+        self.seen = {event_key(event) for _, event in entries}
+        self.pending = [entry for entry in entries if entry[0] > flushed]
+        self.verify = bool(self.pending)
+        print(f'✓ 로그 복원: 이벤트 {len(self.seen)}개, 미반영 {len(self.pending)}개')
+
+    async def start(self, app):
+        self.db = self.db or get_db()
+        self.recover()
+        self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self, app):
+        if self.flusher:
+            self.flusher.cancel()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.flush()
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post('/events', self.handle_events)
+        app.router.add_route('OPTIONS', '/events', self.handle_options)
+        app.router.add_get('/stats', self.handle_stats)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+    async def handle_options(self, request):
+        return web.Response(headers=CORS_HEADERS)
+
+    async def handle_stats(self, request):
+        return web.json_response({**self.stats, 'pending': len(self.pending)}, headers=CORS_HEADERS)
+
+    def bad_request(self, message):
+        self.stats['bad_requests'] += 1
+        return web.json_response({'error': message}, status=400, headers=CORS_HEADERS)
+
+    async def handle_events(self, request):
+        # sendBeacon은 text/plain으로 보내므로 content-type에 의존하지 않음
+        try:
+            payload = json.loads(await request.text())
+        except ValueError:
+            return self.bad_request('요청 본문이 JSON이 아닙니다')
+        events = payload.get('events', []) if isinstance(payload, dict) else payload
+        if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+            return self.bad_request('events는 이벤트 객체의 배열이어야 합니다')
+        self.stats['received'] += len(events)
+
+        accepted = []
+        keys = set()
+        for event in events:
+            key = event_key(event)
+            if key in self.seen or key in keys:
+                continue
+            keys.add(key)
+            accepted.append(event)
+
+        if accepted:
+            self.pending.extend(zip(self.log.append(accepted), accepted))
+            # 로그 기록이 성공한 뒤에만 등록해야 기록 실패 시 재전송이 중복으로 버려지지 않음
+            self.seen.update(keys)
+        self.stats['accepted'] += len(accepted)
+        self.stats['duplicates'] += len(events) - len(accepted)
+
+        if len(self.pending) >= FLUSH_EVENTS:
+            # 태스크 참조를 유지해야 완료 전에 가비지 컬렉션되지 않음
+            task = asyncio.create_task(self.flush())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        return web.json_response({'accepted': len(accepted), 'duplicates': len(events) - len(accepted)},
+                                 headers=CORS_HEADERS)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """대기 이벤트를 세션별로 묶어 WriteBatch로 커밋하고 반영 위치 저장"""
+        async with self.flush_lock:
+            if not self.pending:
+                return 0
+            entries = self.pending
+            self.pending = []
+
+            try:
+                applied = await asyncio.to_thread(self._applied_offsets, entries) if self.verify else {}
+                updates = session_updates(entries, self.log.log_id, applied)
+                await asyncio.to_thread(self._commit, updates)
+            except Exception as e:
+                # 실패하면 대기열 앞에 되돌려 두고 다음 주기에 재시도
+                # (일부 배치만 커밋되었을 수 있으므로 재시도 전에 문서 offset 확인)
+                self.pending = entries + self.pending
+                self.verify = True
+                self.stats['flush_errors'] += 1
+                print(f'❌ Firestore 반영 실패: {e}')
+                return 0
+
+            self.log.mark_flushed(entries[-1][0])
+            self.verify = False
+            self.stats['flushed'] += len(entries)
+            return len(entries)
+
+    def _applied_offsets(self, entries):
+        """대기 이벤트가 속한 세션 문서에 이 로그가 이미 반영한 offset: {document_path: offset}"""
+        paths = {path for path in (session_path(event) for _, event in entries) if path}
+        applied = {}
+        refs = [self.db.document(path) for path in sorted(paths)]
+        for snapshot in self.db.get_all(refs, field_paths=['ingest']):
+            ingest = (snapshot.to_dict() or {}).get('ingest') if snapshot.exists else None
+            if ingest and ingest.get('log') == self.log.log_id:
+                applied[snapshot.reference.path] = ingest.get('offset', 0)
+        return applied
+
+    def _commit(self, updates):
+        for i in range(0, len(updates), BATCH_SIZE):
+            batch = self.db.batch()
+            for path, update in updates[i:i + BATCH_SIZE]:
+                # set(merge=True): 세션 문서가 아직 없어도 생성
+                batch.set(self.db.document(path), nested(update), merge=True)
+            batch.commit()
+            self.stats['commits'] += 1
+
+
+def nested(update):
+    """'reading.events' 같은 점 경로를 set(merge=True)용 중첩 dict로 변환"""
+    result = {}
+    for path, value in update.items():
+        target = result
+        *parents, leaf = path.split('.')
+        for key in parents:
+            target = target.setdefault(key, {})
+        target[leaf] = value
+    return result
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8788
+    service = IngestService()
+    print(f'📥 Event ingest: http://localhost:{port}/events (log: {service.log.path})')
+    web.run_app(service.make_app(), port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Firebase 실험 세션을 Parquet 테이블로 내보내기
+users/{participantId}/experiments/{sessionId} 문서를 읽어
+이벤트 배열을 이벤트 타입별 컬럼 테이블로 펼칩니다.
+
+사용법:
+    python export_sessions.py [output_dir] [--full] [--archive]
+
+출력 (output_dir, 기본값 ./export):
+    sessions.parquet              세션당 1행 (조건, 논문, 읽기/퀴즈 요약)
+    events_<eventType>.parquet    이벤트 타입별 테이블 (scroll_action, focus_switch, ...)
+    events_other.parquet          스키마가 없는 이벤트 타입 (나머지 필드는 extra에 JSON)
+    llm_messages.parquet          llmInteraction.messages
+    quiz_answers.parquet          세션별 최종 퀴즈 응답
+    _watermark.json               증분 내보내기 기준 (serverTimestamp 최대값)
+    events.evarc                  --archive: 세션별 원본 이벤트 바이너리 아카이브 (event_archive.py)
+
+증분 내보내기:
+    _watermark.json이 있으면 WATERMARK_FIELDS 중 하나라도 기준 이후로 바뀐 세션만
+    collection group 쿼리로 다시 읽고, 해당 세션의 행만 교체합니다.
+    (experiments 컬렉션 그룹에 대한 단일 필드 인덱스가 필요합니다)
+    --full 옵션으로 전체를 다시 내보낼 수 있습니다.
+"""
+
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from copy_reading_data import get_db
+from event_archive import write_archive
+
+USERS_PAGE_SIZE = 200
+READ_WORKERS = 8
+
+# serverTimestamp()로 기록되는 필드 (README의 Firestore 구조 참고)
+WATERMARK_FIELDS = [
+    'reading.lastAutoSave',
+    'reading.completedAt',
+    'quiz.submittedAt',
+    'review.submittedAt',
+    'completedAt',
+]
+
+# logEvent()가 모든 이벤트에 넣는 공통 필드
+COMMON_COLUMNS = {
+    'sessionKey': 'string',
+    'eventId': 'string',
+    'timestamp': 'Int64',
+    'eventType': 'string',
+    'phase': 'string',
+    'timeSinceLast': 'Float64',
+    'participantId': 'string',
+    'sessionId': 'string',
+    'condition': 'string',
+    'paper': 'string',
+}
+
+# 이벤트 타입별 추가 필드 (index.html의 logEvent 호출 참고)
+EVENT_COLUMNS = {
+    'scroll_action': {
+        'scrollY': 'Float64',
+        'sectionBeforeScroll': 'string',
+        'sectionAfterScroll': 'string',
+        'classification': 'string',
+        'pauseDuration': 'Float64',
+        'scrollDuration': 'Float64',
+        'isFocusSwitch': 'boolean',
+        'isTabSwitch': 'boolean',
+        'isFinalSegment': 'boolean',
+    },
+    'focus_switch': {
+        'from': 'string',
+        'to': 'string',
+        'timeOnPreviousFocus': 'Float64',
+        'classification': 'string',
+        'llmDuration': 'Float64',
+        'isFinalSegment': 'boolean',
+    },
+    'tab_switch': {
+        'from': 'string',
+        'to': 'string',
+        'timeOnPreviousTab': 'Float64',
+    },
+    'llm_activity': {
+        'classification': 'string',
+        'duration': 'Float64',
+        'isFocusSwitch': 'boolean',
+    },
+    'text_selection': {
+        'selectedText': 'string',
+    },
+    'llm_question_asked': {
+        'question': 'string',
+    },
+    'llm_question_asked_with_files': {
+        'question': 'string',
+        'fileCount': 'Int64',
+    },
+    'llm_answer_received': {
+        'question': 'string',
+        'answer': 'string',
+        'responseTime': 'Float64',
+    },
+    'paper_pdf_attached': {
+        'paperId': 'string',
+        'pdfUrl': 'string',
+    },
+    'quiz_answer': {
+        'questionId': 'string',
+        'answer': 'string',
+    },
+}
+
+SESSION_COLUMNS = {
+    'sessionKey': 'string',
+    'participantId': 'string',
+    'sessionId': 'string',
+    'condition': 'string',
+    'paper': 'string',
+    'status': 'string',
+    'startedAt': 'datetime64[ns, UTC]',
+    'completedAt': 'datetime64[ns, UTC]',
+    'readingDuration': 'Float64',
+    'focusReading': 'Float64',
+    'focusChat': 'Float64',
+    'quizDuration': 'Float64',
+    'accuracy': 'Float64',
+    'eventCount': 'Int64',
+    'updatedAt': 'datetime64[ns, UTC]',
+}
+
+LLM_MESSAGE_COLUMNS = {
+    'sessionKey': 'string',
+    'question': 'string',
+    'questionTime': 'Int64',
+    'answer': 'string',
+    'answerTime': 'Int64',
+    'responseTime': 'Float64',
+}
+
+QUIZ_ANSWER_COLUMNS = {
+    'sessionKey': 'string',
+    'participantId': 'string',
+    'paper': 'string',
+    'condition': 'string',
+    'questionId': 'string',
+    'answer': 'string',
+}
+
+# quiz 맵에서 응답이 아닌 키 (quiz.answers -> quiz 로 평탄화된 문서 대응)
+QUIZ_META_KEYS = {'answers', 'duration', 'submittedAt'}
+
+
+def get_path(data, dotted):
+    """'reading.completedAt' 같은 경로로 중첩 필드 읽기"""
+    value = data
+    for key in dotted.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def to_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+def session_updated_at(data):
+    """세션 문서의 serverTimestamp 필드 중 가장 최근 값"""
+    stamps = [to_datetime(get_path(data, field)) for field in WATERMARK_FIELDS]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+def quiz_answers_of(data):
+    quiz = data.get('quiz') or {}
+    if isinstance(quiz.get('answers'), dict):
+        return quiz['answers']
+    return {key: value for key, value in quiz.items() if key not in QUIZ_META_KEYS}
+
+
+def iter_session_events(data):
+    """세션 문서 안의 이벤트 배열 (reading.events, 전체 내보내기의 events)"""
+    seen = set()
+    for events in (get_path(data, 'reading.events'), data.get('events')):
+        for event in events or []:
+            key = event.get('eventId') or f"{event.get('timestamp')}_{event.get('eventType')}"
+            if key in seen:
+                continue
+            seen.add(key)
+            yield event
+
+
+def flatten_session(participant_id, session_id, data):
+    """세션 문서 하나를 테이블별 행 목록으로 변환"""
+    session_key = f'{participant_id}/{session_id}'
+    focus_times = get_path(data, 'reading.focusTimes') or {}
+    quiz_duration = get_path(data, 'quiz.duration')
+    rows = {'sessions': [], 'llm_messages': [], 'quiz_answers': []}
+
+    event_count = 0
+    for event in iter_session_events(data):
+        event_type = event.get('eventType') or 'unknown'
+        table = f'events_{event_type}' if event_type in EVENT_COLUMNS else 'events_other'
+        typed = EVENT_COLUMNS.get(event_type, {})
+
+        row = {column: event.get(column) for column in COMMON_COLUMNS}
+        row['sessionKey'] = session_key
+        row['participantId'] = row['participantId'] or participant_id
+        row['sessionId'] = row['sessionId'] or session_id
+        row.update({column: event.get(column) for column in typed})
+        if table == 'events_other':
+            extra = {key: value for key, value in event.items() if key not in COMMON_COLUMNS}
+            row['extra'] = json.dumps(extra, ensure_ascii=False, default=str)
+
+        rows.setdefault(table, []).append(row)
+        event_count += 1
+
+    for message in get_path(data, 'llmInteraction.messages') or []:
+        rows['llm_messages'].append({
+            'sessionKey': session_key,
+            **{column: message.get(column) for column in LLM_MESSAGE_COLUMNS if column != 'sessionKey'},
+        })
+
+    for question_id, answer in quiz_answers_of(data).items():
+        rows['quiz_answers'].append({
+            'sessionKey': session_key,
+            'participantId': participant_id,
+            'paper': data.get('paper'),
+            'condition': data.get('condition'),
+            'questionId': str(question_id),
+            'answer': answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False),
+        })
+
+    rows['sessions'].append({
+        'sessionKey': session_key,
+        'participantId': participant_id,
+        'sessionId': session_id,
+        'condition': data.get('condition'),
+        'paper': data.get('paper'),
+        'status': data.get('status'),
+        'startedAt': to_datetime(data.get('startedAt')),
+        'completedAt': to_datetime(data.get('completedAt')),
+        'readingDuration': get_path(data, 'reading.duration'),
+        'focusReading': focus_times.get('reading'),
+        'focusChat': focus_times.get('chat'),
+        'quizDuration': quiz_duration if isinstance(quiz_duration, (int, float)) else None,
+        'accuracy': data.get('accuracy'),
+        'eventCount': event_count,
+        'updatedAt': session_updated_at(data),
+    })
+
+    return rows
+
+
+def table_schema(table):
+    if table == 'sessions':
+        return SESSION_COLUMNS
+    if table == 'llm_messages':
+        return LLM_MESSAGE_COLUMNS
+    if table == 'quiz_answers':
+        return QUIZ_ANSWER_COLUMNS
+    if table == 'events_other':
+        return {**COMMON_COLUMNS, 'extra': 'string'}
+    return {**COMMON_COLUMNS, **EVENT_COLUMNS[table[len('events_'):]]}
+
+
+def build_frame(table, rows):
+    """행 목록을 스키마에 맞는 타입의 DataFrame으로 변환"""
+    schema = table_schema(table)
+    frame = pd.DataFrame(rows, columns=list(schema))
+    for column, dtype in schema.items():
+        if dtype.startswith('datetime64'):
+            frame[column] = pd.to_datetime(frame[column], utc=True)
+        elif dtype in ('Int64', 'Float64'):
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype(dtype)
+        else:
+            frame[column] = frame[column].astype(dtype)
+    return frame
+
+
+def read_all_sessions(db):
+    """users를 페이지 단위로 읽고, 사용자별 experiments를 제한된 동시성으로 읽기"""
+
+    def read_experiments(user_doc):
+        return [(user_doc.id, exp.id, exp.to_dict()) for exp in user_doc.reference.collection('experiments').stream()]
+
+    sessions = []
+    last_user = None
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        while True:
+            query = db.collection('users').order_by('__name__').limit(USERS_PAGE_SIZE)
+            if last_user is not None:
+                query = query.start_after(last_user)
+            page = list(query.stream())
+            if not page:
+                break
+
+            for user_sessions in pool.map(read_experiments, page):
+                sessions.extend(user_sessions)
+            print(f'  ✓ users {len(page)}명 / 누적 세션 {len(sessions)}개')
+
+            last_user = page[-1]
+            if len(page) < USERS_PAGE_SIZE:
+                break
+    return sessions
+
+
+def read_changed_sessions(db, watermark):
+    """watermark 이후 serverTimestamp가 바뀐 세션만 collection group 쿼리로 읽기"""
+
+    def query_field(field):
+        query = db.collection_group('experiments').where(field, '>', watermark)
+        return [(doc.reference.parent.parent.id, doc.id, doc.to_dict()) for doc in query.stream()]
+
+    changed = {}
+    with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(WATERMARK_FIELDS))) as pool:
+        for results in pool.map(query_field, WATERMARK_FIELDS):
+            for participant_id, session_id, data in results:
+                changed[(participant_id, session_id)] = data
+    return [(participant_id, session_id, data) for (participant_id, session_id), data in changed.items()]
+
+
+def load_watermark(output_dir):
+    path = output_dir / '_watermark.json'
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        value = json.load(f).get('watermark')
+    return datetime.fromisoformat(value) if value else None
+
+
+def save_watermark(output_dir, watermark, session_count):
+    with open(output_dir / '_watermark.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'watermark': watermark.isoformat() if watermark else None,
+            'exportedAt': datetime.now(timezone.utc).isoformat(),
+            'sessions': session_count,
+        }, f, indent=2)
+
+
+def write_tables(output_dir, rows_by_table, replaced_keys):
+    """테이블별 Parquet 쓰기. 증분이면 바뀐 세션의 기존 행만 교체"""
+    tables = set(rows_by_table) | {path.stem for path in output_dir.glob('*.parquet')}
+    for table in sorted(tables):
+        new_frame = build_frame(table, rows_by_table.get(table, []))
+        path = output_dir / f'{table}.parquet'
+
+        if replaced_keys is not None and path.exists():
+            old_frame = pd.read_parquet(path)
+            old_frame = old_frame[~old_frame['sessionKey'].isin(replaced_keys)]
+            new_frame = pd.concat([old_frame, new_frame], ignore_index=True) if len(new_frame) else old_frame
+
+        new_frame.to_parquet(path, index=False)
+        print(f'  ✓ {table}.parquet ({len(new_frame)} rows)')
+
+
+def export_sessions(output_dir, full=False, db=None, archive=False):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    db = db or get_db()
+
+    watermark = None if full else load_watermark(output_dir)
+
+    print('📦 세션 내보내기 시작...')
+    if watermark:
+        print(f'증분 모드: {watermark.isoformat()} 이후 변경된 세션')
+        sessions = read_changed_sessions(db, watermark)
+    else:
+        print('전체 모드')
+        sessions = read_all_sessions(db)
+    print(f'✓ 세션 {len(sessions)}개 읽기 완료')
+
+    rows_by_table = {}
+    new_watermark = watermark
+    for participant_id, session_id, data in sessions:
+        for table, rows in flatten_session(participant_id, session_id, data).items():
+            rows_by_table.setdefault(table, []).extend(rows)
+        updated_at = session_updated_at(data)
+        if updated_at and (new_watermark is None or updated_at > new_watermark):
+            new_watermark = updated_at
+
+    replaced_keys = None
+    if watermark:
+        replaced_keys = {f'{participant_id}/{session_id}' for participant_id, session_id, _ in sessions}
+
+    write_tables(output_dir, rows_by_table, replaced_keys)
+    if archive:
+        archive_path = write_archive(
+            output_dir / 'events.evarc',
+            [(f'{participant_id}/{session_id}', iter_session_events(data)) for participant_id, session_id, data in sessions],
+            update=watermark is not None,
+        )
+        print(f'  ✓ events.evarc ({archive_path.stat().st_size / 1024:.1f} KB)')
+    save_watermark(output_dir, new_watermark, len(sessions))
+
+    print(f'🎉 내보내기 완료: {output_dir}')
+    return rows_by_table
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    full = '--full' in sys.argv[1:]
+    archive = '--archive' in sys.argv[1:]
+    output_dir = Path(args[0]) if args else Path('./export')
+    export_sessions(output_dir, full=full, archive=archive)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+텍스트 선택 / LLM 답변 인용 → 논문 문단 위치 찾기
+논문별로 정규화된 문단 텍스트(parse_acm_html 결과)의 단어 단위 suffix array를 만들어 두고
+text_selection의 selectedText, llm_answer_received의 answer 속 인용을 문단/섹션에 매핑합니다.
+
+정규화:
+    소문자, 따옴표/대시 통일 후 단어(\\w+)만 사용 → 공백, 줄바꿈, 문장부호 차이는 무시
+    선택 영역의 첫/마지막 단어가 잘려 있어도 (예: "ading behaviour of partic") 찾습니다.
+
+사용법:
+    python grounding_index.py build [paper_id ...]               # grounding_index/<paper_id>.npz
+    python grounding_index.py query <paper_id> "<text>"
+    python grounding_index.py annotate [export_dir]              # <export_dir>/grounding/*.parquet
+
+출력 (annotate):
+    events_text_selection.parquet        paragraphId, paragraphEnd, section, topSection, matchType, matchCount
+    events_llm_answer_received.parquet   groundedParagraphs, groundedSections (JSON 배열), groundedWords
+"""
+
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from export_sessions import build_frame
+from paper_content import PROJECT_DIR, iter_paragraphs, list_paper_ids, load_paper_content, normalize_text
+
+INDEX_DIR = PROJECT_DIR / 'grounding_index'
+
+# 이보다 짧은 답변 속 인용은 무시 (흔한 구절 오탐 방지)
+MIN_QUOTE_WORDS = 4
+# 답변에서 따옴표 없이 그대로 옮겨 온 구간을 찾을 때의 최소 길이
+MIN_VERBATIM_WORDS = 8
+
+QUOTE_PATTERN = re.compile(r'"([^"]+)"|“([^”]+)”|^>\s?(.+)$', re.M)
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return WORD_PATTERN.findall(normalize_text(text))
+
+
+def suffix_array(ids):
+    """정수 배열의 suffix array (prefix doubling, O(n log^2 n))"""
+    n = len(ids)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32)
+    rank = ids.astype(np.int64)
+    k = 1
+    while True:
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+        order = np.lexsort((second, rank))
+        first_sorted, second_sorted = rank[order], second[order]
+        changed = np.empty(n, dtype=bool)
+        changed[0] = True
+        changed[1:] = (first_sorted[1:] != first_sorted[:-1]) | (second_sorted[1:] != second_sorted[:-1])
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.cumsum(changed) - 1
+        if rank[order[-1]] == n - 1 or k >= n:
+            return order.astype(np.int32)
+        k *= 2
+
+
+class GroundingIndex:
+    """논문 하나의 단어 suffix array와 단어 위치 → 문단 매핑"""
+
+    def __init__(self, paper_id, words, ids, sa, paragraph_starts, paragraphs):
+        self.paper_id = paper_id
+        self.words = words
+        self.word_ids = {word: i for i, word in enumerate(words)}
+        self.ids = ids
+        self.sa = sa
+        self.paragraph_starts = paragraph_starts
+        self.paragraphs = paragraphs
+
+    @classmethod
+    def build(cls, paper_id, project_dir=PROJECT_DIR):
+        content = load_paper_content(paper_id, project_dir)['content']
+        words, word_ids = [], {}
+        ids, starts, paragraphs = [], [], []
+        for paragraph_index, section, top_section, text in iter_paragraphs(content):
+            starts.append(len(ids))
+            paragraphs.append([section, top_section])
+            for token in tokenize(text):
+                if token not in word_ids:
+                    word_ids[token] = len(words)
+                    words.append(token)
+                ids.append(word_ids[token])
+        ids = np.asarray(ids, dtype=np.int32)
+        return cls(paper_id, words, ids, suffix_array(ids), np.asarray(starts, dtype=np.int32), paragraphs)
+
+    def save(self, index_dir=INDEX_DIR):
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        np.savez(index_dir / f'{self.paper_id}.npz', ids=self.ids, sa=self.sa, paragraph_starts=self.paragraph_starts,
+                 meta=np.frombuffer(json.dumps({'words': self.words, 'paragraphs': self.paragraphs},
+                                               ensure_ascii=False).encode('utf-8'), dtype=np.uint8))
+
+    @classmethod
+    def load(cls, paper_id, index_dir=INDEX_DIR):
+        with np.load(Path(index_dir) / f'{paper_id}.npz') as data:
+            meta = json.loads(data['meta'].tobytes())
+            return cls(paper_id, meta['words'], data['ids'], data['sa'], data['paragraph_starts'], meta['paragraphs'])
+
+    def _bound(self, query, upper):
+        """query로 시작하는 suffix 범위의 경계 (upper=False: 첫 위치, True: 마지막 다음)"""
+        lo, hi = 0, len(self.sa)
+        m = len(query)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = int(self.sa[mid])
+            prefix = self.ids[start:start + m].tolist()
+            if prefix < query or (upper and prefix == query):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, query_ids):
+        """단어 번호 목록이 나오는 모든 시작 위치 (정렬됨)"""
+        if not query_ids:
+            return []
+        lo = self._bound(query_ids, upper=False)
+        hi = self._bound(query_ids, upper=True)
+        return sorted(self.sa[lo:hi].tolist())
+
+    def locate_tokens(self, tokens):
+        """
+        토큰 목록의 위치 찾기. 전체가 없으면 잘린 첫/마지막 단어를 접두/접미사로만 비교.
+
+        Returns:
+            (match_type, [(start, end), ...]) — 단어 위치 구간, 없으면 (None, [])
+        """
+        if not tokens:
+            return None, []
+        attempts = [(0, 0)]
+        if len(tokens) >= 2:
+            attempts += [(1, 0), (0, 1)]
+        if len(tokens) >= 3:
+            attempts.append((1, 1))
+
+        for drop_first, drop_last in attempts:
+            core = tokens[drop_first:len(tokens) - drop_last]
+            if any(token not in self.word_ids for token in core):
+                continue
+            matches = []
+            for start in self.find([self.word_ids[token] for token in core]):
+                end = start + len(core)
+                if drop_first:
+                    if start == 0 or not self.words[self.ids[start - 1]].endswith(tokens[0]):
+                        continue
+                    start -= 1
+                if drop_last:
+                    if end >= len(self.ids) or not self.words[self.ids[end]].startswith(tokens[-1]):
+                        continue
+                    end += 1
+                matches.append((start, end))
+            if matches:
+                return ('exact' if not (drop_first or drop_last) else 'partial'), matches
+        return None, []
+
+    def locate(self, text):
+        return self.locate_tokens(tokenize(text))
+
+    def paragraph_of(self, position):
+        return int(np.searchsorted(self.paragraph_starts, position, side='right') - 1)
+
+    def verbatim_spans(self, tokens, min_words=MIN_VERBATIM_WORDS):
+        """tokens 중 논문에 그대로 나오는 min_words 이상 구간들: [(token_start, paper_start, length)]"""
+        spans = []
+        i = 0
+        while i + min_words <= len(tokens):
+            window = tokens[i:i + min_words]
+            if any(token not in self.word_ids for token in window):
+                i += 1
+                continue
+            starts = self.find([self.word_ids[token] for token in window])
+            if not starts:
+                i += 1
+                continue
+            best_start, best_length = starts[0], min_words
+            for start in starts:
+                length = min_words
+                while (i + length < len(tokens) and start + length < len(self.ids)
+                       and self.words[self.ids[start + length]] == tokens[i + length]):
+                    length += 1
+                if length > best_length:
+                    best_start, best_length = start, length
+            spans.append((i, best_start, best_length))
+            i += best_length
+        return spans
+
+    def ground_answer(self, answer):
+        """답변 속 인용("..." / “...” / > 인용문)과 그대로 옮긴 구간이 나오는 문단 번호 (등장 순서)"""
+        tokens = tokenize(answer)
+        paragraphs = []
+        grounded_words = 0
+
+        for match in QUOTE_PATTERN.finditer(answer):
+            quote_tokens = tokenize(next(group for group in match.groups() if group))
+            if len(quote_tokens) < MIN_QUOTE_WORDS:
+                continue
+            match_type, matches = self.locate_tokens(quote_tokens)
+            if matches:
+                grounded_words += len(quote_tokens)
+                paragraphs.append(self.paragraph_of(matches[0][0]))
+
+        for _, start, length in self.verbatim_spans(tokens):
+            paragraph = self.paragraph_of(start)
+            if paragraph not in paragraphs:
+                grounded_words += length
+            paragraphs.append(paragraph)
+
+        return list(dict.fromkeys(paragraphs)), grounded_words
+
+
+class GroundingIndexes:
+    """논문별 인덱스 캐시 (저장된 인덱스가 없으면 바로 만들기)"""
+
+    def __init__(self, index_dir=INDEX_DIR, project_dir=PROJECT_DIR):
+        self.index_dir = Path(index_dir)
+        self.project_dir = Path(project_dir)
+        self.indexes = {}
+
+    def get(self, paper_id):
+        if paper_id not in self.indexes:
+            index = None
+            if (self.index_dir / f'{paper_id}.npz').exists():
+                index = GroundingIndex.load(paper_id, self.index_dir)
+            elif paper_id and (self.project_dir / 'papers_json' / f'{paper_id}.json').exists():
+                index = GroundingIndex.build(paper_id, self.project_dir)
+            self.indexes[paper_id] = index
+        return self.indexes[paper_id]
+
+
+def annotate_selections(indexes, events):
+    """events_text_selection에 문단/섹션 컬럼 추가"""
+    events = events.copy()
+    columns = {name: [] for name in ['paragraphId', 'paragraphEnd', 'section', 'topSection', 'matchType', 'matchCount']}
+    for paper, text in zip(events['paper'].tolist(), events['selectedText'].tolist()):
+        index = indexes.get(paper) if isinstance(paper, str) else None
+        match_type, matches = index.locate(text) if index is not None and isinstance(text, str) else (None, [])
+        if matches:
+            start, end = matches[0]
+            first = index.paragraph_of(start)
+            section, top_section = index.paragraphs[first]
+            row = [first, index.paragraph_of(end - 1), section, top_section,
+                   match_type if len(matches) == 1 else 'ambiguous', len(matches)]
+        else:
+            row = [None, None, None, None, None, 0]
+        for name, value in zip(columns, row):
+            columns[name].append(value)
+
+    for name in ['paragraphId', 'paragraphEnd', 'matchCount']:
+        events[name] = pd.array(columns[name], dtype='Int64')
+    for name in ['section', 'topSection', 'matchType']:
+        events[name] = pd.array(columns[name], dtype='string')
+    return events
+
+
+def annotate_answers(indexes, events):
+    """events_llm_answer_received에 근거 문단/섹션 컬럼 추가"""
+    events = events.copy()
+    grounded_paragraphs, grounded_sections, grounded_words = [], [], []
+    for paper, answer in zip(events['paper'].tolist(), events['answer'].tolist()):
+        index = indexes.get(paper) if isinstance(paper, str) else None
+        paragraphs, words = index.ground_answer(answer) if index is not None and isinstance(answer, str) else ([], 0)
+        sections = list(dict.fromkeys(index.paragraphs[p][1] for p in paragraphs)) if paragraphs else []
+        grounded_paragraphs.append(json.dumps(paragraphs))
+        grounded_sections.append(json.dumps(sections, ensure_ascii=False))
+        grounded_words.append(words)
+
+    events['groundedParagraphs'] = pd.array(grounded_paragraphs, dtype='string')
+    events['groundedSections'] = pd.array(grounded_sections, dtype='string')
+    events['groundedWords'] = pd.array(grounded_words, dtype='Int64')
+    return events
+
+
+def load_table(export_dir, table):
+    path = Path(export_dir) / f'{table}.parquet'
+    return pd.read_parquet(path) if path.exists() else build_frame(table, [])
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'query', 'annotate'):
+        print(__doc__)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    if command == 'build':
+        for paper_id in sys.argv[2:] or list_paper_ids():
+            start = time.perf_counter()
+            index = GroundingIndex.build(paper_id)
+            index.save()
+            print(f'✓ {paper_id}: 단어 {len(index.ids)}개, 문단 {len(index.paragraphs)}개 '
+                  f'({(time.perf_counter() - start) * 1000:.0f} ms)')
+        print(f'\n✅ 인덱스 저장: {INDEX_DIR}')
+        return
+
+    if command == 'query':
+        if len(sys.argv) < 4:
+            print(__doc__)
+            sys.exit(1)
+        index = GroundingIndexes().get(sys.argv[2])
+        if index is None:
+            print(f'❌ 논문을 찾을 수 없습니다: {sys.argv[2]}')
+            sys.exit(1)
+        start = time.perf_counter()
+        match_type, matches = index.locate(sys.argv[3])
+        elapsed = (time.perf_counter() - start) * 1000
+        if not matches:
+            print('❌ 일치하는 위치가 없습니다')
+        for position, end in matches:
+            paragraph = index.paragraph_of(position)
+            print(f'[{match_type}] 문단 {paragraph} ({index.paragraphs[paragraph][0]}): '
+                  f"{' '.join(index.words[i] for i in index.ids[position:end][:20])}")
+        print(f'\n⏱️  {elapsed:.3f} ms')
+        return
+
+    export_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else Path('./export')
+    indexes = GroundingIndexes()
+    output_dir = export_dir / 'grounding'
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print('📍 텍스트 선택 / 답변 근거 위치 매핑...')
+    selections = load_table(export_dir, 'events_text_selection')
+    if not selections.empty:
+        annotated = annotate_selections(indexes, selections)
+        annotated.to_parquet(output_dir / 'events_text_selection.parquet', index=False)
+        found = annotated['matchCount'].gt(0).sum()
+        print(f'  ✓ events_text_selection.parquet ({len(annotated)} rows, 매핑 {found}개)')
+
+    answers = load_table(export_dir, 'events_llm_answer_received')
+    if not answers.empty:
+        annotated = annotate_answers(indexes, answers)
+        annotated.to_parquet(output_dir / 'events_llm_answer_received.parquet', index=False)
+        found = (annotated['groundedParagraphs'] != '[]').sum()
+        print(f'  ✓ events_llm_answer_received.parquet ({len(annotated)} rows, 근거 있음 {found}개)')
+
+    print(f'\n🎉 완료: {output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Pipeline Instrumentation
+========================
+Nested timing spans, counters and a quiet mode shared by the pipeline tools
+(paper_similarity, tools/parse_acm_html, tools/scrape_acm, tools/convert_paper,
+tools/generate_papers_data), so slow stages in a big batch show up without
+reading through the emoji progress output.
+
+    from instrumentation import configure, count, span
+
+    configure()                          # consumes --quiet / --trace= / --metrics= from sys.argv
+    with span('embed', papers=n):
+        ...
+        count('tokens_embedded', n_tokens)
+
+    @span('extract_pdf')
+    def extract(...): ...
+
+Spans become Chrome-trace complete events (open the --trace file in
+chrome://tracing or https://ui.perfetto.dev); spans and counters are also
+aggregated into a metrics dump written as JSON, or as Prometheus text when the
+--metrics path ends in .prom.
+
+Command-line flags (or environment variables):
+    --quiet            INSTRUMENT_QUIET=1       suppress progress output on stdout
+    --trace=PATH       INSTRUMENT_TRACE=PATH    write Chrome-trace JSON at exit
+    --metrics=PATH     INSTRUMENT_METRICS=PATH  write metrics (.json or .prom) at exit
+
+Reading a JSON metrics dump back:
+    python instrumentation.py metrics.json            table of spans and counters
+    python instrumentation.py metrics.json --prom     Prometheus text on stdout
+"""
+
+import atexit
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+METRIC_PREFIX = "papers"
+
+# Past this many trace events only the aggregates keep growing
+MAX_TRACE_EVENTS = 200_000
+
+_lock = threading.Lock()
+_origin = time.perf_counter()
+_events: List[dict] = []
+_counters: Dict[str, float] = {}
+_spans: Dict[str, dict] = {}
+_dropped_events = 0
+_config = {'quiet': False, 'trace': None, 'metrics': None, 'stdout': None}
+
+
+def _timestamp(seconds: float) -> float:
+    """perf_counter seconds -> trace microseconds since import"""
+    return (seconds - _origin) * 1e6
+
+
+def _append_event(event: dict):
+    global _dropped_events
+    if len(_events) < MAX_TRACE_EVENTS:
+        _events.append(event)
+    else:
+        _dropped_events += 1
+
+
+def record_span(name: str, start: float, seconds: float, tid: Optional[int] = None, **args):
+    """
+    Record a span timed elsewhere, e.g. a page laid out in a worker process.
+
+    Args:
+        name: Span name (aggregated by name)
+        start: time.perf_counter() at the start of the span
+        seconds: Duration
+        tid: Trace row (default: current thread)
+        **args: Shown with the event in the trace viewer
+    """
+    with _lock:
+        stats = _spans.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        _append_event({
+            'name': name, 'cat': 'span', 'ph': 'X',
+            'ts': round(_timestamp(start), 3), 'dur': round(seconds * 1e6, 3),
+            'pid': os.getpid(), 'tid': tid if tid is not None else threading.get_ident(),
+            'args': {key: value if isinstance(value, (int, float, bool)) else str(value)
+                     for key, value in args.items()},
+        })
+
+
+class span:
+    """Timing span: a context manager, or a decorator when applied to a function"""
+
+    def __init__(self, name: str, **args):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        args = dict(self.args)
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+        record_span(self.name, self.start, seconds, **args)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(self.name, **self.args):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def count(name: str, value: float = 1):
+    """Add to a counter (bytes_fetched, pages_parsed, tokens_embedded, cache_hits, ...)"""
+    with _lock:
+        total = _counters[name] = _counters.get(name, 0) + value
+        _append_event({
+            'name': name, 'cat': 'counter', 'ph': 'C',
+            'ts': round(_timestamp(time.perf_counter()), 3),
+            'pid': os.getpid(), 'args': {name: total},
+        })
+
+
+def snapshot() -> dict:
+    """Counters and per-span aggregates collected so far"""
+    with _lock:
+        spans = {name: {**stats, 'mean_seconds': stats['seconds'] / stats['count']}
+                 for name, stats in sorted(_spans.items())}
+        return {
+            'counters': dict(sorted(_counters.items())),
+            'spans': spans,
+            'wall_seconds': time.perf_counter() - _origin,
+            'dropped_trace_events': _dropped_events,
+        }
+
+
+def reset():
+    global _dropped_events
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _spans.clear()
+        _dropped_events = 0
+
+
+def chrome_trace() -> dict:
+    """Trace Event Format document (complete events for spans, counter events)"""
+    with _lock:
+        events = list(_events)
+    events.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                   'args': {'name': os.path.basename(sys.argv[0]) or 'python'}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', f"{METRIC_PREFIX}_{name}")
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(metrics: Optional[dict] = None) -> str:
+    """Metrics (a snapshot() dump, by default the current one) in the Prometheus text exposition format"""
+    metrics = metrics or snapshot()
+    lines = []
+    for name, value in metrics['counters'].items():
+        metric = _metric_name(name) + '_total'
+        lines += [f"# TYPE {metric} counter", f"{metric} {_format_value(value)}"]
+
+    if metrics['spans']:
+        seconds = _metric_name('span_seconds')
+        lines.append(f"# TYPE {seconds} summary")
+        for name, stats in metrics['spans'].items():
+            lines.append(f'{seconds}_sum{{span="{_label(name)}"}} {stats["seconds"]:.6f}')
+            lines.append(f'{seconds}_count{{span="{_label(name)}"}} {stats["count"]}')
+        longest = _metric_name('span_max_seconds')
+        lines.append(f"# TYPE {longest} gauge")
+        for name, stats in metrics['spans'].items():
+            lines.append(f'{longest}{{span="{_label(name)}"}} {stats["max_seconds"]:.6f}')
+
+    wall = _metric_name('wall_seconds')
+    lines += [f"# TYPE {wall} gauge", f"{wall} {metrics['wall_seconds']:.6f}"]
+    return '\n'.join(lines) + '\n'
+
+
+def write_trace(path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(chrome_trace(), f)
+
+
+def write_metrics(path: str):
+    """JSON, or Prometheus text when the path ends in .prom"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if str(path).endswith('.prom'):
+            f.write(prometheus_text())
+        else:
+            json.dump(snapshot(), f, indent=2)
+
+
+def is_quiet() -> bool:
+    return _config['quiet']
+
+
+def set_quiet(quiet: bool = True):
+    """Send stdout (the progress prints) to /dev/null; stderr is left alone"""
+    if quiet and not _config['quiet']:
+        _config['stdout'] = sys.stdout
+        sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    elif not quiet and _config['quiet']:
+        sys.stdout.close()
+        sys.stdout = _config['stdout']
+    _config['quiet'] = quiet
+
+
+def _export():
+    for key, write in (('trace', write_trace), ('metrics', write_metrics)):
+        if _config[key]:
+            write(_config[key])
+            print(f"Saved {key}: {_config[key]}", file=sys.stderr)
+
+
+def configure(argv: Optional[List[str]] = None):
+    """
+    Apply --quiet / --trace=PATH / --metrics=PATH (or the INSTRUMENT_* variables)
+    and schedule the exports for interpreter exit.
+
+    The flags are removed from argv (default: sys.argv) so each tool's own
+    argument handling never sees them.
+    """
+    argv = sys.argv if argv is None else argv
+    quiet = os.environ.get('INSTRUMENT_QUIET', '') not in ('', '0')
+    trace = os.environ.get('INSTRUMENT_TRACE') or None
+    metrics = os.environ.get('INSTRUMENT_METRICS') or None
+
+    remaining = []
+    for arg in argv:
+        if arg == '--quiet':
+            quiet = True
+        elif arg.startswith('--trace='):
+            trace = arg.split('=', 1)[1]
+        elif arg.startswith('--metrics='):
+            metrics = arg.split('=', 1)[1]
+        else:
+            remaining.append(arg)
+    argv[:] = remaining
+
+    if (trace or metrics) and not (_config['trace'] or _config['metrics']):
+        atexit.register(_export)
+    _config['trace'] = trace
+    _config['metrics'] = metrics
+    set_quiet(quiet)
+
+
+def main():
+    """Print a metrics dump (python instrumentation.py metrics.json [--prom]) as a table or Prometheus text"""
+    args = [arg for arg in sys.argv[1:] if arg != '--prom']
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    with open(args[0], 'r', encoding='utf-8') as f:
+        metrics = json.load(f)
+
+    if '--prom' in sys.argv[1:]:
+        sys.stdout.write(prometheus_text(metrics))
+        return
+
+    print(f"Wall time: {metrics['wall_seconds']:.2f} s")
+    if metrics['spans']:
+        print(f"\n{'span':<32} {'count':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}")
+        for name, stats in sorted(metrics['spans'].items(), key=lambda item: -item[1]['seconds']):
+            print(f"{name:<32} {stats['count']:>8} {stats['seconds']:>10.3f} "
+                  f"{1000 * stats['mean_seconds']:>10.1f} {1000 * stats['max_seconds']:>10.1f}")
+    if metrics['counters']:
+        print(f"\n{'counter':<32} {'value':>12}")
+        for name, value in metrics['counters'].items():
+            print(f"{name:<32} {_format_value(value):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+로컬 LLM 게이트웨이 (OpenAI chat-completions 프록시)
+읽기 페이지의 LLM 질문을 받아 업스트림으로 전달하면서
+- keep-alive 연결 풀로 업스트림 연결 재사용
+- (논문, 조건, 정규화된 대화) 키로 응답 캐시
+- 같은 키의 동시 요청은 업스트림 호출 하나로 병합 (coalescing)
+- stream: true 이면 토큰을 SSE로 바로 전달
+- 요청별 지연 시간, 첫 토큰 시간, 토큰 수를 /metrics 에서 제공
+
+사용법:
+    OPENAI_API_KEY=... python llm_gateway.py [port]
+
+환경 변수:
+    OPENAI_API_KEY      업스트림 API 키 (요청에 Authorization 헤더가 있으면 그것을 사용)
+    LLM_UPSTREAM_URL    기본값 https://api.openai.com/v1/chat/completions
+    LLM_CACHE_SIZE      캐시 항목 수 (기본 2000)
+    LLM_CACHE_TTL       캐시 유지 시간 초 (기본 86400)
+    LLM_COMPACT_CONTEXT 설정하면 (예: 3) 시스템 프롬프트의 논문 전문을 질문과 관련된
+                        상위 k개 섹션으로 교체 (section_retrieval.py build 로 인덱스 필요)
+
+요청:
+    POST /v1/chat/completions   OpenAI와 같은 body, 추가로 X-Paper-Id / X-Condition 헤더
+                                (또는 body의 paper / condition 필드, 업스트림에는 전달하지 않음)
+    GET  /metrics               캐시/병합/지연 시간 통계 (JSON)
+
+응답의 usage는 캐시/병합 응답에도 원래 업스트림 호출의 토큰 수를 담고,
+gateway.usage_billed가 이번 요청이 실제로 과금됐는지(upstream) 알려줍니다.
+오류 응답도 OpenAI 형식({"error": {"message": ...}})이며 CORS 헤더가 붙습니다.
+업스트림의 4xx 상태(401, 429 등)는 그대로 전달하고, 5xx와 연결 실패는 502로 응답합니다.
+
+필요한 라이브러리:
+    pip install aiohttp
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+UPSTREAM_URL = os.environ.get('LLM_UPSTREAM_URL', 'https://api.openai.com/v1/chat/completions')
+CACHE_SIZE = int(os.environ.get('LLM_CACHE_SIZE', '2000'))
+CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', '86400'))
+COMPACT_CONTEXT_K = int(os.environ.get('LLM_COMPACT_CONTEXT', '0'))
+
+# 업스트림 연결 풀 크기
+UPSTREAM_CONNECTIONS = 32
+# 메트릭 계산에 쓰는 최근 요청 수
+METRICS_WINDOW = 1000
+
+# 게이트웨이 전용 필드 (업스트림에 보내지 않음)
+GATEWAY_FIELDS = ('paper', 'condition')
+
+# index.html 시스템 프롬프트에서 논문 전문이 들어가는 부분
+PAPER_CONTENT_PATTERN = re.compile(r'(\*\*Paper Content:\*\*\n)(.*?)(\n\n\*\*Your Role:\*\*)', re.DOTALL)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Paper-Id, X-Condition',
+    'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+}
+
+
+def normalize_text(text):
+    """대소문자/공백 차이를 무시하도록 정규화"""
+    if not isinstance(text, str):
+        text = json.dumps(text, sort_keys=True, ensure_ascii=False)
+    return re.sub(r'\s+', ' ', text).strip().casefold()
+
+
+def cache_key(body, paper, condition):
+    """(논문, 조건, 모델, 정규화된 대화) 캐시 키
+
+    시스템 메시지에는 논문 전문이 들어 있으므로 논문 ID가 있으면 그것으로 대신하고,
+    없으면 시스템 메시지의 해시를 씁니다.
+    """
+    messages = body.get('messages', [])
+    system = [m.get('content', '') for m in messages if m.get('role') == 'system']
+    dialog = [(m.get('role'), normalize_text(m.get('content', ''))) for m in messages if m.get('role') != 'system']
+
+    context = paper or hashlib.sha256(json.dumps(system, ensure_ascii=False).encode('utf-8')).hexdigest()
+    payload = json.dumps({
+        'paper': context,
+        'condition': condition,
+        'model': body.get('model'),
+        'temperature': body.get('temperature'),
+        'dialog': dialog,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """TTL이 있는 LRU 캐시 (key → {'content', 'usage'})"""
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+class Flight:
+    """진행 중인 업스트림 요청. 병합된 요청들이 같은 토큰 스트림을 구독"""
+
+    def __init__(self):
+        self.chunks = []
+        self.usage = None
+        self.error = None
+        self.done = False
+        self.changed = asyncio.Condition()
+
+    async def publish(self, chunk=None, done=False, usage=None, error=None):
+        async with self.changed:
+            if chunk:
+                self.chunks.append(chunk)
+            if usage:
+                self.usage = usage
+            if error:
+                self.error = error
+            self.done = self.done or done
+            self.changed.notify_all()
+
+    async def follow(self):
+        """지금까지의 청크를 재생한 뒤 새 청크를 이어서 반환"""
+        position = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.done or len(self.chunks) > position)
+                new_chunks = self.chunks[position:]
+                finished = self.done
+            for chunk in new_chunks:
+                yield chunk
+            position += len(new_chunks)
+            if finished and position >= len(self.chunks):
+                if self.error:
+                    raise self.error
+                return
+
+
+class Metrics:
+    """요청별 지연 시간/토큰 기록과 요약"""
+
+    def __init__(self):
+        self.recent = deque(maxlen=METRICS_WINDOW)
+        self.counters = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'upstream_calls': 0,
+                         'upstream_errors': 0, 'bad_requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                         'saved_prompt_tokens': 0, 'saved_completion_tokens': 0}
+
+    def record(self, source, latency, first_token, usage):
+        self.counters['requests'] += 1
+        if source == 'cache':
+            self.counters['cache_hits'] += 1
+        elif source == 'coalesced':
+            self.counters['coalesced'] += 1
+        if usage:
+            # 캐시/병합 응답의 토큰은 업스트림에 다시 과금되지 않은 (절약된) 토큰
+            prefix = '' if source == 'upstream' else 'saved_'
+            self.counters[prefix + 'prompt_tokens'] += usage.get('prompt_tokens', 0)
+            self.counters[prefix + 'completion_tokens'] += usage.get('completion_tokens', 0)
+        self.recent.append({'source': source, 'latency': latency, 'first_token': first_token,
+                            'tokens': (usage or {}).get('total_tokens', 0)})
+
+    def summary(self):
+        def percentile(values, q):
+            if not values:
+                return None
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+
+        latencies = [r['latency'] for r in self.recent]
+        first_tokens = [r['first_token'] for r in self.recent if r['first_token'] is not None]
+        requests = max(self.counters['requests'], 1)
+        return {
+            **self.counters,
+            'cache_hit_rate': round(self.counters['cache_hits'] / requests, 3),
+            'latency_ms': {'p50': percentile(latencies, 0.5), 'p95': percentile(latencies, 0.95)},
+            'first_token_ms': {'p50': percentile(first_tokens, 0.5), 'p95': percentile(first_tokens, 0.95)},
+        }
+
+
+def error_body(status, message, error_type='gateway_error'):
+    return {'error': {'message': message, 'type': error_type, 'code': status}}
+
+
+def upstream_error_body(status, text):
+    """업스트림이 OpenAI 형식 오류를 보냈으면 그대로, 아니면 게이트웨이 오류로 감싸기"""
+    try:
+        body = json.loads(text)
+    except (TypeError, ValueError):
+        body = None
+    if isinstance(body, dict) and isinstance(body.get('error'), dict):
+        return body
+    return error_body(status, text or 'Upstream request failed', 'upstream_error')
+
+
+class UpstreamError(web.HTTPError):
+    """업스트림 상태 코드를 그대로 쓰는 오류 (aiohttp 예외 클래스는 상태별로 고정되어 있음)"""
+
+    def __init__(self, status, text):
+        self.status_code = status
+        super().__init__(text=text, content_type='application/json')
+
+
+def upstream_http_error(status, text):
+    """업스트림 오류 응답: 4xx(401, 429 등)는 그대로, 그 밖의 상태는 502"""
+    body = json.dumps(upstream_error_body(status, text))
+    if 400 <= status < 500:
+        return UpstreamError(status, body)
+    return web.HTTPBadGateway(text=body, content_type='application/json')
+
+
+@web.middleware
+async def json_errors(request, handler):
+    """모든 오류를 CORS 헤더가 붙은 JSON으로 (브라우저가 오류 내용을 읽을 수 있도록)"""
+    try:
+        return await handler(request)
+    except web.HTTPException as e:
+        if e.status < 400:
+            raise
+        return web.json_response(upstream_error_body(e.status, e.text), status=e.status, headers=CORS_HEADERS)
+    except Exception as e:
+        print(f'❌ {request.method} {request.path}: {e!r}')
+        return web.json_response(error_body(500, 'Internal gateway error'), status=500, headers=CORS_HEADERS)
+
+
+def compact_paper_context(body, paper, retriever, k):
+    """시스템 프롬프트의 논문 전문을 마지막 질문과 관련된 섹션으로 교체 (찾지 못하면 그대로)"""
+    messages = body.get('messages', [])
+    questions = [m.get('content') for m in messages if m.get('role') == 'user' and isinstance(m.get('content'), str)]
+    if not paper or not questions:
+        return body
+
+    context = retriever.compact_context(paper, questions[-1], k)
+    if context is None:
+        return body
+
+    compacted = []
+    for message in messages:
+        if message.get('role') == 'system' and isinstance(message.get('content'), str):
+            content = PAPER_CONTENT_PATTERN.sub(lambda m: m.group(1) + context + m.group(3), message['content'], count=1)
+            message = dict(message, content=content)
+        compacted.append(message)
+    return dict(body, messages=compacted)
+
+
+class LLMGateway:
+    def __init__(self, upstream_url=UPSTREAM_URL, api_key=None, cache=None, compact_k=COMPACT_CONTEXT_K):
+        self.upstream_url = upstream_url
+        self.api_key = api_key if api_key is not None else os.environ.get('OPENAI_API_KEY', '')
+        self.cache = cache or ResponseCache()
+        self.metrics = Metrics()
+        self.in_flight = {}
+        self.session = None
+        self.compact_k = compact_k
+        self.tasks = set()
+        self.retriever = None
+        self.retrieval_executor = None
+        if compact_k:
+            from section_retrieval import SectionRetriever
+            self.retriever = SectionRetriever()
+            # 섹션 검색(모델 로딩, 쿼리 임베딩, 오래된 인덱스 재생성)은 이벤트 루프 밖의
+            # 스레드 하나에서 순서대로 실행 (SectionRetriever 캐시를 동시에 건드리지 않도록)
+            self.retrieval_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self, app):
+        # keep-alive 연결 풀
+        self.session = ClientSession(
+            connector=TCPConnector(limit=UPSTREAM_CONNECTIONS, keepalive_timeout=60),
+            timeout=ClientTimeout(total=300, sock_read=120),
+        )
+
+    async def stop(self, app):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.session:
+            await self.session.close()
+        if self.retrieval_executor:
+            self.retrieval_executor.shutdown(wait=False)
+
+    def make_app(self):
+        app = web.Application(middlewares=[json_errors])
+        app.router.add_post('/v1/chat/completions', self.handle_chat)
+        app.router.add_route('OPTIONS', '/v1/chat/completions', self.handle_options)
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+    async def handle_options(self, request):
+        return web.Response(headers=CORS_HEADERS)
+
+    async def handle_metrics(self, request):
+        return web.json_response(self.metrics.summary(), headers=CORS_HEADERS)
+
+    async def handle_chat(self, request):
+        started = time.perf_counter()
+        try:
+            body = await request.json()
+        except ValueError:
+            self.metrics.counters['bad_requests'] += 1
+            raise web.HTTPBadRequest(text=json.dumps(error_body(400, 'Request body is not valid JSON',
+                                                                'invalid_request_error')))
+        if not isinstance(body, dict) or not isinstance(body.get('messages'), list):
+            self.metrics.counters['bad_requests'] += 1
+            raise web.HTTPBadRequest(text=json.dumps(error_body(400, "Request body needs a 'messages' list",
+                                                                'invalid_request_error')))
+        paper = request.headers.get('X-Paper-Id') or body.get('paper')
+        condition = request.headers.get('X-Condition') or body.get('condition')
+        for field in GATEWAY_FIELDS:
+            body.pop(field, None)
+        stream = bool(body.get('stream'))
+        if self.retriever is not None and paper:
+            body = await asyncio.get_running_loop().run_in_executor(
+                self.retrieval_executor, compact_paper_context, body, paper, self.retriever, self.compact_k)
+        authorization = request.headers.get('Authorization') or f'Bearer {self.api_key}'
+
+        key = cache_key(body, paper, condition)
+        cached = self.cache.get(key)
+        if cached is not None:
+            source = 'cache'
+            chunks = self._replay(cached['content'])
+            usage = lambda: cached['usage']
+        else:
+            if key in self.in_flight:
+                source = 'coalesced'
+                flight = self.in_flight[key]
+            else:
+                source = 'upstream'
+                flight = Flight()
+                self.in_flight[key] = flight
+                # 태스크 참조를 유지해야 완료 전에 가비지 컬렉션되지 않음
+                task = asyncio.create_task(self._call_upstream(key, body, authorization, flight))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            chunks = flight.follow()
+            usage = lambda: flight.usage
+
+        if stream:
+            return await self._stream_response(request, chunks, source, started, usage, body)
+        return await self._json_response(chunks, source, started, usage, body)
+
+    async def _replay(self, content):
+        yield content
+
+    async def _call_upstream(self, key, body, authorization, flight):
+        """업스트림 스트리밍 호출. 받은 토큰을 flight에 게시하고 완료되면 캐시에 저장"""
+        self.metrics.counters['upstream_calls'] += 1
+        upstream_body = dict(body, stream=True, stream_options={'include_usage': True})
+        headers = {'Content-Type': 'application/json', 'Authorization': authorization}
+        try:
+            async with self.session.post(self.upstream_url, json=upstream_body, headers=headers) as response:
+                if response.status != 200:
+                    detail = await response.text()
+                    raise upstream_http_error(response.status, detail)
+
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    event = json.loads(data)
+                    if event.get('usage'):
+                        await flight.publish(usage=event['usage'])
+                    for choice in event.get('choices', []):
+                        delta = choice.get('delta', {}).get('content')
+                        if delta:
+                            await flight.publish(chunk=delta)
+
+            self.cache.put(key, {'content': ''.join(flight.chunks), 'usage': flight.usage})
+            await flight.publish(done=True)
+        except Exception as e:
+            self.metrics.counters['upstream_errors'] += 1
+            error = e if isinstance(e, web.HTTPException) else web.HTTPBadGateway(text=str(e))
+            await flight.publish(done=True, error=error)
+        finally:
+            self.in_flight.pop(key, None)
+
+    async def _json_response(self, chunks, source, started, usage_of, body):
+        parts = []
+        first_token = None
+        async for chunk in chunks:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            parts.append(chunk)
+
+        usage = usage_of()
+        self.metrics.record(source, time.perf_counter() - started, first_token, usage)
+        return web.json_response({
+            'object': 'chat.completion',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(parts)},
+                         'finish_reason': 'stop'}],
+            'usage': usage,
+            'gateway': {'source': source, 'usage_billed': source == 'upstream',
+                        'latency_ms': round((time.perf_counter() - started) * 1000, 1)},
+        }, headers=CORS_HEADERS)
+
+    async def _stream_response(self, request, chunks, source, started, usage_of, body):
+        response = web.StreamResponse(headers={**CORS_HEADERS, 'Content-Type': 'text/event-stream',
+                                               'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+
+        first_token = None
+        try:
+            async for chunk in chunks:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                event = {'object': 'chat.completion.chunk', 'model': body.get('model'),
+                         'choices': [{'index': 0, 'delta': {'content': chunk}}]}
+                await response.write(f'data: {json.dumps(event, ensure_ascii=False)}\n\n'.encode('utf-8'))
+        except web.HTTPException as e:
+            error = upstream_error_body(e.status, e.text or e.reason)
+            await response.write(f'data: {json.dumps(error)}\n\n'.encode('utf-8'))
+
+        usage = usage_of()
+        self.metrics.record(source, time.perf_counter() - started, first_token, usage)
+        final = {'object': 'chat.completion.chunk', 'choices': [], 'usage': usage,
+                 'gateway': {'source': source, 'usage_billed': source == 'upstream'}}
+        await response.write(f'data: {json.dumps(final)}\n\ndata: [DONE]\n\n'.encode('utf-8'))
+        await response.write_eof()
+        return response
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8787
+    gateway = LLMGateway()
+    print(f'🤖 LLM gateway: http://localhost:{port}/v1/chat/completions → {gateway.upstream_url}')
+    web.run_app(gateway.make_app(), port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Max-Distance Pair Stability
+===========================
+Checks how robust the pair in max_distance_pair.csv is to the text that goes
+into the embedding. Each perturbation scheme rewrites every paper's
+"{title} [SEP] {abstract}" input:
+
+    sentence_dropout   drop each abstract sentence with probability --dropout
+                       (one replicate per --replicates, at least one sentence kept)
+    truncate_<L>       keep the first L words of the abstract (--truncate=64,128,256)
+    title_only         the title alone
+    abstract_only      the abstract alone
+
+All perturbed texts (deduplicated) are embedded in one batched call. The
+farthest pair of every replicate is then found at once: batched similarity
+matrices with the lower triangle masked and an argmin over each flattened
+replicate. The report gives, per scheme, how often each pair was selected with
+a Wilson 95% confidence interval.
+
+Usage:
+    python pair_stability.py [--backend=specter2|hashing|server] [--replicates=200]
+                             [--dropout=0.2] [--truncate=64,128,256] [--seed=0] [--batch-size=32]
+
+Also run from the pipeline with: python paper_similarity.py --stability[=REPLICATES]
+"""
+
+import os
+import re
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import configure, count, span
+
+STABILITY_PATH = "./output/pair_stability.csv"
+
+DEFAULT_REPLICATES = 200
+DEFAULT_DROPOUT = 0.2
+DEFAULT_TRUNCATE = (64, 128, 256)
+
+# Batched similarity matrices (replicates x n x n float32) and the gathered
+# embeddings of the same replicates (replicates x n x dim float32) must fit in this
+MEMORY_BUDGET_MB = 256
+
+# z for a 95% interval
+WILSON_Z = 1.959964
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"(])')
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence]
+
+
+def sentence_dropout(abstract: str, rate: float, rng: np.random.Generator) -> str:
+    """Abstract with each sentence dropped with probability rate (one is always kept)"""
+    sentences = split_sentences(abstract)
+    if len(sentences) < 2:
+        return abstract
+    keep = rng.random(len(sentences)) >= rate
+    if not keep.any():
+        keep[rng.integers(len(sentences))] = True
+    return ' '.join(sentence for sentence, kept in zip(sentences, keep) if kept)
+
+
+def build_schemes(replicates: int = DEFAULT_REPLICATES, dropout: float = DEFAULT_DROPOUT,
+                  truncate: Tuple[int, ...] = DEFAULT_TRUNCATE) -> Dict[str, Tuple[int, Callable]]:
+    """
+    Perturbation schemes as name -> (replicates, function(title, abstract, rng) -> text).
+    Deterministic schemes have a single replicate.
+    """
+    schemes = {}
+    if replicates and dropout > 0:
+        schemes['sentence_dropout'] = (replicates, lambda title, abstract, rng:
+                                       f"{title} [SEP] {sentence_dropout(abstract, dropout, rng)}")
+    for length in truncate:
+        schemes[f'truncate_{length}'] = (1, lambda title, abstract, rng, length=length:
+                                         f"{title} [SEP] {' '.join(abstract.split()[:length])}")
+    schemes['title_only'] = (1, lambda title, abstract, rng: title)
+    schemes['abstract_only'] = (1, lambda title, abstract, rng: abstract)
+    return schemes
+
+
+def replicate_block_size(n_papers: int, memory_budget_mb: int = MEMORY_BUDGET_MB, dim: int = 0) -> int:
+    """Replicates per batch so their (n x n) similarity and (n x dim) embedding blocks fit the budget"""
+    n = max(n_papers, 1)
+    return max(1, int(memory_budget_mb * 2 ** 20 // ((n * n + n * dim) * 4)))
+
+
+@span('replicate_farthest_pairs')
+def farthest_pairs(embeddings: np.ndarray, rows: Optional[np.ndarray] = None,
+                   memory_budget_mb: int = MEMORY_BUDGET_MB) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Farthest pair (by cosine distance) of every replicate.
+
+    Args:
+        embeddings: Array of shape (replicates, n_papers, dim), or (n_texts, dim)
+            when rows is given
+        rows: Optional (replicates, n_papers) indices into embeddings; each block
+            of replicates is gathered only when it is compared, so the full
+            replicates x n_papers x dim array is never built
+
+    Returns:
+        Tuple of ((replicates, 2) paper indices with i < j, (replicates,) distances).
+        Ties go to the first pair in row-major order, as in find_max_distance_pair.
+    """
+    if rows is None:
+        n_replicates, n, dim = embeddings.shape
+    else:
+        (n_replicates, n), dim = rows.shape, embeddings.shape[-1]
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    unit = (embeddings / np.maximum(norms, 1e-12)).astype(np.float32, copy=False)
+    lower = np.tril(np.ones((n, n), dtype=bool))
+
+    pairs = np.empty((n_replicates, 2), dtype=np.int64)
+    distances = np.empty(n_replicates)
+    step = replicate_block_size(n, memory_budget_mb, dim)
+    for start in range(0, n_replicates, step):
+        block = unit[start:start + step] if rows is None else unit[rows[start:start + step]]
+        similarity = block @ block.transpose(0, 2, 1)
+        similarity[:, lower] = np.inf
+        flat = similarity.reshape(len(similarity), -1).argmin(axis=1)
+        pairs[start:start + step] = np.stack(np.unravel_index(flat, (n, n)), axis=1)
+        distances[start:start + step] = 1.0 - similarity.reshape(len(similarity), -1)[np.arange(len(flat)), flat]
+    return pairs, distances
+
+
+def wilson_interval(successes: np.ndarray, trials: int, z: float = WILSON_Z) -> Tuple[np.ndarray, np.ndarray]:
+    """Wilson score interval for a binomial proportion (vectorized over successes)"""
+    p = np.asarray(successes, dtype=np.float64) / trials
+    denominator = 1 + z ** 2 / trials
+    centre = (p + z ** 2 / (2 * trials)) / denominator
+    half = z * np.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    return np.clip(centre - half, 0, 1), np.clip(centre + half, 0, 1)
+
+
+def selection_frequencies(pairs: np.ndarray, distances: np.ndarray, paper_ids: List[str],
+                          baseline: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+    """
+    How often each pair was selected across replicates.
+
+    Returns:
+        DataFrame (most frequent first) with paper1_id, paper2_id, selections,
+        replicates, frequency, ci_low, ci_high, mean_distance (over the
+        replicates that selected it) and is_baseline; the baseline pair gets a
+        row with 0 selections if it was never selected
+    """
+    unique, inverse, selections = np.unique(pairs, axis=0, return_inverse=True, return_counts=True)
+    mean_distance = np.bincount(inverse.ravel(), weights=distances) / selections
+    if baseline is not None and not (unique == baseline).all(axis=1).any():
+        unique = np.vstack([unique, baseline])
+        selections = np.append(selections, 0)
+        mean_distance = np.append(mean_distance, np.nan)
+    ci_low, ci_high = wilson_interval(selections, len(pairs))
+    order = np.lexsort((unique[:, 1], unique[:, 0], -selections))
+    return pd.DataFrame({
+        'paper1_id': [paper_ids[i] for i in unique[order, 0]],
+        'paper2_id': [paper_ids[j] for j in unique[order, 1]],
+        'selections': selections[order],
+        'replicates': len(pairs),
+        'frequency': selections[order] / len(pairs),
+        'ci_low': ci_low[order],
+        'ci_high': ci_high[order],
+        'mean_distance': mean_distance[order],
+        'is_baseline': ([tuple(pair) == tuple(baseline) for pair in unique[order]]
+                        if baseline is not None else False),
+    })
+
+
+def pair_stability(papers: pd.DataFrame, embed: Callable[[List[str]], np.ndarray],
+                   schemes: Dict[str, Tuple[int, Callable]], seed: int = 0) -> pd.DataFrame:
+    """
+    Selection frequencies of the farthest pair under each perturbation scheme.
+
+    Args:
+        papers: extracted_papers.csv frame (index: paper id; title, abstract, specter_input)
+        embed: texts -> (n_texts, dim) embeddings
+        schemes: From build_schemes
+        seed: Seed for the stochastic schemes
+
+    Returns:
+        One frame with a scheme column; scheme 'original' is the unperturbed
+        specter_input and defines the baseline pair
+    """
+    rng = np.random.default_rng(seed)
+    paper_ids = list(papers.index)
+    titles, abstracts = list(papers['title']), list(papers['abstract'])
+
+    with span('perturb_texts'):
+        replicate_texts = {'original': [list(papers['specter_input'])]}
+        for name, (replicates, perturb) in schemes.items():
+            replicate_texts[name] = [[perturb(title, abstract, rng) for title, abstract in zip(titles, abstracts)]
+                                     for _ in range(replicates)]
+
+    unique_texts = list(dict.fromkeys(text for texts in replicate_texts.values() for rows in texts for text in rows))
+    count('stability_texts', len(unique_texts))
+    with span('embed_perturbed', texts=len(unique_texts)):
+        vectors = np.asarray(embed(unique_texts), dtype=np.float32)
+    row_of = {text: row for row, text in enumerate(unique_texts)}
+
+    frames = []
+    baseline = None
+    for name, texts in replicate_texts.items():
+        rows = np.array([[row_of[text] for text in replicate] for replicate in texts])
+        pairs, distances = farthest_pairs(vectors, rows)
+        if baseline is None:
+            baseline = tuple(pairs[0])
+        frame = selection_frequencies(pairs, distances, paper_ids, baseline)
+        frame.insert(0, 'scheme', name)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def print_summary(report: pd.DataFrame, titles: Optional[Dict[str, str]] = None):
+    titles = titles or {}
+    baseline = report[(report['scheme'] == 'original') & report['is_baseline']].iloc[0]
+    print(f"Baseline pair: {baseline['paper1_id']} / {baseline['paper2_id']}")
+    for pid in (baseline['paper1_id'], baseline['paper2_id']):
+        if pid in titles:
+            print(f"  {pid}: {titles[pid][:70]}")
+    print(f"\n{'scheme':<20} {'reps':>5} {'baseline freq':>14} {'95% CI':>15}  most selected")
+    for scheme, frame in report[report['scheme'] != 'original'].groupby('scheme', sort=False):
+        base = frame[frame['is_baseline']].iloc[0]
+        top = frame.iloc[0]
+        most = 'baseline' if top['is_baseline'] else f"{top['paper1_id']} / {top['paper2_id']} ({top['frequency']:.2f})"
+        print(f"{scheme:<20} {int(base['replicates']):>5} {base['frequency']:>14.2f} "
+              f"{'[' + format(base['ci_low'], '.2f') + ', ' + format(base['ci_high'], '.2f') + ']':>15}  {most}")
+
+
+def main():
+    configure()
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+
+    from embedding_shards import EXTRACTED_PAPERS_PATH, load_backend, load_extracted_papers
+
+    papers_path = options.get('papers', EXTRACTED_PAPERS_PATH)
+    if not os.path.exists(papers_path):
+        print(f"Error: {papers_path} not found (run paper_similarity.py first)")
+        sys.exit(1)
+    papers = load_extracted_papers(papers_path)
+    if len(papers) < 2:
+        print("Error: Need at least 2 papers")
+        sys.exit(1)
+
+    truncate = tuple(int(length) for length in options['truncate'].split(',') if length) \
+        if 'truncate' in options else DEFAULT_TRUNCATE
+    schemes = build_schemes(int(options.get('replicates', DEFAULT_REPLICATES)),
+                            float(options.get('dropout', DEFAULT_DROPOUT)), truncate)
+    embed, identity = load_backend(options.get('backend', 'specter2'), int(options.get('batch-size', 32)))
+    print(f"Perturbing {len(papers)} papers ({', '.join(schemes)}) with "
+          f"{identity.get('model', identity.get('backend'))}")
+
+    report = pair_stability(papers, embed, schemes, int(options.get('seed', 0)))
+    report.to_csv(STABILITY_PATH, index=False)
+    print_summary(report, dict(zip(papers.index, papers['title'])))
+    print(f"\nSaved: {STABILITY_PATH}")
+
+
+if __name__ == "__main__":
+    main()
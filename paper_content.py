@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Load parsed paper content for offline indexing
+Rebuilds the `content` list produced by tools/parse_acm_html.py from the clean
+papers_html/<paper_id>.html it generates, so indexes see exactly the text that
+participants read, together with the papers_json metadata.
+"""
+
+import json
+import re
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+PROJECT_DIR = Path(__file__).parent
+
+
+def load_metadata(paper_id, project_dir=PROJECT_DIR):
+    json_path = Path(project_dir) / 'papers_json' / f'{paper_id}.json'
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_paper_content(paper_id, project_dir=PROJECT_DIR):
+    """
+    Rebuild parse_acm_html-style content items for a paper.
+
+    Args:
+        paper_id: Paper identifier (papers_json/<paper_id>.json)
+        project_dir: Project root
+
+    Returns:
+        Dict with 'metadata' and 'content' (section / subsection / paragraph /
+        table items), matching the schema of parse_acm_html
+    """
+    metadata = load_metadata(paper_id, project_dir)
+    html_path = Path(project_dir) / 'papers_html' / f'{paper_id}.html'
+    with open(html_path, 'r', encoding='utf-8') as f:
+        soup = BeautifulSoup(f.read(), 'html.parser')
+
+    container = soup.find(id='paper-content') or soup
+    content = []
+    for element in container.find_all(['h2', 'h3', 'p', 'table']):
+        if element.name in ('h2', 'h3') and element.get('data-section'):
+            content.append({
+                'type': 'section' if element.name == 'h2' else 'subsection',
+                'text': element['data-section'],
+                'level': 2 if element.name == 'h2' else 3,
+            })
+        elif element.name == 'p' and 'text-justify' in (element.get('class') or []):
+            content.append({'type': 'paragraph', 'text': element.get_text(strip=True)})
+        elif element.name == 'table':
+            content.append({'type': 'table', 'caption': '', 'html': str(element),
+                            'text': element.get_text(' ', strip=True)})
+
+    return {'metadata': metadata, 'content': content}
+
+
+def iter_paragraphs(content):
+    """Yield (paragraph_index, section, top_section, text) for paragraph items"""
+    section = 'Abstract'
+    top_section = 'Abstract'
+    paragraph_index = 0
+    for item in content:
+        if item['type'] == 'section':
+            section = top_section = item['text']
+        elif item['type'] == 'subsection':
+            section = item['text']
+        elif item['type'] in ('paragraph', 'table'):
+            text = item.get('text', '')
+            if text:
+                yield paragraph_index, section, top_section, text
+                paragraph_index += 1
+
+
+def list_paper_ids(project_dir=PROJECT_DIR):
+    """Papers that have both papers_json metadata and a clean HTML page"""
+    project_dir = Path(project_dir)
+    return [
+        path.stem for path in sorted((project_dir / 'papers_json').glob('*.json'))
+        if (project_dir / 'papers_html' / f'{path.stem}.html').exists()
+    ]
+
+
+def normalize_text(text):
+    """Lowercase, unify quotes/dashes and collapse whitespace"""
+    text = text.replace('’', "'").replace('‘', "'").replace('“', '"').replace('”', '"')
+    text = re.sub(r'[‐-―]', '-', text)
+    return re.sub(r'\s+', ' ', text).strip().lower()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Paper Detection (MinHash / LSH)
+==============================================
+Clusters copies of the same paper (DOI-named PDFs in ./pdfs vs chi20xx-* copies
+in papers_pdf, preprint vs camera-ready) before embedding, picks one canonical
+id per cluster, and persists the mapping so paper_similarity skips duplicates.
+
+MinHash signatures over word 5-gram shingles are banded into LSH buckets, so
+only papers sharing a bucket are compared (near-linear in the number of papers).
+Signatures are cached per PDF (keyed on size and mtime), so later runs only
+extract text from new or changed files.
+
+Usage:
+    python paper_dedupe.py [pdf_dir ...]      (default: ./pdfs ./papers_pdf)
+"""
+
+import json
+import os
+import re
+import sys
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+DEDUPE_MAP_PATH = "./output/dedupe_map.json"
+SIGNATURE_CACHE_PATH = "./output/dedupe_signatures.npz"
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+# 32 bands x 4 rows: pairs above ~0.42 Jaccard are likely to share a bucket
+LSH_BANDS = 32
+# Estimated Jaccard similarity at which two papers count as the same paper
+DUPLICATE_THRESHOLD = 0.5
+
+MERSENNE_PRIME = (1 << 31) - 1
+MAX_HASH = np.uint64(MERSENNE_PRIME)
+
+DOI_ID_PATTERN = re.compile(r'^\d{7}\.\d{7}$')
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Hash the word n-gram shingles of a text.
+
+    Args:
+        text: Extracted paper text
+        size: Words per shingle
+
+    Returns:
+        Unique 31-bit shingle hashes (uint64 array)
+    """
+    words = re.findall(r'[a-z0-9]+', text.lower())
+    shingles = {' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))} if words else set()
+    hashes = [zlib.crc32(shingle.encode('utf-8')) & MERSENNE_PRIME for shingle in shingles]
+    return np.unique(np.array(hashes, dtype=np.uint64))
+
+
+class MinHasher:
+    """Universal hashing (a * x + b) mod p over NUM_PERM permutations"""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        if len(hashes) == 0:
+            return np.full(len(self.a), MAX_HASH, dtype=np.uint64)
+        # a, x < 2^31 so a * x + b stays below 2^63
+        values = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MAX_HASH
+        return values.min(axis=1)
+
+
+def lsh_candidates(signatures: Dict[str, np.ndarray], bands: int = LSH_BANDS) -> Set[Tuple[str, str]]:
+    """Pairs of ids that share at least one LSH band bucket"""
+    banded = {pid: signature.reshape(bands, -1) for pid, signature in signatures.items()}
+    candidates = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[str]] = {}
+        for paper_id, rows in banded.items():
+            buckets.setdefault(rows[band].tobytes(), []).append(paper_id)
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    candidates.add(tuple(sorted((members[i], members[j]))))
+    return candidates
+
+
+def choose_canonical(cluster: List[str], lengths: Dict[str, int]) -> str:
+    """DOI-named ids first (stable across corpora), then the longest text, then by name"""
+    return min(cluster, key=lambda pid: (not DOI_ID_PATTERN.match(pid), -lengths.get(pid, 0), pid))
+
+
+def find_duplicates(texts: Dict[str, str], threshold: float = DUPLICATE_THRESHOLD,
+                    num_perm: int = NUM_PERM, bands: int = LSH_BANDS) -> Tuple[Dict[str, str], List[List[str]]]:
+    """
+    Cluster near-duplicate papers.
+
+    Args:
+        texts: {paper_id: extracted text}
+        threshold: Minimum estimated Jaccard similarity for a duplicate pair
+
+    Returns:
+        Tuple of ({paper_id: canonical_id} for every paper, clusters with 2+ members)
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+    hasher = MinHasher(num_perm)
+    signatures = {pid: hasher.signature(shingle_hashes(text)) for pid, text in texts.items()}
+    return cluster_signatures(signatures, {pid: len(text) for pid, text in texts.items()}, threshold, bands)
+
+
+def cluster_signatures(signatures: Dict[str, np.ndarray], lengths: Dict[str, int],
+                       threshold: float = DUPLICATE_THRESHOLD,
+                       bands: int = LSH_BANDS) -> Tuple[Dict[str, str], List[List[str]]]:
+    """
+    Cluster papers from precomputed MinHash signatures.
+
+    Args:
+        signatures: {paper_id: MinHash signature}
+        lengths: {paper_id: text length}, used to pick the canonical copy
+
+    Returns:
+        Same as find_duplicates
+    """
+    parent = {pid: pid for pid in signatures}
+
+    def find(pid):
+        while parent[pid] != pid:
+            parent[pid] = parent[parent[pid]]
+            pid = parent[pid]
+        return pid
+
+    for a, b in lsh_candidates(signatures, bands):
+        if np.mean(signatures[a] == signatures[b]) >= threshold:
+            parent[find(a)] = find(b)
+
+    groups: Dict[str, List[str]] = {}
+    for pid in signatures:
+        groups.setdefault(find(pid), []).append(pid)
+
+    mapping = {}
+    clusters = []
+    for members in groups.values():
+        canonical = choose_canonical(members, lengths)
+        for pid in members:
+            mapping[pid] = canonical
+        if len(members) > 1:
+            clusters.append(sorted(members, key=lambda pid: pid != canonical))
+    return mapping, clusters
+
+
+def save_mapping(mapping: Dict[str, str], clusters: List[List[str]], path: str = DEDUPE_MAP_PATH):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'params': {'shingle_size': SHINGLE_SIZE, 'num_perm': NUM_PERM, 'bands': LSH_BANDS,
+                       'threshold': DUPLICATE_THRESHOLD},
+            'canonical': mapping,
+            'clusters': clusters,
+        }, f, indent=2)
+
+
+def load_mapping(path: str = DEDUPE_MAP_PATH) -> Dict[str, str]:
+    """{paper_id: canonical_id} from a previous run, or {} if none"""
+    if not Path(path).exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('canonical', {})
+
+
+def merge_mappings(persisted: Dict[str, str], current: Dict[str, str]) -> Dict[str, str]:
+    """
+    Combine a persisted mapping with this run's.
+
+    Every id in this run takes its current canonical id, so a replaced or corrected
+    PDF is un-deduped once it no longer clusters. Persisted duplicates (id -> another
+    id) are kept only for ids absent from this run, then chains are resolved.
+    """
+    merged = {pid: canonical for pid, canonical in persisted.items()
+              if pid != canonical and pid not in current}
+    merged.update(current)
+    resolved = {}
+    for pid in merged:
+        canonical, seen = merged[pid], {pid}
+        while merged.get(canonical, canonical) != canonical and canonical not in seen:
+            seen.add(canonical)
+            canonical = merged[canonical]
+        resolved[pid] = canonical
+    return resolved
+
+
+def clusters_of(mapping: Dict[str, str]) -> List[List[str]]:
+    """Clusters with 2+ members, canonical id first"""
+    groups: Dict[str, List[str]] = {}
+    for pid, canonical in mapping.items():
+        groups.setdefault(canonical, []).append(pid)
+    return [sorted(members, key=lambda pid: (pid != canonical, pid))
+            for canonical, members in groups.items() if len(members) > 1]
+
+
+def skip_duplicates(paper_ids: Iterable[str], mapping: Dict[str, str]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Keep one id per canonical paper.
+
+    Returns:
+        Tuple of (kept ids in input order, {skipped id: id kept instead})
+    """
+    groups: Dict[str, List[str]] = {}
+    for pid in paper_ids:
+        groups.setdefault(mapping.get(pid, pid), []).append(pid)
+
+    kept = []
+    skipped = {}
+    for canonical, members in groups.items():
+        # The canonical id itself when present, otherwise the first copy seen
+        keep = canonical if canonical in members else members[0]
+        kept.append(keep)
+        skipped.update({pid: keep for pid in members if pid != keep})
+    return kept, skipped
+
+
+def pdf_signatures(pdf_paths: Dict[str, str],
+                   cache_path: Optional[str] = SIGNATURE_CACHE_PATH) -> Tuple[Dict[str, np.ndarray], Dict[str, int], int]:
+    """
+    MinHash signatures of PDFs, extracting full text only for files not in the cache.
+
+    Args:
+        pdf_paths: {paper_id: PDF path}
+        cache_path: Signature cache (.npz), or None to always extract
+
+    Returns:
+        Tuple of ({paper_id: signature}, {paper_id: text length}, number of PDFs extracted now)
+    """
+    from paper_similarity import extract_full_text_from_pdf
+
+    params = json.dumps({'shingle_size': SHINGLE_SIZE, 'num_perm': NUM_PERM, 'seed': 1})
+    file_keys = {}
+    for pid, pdf_path in pdf_paths.items():
+        stat = os.stat(pdf_path)
+        file_keys[pid] = f"{pid}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    cached = {}
+    if cache_path and Path(cache_path).exists():
+        with np.load(cache_path, allow_pickle=False) as data:
+            if str(data['params']) == params:
+                cached = {key: (signature, int(length)) for key, signature, length
+                          in zip(data['keys'], data['signatures'], data['lengths'])}
+
+    hasher = MinHasher(NUM_PERM)
+    missing = [pid for pid in pdf_paths if file_keys[pid] not in cached]
+    for pid in missing:
+        text = extract_full_text_from_pdf(str(pdf_paths[pid]))
+        cached[file_keys[pid]] = (hasher.signature(shingle_hashes(text)), len(text))
+
+    if cache_path and missing:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        # Only the current files are kept, so renamed or deleted PDFs drop out
+        keys = [file_keys[pid] for pid in pdf_paths]
+        tmp = Path(cache_path).with_suffix('.tmp.npz')
+        np.savez(tmp, params=np.array(params), keys=np.array(keys, dtype=str),
+                 signatures=np.array([cached[key][0] for key in keys], dtype=np.uint64).reshape(len(keys), NUM_PERM),
+                 lengths=np.array([cached[key][1] for key in keys], dtype=np.int64))
+        os.replace(tmp, cache_path)
+
+    signatures = {pid: cached[file_keys[pid]][0] for pid in pdf_paths}
+    lengths = {pid: cached[file_keys[pid]][1] for pid in pdf_paths}
+    return signatures, lengths, len(missing)
+
+
+def dedupe_pdf_dirs(pdf_dirs: List[str],
+                    path: Optional[str] = DEDUPE_MAP_PATH) -> Tuple[Dict[str, str], List[List[str]]]:
+    """Sign every PDF in pdf_dirs (cached), cluster and persist the mapping"""
+    pdf_paths = {}
+    for pdf_dir in pdf_dirs:
+        for pdf_path in sorted(Path(pdf_dir).glob("*.pdf")):
+            pdf_paths[pdf_path.stem] = str(pdf_path)
+    signatures, lengths, extracted = pdf_signatures(pdf_paths)
+    print(f"Signed {len(pdf_paths)} PDFs ({extracted} extracted, {len(pdf_paths) - extracted} cached)")
+
+    mapping, clusters = cluster_signatures(signatures, lengths)
+    if path:
+        save_mapping(mapping, clusters, path)
+    return mapping, clusters
+
+
+def main():
+    pdf_dirs = sys.argv[1:] or ["./pdfs", "./papers_pdf"]
+
+    print("\n" + "="*60)
+    print("Near-duplicate detection (MinHash / LSH)")
+    print("="*60)
+
+    mapping, clusters = dedupe_pdf_dirs(pdf_dirs)
+
+    print(f"\n{len(clusters)} duplicate cluster(s):")
+    for cluster in clusters:
+        print(f"  {cluster[0]}  <=  {', '.join(cluster[1:])}")
+    print(f"\nSaved: {DEDUPE_MAP_PATH}")
+
+
+if __name__ == "__main__":
+    main()
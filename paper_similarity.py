@@ -8,6 +8,7 @@ using SPECTER2 embeddings for stimulus selection diversity.
 
 import os
 import re
+import sys
 import fitz  # PyMuPDF
 import numpy as np
 import pandas as pd
@@ -16,7 +17,10 @@ from typing import Tuple, List, Dict, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
+from instrumentation import configure, count, span
 
+
+@span('extract_title_abstract')
 def extract_title_abstract_from_pdf(pdf_path: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Extract title and abstract from an ACM-formatted PDF.
@@ -45,9 +49,9 @@ def extract_title_abstract_from_pdf(pdf_path: str) -> Tuple[Optional[str], Optio
         for block in blocks:
             if "lines" in block:
                 for line in block["lines"]:
-                    for span in line["spans"]:
-                        font_size = span["size"]
-                        text_content = span["text"].strip()
+                    for text_span in line["spans"]:
+                        font_size = text_span["size"]
+                        text_content = text_span["text"].strip()
                         if font_size > 12 and len(text_content) > 5:
                             title_candidates.append((font_size, text_content, block["bbox"][1]))
 
@@ -97,6 +101,27 @@ def extract_title_abstract_from_pdf(pdf_path: str) -> Tuple[Optional[str], Optio
         return None, None
 
 
+@span('extract_full_text')
+def extract_full_text_from_pdf(pdf_path: str) -> str:
+    """
+    Extract the plain text of all pages (for the sparse backends' --full-text option).
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Returns:
+        Whitespace-normalised text, or "" if extraction fails
+    """
+    try:
+        with fitz.open(pdf_path) as doc:
+            text = " ".join(page.get_text() for page in doc)
+        return re.sub(r'\s+', ' ', text).strip()
+    except Exception as e:
+        print(f"Error reading full text of {pdf_path}: {e}")
+        return ""
+
+
+@span('load_specter2_model')
 def load_specter2_model():
     """
     Load SPECTER2 model with proximity adapter for semantic distance measurement.
@@ -120,7 +145,8 @@ def load_specter2_model():
     return tokenizer, model
 
 
-def get_embeddings(texts: List[str], tokenizer, model) -> np.ndarray:
+@span('get_embeddings')
+def get_embeddings(texts: List[str], tokenizer, model, batch_size: int = 1, store=None) -> np.ndarray:
     """
     Generate SPECTER2 embeddings for a list of texts.
 
@@ -128,6 +154,10 @@ def get_embeddings(texts: List[str], tokenizer, model) -> np.ndarray:
         texts: List of "{title} [SEP] {abstract}" formatted strings
         tokenizer: SPECTER2 tokenizer
         model: SPECTER2 model with proximity adapter
+        batch_size: Texts per forward pass (padded; the attention mask keeps
+            each CLS embedding independent of its batch neighbours)
+        store: Optional token_store.TokenStore for this tokenizer; token ids are
+            read from it (texts not stored yet are tokenized once and appended)
 
     Returns:
         numpy array of embeddings (n_texts, embedding_dim)
@@ -135,25 +165,34 @@ def get_embeddings(texts: List[str], tokenizer, model) -> np.ndarray:
     import torch
 
     embeddings = []
+    token_ids = store.token_ids(texts, max_length=512) if store is not None else None
 
-    for text in texts:
-        inputs = tokenizer(
-            text,
-            padding=True,
-            truncation=True,
-            max_length=512,
-            return_tensors="pt"
-        )
+    for start in range(0, len(texts), batch_size):
+        if store is not None:
+            from token_store import pad_batch
+
+            input_ids, attention_mask = pad_batch(token_ids[start:start + batch_size], store.tokenizer.pad_id)
+            inputs = {'input_ids': torch.from_numpy(input_ids), 'attention_mask': torch.from_numpy(attention_mask)}
+        else:
+            inputs = tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_tensors="pt"
+            )
+        count('texts_embedded', int(inputs['input_ids'].shape[0]))
+        count('tokens_embedded', int(inputs['attention_mask'].sum()))
 
         with torch.no_grad():
             outputs = model(**inputs)
             # Use CLS token embedding
-            embedding = outputs.last_hidden_state[:, 0, :].numpy()
-            embeddings.append(embedding[0])
+            embeddings.extend(outputs.last_hidden_state[:, 0, :].numpy())
 
     return np.array(embeddings)
 
 
+@span('compute_pairwise_distances')
 def compute_pairwise_distances(embeddings: np.ndarray) -> np.ndarray:
     """
     Compute pairwise cosine distances between all embeddings.
@@ -169,6 +208,7 @@ def compute_pairwise_distances(embeddings: np.ndarray) -> np.ndarray:
     return cosine_distances(embeddings)
 
 
+@span('find_max_distance_pair')
 def find_max_distance_pair(distance_matrix: np.ndarray, paper_names: List[str]) -> Tuple[str, str, float]:
     """
     Find the pair of papers with maximum semantic distance.
@@ -190,7 +230,9 @@ def find_max_distance_pair(distance_matrix: np.ndarray, paper_names: List[str])
     return paper_names[max_idx[0]], paper_names[max_idx[1]], max_distance
 
 
-def create_visualization(distance_matrix: np.ndarray, paper_names: List[str], output_dir: str):
+@span('create_visualization')
+def create_visualization(distance_matrix: np.ndarray, paper_names: List[str], output_dir: str,
+                         model_label: Optional[str] = None):
     """
     Create visualizations: heatmap and t-SNE/MDS plot.
 
@@ -198,6 +240,7 @@ def create_visualization(distance_matrix: np.ndarray, paper_names: List[str], ou
         distance_matrix: Pairwise distance matrix
         paper_names: List of paper identifiers
         output_dir: Directory to save visualizations
+        model_label: Subtitle for the plots (defaults to SPECTER2)
     """
     import matplotlib.pyplot as plt
     import seaborn as sns
@@ -217,7 +260,7 @@ def create_visualization(distance_matrix: np.ndarray, paper_names: List[str], ou
         fmt='.2f',
         square=True
     )
-    plt.title('Pairwise Semantic Distance (Cosine Distance)\nSPECTER2 with Proximity Adapter', fontsize=14)
+    plt.title(f"Pairwise Semantic Distance (Cosine Distance)\n{model_label or 'SPECTER2 with Proximity Adapter'}", fontsize=14)
     plt.xticks(rotation=45, ha='right', fontsize=8)
     plt.yticks(rotation=0, fontsize=8)
     plt.tight_layout()
@@ -242,7 +285,7 @@ def create_visualization(distance_matrix: np.ndarray, paper_names: List[str], ou
             alpha=0.8
         )
 
-    plt.title('MDS Visualization of Paper Semantic Space\nSPECTER2 Embeddings', fontsize=14)
+    plt.title(f"MDS Visualization of Paper Semantic Space\n{model_label or 'SPECTER2 Embeddings'}", fontsize=14)
     plt.xlabel('MDS Dimension 1')
     plt.ylabel('MDS Dimension 2')
     plt.tight_layout()
@@ -251,13 +294,59 @@ def create_visualization(distance_matrix: np.ndarray, paper_names: List[str], ou
     print(f"Saved: mds_visualization.png")
 
 
+@span('paper_similarity')
 def main():
     """Main pipeline execution."""
 
+    # --quiet / --trace=PATH / --metrics=PATH (see instrumentation.py)
+    configure()
+
     # Configuration
     PDF_DIR = "./pdfs"
     OUTPUT_DIR = "./output"
 
+    # Similarity backend: specter2 (default), or tfidf / bm25 (offline, sparse)
+    #   python paper_similarity.py --backend=tfidf [--full-text]
+    BACKEND = os.environ.get('SIMILARITY_BACKEND', 'specter2')
+    for arg in sys.argv[1:]:
+        if arg.startswith('--backend='):
+            BACKEND = arg.split('=', 1)[1]
+    FULL_TEXT = '--full-text' in sys.argv[1:]
+
+    # Use embeddings merged from a sharded run instead of loading the model here
+    #   python embedding_shards.py run --shards=4   (after extracted_papers.csv exists)
+    #   python paper_similarity.py --from-shards
+    FROM_SHARDS = '--from-shards' in sys.argv[1:]
+
+    # Update output/distance_state.npz (per-paper top-k lists, farthest pairs) for
+    # the papers that were added/removed instead of recomputing the full matrix
+    #   python paper_similarity.py --incremental
+    INCREMENTAL = '--incremental' in sys.argv[1:]
+
+    # Re-select the max-distance pair under text perturbations (sentence dropout,
+    # truncation, title/abstract only) and write output/pair_stability.csv
+    #   python paper_similarity.py --stability[=200]
+    STABILITY_REPLICATES = None
+    for arg in sys.argv[1:]:
+        if arg == '--stability':
+            STABILITY_REPLICATES = 200
+        elif arg.startswith('--stability='):
+            STABILITY_REPLICATES = int(arg.split('=', 1)[1])
+
+    # Blend in citation distances (bibliographic coupling / co-citation from papers_json references)
+    #   python paper_similarity.py --blend-citations[=0.3]
+    CITATION_WEIGHT = None
+    for arg in sys.argv[1:]:
+        if arg == '--blend-citations':
+            CITATION_WEIGHT = 0.3
+        elif arg.startswith('--blend-citations='):
+            CITATION_WEIGHT = float(arg.split('=', 1)[1])
+
+    # Sparse backends write to output/<backend>/ so cached SPECTER2 results stay comparable
+    SPECTER2_DIR = OUTPUT_DIR
+    if BACKEND != 'specter2':
+        OUTPUT_DIR = os.path.join(OUTPUT_DIR, BACKEND)
+
     # Create output directory
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -271,6 +360,8 @@ def main():
 
     for pdf_path in pdf_files:
         print(f"\nProcessing: {pdf_path.name}")
+        count('pdfs_read')
+        count('pdf_bytes_read', pdf_path.stat().st_size)
         title, abstract = extract_title_abstract_from_pdf(str(pdf_path))
 
         if title and abstract:
@@ -280,6 +371,7 @@ def main():
                 'abstract': abstract,
                 'specter_input': f"{title} [SEP] {abstract}"
             }
+            count('papers_extracted')
             print(f"  Title: {title[:60]}...")
             print(f"  Abstract: {abstract[:100]}...")
         else:
@@ -291,35 +383,200 @@ def main():
         print("Error: Need at least 2 papers to compute distances")
         return
 
+    # Skip near-duplicate copies (same paper under different names) before embedding
+    if '--no-dedupe' not in sys.argv[1:]:
+        from paper_dedupe import (cluster_signatures, clusters_of, load_mapping, merge_mappings,
+                                  pdf_signatures, save_mapping, skip_duplicates)
+
+        print("\n" + "="*60)
+        print("Step 1b: Skipping near-duplicate papers (MinHash / LSH)")
+        print("="*60)
+
+        # Full text is extracted only for PDFs without a cached MinHash signature
+        signatures, lengths, extracted = pdf_signatures(
+            {pid: os.path.join(PDF_DIR, info['filename']) for pid, info in papers.items()})
+        count('dedupe_texts_extracted', extracted)
+        with span('find_duplicates', papers=len(signatures)):
+            current, _ = cluster_signatures(signatures, lengths)
+        mapping = merge_mappings(load_mapping(), current)
+        save_mapping(mapping, clusters_of(mapping))
+
+        kept, skipped = skip_duplicates(list(papers), mapping)
+        for pid, kept_id in skipped.items():
+            print(f"  Skipping {pid} (duplicate of {kept_id})")
+        papers = {pid: papers[pid] for pid in kept}
+        count('duplicates_skipped', len(skipped))
+        print(f"{len(papers)} unique papers ({len(skipped)} duplicates skipped)")
+
+        if len(papers) < 2:
+            print("Error: Need at least 2 papers to compute distances")
+            return
+
     # Save extracted data
     papers_df = pd.DataFrame.from_dict(papers, orient='index')
     papers_df.to_csv(os.path.join(OUTPUT_DIR, 'extracted_papers.csv'))
     print(f"Saved: extracted_papers.csv")
 
-    # Step 2: Generate SPECTER2 embeddings
-    print("\n" + "="*60)
-    print("Step 2: Generating SPECTER2 embeddings")
-    print("="*60)
-
-    tokenizer, model = load_specter2_model()
-
     paper_ids = list(papers.keys())
-    texts = [papers[pid]['specter_input'] for pid in paper_ids]
 
-    embeddings = get_embeddings(texts, tokenizer, model)
-    print(f"Generated embeddings: {embeddings.shape}")
+    if BACKEND == 'specter2':
+        if FROM_SHARDS:
+            from embedding_shards import MERGED_INDEX_PATH, load_merged
+
+            # Step 2: Load embeddings merged from the shard stores
+            print("\n" + "="*60)
+            print("Step 2: Loading sharded SPECTER2 embeddings")
+            print("="*60)
+
+            if not os.path.exists(MERGED_INDEX_PATH):
+                print(f"Error: {MERGED_INDEX_PATH} not found")
+                print("Run: python embedding_shards.py run --shards=N  (or embed each shard, then merge)")
+                return
+            try:
+                embeddings, identity = load_merged(paper_ids)
+            except KeyError as e:
+                print(f"Error: {e.args[0]}; re-run the affected shards and merge")
+                return
+            print(f"Loaded embeddings: {embeddings.shape} "
+                  f"({identity.get('model', identity.get('backend'))})")
+        else:
+            # Step 2: Generate SPECTER2 embeddings
+            print("\n" + "="*60)
+            print("Step 2: Generating SPECTER2 embeddings")
+            print("="*60)
+
+            from token_store import HFTokenizer, TokenStore
+
+            tokenizer, model = load_specter2_model()
+
+            texts = [papers[pid]['specter_input'] for pid in paper_ids]
+
+            # Token ids come from output/token_store/ (tokenized once per tokenizer)
+            store = TokenStore(HFTokenizer(tokenizer))
+            embeddings = get_embeddings(texts, tokenizer, model, store=store)
+            print(f"Generated embeddings: {embeddings.shape}")
+
+        # Save embeddings
+        embeddings_df = pd.DataFrame(embeddings, index=paper_ids)
+        embeddings_df.to_csv(os.path.join(OUTPUT_DIR, 'embeddings.csv'))
+        print(f"Saved: embeddings.csv")
+
+        if INCREMENTAL:
+            from distance_state import DISTANCE_STATE_PATH, load_or_create
+
+            # Step 3: Update the distance state with only the changed papers
+            print("\n" + "="*60)
+            print("Step 3: Updating incremental distance state")
+            print("="*60)
+
+            if CITATION_WEIGHT:
+                print("Note: --blend-citations needs the full matrix and is not applied with --incremental")
+            state = load_or_create(DISTANCE_STATE_PATH, identity=identity if FROM_SHARDS else None)
+            stats = state.sync(paper_ids, embeddings)
+            state.save(DISTANCE_STATE_PATH)
+            print(f"{len(state)} papers: {stats['added']} added, {stats['removed']} removed, "
+                  f"{stats['changed']} changed, {stats['unchanged']} unchanged")
+            print(f"Saved: {os.path.basename(DISTANCE_STATE_PATH)}")
+
+            rows = []
+            for pid in paper_ids:
+                for kind, entries in state.neighbours(pid).items():
+                    rows += [{'paper_id': pid, 'kind': kind, 'rank': rank + 1, 'other_id': other,
+                              'cosine_distance': distance} for rank, (other, distance) in enumerate(entries)]
+            pd.DataFrame(rows).to_csv(os.path.join(OUTPUT_DIR, 'distance_topk.csv'), index=False)
+            print(f"Saved: distance_topk.csv")
+
+            id1, id2, max_dist = state.farthest_pairs(1)[0]
+            pd.DataFrame([{
+                'paper1_id': id1, 'paper1_title': papers[id1]['title'],
+                'paper2_id': id2, 'paper2_title': papers[id2]['title'],
+                'cosine_distance': max_dist,
+            }]).to_csv(os.path.join(OUTPUT_DIR, 'max_distance_pair.csv'), index=False)
+            print(f"\nMost distant pair: {papers[id1]['title']} / {papers[id2]['title']} ({max_dist:.4f})")
+            print(f"Saved: max_distance_pair.csv")
+            return
+
+        # Step 3: Compute pairwise distances
+        print("\n" + "="*60)
+        print("Step 3: Computing pairwise cosine distances")
+        print("="*60)
+
+        distance_matrix = compute_pairwise_distances(embeddings)
+    else:
+        from scipy import sparse
+        from sparse_similarity import (FULL_MATRIX_LIMIT, build_term_matrix, compare_with_cached,
+                                       farthest_pairs, pairwise_distances)
+
+        # Step 2: Build sparse term matrix
+        print("\n" + "="*60)
+        print(f"Step 2: Building sparse {BACKEND.upper()} matrix{' (full text)' if FULL_TEXT else ''}")
+        print("="*60)
+
+        if INCREMENTAL:
+            # IDF weights depend on the whole corpus, so stored vectors go stale whenever
+            # a paper is added or removed; the sparse path always rebuilds instead
+            print(f"Note: --incremental needs the specter2 backend and is not applied with --backend={BACKEND}")
+
+        texts = []
+        for pid in paper_ids:
+            text = f"{papers[pid]['title']} {papers[pid]['abstract']}"
+            if FULL_TEXT:
+                text += " " + extract_full_text_from_pdf(os.path.join(PDF_DIR, papers[pid]['filename']))
+            texts.append(text)
+
+        with span('build_term_matrix', scheme=BACKEND, papers=len(texts)):
+            term_matrix, vocabulary = build_term_matrix(texts, scheme=BACKEND)
+        print(f"Term matrix: {term_matrix.shape}, {term_matrix.nnz} non-zeros")
+        sparse.save_npz(os.path.join(OUTPUT_DIR, 'term_matrix.npz'), term_matrix)
+        print(f"Saved: term_matrix.npz")
+
+        if len(paper_ids) > FULL_MATRIX_LIMIT:
+            # Too many papers for an n x n matrix: scan blocks for the farthest pair only
+            with span('farthest_pairs', papers=len(paper_ids)):
+                i, j, distance = farthest_pairs(term_matrix, n_pairs=1)[0]
+            pd.DataFrame([{
+                'paper1_id': paper_ids[i], 'paper1_title': papers[paper_ids[i]]['title'],
+                'paper2_id': paper_ids[j], 'paper2_title': papers[paper_ids[j]]['title'],
+                'cosine_distance': distance,
+            }]).to_csv(os.path.join(OUTPUT_DIR, 'max_distance_pair.csv'), index=False)
+            print(f"\nMost distant pair: {paper_ids[i]} / {paper_ids[j]} ({distance:.4f})")
+            print(f"Saved: max_distance_pair.csv")
+            return
+
+        # Step 3: Compute pairwise distances
+        print("\n" + "="*60)
+        print("Step 3: Computing pairwise cosine distances (blocked sparse products)")
+        print("="*60)
+
+        with span('pairwise_distances', papers=len(paper_ids)):
+            distance_matrix = pairwise_distances(term_matrix).astype(np.float64)
+
+        agreement = compare_with_cached(distance_matrix, paper_ids, SPECTER2_DIR)
+        if agreement:
+            print(f"Rank agreement with cached SPECTER2 ({agreement['papers']} papers):")
+            for key, value in agreement.items():
+                if key != 'papers':
+                    print(f"  {key}: {value:.4f}")
+            pd.DataFrame([agreement]).to_csv(os.path.join(OUTPUT_DIR, 'rank_agreement.csv'), index=False)
+            print(f"Saved: rank_agreement.csv")
+        else:
+            print("No cached SPECTER2 distance_matrix.csv to compare against")
 
-    # Save embeddings
-    embeddings_df = pd.DataFrame(embeddings, index=paper_ids)
-    embeddings_df.to_csv(os.path.join(OUTPUT_DIR, 'embeddings.csv'))
-    print(f"Saved: embeddings.csv")
+    if CITATION_WEIGHT:
+        from citation_graph import blend_distances, citation_distances
 
-    # Step 3: Compute pairwise distances
-    print("\n" + "="*60)
-    print("Step 3: Computing pairwise cosine distances")
-    print("="*60)
+        print("\n" + "="*60)
+        print(f"Step 3b: Blending citation distances (weight {CITATION_WEIGHT})")
+        print("="*60)
 
-    distance_matrix = compute_pairwise_distances(embeddings)
+        with span('citation_distances', papers=len(paper_ids)):
+            citation = citation_distances(paper_ids)
+        defined = int(np.isfinite(citation[np.triu_indices(len(paper_ids), 1)]).sum())
+        print(f"Citation distance defined for {defined} of {len(paper_ids) * (len(paper_ids) - 1) // 2} pairs")
+        pd.DataFrame(citation, index=paper_ids, columns=paper_ids).to_csv(
+            os.path.join(OUTPUT_DIR, 'citation_distance.csv'))
+        print(f"Saved: citation_distance.csv")
+        distance_matrix = blend_distances(distance_matrix, citation, CITATION_WEIGHT)
 
     # Save distance matrix
     distance_df = pd.DataFrame(distance_matrix, index=paper_ids, columns=paper_ids)
@@ -359,6 +616,30 @@ def main():
     result_df.to_csv(os.path.join(OUTPUT_DIR, 'max_distance_pair.csv'), index=False)
     print(f"\nSaved: max_distance_pair.csv")
 
+    if STABILITY_REPLICATES is not None:
+        from pair_stability import STABILITY_PATH, build_schemes, pair_stability, print_summary
+
+        # Step 4b: How often the pair survives perturbed inputs
+        print("\n" + "="*60)
+        print("Step 4b: Max-distance pair stability under text perturbation")
+        print("="*60)
+
+        if BACKEND != 'specter2':
+            print("Note: --stability re-embeds texts and needs the specter2 backend; skipped")
+        else:
+            if FROM_SHARDS:
+                from embedding_shards import load_backend
+
+                embed, _ = load_backend('specter2', batch_size=32)
+            else:
+                embed = lambda texts: get_embeddings(texts, tokenizer, model, batch_size=32, store=store)
+            stability = pair_stability(papers_df.loc[paper_ids], embed, build_schemes(STABILITY_REPLICATES))
+            stability.to_csv(STABILITY_PATH, index=False)
+            print_summary(stability, {pid: papers[pid]['title'] for pid in paper_ids})
+            if CITATION_WEIGHT:
+                print("Note: replicates use embedding distances only (citations are not blended)")
+            print(f"Saved: {STABILITY_PATH}")
+
     # Step 5: Create visualizations
     print("\n" + "="*60)
     print("Step 5: Creating visualizations")
@@ -366,16 +647,25 @@ def main():
 
     # Use short titles for visualization
     short_titles = [t[:25] + "..." if len(t) > 25 else t for t in paper_titles]
-    create_visualization(distance_matrix, short_titles, OUTPUT_DIR)
+    model_label = None if BACKEND == 'specter2' else f"Sparse {BACKEND.upper()} (offline)"
+    create_visualization(distance_matrix, short_titles, OUTPUT_DIR, model_label)
 
     print("\n" + "="*60)
     print("Pipeline completed successfully!")
     print("="*60)
     print(f"\nOutput files in: {OUTPUT_DIR}/")
     print("  - extracted_papers.csv (title, abstract for each paper)")
-    print("  - embeddings.csv (SPECTER2 embeddings)")
+    if BACKEND == 'specter2':
+        print("  - embeddings.csv (SPECTER2 embeddings)")
+    else:
+        print(f"  - term_matrix.npz (sparse {BACKEND.upper()} matrix)")
+        print("  - rank_agreement.csv (vs cached SPECTER2, if available)")
+    if CITATION_WEIGHT:
+        print("  - citation_distance.csv (coupling / co-citation distances, blended into distance_matrix.csv)")
     print("  - distance_matrix.csv (pairwise cosine distances)")
     print("  - max_distance_pair.csv (most distant pair)")
+    if STABILITY_REPLICATES is not None and BACKEND == 'specter2':
+        print("  - pair_stability.csv (pair selection frequencies under text perturbation)")
     print("  - distance_heatmap.png (visualization)")
     print("  - mds_visualization.png (2D projection)")
 
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+퀴즈 문항 → 논문 섹션/문단 정렬
+questions_data/*.json의 section 라벨("Introduction", "Methods" 등)은 손으로 적은 값이라
+papers_json의 번호 붙은 섹션 제목("1 Introduction", "4 Methods")과 맞지 않습니다.
+문항, 보기, 정답을 해당 논문의 문단과 함께 임베딩해 가장 근거가 되는 섹션/문단과
+신뢰도를 계산하고 question_alignment/<paperId>.json에 캐시합니다.
+
+점수 (문단별):
+    0.5 * cos(문항) + 0.5 * cos(정답) - WRONG_OPTION_WEIGHT * 평균 cos(오답 보기)
+    + LABEL_WEIGHT (문단의 상위 섹션이 section 라벨과 같은 역할일 때: 예 "Results" ↔ "5 Findings")
+    섹션 점수는 섹션 안 문단 점수의 최대값, 신뢰도는 섹션 점수 softmax에서 1위의 확률입니다.
+
+임베딩은 다국어 문장 인코더(MODEL_NAME)를 사용합니다 (문항은 한국어, 논문은 영어).
+모델을 불러올 수 없으면 BM25(영어 문항) + 라벨로 대신 계산하고 method 필드에 표시합니다.
+BM25 점수가 모두 0이면 라벨만으로 정하고(method 'label'), 라벨과 맞는 문단도 없으면
+섹션/문단을 비워 정렬 안 됨(method 'unaligned')으로 기록합니다.
+문항/논문 내용/모델이 바뀌지 않은 문항은 캐시에서 바로 읽습니다.
+
+사용법:
+    python question_alignment.py [paper_id ...] [--refresh]
+
+reading_analytics.py가 결과를 읽어 퀴즈 정답 여부와 해당 섹션 체류 시간을 조인합니다.
+"""
+
+import hashlib
+import json
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from paper_content import PROJECT_DIR, iter_paragraphs, load_paper_content
+from section_retrieval import BM25Index
+
+QUESTIONS_DIR = PROJECT_DIR / 'questions_data'
+ALIGNMENT_DIR = PROJECT_DIR / 'question_alignment'
+
+MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+ENCODE_BATCH_SIZE = 32
+
+WRONG_OPTION_WEIGHT = 0.25
+LABEL_WEIGHT = 0.1
+SOFTMAX_TEMPERATURE = 0.05
+
+# section 라벨과 섹션 제목을 같은 역할로 묶는 키워드 (앞에서부터 먼저 맞는 역할)
+SECTION_ROLES = [
+    ('abstract', ['abstract']),
+    ('related', ['related work', 'background', 'literature', 'prior work']),
+    ('introduction', ['introduction', 'motivation']),
+    ('method', ['method', 'methodology', 'study design', 'procedure', 'participants', 'user study',
+                'implementation', 'system', 'design', 'approach']),
+    ('results', ['result', 'finding', 'evaluation', 'analysis']),
+    ('discussion', ['discussion', 'implication', 'limitation']),
+    ('conclusion', ['conclusion', 'future work', 'next step']),
+    ('backmatter', ['acknowledg', 'reference', 'appendix']),
+]
+
+# 문항 근거로 보지 않는 역할
+EXCLUDED_ROLES = {'backmatter'}
+
+# 점수 계산 방식이 바뀌면 올려서 캐시를 무효화
+ALIGNMENT_VERSION = 3
+
+ALIGNMENT_COLUMNS = ['paper', 'questionId', 'label', 'alignedSection', 'alignedTopSection',
+                     'paragraphId', 'confidence', 'method']
+
+
+def strip_numbering(title):
+    """'4.1 Phase 1 - Lab Study' → 'phase 1 - lab study', 'A Appendix' → 'appendix'"""
+    return re.sub(r'^([A-Z]|\d+)(\.\d+)*\.?\s+', '', title.strip()).lower()
+
+
+def section_role(title):
+    title = strip_numbering(title or '')
+    for role, keywords in SECTION_ROLES:
+        if any(keyword in title for keyword in keywords):
+            return role
+    return title or None
+
+
+class SentenceEncoder:
+    """다국어 문장 임베딩 (mean pooling, L2 정규화)"""
+
+    def __init__(self, model_name=MODEL_NAME):
+        from transformers import AutoModel, AutoTokenizer
+        import torch
+
+        self.torch = torch
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.eval()
+
+    def encode(self, texts):
+        vectors = []
+        for i in range(0, len(texts), ENCODE_BATCH_SIZE):
+            batch = self.tokenizer(texts[i:i + ENCODE_BATCH_SIZE], padding=True, truncation=True,
+                                   max_length=256, return_tensors='pt')
+            with self.torch.no_grad():
+                output = self.model(**batch).last_hidden_state
+            mask = batch['attention_mask'].unsqueeze(-1).float()
+            pooled = (output * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            vectors.append(pooled.numpy())
+        vectors = np.vstack(vectors) if vectors else np.zeros((0, 1), dtype=np.float32)
+        return (vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+
+def load_encoder(model_name=MODEL_NAME):
+    try:
+        return SentenceEncoder(model_name)
+    except Exception as e:
+        print(f'  ⚠️ 임베딩 모델을 불러올 수 없어 BM25 + 라벨로 정렬합니다: {e}')
+        return None
+
+
+def load_questions(questions_dir=QUESTIONS_DIR):
+    """{paperId: [question, ...]}"""
+    papers = {}
+    for json_file in sorted(Path(questions_dir).glob('*.json')):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        papers[data.get('paperId', json_file.stem)] = data.get('questions', [])
+    return papers
+
+
+def question_key(question, content_hash, method):
+    payload = json.dumps([question.get('question'), question.get('options'), question.get('correctAnswer'),
+                          question.get('section'), content_hash, method, ALIGNMENT_VERSION], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def correct_answers(question):
+    """정답 목록 (복수 정답 문항은 correctAnswer가 리스트)"""
+    answer = question.get('correctAnswer')
+    if not answer:
+        return []
+    if isinstance(answer, (list, tuple)):
+        return [str(option) for option in answer if option]
+    return [str(answer)]
+
+
+def softmax_confidence(section_scores):
+    values = np.array(list(section_scores.values()), dtype=np.float64)
+    weights = np.exp((values - values.max()) / SOFTMAX_TEMPERATURE)
+    return float(weights.max() / weights.sum())
+
+
+class PaperAligner:
+    """논문 하나의 문단 단위 점수 계산"""
+
+    def __init__(self, paper_id, encoder=None, project_dir=PROJECT_DIR):
+        content = load_paper_content(paper_id, project_dir)['content']
+        self.paper_id = paper_id
+        self.paragraphs = list(iter_paragraphs(content))
+        texts = [text for _, _, _, text in self.paragraphs]
+        self.content_hash = hashlib.sha1('\n'.join(texts).encode('utf-8')).hexdigest()
+        self.roles = [section_role(top_section) for _, _, top_section, _ in self.paragraphs]
+        self.encoder = encoder
+        self.method = f'embedding:{encoder.model_name}' if encoder else 'bm25'
+        self.embeddings = encoder.encode(texts) if encoder else None
+        self.bm25 = None if encoder else BM25Index.build(texts)
+
+    def paragraph_scores(self, question):
+        answers = correct_answers(question)
+        correct = ' '.join(answers)
+        wrong = [option for option in question.get('options') or [] if option not in answers]
+
+        if self.embeddings is not None:
+            vectors = self.encoder.encode([question.get('question', ''), correct] + wrong)
+            similarity = self.embeddings @ vectors.T
+            scores = 0.5 * similarity[:, 0] + 0.5 * similarity[:, 1]
+            if wrong:
+                scores -= WRONG_OPTION_WEIGHT * similarity[:, 2:].mean(axis=1)
+        else:
+            scores = self.bm25.scores(f"{question.get('question', '')} {correct}").astype(np.float64)
+            if scores.max() > 0:
+                scores = scores / scores.max()
+            else:
+                self.last_method = 'label'
+
+        label_role = section_role(question.get('section'))
+        if label_role:
+            scores = scores + LABEL_WEIGHT * np.array([role == label_role for role in self.roles], dtype=np.float64)
+        scores[[role in EXCLUDED_ROLES for role in self.roles]] = -np.inf
+        return scores
+
+    def align(self, question):
+        self.last_method = self.method
+        scores = self.paragraph_scores(question)
+        section_scores = {}
+        for (_, section, _, _), score in zip(self.paragraphs, scores):
+            if np.isfinite(score):
+                section_scores[section] = max(section_scores.get(section, -np.inf), float(score))
+
+        # 근거 문단이 없으면 argmax가 첫 문단(초록)을 고르므로 정렬 안 됨으로 기록
+        finite = np.isfinite(scores)
+        if not finite.any() or (self.last_method == 'label' and not (scores[finite] > 0).any()):
+            return {
+                'questionId': str(question['id']),
+                'label': question.get('section'),
+                'alignedSection': None,
+                'alignedTopSection': None,
+                'paragraphId': None,
+                'confidence': 0.0,
+                'method': 'unaligned',
+            }
+
+        best = int(np.argmax(scores))
+        paragraph_id, section, top_section, _ = self.paragraphs[best]
+        return {
+            'questionId': str(question['id']),
+            'label': question.get('section'),
+            'alignedSection': section,
+            'alignedTopSection': top_section,
+            'paragraphId': paragraph_id,
+            'confidence': round(softmax_confidence(section_scores), 4),
+            'method': self.last_method,
+        }
+
+
+def align_paper(paper_id, questions, encoder=None, alignment_dir=ALIGNMENT_DIR, refresh=False):
+    """논문 하나의 문항 정렬 (캐시된 문항은 재계산하지 않음)"""
+    alignment_dir = Path(alignment_dir)
+    alignment_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = alignment_dir / f'{paper_id}.json'
+    cache = {}
+    if cache_path.exists() and not refresh:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f).get('questions', {})
+
+    aligner = PaperAligner(paper_id, encoder)
+    results = {}
+    computed = 0
+    for question in questions:
+        key = question_key(question, aligner.content_hash, aligner.method)
+        if key in cache:
+            results[key] = cache[key]
+            continue
+        results[key] = aligner.align(question)
+        computed += 1
+
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'paperId': paper_id, 'method': aligner.method, 'questions': results}, f, ensure_ascii=False, indent=2)
+    methods = Counter(result['method'] for result in results.values())
+    print(f'✓ {paper_id}: 문항 {len(questions)}개 (새로 계산 {computed}개, '
+          f"{', '.join(f'{method} {n}개' for method, n in methods.most_common())})")
+    return list(results.values())
+
+
+def load_alignments(alignment_dir=ALIGNMENT_DIR):
+    """캐시된 정렬 결과 → DataFrame (paper, questionId, alignedSection, ...)"""
+    rows = []
+    for json_file in sorted(Path(alignment_dir).glob('*.json')):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for result in data.get('questions', {}).values():
+            rows.append({'paper': data['paperId'], **result})
+    return pd.DataFrame(rows, columns=ALIGNMENT_COLUMNS)
+
+
+def main():
+    refresh = '--refresh' in sys.argv[1:]
+    paper_ids = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    papers = load_questions()
+    if paper_ids:
+        papers = {paper_id: papers[paper_id] for paper_id in paper_ids if paper_id in papers}
+
+    print(f"\n{'='*60}")
+    print(f'Aligning quiz questions for {len(papers)} paper(s)')
+    print(f"{'='*60}\n")
+
+    encoder = load_encoder()
+    methods = Counter()
+    for paper_id, questions in papers.items():
+        for result in align_paper(paper_id, questions, encoder, refresh=refresh):
+            methods[result['method']] += 1
+            if result['method'] == 'unaligned':
+                print(f"   Q{result['questionId']}: {result['label']} → 정렬 안 됨 (근거 문단 없음)")
+                continue
+            marker = '' if section_role(result['label']) == section_role(result['alignedTopSection']) else '  ← 라벨과 다름'
+            print(f"   Q{result['questionId']}: {result['label']} → {result['alignedSection']} "
+                  f"(문단 {result['paragraphId']}, {result['confidence']:.2f}, {result['method']}){marker}")
+
+    print(f"\n방식별 문항 수: {', '.join(f'{method} {n}개' for method, n in methods.most_common())}")
+    print(f'✅ 저장: {ALIGNMENT_DIR}')
+
+
+if __name__ == '__main__':
+    main()
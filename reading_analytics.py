@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+읽기 행동 분석 (export_sessions.py로 내보낸 Parquet 테이블 기반)
+analytics.html / reading_phase_complete 요약과 같은 지표를 세션 전체에 대해
+pandas group-by 한 번씩으로 계산합니다.
+
+사용법:
+    python reading_analytics.py [export_dir] [output_dir] [--all-participants]
+
+출력 (output_dir, 기본값 <export_dir>/analytics):
+    session_summary.csv     세션별 reading/scanning/scrolling/llm 시간, scan/read 비율,
+                            LLM 전환 지표, 퀴즈 점수
+    section_dwell.csv       세션 x 섹션별 분류 시간 (sectionAnalysis와 동일)
+    condition_summary.csv   조건별 평균/표준편차
+    paper_summary.csv       논문별 평균/표준편차
+    question_dwell.csv      문항별 정답 여부 x 근거 섹션 체류 시간
+                            (question_alignment.py 결과가 있을 때)
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from export_sessions import build_frame
+from question_alignment import load_alignments
+from session_timeline import load_section_index
+
+QUESTIONS_DIR = Path(__file__).parent / 'questions_data'
+
+# analytics.html과 같은 참가자 필터 (P001, P002, ...)
+PARTICIPANT_PATTERN = r'^P\d{3}$'
+
+CLASSIFICATIONS = ['reading', 'scanning', 'scrolling']
+
+SUMMARY_METRICS = [
+    'readingMs', 'scanningMs', 'scrollingMs', 'llmMs',
+    'scanReadRatio', 'chatVisits', 'chatVisitsPerMin', 'typingShare', 'quizScore',
+]
+
+
+def load_tables(export_dir, participant_pattern=PARTICIPANT_PATTERN):
+    """분석에 필요한 테이블 읽기 (없는 테이블은 빈 테이블)"""
+    export_dir = Path(export_dir)
+    tables = {}
+    for table in ['sessions', 'events_scroll_action', 'events_focus_switch',
+                  'events_llm_activity', 'quiz_answers']:
+        path = export_dir / f'{table}.parquet'
+        tables[table] = pd.read_parquet(path) if path.exists() else build_frame(table, [])
+
+    if participant_pattern:
+        keep = tables['sessions'].loc[
+            tables['sessions']['participantId'].str.match(participant_pattern, na=False), 'sessionKey'
+        ]
+        tables = {name: frame[frame['sessionKey'].isin(keep)] for name, frame in tables.items()}
+
+    return tables
+
+
+def load_answer_keys(questions_dir=QUESTIONS_DIR):
+    """questions_data/*.json → (paper, questionId, correctAnswer, section)"""
+    rows = []
+    for json_file in sorted(Path(questions_dir).glob('*.json')):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        paper = data.get('paperId', json_file.stem)
+        for question in data.get('questions', []):
+            correct = question.get('correctAnswer')
+            # 복수 선택 정답은 export_sessions가 응답을 저장하는 형식(JSON 문자열)으로 비교
+            if correct is not None and not isinstance(correct, str):
+                correct = json.dumps(correct, ensure_ascii=False)
+            rows.append({
+                'paper': paper,
+                'questionId': str(question['id']),
+                'correctAnswer': correct,
+                'section': question.get('section'),
+            })
+    return pd.DataFrame(rows, columns=['paper', 'questionId', 'correctAnswer', 'section'])
+
+
+def classification_totals(scroll):
+    """세션별 분류 count/duration (classificationSummary와 동일)"""
+    grouped = scroll.groupby(['sessionKey', 'classification'], observed=True)['pauseDuration']
+    totals = grouped.agg(['count', 'sum']).unstack('classification', fill_value=0)
+
+    result = pd.DataFrame(index=totals.index)
+    for classification in CLASSIFICATIONS:
+        result[f'{classification}Count'] = totals.get(('count', classification), 0)
+        result[f'{classification}Ms'] = totals.get(('sum', classification), 0.0)
+    return result
+
+
+def section_dwell(scroll):
+    """세션 x 섹션별 분류 시간 (sectionAnalysis와 동일)"""
+    dwell = (
+        scroll.groupby(['sessionKey', 'sectionBeforeScroll', 'classification'], observed=True)['pauseDuration']
+        .sum()
+        .unstack('classification', fill_value=0)
+        .reindex(columns=CLASSIFICATIONS, fill_value=0)
+        .rename_axis(index={'sectionBeforeScroll': 'section'}, columns=None)
+    )
+    dwell['totalMs'] = dwell[CLASSIFICATIONS].sum(axis=1)
+    return dwell.reset_index()
+
+
+def llm_interleaving(focus, llm_activity):
+    """세션별 LLM 사용 시간과 reading ↔ chat 전환 지표"""
+    is_llm = focus['classification'].eq('llm').fillna(False)
+    to_chat = focus['to'].eq('chat').fillna(False)
+
+    per_focus = pd.DataFrame({
+        'sessionKey': focus['sessionKey'],
+        'llmMs': focus['llmDuration'].where(is_llm, 0).fillna(0),
+        'chatVisits': to_chat.astype(int),
+    }).groupby('sessionKey').sum()
+
+    typing = (
+        llm_activity.groupby(['sessionKey', 'classification'], observed=True)['duration']
+        .sum()
+        .unstack('classification', fill_value=0)
+        .reindex(columns=['typing', 'none-typing'], fill_value=0)
+    )
+    per_focus = per_focus.join(typing.rename(columns={'typing': 'typingMs', 'none-typing': 'noneTypingMs'}),
+                               how='outer')
+    return per_focus.fillna(0)
+
+
+def quiz_scores(quiz_answers, answer_keys):
+    """세션별 퀴즈 점수 (analytics.html의 calculateQuizScore와 동일: 응답한 문항 기준 %)"""
+    graded = quiz_answers.merge(answer_keys, on=['paper', 'questionId'], how='inner')
+    graded['correct'] = (graded['answer'] == graded['correctAnswer']).astype(int)
+    scores = graded.groupby('sessionKey').agg(quizAnswered=('correct', 'size'), quizCorrect=('correct', 'sum'))
+    scores['quizScore'] = scores['quizCorrect'] / scores['quizAnswered'] * 100
+    return scores
+
+
+def question_dwell(quiz_answers, answer_keys, alignments, dwell, sessions, section_index):
+    """문항별 정답 여부와 정렬된 섹션(및 상위 섹션)의 체류 시간"""
+    graded = quiz_answers.merge(answer_keys, on=['paper', 'questionId'], how='inner')
+    graded['correct'] = (graded['answer'] == graded['correctAnswer']).astype(int)
+    # 정렬 안 된 문항(근거 문단 없음)은 체류 시간과 조인하지 않음
+    aligned = alignments[alignments['method'] != 'unaligned'].drop(columns=['label'])
+    graded = graded.merge(aligned, on=['paper', 'questionId'], how='inner')
+
+    dwell = dwell.merge(sessions[['sessionKey', 'paper']], on='sessionKey', how='left')
+    dwell['topSection'] = [
+        section_index.get(paper, {}).get(section, {}).get('top', section)
+        for paper, section in zip(dwell['paper'], dwell['section'])
+    ]
+    section_ms = dwell[['sessionKey', 'section', 'totalMs']].rename(
+        columns={'section': 'alignedSection', 'totalMs': 'sectionDwellMs'})
+    top_ms = (dwell.groupby(['sessionKey', 'topSection'], as_index=False)['totalMs'].sum()
+              .rename(columns={'topSection': 'alignedTopSection', 'totalMs': 'topSectionDwellMs'}))
+
+    result = (graded
+              .merge(section_ms, on=['sessionKey', 'alignedSection'], how='left')
+              .merge(top_ms, on=['sessionKey', 'alignedTopSection'], how='left'))
+    result[['sectionDwellMs', 'topSectionDwellMs']] = result[['sectionDwellMs', 'topSectionDwellMs']].fillna(0)
+    return result[['sessionKey', 'participantId', 'condition', 'paper', 'questionId', 'correct',
+                   'alignedSection', 'alignedTopSection', 'confidence', 'sectionDwellMs', 'topSectionDwellMs']]
+
+
+def session_summary(tables, answer_keys):
+    sessions = tables['sessions'].set_index('sessionKey')[
+        ['participantId', 'sessionId', 'condition', 'paper', 'readingDuration']
+    ]
+    summary = (
+        sessions
+        .join(classification_totals(tables['events_scroll_action']))
+        .join(llm_interleaving(tables['events_focus_switch'], tables['events_llm_activity']))
+        .join(quiz_scores(tables['quiz_answers'], answer_keys))
+    )
+
+    count_columns = [f'{c}Count' for c in CLASSIFICATIONS] + ['chatVisits']
+    ms_columns = [f'{c}Ms' for c in CLASSIFICATIONS] + ['llmMs', 'typingMs', 'noneTypingMs']
+    summary[count_columns + ms_columns] = summary[count_columns + ms_columns].fillna(0)
+
+    total_ms = summary[[f'{c}Ms' for c in CLASSIFICATIONS] + ['llmMs']].sum(axis=1)
+    for column in [f'{c}Ms' for c in CLASSIFICATIONS] + ['llmMs']:
+        summary[column.replace('Ms', 'TimeShare')] = summary[column] / total_ms.replace(0, np.nan)
+
+    summary['scanReadRatio'] = summary['scanningMs'] / summary['readingMs'].replace(0, np.nan)
+    minutes = summary['readingDuration'].astype('Float64') / 60000
+    summary['chatVisitsPerMin'] = summary['chatVisits'] / minutes.replace(0, np.nan)
+    chat_ms = summary['typingMs'] + summary['noneTypingMs']
+    summary['typingShare'] = summary['typingMs'] / chat_ms.replace(0, np.nan)
+
+    return summary.reset_index()
+
+
+def group_summary(summary, by):
+    """조건/논문별 평균, 표준편차, 세션 수"""
+    metrics = summary[[by] + SUMMARY_METRICS].copy()
+    metrics[SUMMARY_METRICS] = metrics[SUMMARY_METRICS].astype(float)
+    grouped = metrics.groupby(by, dropna=False)[SUMMARY_METRICS].agg(['mean', 'std'])
+    grouped.columns = [f'{metric}_{stat}' for metric, stat in grouped.columns]
+    grouped.insert(0, 'sessions', summary.groupby(by, dropna=False).size())
+    return grouped.reset_index()
+
+
+def analyze(export_dir, output_dir=None, participant_pattern=PARTICIPANT_PATTERN):
+    tables = load_tables(export_dir, participant_pattern)
+    answer_keys = load_answer_keys()
+
+    summary = session_summary(tables, answer_keys)
+    results = {
+        'session_summary': summary,
+        'section_dwell': section_dwell(tables['events_scroll_action']),
+        'condition_summary': group_summary(summary, 'condition'),
+        'paper_summary': group_summary(summary, 'paper'),
+    }
+
+    alignments = load_alignments()
+    if not alignments.empty:
+        results['question_dwell'] = question_dwell(
+            tables['quiz_answers'], answer_keys, alignments, results['section_dwell'],
+            tables['sessions'], load_section_index(),
+        )
+
+    if output_dir:
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for name, frame in results.items():
+            frame.to_csv(output_dir / f'{name}.csv', index=False)
+            print(f'  ✓ {name}.csv ({len(frame)} rows)')
+
+    return results
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    export_dir = Path(args[0]) if args else Path('./export')
+    output_dir = Path(args[1]) if len(args) > 1 else export_dir / 'analytics'
+    pattern = None if '--all-participants' in sys.argv[1:] else PARTICIPANT_PATTERN
+
+    if not (export_dir / 'sessions.parquet').exists():
+        print(f'❌ sessions.parquet가 없습니다: {export_dir} (먼저 export_sessions.py 실행)')
+        sys.exit(1)
+
+    print('📊 읽기 행동 분석 시작...')
+    results = analyze(export_dir, output_dir, pattern)
+    print(f'🎉 분석 완료: 세션 {len(results["session_summary"])}개 → {output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Section-level retrieval for compact LLM context
+Chunks each paper by section (from the parse_acm_html content items), builds a
+BM25 index and, when SPECTER2 is available, an embedding index offline, and
+serves the top-k sections for a participant question.
+
+Chunks are sized in words by default; RETRIEVAL_CHUNK_UNIT=tokens sizes them in
+SPECTER2 tokens instead (needs transformers). The unit is stored in each index,
+and indexes built with another unit are rebuilt on load.
+
+Usage:
+    python section_retrieval.py build [paper_id ...]
+    python section_retrieval.py query <paper_id> "<question>" [k]
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from paper_content import PROJECT_DIR, list_paper_ids, load_paper_content
+from sparse_similarity import BM25_B, BM25_K1, tokenize
+
+INDEX_DIR = PROJECT_DIR / 'retrieval_index'
+
+# Bump when chunking or BM25 tokenization changes; older indexes are rebuilt on load
+INDEX_VERSION = 2
+
+# Sections longer than this are split at paragraph boundaries
+MAX_CHUNK_WORDS = 300
+# Same, in SPECTER2 tokens (leaves room for the section heading within the 512-token input)
+MAX_CHUNK_TOKENS = 480
+CHUNK_UNITS = {'words': MAX_CHUNK_WORDS, 'tokens': MAX_CHUNK_TOKENS}
+CHUNK_UNIT = os.environ.get('RETRIEVAL_CHUNK_UNIT', 'words')
+
+# Reciprocal rank fusion constant for combining BM25 and embedding ranks
+RRF_K = 60
+
+def chunk_paper(paper_id, project_dir=PROJECT_DIR, unit=CHUNK_UNIT, store=None):
+    """
+    Split a paper into section chunks of at most MAX_CHUNK_WORDS words, or
+    MAX_CHUNK_TOKENS tokens with unit='tokens' (paragraph lengths are read from
+    the token_store.TokenStore, tokenizing new paragraphs once)
+    """
+    if unit not in CHUNK_UNITS:
+        raise ValueError(f"Unknown chunk unit {unit!r} (choose from {', '.join(CHUNK_UNITS)})")
+    data = load_paper_content(paper_id, project_dir)
+    chunks = []
+    current = None
+
+    limit = CHUNK_UNITS[unit]
+    sizes = {}
+    if unit == 'tokens':
+        store = store or token_store()
+        if store is None:
+            raise RuntimeError("Chunk unit 'tokens' needs the SPECTER2 tokenizer (pip install transformers)")
+        paragraphs = list(dict.fromkeys(item['text'] for item in data['content']
+                                        if item['type'] not in ('section', 'subsection') and item.get('text')))
+        specials = store.tokenizer.head + store.tokenizer.tail
+        sizes = dict(zip(paragraphs, (store.lengths(paragraphs) - specials).tolist()))
+
+    def flush():
+        if current and current['paragraphs']:
+            chunks.append({
+                'id': len(chunks),
+                'section': current['section'],
+                'text': '\n\n'.join(current['paragraphs']),
+            })
+
+    for item in data['content']:
+        if item['type'] in ('section', 'subsection'):
+            flush()
+            current = {'section': item['text'], 'paragraphs': [], 'size': 0}
+            continue
+
+        text = item.get('text', '')
+        if not text:
+            continue
+        if current is None:
+            current = {'section': 'Abstract', 'paragraphs': [], 'size': 0}
+
+        size = sizes[text] if unit == 'tokens' else len(text.split())
+        if current['paragraphs'] and current['size'] + size > limit:
+            flush()
+            current = {'section': current['section'], 'paragraphs': [], 'size': 0}
+        current['paragraphs'].append(text)
+        current['size'] += size
+    flush()
+
+    return data['metadata'], chunks
+
+
+class BM25Index:
+    """Okapi BM25 over a small set of chunks with per-term postings"""
+
+    def __init__(self, postings, doc_lengths):
+        self.postings = postings
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        n = len(self.doc_lengths)
+        self.idf = {term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, (docs, _) in postings.items()}
+
+    @classmethod
+    def build(cls, texts):
+        postings = {}
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(doc_id)
+                tfs.append(tf)
+        return cls(postings, lengths)
+
+    def to_dict(self):
+        return {'postings': self.postings, 'doc_lengths': self.doc_lengths.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({term: tuple(value) for term, value in data['postings'].items()}, data['doc_lengths'])
+
+    def scores(self, query):
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, tfs = self.postings[term]
+            docs = np.asarray(docs)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            scores[docs] += self.idf[term] * tfs * (BM25_K1 + 1) / (tfs + norm[docs])
+        return scores
+
+
+def embed_texts(texts):
+    """
+    SPECTER2 embeddings (L2-normalised), or None when the model is unavailable.
+    With EMBEDDING_SERVER set, a running embedding_server.py does the work
+    instead of a model loaded into this process.
+    """
+    try:
+        if os.environ.get('EMBEDDING_SERVER'):
+            from embedding_server import EmbeddingClient
+            embeddings = _load_model(EmbeddingClient).embed(texts)
+        else:
+            from paper_similarity import get_embeddings, load_specter2_model
+            tokenizer, model = _load_model(load_specter2_model)
+            embeddings = get_embeddings(texts, tokenizer, model, store=token_store())
+    except Exception as e:
+        print(f"  ⚠️ Embedding index skipped: {e}")
+        return None
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+_MODEL = None
+_TOKEN_STORE = None
+
+
+def _load_model(loader):
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = loader()
+    return _MODEL
+
+
+def token_store():
+    """SPECTER2 token store (output/token_store/), or None without transformers"""
+    global _TOKEN_STORE
+    if _TOKEN_STORE is None:
+        try:
+            from token_store import TokenStore
+            _TOKEN_STORE = TokenStore('specter2')
+        except Exception:
+            _TOKEN_STORE = False
+    return _TOKEN_STORE or None
+
+
+def build_index(paper_id, index_dir=INDEX_DIR, project_dir=PROJECT_DIR, with_embeddings=True, unit=CHUNK_UNIT):
+    """Chunk a paper and write its BM25 (+ embedding) index to index_dir"""
+    metadata, chunks = chunk_paper(paper_id, project_dir, unit)
+    texts = [f"{chunk['section']}\n{chunk['text']}" for chunk in chunks]
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with open(index_dir / f'{paper_id}.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'index_version': INDEX_VERSION,
+            'chunk_unit': unit,
+            'paper_id': paper_id,
+            'title': metadata.get('title', ''),
+            'chunks': chunks,
+            'bm25': BM25Index.build(texts).to_dict(),
+        }, f, ensure_ascii=False)
+
+    embeddings = embed_texts(texts) if with_embeddings else None
+    embedding_path = index_dir / f'{paper_id}.npy'
+    if embeddings is not None:
+        np.save(embedding_path, embeddings)
+    elif embedding_path.exists():
+        embedding_path.unlink()
+
+    print(f"✓ {paper_id}: {len(chunks)} chunks{' + embeddings' if embeddings is not None else ''}")
+    return chunks
+
+
+class SectionRetriever:
+    """Serves top-k chunks per paper from prebuilt indexes (loaded once, kept in memory)"""
+
+    def __init__(self, index_dir=INDEX_DIR, unit=CHUNK_UNIT):
+        self.index_dir = Path(index_dir)
+        self.unit = unit
+        self.papers = {}
+
+    def _paper(self, paper_id):
+        if paper_id not in self.papers:
+            json_path = self.index_dir / f'{paper_id}.json'
+            if not json_path.exists():
+                return None
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            embedding_path = self.index_dir / f'{paper_id}.npy'
+            if data.get('index_version') != INDEX_VERSION or data.get('chunk_unit') != self.unit:
+                print(f"  Rebuilding stale retrieval index for {paper_id}")
+                build_index(paper_id, self.index_dir, with_embeddings=embedding_path.exists(), unit=self.unit)
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            self.papers[paper_id] = {
+                'chunks': data['chunks'],
+                'bm25': BM25Index.from_dict(data['bm25']),
+                'embeddings': np.load(embedding_path) if embedding_path.exists() else None,
+            }
+        return self.papers[paper_id]
+
+    def search(self, paper_id, question, k=3, use_embeddings=True):
+        """
+        Rank a paper's chunks for a question.
+
+        Returns:
+            List of chunk dicts with an added 'score', best first. Empty when the
+            paper is not indexed or nothing in the question matches.
+        """
+        paper = self._paper(paper_id)
+        if paper is None:
+            return []
+
+        bm25 = paper['bm25'].scores(question)
+        ranked_lists = []
+        if bm25.any():
+            ranked_lists.append(np.argsort(-bm25))
+
+        if use_embeddings and paper['embeddings'] is not None:
+            query = embed_texts([question])
+            if query is not None:
+                ranked_lists.append(np.argsort(-(paper['embeddings'] @ query[0])))
+
+        if not ranked_lists:
+            return []
+
+        fused = np.zeros(len(paper['chunks']), dtype=np.float32)
+        for ranking in ranked_lists:
+            fused[ranking] += 1.0 / (RRF_K + np.arange(1, len(ranking) + 1))
+
+        top = np.argsort(-fused)[:k]
+        return [dict(paper['chunks'][i], score=float(fused[i])) for i in top]
+
+    def compact_context(self, paper_id, question, k=3):
+        """Top-k sections formatted as prompt context, or None to fall back to the full paper"""
+        hits = self.search(paper_id, question, k)
+        if not hits:
+            return None
+        hits.sort(key=lambda chunk: chunk['id'])
+        return '\n\n'.join(f"## {chunk['section']}\n{chunk['text']}" for chunk in hits)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'query'):
+        print(__doc__)
+        sys.exit(1)
+
+    if sys.argv[1] == 'build':
+        paper_ids = sys.argv[2:] or list_paper_ids()
+        print(f"\n{'='*60}")
+        print(f"Building retrieval index for {len(paper_ids)} paper(s)")
+        print(f"{'='*60}\n")
+        for paper_id in paper_ids:
+            build_index(paper_id)
+        print(f"\n✅ Index saved: {INDEX_DIR}")
+        return
+
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+
+    paper_id, question = sys.argv[2], sys.argv[3]
+    k = int(sys.argv[4]) if len(sys.argv) > 4 else 3
+
+    retriever = SectionRetriever()
+    retriever.search(paper_id, question, k)  # warm-up: load index
+    start = time.perf_counter()
+    hits = retriever.search(paper_id, question, k)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if not hits:
+        print("❌ No matching sections (is the paper indexed?)")
+        sys.exit(1)
+
+    for chunk in hits:
+        print(f"[{chunk['score']:.4f}] {chunk['section']}: {chunk['text'][:100]}...")
+    print(f"\n⏱️  {elapsed:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
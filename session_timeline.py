@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+세션 타임라인 재구성 (export_sessions.py로 내보낸 Parquet 테이블 기반)
+scroll_action / focus_switch 이벤트로 세션별 "화면에 보이던 섹션"과 "포커스 상태"
+구간을 정렬된 배열로 만들고, 다른 이벤트(LLM 질문, 텍스트 선택 등)를 시간으로 조인합니다.
+
+구간은 (세션 번호, 시작 시각)을 하나의 int64 키로 합쳐 정렬해 두므로
+모든 세션의 조회가 np.searchsorted 한 번으로 끝납니다 (이벤트 수 N, 구간 수 M일 때 O(N log M)).
+섹션 순서와 상위 섹션은 parse_acm_html이 papers_json에 쓴 section_boundaries / sections 기준입니다.
+
+사용법:
+    python session_timeline.py [export_dir]
+
+출력 (<export_dir>/timeline/):
+    <event table>.parquet   sectionOnScreen, topSection, focusState 컬럼이 추가된 이벤트
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from export_sessions import build_frame
+
+PAPERS_JSON_DIR = Path(__file__).parent / 'papers_json'
+
+# 조인 대상 이벤트 테이블
+JOIN_TABLES = [
+    'events_llm_question_asked',
+    'events_llm_question_asked_with_files',
+    'events_llm_answer_received',
+    'events_text_selection',
+    'events_focus_switch',
+    'events_llm_activity',
+]
+
+FOCUS_STATES = ['reading', 'chat']
+
+# 세션 번호를 상위 비트에, 세션 내 시각(ms)을 하위 42비트에 넣음 (약 139년 범위)
+TIME_BITS = 42
+
+
+def load_section_index(papers_json_dir=PAPERS_JSON_DIR):
+    """논문별 섹션 순서와 상위(level 2) 섹션
+
+    Returns:
+        {paper_id: {section_name: {'order': int, 'level': int, 'top': str}}}
+    """
+    index = {}
+    for json_file in sorted(Path(papers_json_dir).glob('*.json')):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+        boundaries = metadata.get('section_boundaries', {})
+        levels = {s['title']: s.get('level', 2) for s in metadata.get('sections', [])}
+        names = sorted(boundaries, key=lambda name: boundaries[name]['start']) or list(levels)
+
+        sections = {}
+        top = None
+        for order, name in enumerate(names):
+            level = levels.get(name, 2)
+            if level <= 2 or top is None:
+                top = name
+            sections[name] = {'order': order, 'level': level, 'top': top}
+
+        index[metadata.get('paper_id', json_file.stem)] = sections
+    return index
+
+
+class TimelineIndex:
+    """모든 세션의 섹션/포커스 구간을 담은 정렬 배열 인덱스"""
+
+    def __init__(self, session_keys, base_time, section_keys, section_ends, section_codes, section_names,
+                 focus_keys, focus_ends, focus_codes, session_papers, section_index):
+        self.session_keys = session_keys
+        self.session_codes = {key: code for code, key in enumerate(session_keys)}
+        self.base_time = base_time
+        self.section_keys = section_keys
+        self.section_ends = section_ends
+        self.section_codes = section_codes
+        self.section_names = section_names
+        self.focus_keys = focus_keys
+        self.focus_ends = focus_ends
+        self.focus_codes = focus_codes
+        self.session_papers = session_papers
+        self.section_index = section_index
+
+    def _keys(self, session_keys, times):
+        codes = pd.Series(session_keys).map(self.session_codes).to_numpy(dtype=float)
+        times = np.asarray(times, dtype=float) - self.base_time
+        valid = ~np.isnan(codes) & ~np.isnan(times) & (times >= 0)
+        keys = np.where(valid, (np.nan_to_num(codes).astype(np.int64) << TIME_BITS)
+                        + np.nan_to_num(times).astype(np.int64), -1)
+        return keys, valid
+
+    def _lookup(self, interval_keys, interval_ends, interval_codes, session_keys, times):
+        keys, valid = self._keys(session_keys, times)
+        position = np.searchsorted(interval_keys, keys, side='right') - 1
+        safe = np.clip(position, 0, max(len(interval_keys) - 1, 0))
+        hit = valid & (position >= 0) & (len(interval_keys) > 0)
+        if len(interval_keys):
+            hit &= keys < interval_ends[safe]
+        return np.where(hit, interval_codes[safe] if len(interval_codes) else -1, -1)
+
+    def section_at(self, session_keys, times):
+        """각 (세션, 시각)에 화면에 보이던 섹션 (없으면 None)"""
+        codes = self._lookup(self.section_keys, self.section_ends, self.section_codes, session_keys, times)
+        names = np.array(self.section_names + [None], dtype=object)
+        return names[codes]
+
+    def top_section_at(self, session_keys, times):
+        """section_at의 상위(level 2) 섹션 (예: '2.1 ...' → '2 Related Work')"""
+        sections = self.section_at(session_keys, times)
+        papers = pd.Series(session_keys).map(self.session_papers).to_numpy()
+        return np.array([
+            self.section_index.get(paper, {}).get(section, {}).get('top', section)
+            for paper, section in zip(papers, sections)
+        ], dtype=object)
+
+    def focus_at(self, session_keys, times):
+        """각 (세션, 시각)의 포커스 상태 ('reading' | 'chat' | None)"""
+        codes = self._lookup(self.focus_keys, self.focus_ends, self.focus_codes, session_keys, times)
+        names = np.array(FOCUS_STATES + [None], dtype=object)
+        return names[codes]
+
+    def section_overlap(self, session_key, start, end):
+        """[start, end) 구간 동안 섹션별로 화면에 있던 시간(ms)"""
+        (start_key, end_key), _ = self._keys([session_key, session_key], [start, end])
+        first = max(np.searchsorted(self.section_keys, start_key, side='right') - 1, 0)
+        last = np.searchsorted(self.section_keys, end_key, side='left')
+
+        overlap = {}
+        for i in range(first, last):
+            lo = max(self.section_keys[i], start_key)
+            hi = min(self.section_ends[i], end_key)
+            if hi > lo:
+                name = self.section_names[self.section_codes[i]]
+                overlap[name] = overlap.get(name, 0) + int(hi - lo)
+        return overlap
+
+
+def session_end_times(tables):
+    """세션별 읽기 종료 시각(ms): focus_switch 'finish'가 있으면 그 시각, 없으면 마지막 이벤트 직후"""
+    stamps = pd.concat([
+        table[['sessionKey', 'timestamp']] for name, table in tables.items()
+        if name.startswith('events_') and 'timestamp' in table
+    ], ignore_index=True).dropna(subset=['timestamp'])
+    # 구간은 [start, end)이므로 마지막 이벤트가 구간에 들어가도록 +1
+    latest = stamps.groupby('sessionKey')['timestamp'].max() + 1
+    focus = tables['events_focus_switch'].dropna(subset=['timestamp'])
+    finish = focus[focus['to'] == 'finish'].groupby('sessionKey')['timestamp'].min()
+    return finish.combine_first(latest).astype(np.int64)
+
+
+def section_intervals(scroll, session_ends=None):
+    """scroll_action 이벤트 → (sessionKey, start, end, section) 구간
+
+    섹션은 각 스크롤 이벤트의 sectionAfterScroll이 다음 스크롤 이벤트까지 유지되고,
+    첫 이벤트 이전은 첫 pause 시작부터 sectionBeforeScroll입니다.
+    마지막 스크롤 이후 구간은 session_ends(sessionKey → ms, session_end_times)의
+    세션 종료 시각까지 이어집니다 (종료 시각을 모르면 버림).
+    """
+    scroll = scroll.dropna(subset=['timestamp']).sort_values(['sessionKey', 'timestamp'], kind='stable')
+    if scroll.empty:
+        return pd.DataFrame(columns=['sessionKey', 'start', 'end', 'section'])
+
+    session = scroll['sessionKey'].to_numpy()
+    time = scroll['timestamp'].to_numpy(dtype=np.int64)
+    lead_in = (scroll['pauseDuration'].fillna(0) + scroll['scrollDuration'].fillna(0)).to_numpy(dtype=np.int64)
+    first = np.r_[True, session[1:] != session[:-1]]
+    last = np.r_[session[1:] != session[:-1], True]
+
+    # 각 이벤트 이후 구간: [t_i, t_{i+1}), 세션 마지막 이벤트는 [t_last, 세션 종료)
+    end = np.r_[time[1:], time[-1]]
+    end[last] = time[last]
+    if session_ends is not None:
+        known = pd.Series(session[last]).map(session_ends).to_numpy(dtype=float)
+        end[last] = np.where(np.isnan(known), time[last], np.maximum(known, time[last])).astype(np.int64)
+    after = pd.DataFrame({
+        'sessionKey': session,
+        'start': time,
+        'end': end,
+        'section': scroll['sectionAfterScroll'].fillna(scroll['sectionBeforeScroll']).to_numpy(),
+    })
+    # 첫 이벤트 이전 구간: [t_0 - pause - scroll, t_0)
+    before = pd.DataFrame({
+        'sessionKey': session[first],
+        'start': time[first] - lead_in[first],
+        'end': time[first],
+        'section': scroll['sectionBeforeScroll'].to_numpy()[first],
+    })
+
+    intervals = pd.concat([before, after], ignore_index=True)
+    intervals = intervals[intervals['end'] > intervals['start']]
+    return merge_runs(intervals.sort_values(['sessionKey', 'start'], kind='stable'), 'section')
+
+
+def focus_intervals(focus, sections):
+    """focus_switch 이벤트 → (sessionKey, start, end, focus) 구간
+
+    세션은 reading 상태로 시작하고, 섹션 구간의 시작/끝까지 포함하도록 경계를 넣습니다.
+    """
+    events = pd.concat([
+        sections[['sessionKey', 'start']].rename(columns={'start': 'timestamp'}).assign(to=None),
+        sections[['sessionKey', 'end']].rename(columns={'end': 'timestamp'}).assign(to=None),
+        focus[['sessionKey', 'timestamp', 'to']],
+    ]).dropna(subset=['timestamp']).sort_values(['sessionKey', 'timestamp'], kind='stable')
+    if events.empty:
+        return pd.DataFrame(columns=['sessionKey', 'start', 'end', 'focus'])
+
+    session = events['sessionKey'].to_numpy()
+    time = events['timestamp'].to_numpy(dtype=np.int64)
+    first = np.r_[True, session[1:] != session[:-1]]
+    last = np.r_[session[1:] != session[:-1], True]
+
+    # 세션 첫 이벤트 전부터 reading, focus_switch마다 상태 변경 (forward fill)
+    state = events['to'].where(events['to'].isin(FOCUS_STATES + ['finish']))
+    state = state.mask(first & state.isna().to_numpy(), 'reading')
+    state = state.groupby(session).ffill()
+
+    intervals = pd.DataFrame({
+        'sessionKey': session,
+        'start': time,
+        'end': np.r_[time[1:], time[-1]],
+        'focus': state.to_numpy(),
+    })[~last]
+    intervals = intervals[intervals['focus'].isin(FOCUS_STATES) & (intervals['end'] > intervals['start'])]
+    return merge_runs(intervals, 'focus')
+
+
+def merge_runs(intervals, column):
+    """같은 세션에서 값이 이어지는 연속 구간 병합"""
+    if intervals.empty:
+        return intervals.reset_index(drop=True)
+    session = intervals['sessionKey'].to_numpy()
+    value = intervals[column].to_numpy()
+    new_run = np.r_[True, (session[1:] != session[:-1]) | (value[1:] != value[:-1])]
+    run_id = np.cumsum(new_run)
+    return intervals.groupby(run_id).agg(
+        sessionKey=('sessionKey', 'first'), start=('start', 'first'), end=('end', 'last'), **{column: (column, 'first')}
+    ).reset_index(drop=True)
+
+
+def build_timeline_index(tables, papers_json_dir=PAPERS_JSON_DIR):
+    """세션/이벤트 테이블로 TimelineIndex 생성"""
+    scroll = tables['events_scroll_action']
+    focus = tables['events_focus_switch']
+    sessions = tables['sessions']
+
+    sections = section_intervals(scroll, session_end_times(tables))
+    focuses = focus_intervals(focus, sections)
+
+    session_keys = sorted(set(sessions['sessionKey']) | set(sections['sessionKey']) | set(focuses['sessionKey']))
+    session_codes = {key: code for code, key in enumerate(session_keys)}
+    starts = pd.concat([sections['start'], focuses['start']])
+    base_time = int(starts.min()) if len(starts) else 0
+
+    def encode(intervals):
+        codes = intervals['sessionKey'].map(session_codes).to_numpy(dtype=np.int64) << TIME_BITS
+        return (codes + (intervals['start'].to_numpy(dtype=np.int64) - base_time),
+                codes + (intervals['end'].to_numpy(dtype=np.int64) - base_time))
+
+    section_index = load_section_index(papers_json_dir)
+    section_names = sorted(set(sections['section'].dropna()))
+    section_lookup = {name: code for code, name in enumerate(section_names)}
+
+    section_keys, section_ends = encode(sections)
+    focus_keys, focus_ends = encode(focuses)
+    # 구간은 sessionKey, start 순으로 정렬되어 있고 세션 번호도 같은 순서이므로 키가 이미 정렬됨
+    return TimelineIndex(
+        session_keys=session_keys,
+        base_time=base_time,
+        section_keys=section_keys,
+        section_ends=section_ends,
+        section_codes=sections['section'].map(section_lookup).fillna(len(section_names)).to_numpy(dtype=np.int64),
+        section_names=section_names,
+        focus_keys=focus_keys,
+        focus_ends=focus_ends,
+        focus_codes=focuses['focus'].map({s: i for i, s in enumerate(FOCUS_STATES)}).to_numpy(dtype=np.int64),
+        session_papers=dict(zip(sessions['sessionKey'], sessions['paper'])),
+        section_index=section_index,
+    )
+
+
+def annotate_events(index, events):
+    """이벤트 테이블에 sectionOnScreen, topSection, focusState 컬럼 추가"""
+    events = events.copy()
+    keys = events['sessionKey'].to_numpy()
+    times = events['timestamp'].to_numpy(dtype=float, na_value=np.nan)
+    events['sectionOnScreen'] = pd.array(index.section_at(keys, times), dtype='string')
+    events['topSection'] = pd.array(index.top_section_at(keys, times), dtype='string')
+    events['focusState'] = pd.array(index.focus_at(keys, times), dtype='string')
+    return events
+
+
+def load_tables(export_dir):
+    export_dir = Path(export_dir)
+    tables = {}
+    for table in ['sessions', 'events_scroll_action', 'events_focus_switch'] + JOIN_TABLES:
+        path = export_dir / f'{table}.parquet'
+        tables[table] = pd.read_parquet(path) if path.exists() else build_frame(table, [])
+    return tables
+
+
+def main():
+    export_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path('./export')
+    if not (export_dir / 'sessions.parquet').exists():
+        print(f'❌ sessions.parquet가 없습니다: {export_dir} (먼저 export_sessions.py 실행)')
+        sys.exit(1)
+
+    print('🕒 세션 타임라인 생성...')
+    tables = load_tables(export_dir)
+    index = build_timeline_index(tables)
+    print(f'✓ 세션 {len(index.session_keys)}개, 섹션 구간 {len(index.section_keys)}개, '
+          f'포커스 구간 {len(index.focus_keys)}개')
+
+    output_dir = export_dir / 'timeline'
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for table in JOIN_TABLES:
+        if tables[table].empty:
+            continue
+        annotated = annotate_events(index, tables[table])
+        annotated.to_parquet(output_dir / f'{table}.parquet', index=False)
+        print(f'  ✓ {table}.parquet ({len(annotated)} rows)')
+
+    questions = tables['events_llm_question_asked']
+    if not questions.empty:
+        annotated = annotate_events(index, questions)
+        print('\n💬 LLM 질문 시점의 화면 섹션:')
+        for section, count in annotated['topSection'].value_counts().items():
+            print(f'   {section}: {count}')
+
+    print(f'\n🎉 완료: {output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Sparse TF-IDF / BM25 Similarity Backend
+=======================================
+Pure-local alternative to SPECTER2 for paper_similarity.py: builds a sparse
+term matrix over titles, abstracts and optionally full text, and computes
+cosine distances with blocked sparse products so memory is bounded by
+MEMORY_BUDGET_MB rather than growing with n².
+"""
+
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+SCHEMES = ('tfidf', 'bm25')
+
+# Dense similarity blocks (rows x n_papers float32, plus the sparse product) must fit in this
+MEMORY_BUDGET_MB = 256
+
+# Above this many papers the full n x n distance matrix is not materialised
+FULL_MATRIX_LIMIT = 5000
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9]+(?:-[a-z0-9]+)*")
+
+STOPWORDS = frozenset('''
+a about above after again all also an and any are as at be because been before being between both but by
+can could did do does doing during each few for from further had has have having how however i if in into
+is it its itself just more most no nor not of on once only or other our ours out over own same she should
+so some such than that the their them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your
+'''.split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def build_term_matrix(texts: Iterable[str], scheme: str = 'tfidf',
+                      min_df: int = 1) -> Tuple[sparse.csr_matrix, List[str]]:
+    """
+    Build an L2-normalised sparse term matrix.
+
+    Args:
+        texts: Document texts (streamed; only the sparse counts are kept)
+        scheme: 'tfidf' (sublinear tf x smoothed idf) or 'bm25' (BM25 term weights)
+        min_df: Drop terms that appear in fewer documents
+
+    Returns:
+        Tuple of (csr_matrix of shape (n_docs, n_terms), vocabulary)
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown scheme: {scheme} (expected one of {SCHEMES})")
+
+    vocabulary: Dict[str, int] = {}
+    indptr = array('q', [0])
+    indices = array('i')
+    counts = array('f')
+    for text in texts:
+        for term, tf in Counter(tokenize(text or '')).items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(tf)
+        indptr.append(len(indices))
+
+    n_docs = len(indptr) - 1
+    tf = sparse.csr_matrix(
+        (np.frombuffer(counts, dtype=np.float32), np.frombuffer(indices, dtype=np.int32), np.frombuffer(indptr, dtype=np.int64)),
+        shape=(n_docs, len(vocabulary)),
+    )
+    terms = list(vocabulary)
+
+    df = np.bincount(tf.indices, minlength=tf.shape[1])
+    if min_df > 1:
+        keep = np.flatnonzero(df >= min_df)
+        tf = tf[:, keep].tocsr()
+        df = df[keep]
+        terms = [terms[i] for i in keep]
+
+    if scheme == 'tfidf':
+        idf = np.log((1 + n_docs) / (1 + df)) + 1
+        tf.data = (1 + np.log(tf.data)) * idf[tf.indices]
+    else:
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        lengths = np.asarray(tf.sum(axis=1)).ravel()
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1e-9)) if n_docs else lengths
+        row_norm = np.repeat(norm, np.diff(tf.indptr))
+        tf.data = tf.data * (BM25_K1 + 1) / (tf.data + row_norm) * idf[tf.indices]
+
+    tf.data = tf.data.astype(np.float32)
+    row_lengths = np.sqrt(np.asarray(tf.multiply(tf).sum(axis=1)).ravel())
+    tf = sparse.diags(1 / np.maximum(row_lengths, 1e-12)).astype(np.float32) @ tf
+    return tf.tocsr(), terms
+
+
+def block_size_for(n_docs: int, memory_budget_mb: int = MEMORY_BUDGET_MB) -> int:
+    """Rows per block so a dense (rows x n_docs) float32 block and its sparse product fit the budget"""
+    # ~4 bytes dense + up to ~12 bytes for the intermediate sparse product per entry
+    return max(1, int(memory_budget_mb * 2 ** 20 // (max(n_docs, 1) * 16)))
+
+
+def iter_similarity_blocks(X: sparse.csr_matrix, memory_budget_mb: int = MEMORY_BUDGET_MB):
+    """Yield (start, dense cosine-similarity block of rows start:start+b against all docs)"""
+    XT = X.T.tocsc()
+    step = block_size_for(X.shape[0], memory_budget_mb)
+    for start in range(0, X.shape[0], step):
+        yield start, (X[start:start + step] @ XT).toarray().astype(np.float32, copy=False)
+
+
+def pairwise_distances(X: sparse.csr_matrix, memory_budget_mb: int = MEMORY_BUDGET_MB) -> np.ndarray:
+    """
+    Full cosine distance matrix (only for n <= FULL_MATRIX_LIMIT).
+
+    Args:
+        X: L2-normalised term matrix from build_term_matrix
+
+    Returns:
+        Distance matrix of shape (n_docs, n_docs)
+    """
+    n = X.shape[0]
+    if n > FULL_MATRIX_LIMIT:
+        raise ValueError(f"{n} papers: use farthest_pairs / nearest_neighbours instead of a full matrix")
+    distances = np.empty((n, n), dtype=np.float32)
+    for start, block in iter_similarity_blocks(X, memory_budget_mb):
+        distances[start:start + len(block)] = 1 - block
+    np.clip(distances, 0, 2, out=distances)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+def farthest_pairs(X: sparse.csr_matrix, n_pairs: int = 10,
+                   memory_budget_mb: int = MEMORY_BUDGET_MB) -> List[Tuple[int, int, float]]:
+    """
+    The n_pairs most distant pairs (i < j), scanning the upper triangle block by block.
+
+    Returns:
+        List of (i, j, cosine_distance), most distant first
+    """
+    heap: List[Tuple[float, int, int]] = []
+    for start, block in iter_similarity_blocks(X, memory_budget_mb):
+        rows = np.arange(start, start + len(block))[:, None]
+        block[np.arange(block.shape[1])[None, :] <= rows] = np.inf
+        flat = block.ravel()
+        take = min(n_pairs, flat.size)
+        candidates = np.argpartition(flat, take - 1)[:take] if take < flat.size else np.arange(flat.size)
+        for index in candidates:
+            similarity = float(flat[index])
+            if not np.isfinite(similarity):
+                continue
+            i, j = divmod(int(index), block.shape[1])
+            item = (-similarity, start + i, j)
+            if len(heap) < n_pairs:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    pairs = sorted(heap, reverse=True)
+    return [(i, j, min(max(1 + neg_similarity, 0.0), 2.0)) for neg_similarity, i, j in pairs]
+
+
+def nearest_neighbours(X: sparse.csr_matrix, k: int = 10,
+                       memory_budget_mb: int = MEMORY_BUDGET_MB) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k most similar papers per paper (self excluded).
+
+    Returns:
+        Tuple of (indices, distances), each of shape (n_docs, k), nearest first
+    """
+    n = X.shape[0]
+    k = min(k, max(n - 1, 0))
+    indices = np.zeros((n, k), dtype=np.int64)
+    distances = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return indices, distances
+    for start, block in iter_similarity_blocks(X, memory_budget_mb):
+        rows = np.arange(len(block))
+        block[rows, start + rows] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(block, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        indices[start:start + len(block)] = top
+        distances[start:start + len(block)] = np.clip(1 - np.take_along_axis(block, top, axis=1), 0, 2)
+    return indices, distances
+
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    return pd.Series(values).rank(method='average').to_numpy()
+
+
+def rank_agreement(distances: np.ndarray, reference: np.ndarray, k: int = 5) -> Dict[str, float]:
+    """
+    Agreement between two distance matrices over the same papers.
+
+    Args:
+        distances: Candidate distance matrix (e.g. TF-IDF)
+        reference: Reference distance matrix (e.g. cached SPECTER2)
+        k: Neighbourhood size for top-k overlap
+
+    Returns:
+        Dict with spearman (all pairs), topk_overlap (mean |kNN ∩ kNN_ref| / k)
+        and farthest_pair_match (1.0 if the most distant pair is identical)
+    """
+    n = len(distances)
+    upper = np.triu_indices(n, 1)
+    spearman = float(np.corrcoef(_ranks(distances[upper]), _ranks(reference[upper]))[0, 1]) if n > 2 else float('nan')
+
+    k = min(k, n - 1)
+    overlap = float('nan')
+    if k > 0:
+        masked = distances + np.diag(np.full(n, np.inf))
+        masked_ref = reference + np.diag(np.full(n, np.inf))
+        knn = np.argsort(masked, axis=1)[:, :k]
+        knn_ref = np.argsort(masked_ref, axis=1)[:, :k]
+        overlap = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(knn, knn_ref)]))
+
+    def farthest(matrix):
+        values = np.where(np.triu(np.ones((n, n), dtype=bool), 1), matrix, -np.inf)
+        return np.unravel_index(np.argmax(values), values.shape)
+
+    return {
+        'papers': n,
+        'spearman': spearman,
+        f'top{k}_overlap': overlap,
+        'farthest_pair_match': float(farthest(distances) == farthest(reference)),
+    }
+
+
+def load_cached_distances(output_dir: str) -> Optional[pd.DataFrame]:
+    """SPECTER2 distance_matrix.csv written by a previous paper_similarity run, if any"""
+    path = Path(output_dir) / 'distance_matrix.csv'
+    if not path.exists():
+        return None
+    frame = pd.read_csv(path, index_col=0)
+    # Ids such as 3544549.3585740 are read as strings so they keep their digits
+    frame.index = pd.read_csv(path, usecols=[0], dtype=str).iloc[:, 0].tolist()
+    frame.columns = frame.columns.astype(str)
+    return frame
+
+
+def compare_with_cached(distances: np.ndarray, paper_ids: List[str], output_dir: str,
+                        k: int = 5) -> Optional[Dict[str, float]]:
+    """rank_agreement against the cached SPECTER2 matrix on the papers both runs share"""
+    cached = load_cached_distances(output_dir)
+    if cached is None:
+        return None
+    shared = [pid for pid in paper_ids if pid in cached.index]
+    if len(shared) < 3:
+        return None
+    position = {pid: i for i, pid in enumerate(paper_ids)}
+    idx = [position[pid] for pid in shared]
+    return rank_agreement(distances[np.ix_(idx, idx)], cached.loc[shared, shared].to_numpy(), k)
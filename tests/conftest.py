@@ -0,0 +1,35 @@
+"""
+공용 fixture: 프로젝트 루트를 import 경로에 추가하고, Firestore 에뮬레이터 클라이언트 제공
+
+에뮬레이터 테스트 실행:
+    firebase emulators:start --only firestore   (기본 localhost:8080)
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m pytest tests
+FIRESTORE_EMULATOR_HOST가 없으면 에뮬레이터 테스트는 건너뜁니다.
+"""
+
+import os
+import sys
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+EMULATOR_PROJECT = 'paper-understanding-test'
+
+
+@pytest.fixture
+def emulator_db():
+    host = os.environ.get('FIRESTORE_EMULATOR_HOST')
+    if not host:
+        pytest.skip('FIRESTORE_EMULATOR_HOST가 설정되지 않음 (Firestore 에뮬레이터 필요)')
+    from google.cloud import firestore
+
+    def clear():
+        url = f'http://{host}/emulator/v1/projects/{EMULATOR_PROJECT}/databases/(default)/documents'
+        urllib.request.urlopen(urllib.request.Request(url, method='DELETE'), timeout=10).read()
+
+    clear()
+    yield firestore.Client(project=EMULATOR_PROJECT)
+    clear()
@@ -0,0 +1,109 @@
+"""copy_reading_data: 매핑 검증, 체크포인트, Firestore 에뮬레이터에서 배치 복사/재개"""
+
+import pytest
+
+import copy_reading_data
+from copy_reading_data import (append_checkpoint, check_unique_targets, copy_reading_data as copy,
+                               load_checkpoint, load_mapping, session_path)
+
+
+def write_mapping(path, rows):
+    path.write_text('source_user,source_session,target_user,target_session\n'
+                    + ''.join(','.join(row) + '\n' for row in rows), encoding='utf-8')
+
+
+def test_duplicate_target_with_different_sources_is_rejected(tmp_path):
+    mapping = tmp_path / 'mapping.csv'
+    write_mapping(mapping, [('P1', 's1', 'P9', 't1'), ('P2', 's2', 'P9', 't1')])
+    with pytest.raises(ValueError, match='users/P9/experiments/t1'):
+        load_mapping(mapping)
+
+
+def test_repeated_identical_row_is_allowed():
+    pair = (session_path('P1', 's1'), session_path('P9', 't1'))
+    check_unique_targets([pair, pair])
+
+
+def test_checkpoint_is_keyed_on_source_and_target(tmp_path):
+    checkpoint = tmp_path / 'mapping.csv.checkpoint'
+    append_checkpoint(checkpoint, [('users/P1/experiments/s1', 'users/P9/experiments/t1')])
+    # 예전 형식 (타겟만)
+    with open(checkpoint, 'a', encoding='utf-8') as f:
+        f.write('users/P9/experiments/t2\n')
+
+    done = load_checkpoint(checkpoint)
+    assert copy_reading_data.is_done(done, 'users/P1/experiments/s1', 'users/P9/experiments/t1')
+    assert not copy_reading_data.is_done(done, 'users/P2/experiments/s2', 'users/P9/experiments/t1')
+    assert copy_reading_data.is_done(done, 'users/P3/experiments/s3', 'users/P9/experiments/t2')
+
+
+def seed_sessions(db, n):
+    pairs = []
+    for i in range(n):
+        source = session_path(f'S{i}', f'session_{i}')
+        target = session_path(f'T{i}', f'session_{i}')
+        db.document(source).set({'reading': {'sections': [i]}, 'quiz': {'score': i}})
+        db.document(target).set({'reading': None, 'other': 'kept'})
+        pairs.append((source, target))
+    return pairs
+
+
+class FailingSecondCommit:
+    """두 번째 배치 커밋에서 실패하는 클라이언트 (중간 중단 재현)"""
+
+    def __init__(self, db):
+        self.db = db
+        self.commits = 0
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def batch(self):
+        batch = self.db.batch()
+        commit = batch.commit
+
+        def failing_commit():
+            self.commits += 1
+            if self.commits == 2:
+                raise RuntimeError('injected failure')
+            return commit()
+
+        batch.commit = failing_commit
+        return batch
+
+
+def test_copies_fields_in_batches(emulator_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(copy_reading_data, 'BATCH_SIZE', 3)
+    pairs = seed_sessions(emulator_db, 7)
+    checkpoint = tmp_path / 'mapping.csv.checkpoint'
+
+    assert copy(pairs, fields=['reading', 'quiz'], checkpoint_path=checkpoint, db=emulator_db) == 7
+    for i, (_, target) in enumerate(pairs):
+        data = emulator_db.document(target).get().to_dict()
+        assert data == {'reading': {'sections': [i]}, 'quiz': {'score': i}, 'other': 'kept'}
+    assert len(load_checkpoint(checkpoint)) == 7
+
+    # 재실행: 체크포인트로 모두 건너뜀
+    assert copy(pairs, fields=['reading'], checkpoint_path=checkpoint, db=emulator_db) == 0
+
+
+def test_resumes_after_failed_batch(emulator_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(copy_reading_data, 'BATCH_SIZE', 2)
+    pairs = seed_sessions(emulator_db, 5)
+    checkpoint = tmp_path / 'mapping.csv.checkpoint'
+
+    with pytest.raises(RuntimeError):
+        copy(pairs, checkpoint_path=checkpoint, db=FailingSecondCommit(emulator_db))
+    assert load_checkpoint(checkpoint) == set(pairs[:2])
+
+    assert copy(pairs, checkpoint_path=checkpoint, db=emulator_db) == 3
+    for i, (_, target) in enumerate(pairs):
+        assert emulator_db.document(target).get().to_dict()['reading'] == {'sections': [i]}
+
+
+def test_dry_run_writes_nothing(emulator_db, tmp_path):
+    pairs = seed_sessions(emulator_db, 2)
+    checkpoint = tmp_path / 'mapping.csv.checkpoint'
+    assert copy(pairs, dry_run=True, checkpoint_path=checkpoint, db=emulator_db) == 0
+    assert emulator_db.document(pairs[0][1]).get().to_dict()['reading'] is None
+    assert not checkpoint.exists()
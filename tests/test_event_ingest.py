@@ -0,0 +1,145 @@
+"""event_ingest: 로그 offset, 세션별 업데이트, Firestore 에뮬레이터에서 반영/중단 후 재반영"""
+
+import asyncio
+import json
+
+from aiohttp import ClientSession, web
+
+from event_ingest import EventLog, IngestService, session_updates
+
+
+def make_event(i, session='s1', event_type='scroll_action', phase='reading'):
+    return {'eventId': f'{session}_{i}', 'participantId': 'P1', 'sessionId': session,
+            'timestamp': 1000 + i, 'eventType': event_type, 'phase': phase}
+
+
+def test_log_offsets_match_read_from(tmp_path):
+    log = EventLog(tmp_path)
+    ends = log.append([make_event(1), make_event(2)]) + log.append([make_event(3)])
+    entries, end = log.read_from(0)
+    assert [offset for offset, _ in entries] == ends
+    assert end == ends[-1] == log.path.stat().st_size
+    assert [event['eventId'] for _, event in log.read_from(ends[0])[0]] == ['s1_2', 's1_3']
+    assert EventLog(tmp_path).log_id == log.log_id
+
+
+def test_session_updates_skip_applied_offsets():
+    entries = [(10, make_event(1)), (20, make_event(2)), (30, make_event(3, event_type='quiz_answer')),
+               (40, make_event(4, session='s2'))]
+    updates = dict(session_updates(entries, 'log-a', {'users/P1/experiments/s1': 20}))
+
+    s1 = updates['users/P1/experiments/s1']
+    assert 'reading.totalEvents' not in s1
+    assert s1['events'].values == [make_event(3, event_type='quiz_answer')]
+    assert (s1['ingest.log'], s1['ingest.offset']) == ('log-a', 30)
+
+    s2 = updates['users/P1/experiments/s2']
+    assert s2['reading.totalEvents'].value == 1
+    assert s2['ingest.offset'] == 40
+
+
+def post_events(service, *bodies):
+    """/events만 띄우고(Firestore 없이) 본문들을 차례로 POST, [(status, json 또는 None)] 반환"""
+    async def main():
+        app = web.Application()
+        app.router.add_post('/events', service.handle_events)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/events"
+        responses = []
+        try:
+            async with ClientSession() as client:
+                for body in bodies:
+                    async with client.post(url, data=body) as response:
+                        body = await response.json() if response.content_type == 'application/json' else None
+                        responses.append((response.status, body))
+        finally:
+            await runner.cleanup()
+        return responses
+
+    return asyncio.run(main())
+
+
+def test_malformed_events_are_400(tmp_path):
+    service = IngestService(log=EventLog(tmp_path))
+    responses = post_events(service, b'{not json', b'{"events": [1, 2]}', b'"text"')
+    assert [status for status, _ in responses] == [400, 400, 400]
+    assert all('error' in body for _, body in responses)
+    assert service.stats['bad_requests'] == 3
+    assert not service.pending
+
+
+def test_failed_log_append_does_not_mark_seen(tmp_path, monkeypatch):
+    service = IngestService(log=EventLog(tmp_path))
+    body = json.dumps({'events': [make_event(1), make_event(1), make_event(2)]})
+    append = service.log.append
+
+    def fail(events):
+        raise OSError('디스크 가득 참')
+
+    monkeypatch.setattr(service.log, 'append', fail)
+    assert post_events(service, body)[0][0] == 500
+    assert not service.seen
+
+    monkeypatch.setattr(service.log, 'append', append)
+    assert post_events(service, body, body) == [(200, {'accepted': 2, 'duplicates': 1}),
+                                                (200, {'accepted': 0, 'duplicates': 3})]
+    assert [event['eventId'] for _, event in service.pending] == ['s1_1', 's1_2']
+
+
+def ingest(service, events):
+    service.pending.extend(zip(service.log.append(events), events))
+    service.seen.update(event['eventId'] for event in events)
+
+
+def test_flush_writes_arrays_and_total(emulator_db, tmp_path):
+    service = IngestService(emulator_db, EventLog(tmp_path))
+    ingest(service, [make_event(i) for i in range(5)] + [make_event(5, event_type='quiz_answer', phase='quiz')])
+    assert asyncio.run(service.flush()) == 6
+
+    data = emulator_db.document('users/P1/experiments/s1').get().to_dict()
+    assert data['reading']['totalEvents'] == 5
+    assert len(data['reading']['events']) == 5
+    assert [event['eventId'] for event in data['events']] == ['s1_5']
+    assert service.log.flushed_offset() == service.log.path.stat().st_size
+
+
+def test_replay_after_crash_does_not_double_count(emulator_db, tmp_path, monkeypatch):
+    log = EventLog(tmp_path)
+    service = IngestService(emulator_db, log)
+    ingest(service, [make_event(i) for i in range(3)])
+    # 커밋 후 flushed.offset 저장 전에 중단
+    monkeypatch.setattr(log, 'mark_flushed', lambda offset: None)
+    asyncio.run(service.flush())
+    monkeypatch.undo()
+
+    restarted = IngestService(emulator_db, EventLog(tmp_path))
+    restarted.recover()
+    assert len(restarted.pending) == 3
+    ingest(restarted, [make_event(3)])
+    asyncio.run(restarted.flush())
+
+    data = emulator_db.document('users/P1/experiments/s1').get().to_dict()
+    assert data['reading']['totalEvents'] == 4
+    assert len(data['reading']['events']) == 4
+    assert restarted.log.flushed_offset() == restarted.log.path.stat().st_size
+
+
+def test_failed_flush_is_retried_once(emulator_db, tmp_path):
+    service = IngestService(emulator_db, EventLog(tmp_path))
+    ingest(service, [make_event(i) for i in range(2)])
+    commit = service._commit
+
+    def commit_then_fail(updates):
+        commit(updates)
+        raise RuntimeError('응답 유실')
+
+    service._commit = commit_then_fail
+    assert asyncio.run(service.flush()) == 0
+    service._commit = commit
+    assert asyncio.run(service.flush()) == 2
+
+    data = emulator_db.document('users/P1/experiments/s1').get().to_dict()
+    assert data['reading']['totalEvents'] == 2
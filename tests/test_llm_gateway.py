@@ -0,0 +1,203 @@
+"""llm_gateway: 로컬 대역 LLM 서버(OpenAI 스트리밍 형식)를 업스트림으로 두고 테스트"""
+
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+web = pytest.importorskip('aiohttp.web')
+from aiohttp import ClientSession
+
+from llm_gateway import LLMGateway, ResponseCache
+
+USAGE = {'prompt_tokens': 120, 'completion_tokens': 3, 'total_tokens': 123}
+
+
+class StandInLLM:
+    """chat-completions를 흉내 내는 업스트림: 고정 답을 SSE로 천천히 보냄, model='fail'이면 429, 'down'이면 503"""
+
+    def __init__(self, delay=0.05):
+        self.calls = 0
+        self.delay = delay
+
+    async def handle(self, request):
+        body = await request.json()
+        self.calls += 1
+        if body.get('model') == 'fail':
+            return web.json_response({'error': {'message': 'quota exceeded', 'type': 'insufficient_quota'}},
+                                     status=429)
+        if body.get('model') == 'down':
+            return web.Response(text='service unavailable', status=503)
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for token in ['Hello', ', ', 'world']:
+            await asyncio.sleep(self.delay)
+            event = {'choices': [{'index': 0, 'delta': {'content': token}}]}
+            await response.write(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+        await response.write(f'data: {json.dumps({"choices": [], "usage": USAGE})}\n\n'.encode('utf-8'))
+        await response.write(b'data: [DONE]\n\n')
+        await response.write_eof()
+        return response
+
+
+async def serve(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}'
+
+
+def run_with_gateway(test):
+    """대역 업스트림과 게이트웨이를 띄우고 test(client, gateway_url, upstream, gateway) 실행"""
+    async def main():
+        upstream = StandInLLM()
+        upstream_app = web.Application()
+        upstream_app.router.add_post('/v1/chat/completions', upstream.handle)
+        upstream_runner, upstream_url = await serve(upstream_app)
+
+        gateway = LLMGateway(upstream_url=f'{upstream_url}/v1/chat/completions', api_key='test',
+                             cache=ResponseCache(), compact_k=0)
+        gateway_runner, gateway_url = await serve(gateway.make_app())
+        try:
+            async with ClientSession() as client:
+                await test(client, f'{gateway_url}/v1/chat/completions', upstream, gateway)
+        finally:
+            await gateway_runner.cleanup()
+            await upstream_runner.cleanup()
+
+    asyncio.run(main())
+
+
+def chat_body(question='What is the main finding?', model='gpt-test', **extra):
+    return {'model': model, 'messages': [{'role': 'system', 'content': 'paper text'},
+                                         {'role': 'user', 'content': question}], **extra}
+
+
+def test_cache_hit_reports_stored_usage():
+    async def test(client, url, upstream, gateway):
+        headers = {'X-Paper-Id': 'paper-1', 'X-Condition': 'with_llm'}
+        async with client.post(url, json=chat_body(), headers=headers) as response:
+            first = await response.json()
+        async with client.post(url, json=chat_body('  what is the MAIN finding? '), headers=headers) as response:
+            second = await response.json()
+
+        assert first['choices'][0]['message']['content'] == 'Hello, world'
+        assert first['usage'] == USAGE and first['gateway']['usage_billed'] is True
+        assert second['gateway']['source'] == 'cache'
+        assert second['usage'] == USAGE and second['gateway']['usage_billed'] is False
+        assert upstream.calls == 1
+
+        metrics = gateway.metrics.summary()
+        assert metrics['prompt_tokens'] == 120 and metrics['saved_prompt_tokens'] == 120
+
+    run_with_gateway(test)
+
+
+def test_concurrent_requests_coalesce_with_usage():
+    async def test(client, url, upstream, gateway):
+        async def ask():
+            async with client.post(url, json=chat_body()) as response:
+                return await response.json()
+
+        results = await asyncio.gather(*[ask() for _ in range(5)])
+        assert upstream.calls == 1
+        assert {r['choices'][0]['message']['content'] for r in results} == {'Hello, world'}
+        assert sorted(r['gateway']['source'] for r in results) == ['coalesced'] * 4 + ['upstream']
+        assert all(r['usage'] == USAGE for r in results)
+        assert gateway.metrics.summary()['saved_completion_tokens'] == 4 * USAGE['completion_tokens']
+
+    run_with_gateway(test)
+
+
+def test_stream_response_ends_with_usage():
+    async def test(client, url, upstream, gateway):
+        async with client.post(url, json=chat_body(stream=True)) as response:
+            assert response.headers['Access-Control-Allow-Origin'] == '*'
+            payload = (await response.read()).decode('utf-8')
+
+        events = [json.loads(line[len('data: '):]) for line in payload.splitlines()
+                  if line.startswith('data: ') and line != 'data: [DONE]']
+        content = ''.join(c['delta']['content'] for e in events for c in e['choices'])
+        assert content == 'Hello, world'
+        assert events[-1]['usage'] == USAGE
+        assert payload.rstrip().endswith('data: [DONE]')
+
+    run_with_gateway(test)
+
+
+def test_upstream_error_is_readable_json_with_cors():
+    async def test(client, url, upstream, gateway):
+        async with client.post(url, json=chat_body(model='fail')) as response:
+            # 업스트림 429는 그대로 전달
+            assert response.status == 429
+            assert response.headers['Access-Control-Allow-Origin'] == '*'
+            body = await response.json()
+        assert body['error']['message'] == 'quota exceeded'
+        assert gateway.metrics.counters['upstream_errors'] == 1
+
+    run_with_gateway(test)
+
+
+def test_upstream_server_error_is_502():
+    async def test(client, url, upstream, gateway):
+        async with client.post(url, json=chat_body(model='down')) as response:
+            assert response.status == 502
+            assert (await response.json())['error']['message'] == 'service unavailable'
+
+    run_with_gateway(test)
+
+
+class SlowRetriever:
+    """compact_context가 느린 검색기 (모델 로딩/인덱스 재생성 흉내), 실행 스레드 기록"""
+
+    def __init__(self):
+        self.threads = []
+
+    def compact_context(self, paper, question, k):
+        self.threads.append(threading.current_thread())
+        threading.Event().wait(0.3)
+        return 'relevant section'
+
+
+def test_section_retrieval_does_not_block_streams():
+    async def test(client, url, upstream, gateway):
+        gateway.retriever = SlowRetriever()
+        gateway.retrieval_executor = ThreadPoolExecutor(max_workers=1)
+        system = {'role': 'system', 'content': '**Paper Content:**\nfull text\n\n**Your Role:** tutor'}
+
+        async def compacted():
+            body = dict(chat_body(question='Which method?'), messages=[system, {'role': 'user', 'content': 'Which?'}])
+            async with client.post(url, json=body, headers={'X-Paper-Id': 'p1'}) as response:
+                return await response.json()
+
+        async def plain():
+            async with client.post(url, json=chat_body(question='Other?')) as response:
+                await response.json()
+            return asyncio.get_running_loop().time()
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        _, plain_done = await asyncio.gather(compacted(), plain())
+        # 느린 검색이 이벤트 루프를 막으면 다른 요청도 0.3초 이상 기다림
+        assert plain_done - started < 0.3
+        assert gateway.retriever.threads and gateway.retriever.threads[0] is not threading.main_thread()
+
+    run_with_gateway(test)
+
+
+def test_malformed_body_is_400_with_cors():
+    async def test(client, url, upstream, gateway):
+        async with client.post(url, data=b'{not json', headers={'Content-Type': 'application/json'}) as response:
+            assert response.status == 400
+            assert response.headers['Access-Control-Allow-Origin'] == '*'
+            assert 'not valid JSON' in (await response.json())['error']['message']
+        async with client.post(url, json={'model': 'gpt-test'}) as response:
+            assert response.status == 400
+        assert upstream.calls == 0
+
+    run_with_gateway(test)
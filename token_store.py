@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized Corpus Store
+==========================
+Tokenizes each distinct text once and keeps the token ids on disk in a ragged
+layout that is read through memory maps:
+
+    output/token_store/<tokenizer>-<identity digest>/
+        tokens.i32    all token ids, back to back (int32)
+        offsets.i64   row i spans tokens[offsets[i]:offsets[i + 1]] (int64, rows + 1)
+        keys.txt      SHA-1 of each row's text, one per line
+        meta.json     tokenizer identity and the committed row/token counts
+
+Rows are stored untruncated (with the tokenizer's special tokens), so changing
+max_length only re-truncates, and a different tokenizer gets its own directory.
+Appends are incremental: only texts whose key is not stored yet are tokenized.
+meta.json is written last and is the commit point, so an interrupted append is
+ignored (and overwritten) by the next one. Appends take an exclusive lock, so
+several shard processes can share one store.
+
+Usage:
+    python token_store.py build [--tokenizer=specter2|hashing] [--papers=PATH] [--max-length=512]
+    python token_store.py stats [--tokenizer=specter2|hashing]
+
+The hashing tokenizer (sparse_similarity word tokens hashed to ids) works
+without transformers and feeds embedding_shards.py's hashing backend.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from instrumentation import count, span
+
+TOKEN_STORE_DIR = "./output/token_store"
+
+# Texts handed to the tokenizer per call (fast tokenizers batch internally)
+TOKENIZE_BATCH = 1000
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class HFTokenizer:
+    """Hugging Face tokenizer with the identity that keys its store"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        vocab = tokenizer.get_vocab()
+        vocab_digest = hashlib.sha1(json.dumps(sorted(vocab.items())).encode('utf-8')).hexdigest()
+        self.name = tokenizer.name_or_path
+        self.identity = {
+            'tokenizer': tokenizer.name_or_path,
+            'class': type(tokenizer).__name__,
+            'vocab_size': len(vocab),
+            'vocab_sha1': vocab_digest[:16],
+            'lowercase': bool(getattr(tokenizer, 'do_lower_case', False)),
+        }
+        self.pad_id = tokenizer.pad_token_id or 0
+        # Number of special tokens before/after the text, kept when truncating
+        plain = tokenizer('probe', add_special_tokens=False)['input_ids']
+        full = tokenizer('probe')['input_ids']
+        self.head = full.index(plain[0]) if plain else 0
+        self.tail = len(full) - self.head - len(plain)
+
+    def encode(self, texts: List[str]) -> List[List[int]]:
+        return self.tokenizer(texts, truncation=False, verbose=False)['input_ids']
+
+
+class HashingTokenizer:
+    """Word tokens (sparse_similarity.tokenize) hashed to 31-bit ids; no model files needed"""
+
+    name = 'hashing'
+    identity = {'tokenizer': 'hashing', 'words': 'sparse_similarity.tokenize', 'hash': 'crc32 & 0x7fffffff'}
+    pad_id = 0
+    head = 0
+    tail = 0
+
+    def encode(self, texts: List[str]) -> List[List[int]]:
+        from sparse_similarity import tokenize
+
+        return [[zlib.crc32(token.encode('utf-8')) & 0x7FFFFFFF for token in tokenize(text)]
+                for text in texts]
+
+
+def load_tokenizer(name: str = 'specter2'):
+    """'specter2' (allenai/specter2_base, needs transformers) or 'hashing'"""
+    if name == 'hashing':
+        return HashingTokenizer()
+    if name != 'specter2':
+        raise ValueError(f"Unknown tokenizer: {name}")
+    from transformers import AutoTokenizer
+
+    return HFTokenizer(AutoTokenizer.from_pretrained("allenai/specter2_base"))
+
+
+def pad_batch(token_ids: List[np.ndarray], pad_id: int):
+    """
+    Right-pad a batch of id arrays.
+
+    Returns:
+        Tuple of (input_ids, attention_mask), both int64 arrays (batch, longest)
+    """
+    longest = max((len(ids) for ids in token_ids), default=0)
+    input_ids = np.full((len(token_ids), longest), pad_id, dtype=np.int64)
+    attention_mask = np.zeros((len(token_ids), longest), dtype=np.int64)
+    for row, ids in enumerate(token_ids):
+        input_ids[row, :len(ids)] = ids
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+class TokenStore:
+    """Ragged, memory-mapped token ids for one tokenizer, keyed by text hash"""
+
+    def __init__(self, tokenizer, root: str = TOKEN_STORE_DIR):
+        """
+        Args:
+            tokenizer: HFTokenizer / HashingTokenizer (or the name for load_tokenizer)
+            root: Directory holding one store per tokenizer identity
+        """
+        self.tokenizer = load_tokenizer(tokenizer) if isinstance(tokenizer, str) else tokenizer
+        digest = hashlib.sha1(json.dumps(self.tokenizer.identity, sort_keys=True).encode('utf-8')).hexdigest()
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.tokenizer.name).strip('_')
+        self.path = Path(root) / f"{slug}-{digest[:12]}"
+        self.n_rows = 0
+        self.n_tokens = 0
+        self.keys: Dict[str, int] = {}
+        self.tokens = np.zeros(0, dtype=np.int32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.refresh()
+
+    def __len__(self):
+        return self.n_rows
+
+    def _meta(self) -> dict:
+        meta_path = self.path / 'meta.json'
+        if not meta_path.exists():
+            return {'rows': 0, 'tokens': 0}
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def refresh(self):
+        """Map the committed rows (picks up appends from other processes)"""
+        meta = self._meta()
+        if meta['rows'] == self.n_rows:
+            return
+        self.n_rows, self.n_tokens = meta['rows'], meta['tokens']
+        self.offsets = np.memmap(self.path / 'offsets.i64', dtype=np.int64, mode='r', shape=(self.n_rows + 1,))
+        self.tokens = (np.memmap(self.path / 'tokens.i32', dtype=np.int32, mode='r', shape=(self.n_tokens,))
+                       if self.n_tokens else np.zeros(0, dtype=np.int32))
+        with open(self.path / 'keys.txt', 'r', encoding='ascii') as f:
+            keys = [next(f).rstrip('\n') for _ in range(self.n_rows)]
+        self.keys = {key: row for row, key in enumerate(keys)}
+
+    @contextmanager
+    def _locked(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / 'store.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @span('tokenize')
+    def add(self, texts: Iterable[str]) -> dict:
+        """
+        Tokenize and append the texts that are not stored yet.
+
+        Returns:
+            Dict with added/reused row counts, tokens added, tokenize seconds and tokens_per_second
+        """
+        pending = {text_key(text): text for text in texts}
+        stats = {'added': 0, 'reused': 0, 'tokens': 0, 'seconds': 0.0, 'tokens_per_second': None}
+        if all(key in self.keys for key in pending):
+            stats['reused'] = len(pending)
+            return stats
+
+        with self._locked():
+            self.refresh()
+            missing = [key for key in pending if key not in self.keys]
+            stats['reused'] = len(pending) - len(missing)
+
+            # Drop anything an interrupted append left past the committed counts
+            with open(self.path / 'tokens.i32', 'ab') as tokens_file, \
+                    open(self.path / 'offsets.i64', 'ab') as offsets_file, \
+                    open(self.path / 'keys.txt', 'a', encoding='ascii') as keys_file:
+                tokens_file.truncate(self.n_tokens * 4)
+                offsets_file.truncate((self.n_rows + 1) * 8 if self.n_rows else 0)
+                keys_file.truncate(self.n_rows * 41)  # 40 hex digits + newline
+                if not self.n_rows:
+                    offsets_file.write(np.zeros(1, dtype=np.int64).tobytes())
+
+                end = self.n_tokens
+                for start in range(0, len(missing), TOKENIZE_BATCH):
+                    batch = missing[start:start + TOKENIZE_BATCH]
+                    started = time.perf_counter()
+                    encoded = self.tokenizer.encode([pending[key] for key in batch])
+                    stats['seconds'] += time.perf_counter() - started
+
+                    lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+                    flat = np.fromiter((token for ids in encoded for token in ids), dtype=np.int32,
+                                       count=int(lengths.sum()))
+                    tokens_file.write(flat.tobytes())
+                    offsets_file.write((end + np.cumsum(lengths)).tobytes())
+                    keys_file.write(''.join(f"{key}\n" for key in batch))
+                    end += int(lengths.sum())
+
+            stats['added'] = len(missing)
+            stats['tokens'] = end - self.n_tokens
+            with open(self.path / 'meta.json.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'identity': self.tokenizer.identity, 'head': self.tokenizer.head,
+                           'tail': self.tokenizer.tail, 'rows': self.n_rows + len(missing), 'tokens': end}, f)
+            os.replace(self.path / 'meta.json.tmp', self.path / 'meta.json')
+            self.refresh()
+
+        if stats['seconds']:
+            stats['tokens_per_second'] = stats['tokens'] / stats['seconds']
+        count('texts_tokenized', stats['added'])
+        count('tokens_stored', stats['tokens'])
+        return stats
+
+    def rows(self, texts: List[str], add_missing: bool = True) -> np.ndarray:
+        """Row numbers of the texts (tokenizing any that are new unless add_missing is False)"""
+        if add_missing:
+            self.add(texts)
+        return np.array([self.keys[text_key(text)] for text in texts], dtype=np.int64)
+
+    def lengths(self, texts: List[str], add_missing: bool = True) -> np.ndarray:
+        """Untruncated token counts (special tokens included)"""
+        rows = self.rows(texts, add_missing)
+        return self.offsets[rows + 1] - self.offsets[rows]
+
+    def token_ids(self, texts: List[str], max_length: Optional[int] = None,
+                  add_missing: bool = True) -> List[np.ndarray]:
+        """
+        Token ids of each text, truncated to max_length the way the tokenizer
+        would (leading and trailing special tokens are kept).
+
+        Returns:
+            List of int32 arrays; untruncated rows are views into the memory map
+        """
+        tail = self.tokenizer.tail
+        result = []
+        for row in self.rows(texts, add_missing):
+            ids = self.tokens[self.offsets[row]:self.offsets[row + 1]]
+            if max_length is not None and len(ids) > max_length:
+                ids = np.concatenate([ids[:max_length - tail], ids[len(ids) - tail:]])
+            result.append(ids)
+        return result
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'stats'):
+        print(__doc__)
+        sys.exit(1)
+
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[2:] if arg.startswith('--') and '=' in arg)
+    store = TokenStore(options.get('tokenizer', 'specter2'))
+
+    if sys.argv[1] == 'build':
+        import pandas as pd
+
+        papers_path = options.get('papers', './output/extracted_papers.csv')
+        max_length = int(options.get('max-length', 512))
+        texts = list(pd.read_csv(papers_path, index_col=0, dtype=str, keep_default_na=False)['specter_input'])
+        stats = store.add(texts)
+        lengths = store.lengths(texts, add_missing=False)
+        print(f"Tokenized {stats['added']} new texts ({stats['reused']} already stored): "
+              f"{stats['tokens']} tokens in {stats['seconds']:.2f} s"
+              + (f" ({stats['tokens_per_second']:,.0f} tokens/s)" if stats['tokens_per_second'] else ""))
+        if len(lengths):
+            print(f"Lengths: median {int(np.median(lengths))}, max {int(lengths.max())}, "
+                  f"{int((lengths > max_length).sum())} of {len(lengths)} over max_length {max_length}")
+
+    print(f"Store: {store.path} ({len(store)} texts, {store.n_tokens} tokens)")
+
+
+if __name__ == "__main__":
+    main()
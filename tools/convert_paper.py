@@ -0,0 +1,651 @@
+#!/usr/bin/env python3
+"""
+Convert ACM-formatted PDF papers into reading-experiment HTML
+For papers that only exist as PDFs (papers_pdf/). Produces the same
+`content` / papers_json schema as parse_acm_html.py, so the rest of the
+pipeline (integrate_papers, retrieval, search) treats both sources alike.
+
+Pages are laid out in parallel worker processes (PyMuPDF text dict, image
+rectangles, vector drawing clusters, table finder); the main process then
+walks the pages in order to recover sections, paragraphs, figures, tables
+and the reference list. Embedded images are exported once per xref, even
+when a PDF reuses them on several pages.
+
+Usage:
+    python convert_paper.py <pdf_file> [paper_id] [--workers=N] [--timing]
+"""
+
+import html
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz
+
+from parse_acm_html import normalize_doi, save_paper
+from instrumentation import configure, count, record_span, span
+
+# Headings that are not numbered sections (matched on the uppercased heading text)
+section_keywords = {
+    'ABSTRACT': 'abstract',
+    'CCS CONCEPTS': 'front',
+    'KEYWORDS': 'front',
+    'AUTHOR KEYWORDS': 'front',
+    'ACKNOWLEDGMENTS': 'acknowledgments',
+    'ACKNOWLEDGEMENTS': 'acknowledgments',
+    'ACKNOWLEDGMENT': 'acknowledgments',
+    'REFERENCES': 'references',
+}
+
+HEADING_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)\.?\s+(\S.*)$')
+APPENDIX_PATTERN = re.compile(r'^([A-Z](?:\.\d+)*)\.?\s+(\S.*)$')
+HEADING_SPLIT_PATTERN = re.compile(r'(?<=\S)\s+(?=(?:\d+|[A-Z])\.\d+(?:\.\d+)*\s+[A-Z])')
+FIGURE_CAPTION_PATTERN = re.compile(r'^(?:Figure|Fig\.)\s*(\d+)\s*[:.]')
+TABLE_CAPTION_PATTERN = re.compile(r'^Table\s*(\d+)\s*[:.]')
+REFERENCE_LABEL_PATTERN = re.compile(r'\[(\d+)\]\s*')
+
+# Words kept lowercase when an ALL-CAPS heading is title-cased
+SMALL_WORDS = {'a', 'an', 'and', 'as', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or', 'the', 'to', 'via', 'with'}
+
+# Images / drawing clusters smaller than this (points) are logos, icons or rules
+MIN_FIGURE_SIZE = 40
+# Graphics further apart than this (points) do not belong to the same figure
+FIGURE_GAP = 70
+# Page furniture (running heads, page numbers) lives in these margins
+TOP_MARGIN = 75
+BOTTOM_MARGIN = 50
+RENDER_DPI = 200
+# ACM tables have no vertical rules: their extent is taken from the horizontal rules
+# under the caption (no further apart than TABLE_RULE_GAP), or from the stack of short
+# blocks under it (no further apart than TABLE_ROW_GAP)
+TABLE_RULE_GAP = 150
+TABLE_ROW_GAP = 15
+
+_DOC = None
+
+
+def _open_document(pdf_path):
+    """Worker initializer: each process opens the PDF once"""
+    global _DOC
+    _DOC = fitz.open(pdf_path)
+
+
+def join_lines(lines):
+    """Join PDF lines, undoing end-of-line hyphenation ('person-' + 'ality' → 'personality')"""
+    text = ''
+    for line in lines:
+        line = re.sub(r'\s+', ' ', line).strip()
+        if not line:
+            continue
+        if text.endswith('-') and line[:1].islower():
+            # Keep the hyphen in compounds like 'LLM-powered'
+            text = text[:-1] + line if text[-2:-1].islower() else text + line
+        else:
+            text = f'{text} {line}' if text else line
+    return text
+
+
+def is_bold(text_span):
+    return bool(text_span['flags'] & 16) or bool(re.search(r'bold|TB$|-B$', text_span['font'], re.IGNORECASE))
+
+
+def overlaps_x(a, b):
+    return min(a[2], b[2]) - max(a[0], b[0]) > 0
+
+
+def union(boxes):
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def inside(inner, outer, tolerance=2):
+    return (inner[0] >= outer[0] - tolerance and inner[1] >= outer[1] - tolerance
+            and inner[2] <= outer[2] + tolerance and inner[3] <= outer[3] + tolerance)
+
+
+def table_html(rows):
+    if not rows:
+        return ''
+    cells = lambda row, tag: ''.join(f'<{tag} class="border px-2 py-1">{html.escape((cell or "").strip())}</{tag}>'
+                                     for cell in row)
+    head = f'<thead><tr>{cells(rows[0], "th")}</tr></thead>'
+    body = ''.join(f'<tr>{cells(row, "td")}</tr>' for row in rows[1:])
+    return f'<table class="min-w-full text-sm">{head}<tbody>{body}</tbody></table>'
+
+
+def horizontal_rules(page):
+    """(x0, y, x1) of the horizontal lines and hairline rectangles on a page, top to bottom"""
+    rules = []
+    for drawing in page.get_drawings():
+        for item in drawing['items']:
+            if item[0] == 'l' and abs(item[1].y - item[2].y) < 1:
+                rules.append((min(item[1].x, item[2].x), item[1].y, max(item[1].x, item[2].x)))
+            elif item[0] == 're' and item[1].height < 2:
+                rules.append((item[1].x0, (item[1].y0 + item[1].y1) / 2, item[1].x1))
+    return sorted((rule for rule in rules if rule[2] - rule[0] >= MIN_FIGURE_SIZE), key=lambda rule: rule[1])
+
+
+def table_region(caption, blocks, rules, stops):
+    """
+    Extent of a table without vertical rules below its caption: the run of
+    horizontal rules starting just under the caption, else the stack of short
+    blocks under it. None when neither is found. stops are the tops of other
+    captions, which end a run.
+    """
+    top = caption['bbox'][3]
+    run = []
+    for rule in rules:
+        if rule[1] < top - 2 or not overlaps_x((rule[0], 0, rule[2], 0), caption['bbox']):
+            continue
+        if not run:
+            if rule[1] - top > 40:
+                break
+            run.append(rule)
+        elif abs(rule[0] - run[0][0]) <= 6 and abs(rule[2] - run[0][2]) <= 6:
+            if rule[1] - run[-1][1] > TABLE_RULE_GAP or any(run[-1][1] < y < rule[1] for y in stops):
+                break
+            run.append(rule)
+    if len(run) >= 2:
+        return (min(r[0] for r in run), run[0][1] - 1, max(r[2] for r in run), run[-1][1] + 1)
+
+    stack = []
+    bottom = top
+    for block in sorted(blocks, key=lambda block: block['bbox'][1]):
+        if block['role'] or block is caption or block['bbox'][1] < top - 1 or \
+                not overlaps_x(block['bbox'], caption['bbox']):
+            continue
+        if block['bbox'][1] - bottom > (TABLE_ROW_GAP if stack else 40) or len(block['text']) >= 200 or \
+                block['size'] > caption['size'] + 0.5 or any(bottom < y <= block['bbox'][1] for y in stops):
+            break
+        stack.append(block['bbox'])
+        bottom = block['bbox'][3]
+    return union(stack) if stack else None
+
+
+def find_unruled_table(page, index, blocks, rules, stops):
+    """
+    Table under the caption blocks[index] read with the text strategy inside its
+    table_region. Blocks in the region are marked in_table; when no cells are
+    recovered the table keeps its caption with empty rows.
+    """
+    caption = blocks[index]
+    region = table_region(caption, blocks, rules, stops)
+    rows = []
+    if region:
+        for block in blocks:
+            if not block['role'] and block is not caption and inside(block['bbox'], region):
+                block['role'] = 'in_table'
+        try:
+            found = page.find_tables(clip=fitz.Rect(region), strategy='text').tables
+        except Exception:
+            found = []
+        for table in found:
+            if table.row_count >= 2 and table.col_count >= 2:
+                rows = [row for row in table.extract() if any((cell or '').strip() for cell in row)]
+                break
+    return {'bbox': region or caption['bbox'], 'rows': rows, 'caption': caption['text'], 'anchor': index}
+
+
+def extract_page_layout(page_number):
+    """
+    Layout of one page (runs in a worker process).
+
+    Returns:
+        Dict with text blocks (text, bbox, size, bold, role), figures and tables
+        anchored to a block index, a font-size histogram and the page time
+    """
+    start = time.perf_counter()
+    page = _DOC[page_number]
+    width = page.rect.width
+
+    blocks = []
+    sizes = Counter()
+    # Image blocks are located separately (get_image_rects), so skip decoding them here
+    for block in page.get_text('dict', flags=fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES)['blocks']:
+        if block['type'] != 0:
+            continue
+        spans = [text_span for line in block['lines'] for text_span in line['spans'] if text_span['text'].strip()]
+        if not spans:
+            continue
+        text = join_lines(' '.join(text_span['text'] for text_span in line['spans']) for line in block['lines'])
+        block_sizes = Counter()
+        bold_chars = 0
+        for text_span in spans:
+            chars = len(text_span['text'].strip())
+            block_sizes[round(text_span['size'] * 2) / 2] += chars
+            bold_chars += chars if is_bold(text_span) else 0
+        sizes.update(block_sizes)
+        blocks.append({
+            'bbox': tuple(block['bbox']),
+            'text': text,
+            'size': block_sizes.most_common(1)[0][0],
+            'bold': bold_chars * 2 > sum(block_sizes.values()),
+            'role': None,
+        })
+
+    # Tables first, so their rules and cell text are not mistaken for figures / paragraphs.
+    # The table finder is the slowest step, so it only runs on pages with a table caption.
+    tables = []
+    found_tables = []
+    table_captions = [i for i, block in enumerate(blocks) if TABLE_CAPTION_PATTERN.match(block['text'])]
+    if table_captions:
+        try:
+            found_tables = page.find_tables().tables
+        except Exception:
+            pass
+    for table in found_tables:
+        rows = table.extract()
+        if table.row_count < 2 or table.col_count < 2:
+            continue
+        bbox = tuple(table.bbox)
+        for block in blocks:
+            if inside(block['bbox'], bbox):
+                block['role'] = 'in_table'
+        tables.append({'bbox': bbox, 'rows': rows, 'caption': '', 'anchor': None})
+
+    # Captions: tables take the nearest caption above (ACM style) or below. Captions
+    # without a ruled table fall back to the horizontal rules / text under them.
+    rules = None
+    stops = [block['bbox'][1] for block in blocks
+             if TABLE_CAPTION_PATTERN.match(block['text']) or FIGURE_CAPTION_PATTERN.match(block['text'])]
+    for index in table_captions:
+        block = blocks[index]
+        if block['role']:
+            continue
+        near = [t for t in tables if not t['caption'] and overlaps_x(t['bbox'], block['bbox'])
+                and min(abs(t['bbox'][1] - block['bbox'][3]), abs(block['bbox'][1] - t['bbox'][3])) < 40]
+        if near:
+            near[0].update(caption=block['text'], anchor=index)
+        else:
+            if rules is None:
+                rules = horizontal_rules(page)
+            tables.append(find_unruled_table(page, index, blocks, rules, stops))
+        block['role'] = 'caption'
+
+    graphics = []
+    for image in page.get_images(full=True):
+        xref = image[0]
+        for rect in page.get_image_rects(xref):
+            if rect.width >= MIN_FIGURE_SIZE and rect.height >= MIN_FIGURE_SIZE:
+                graphics.append({'bbox': tuple(rect), 'xref': xref})
+    try:
+        clusters = page.cluster_drawings()
+    except Exception:
+        clusters = []
+    for rect in clusters:
+        if rect.width >= MIN_FIGURE_SIZE and rect.height >= MIN_FIGURE_SIZE and \
+                not any(inside(tuple(rect), table['bbox'], 4) for table in tables):
+            graphics.append({'bbox': tuple(rect), 'xref': None})
+
+    # Figures: grow upwards from each caption through nearby graphics in the same column
+    figures = []
+    used = set()
+    for index, block in enumerate(blocks):
+        match = FIGURE_CAPTION_PATTERN.match(block['text'])
+        if block['role'] or not match:
+            continue
+        block['role'] = 'caption'
+        caption_box = block['bbox']
+        if caption_box[2] - caption_box[0] < width * 0.55:
+            band = (0, 0, width / 2, 0) if caption_box[2] <= width * 0.55 else (width / 2, 0, width, 0)
+        else:
+            band = (0, 0, width, 0)
+
+        group = []
+        top = caption_box[1]
+        candidates = [i for i, g in enumerate(graphics) if i not in used and g['bbox'][3] <= caption_box[1] + 5
+                      and overlaps_x(g['bbox'], band)]
+        for i in sorted(candidates, key=lambda i: -graphics[i]['bbox'][3]):
+            if top - graphics[i]['bbox'][3] <= FIGURE_GAP:
+                group.append(i)
+                top = min(top, graphics[i]['bbox'][1])
+        if not group:
+            continue
+        used.update(group)
+
+        bbox = union([graphics[i]['bbox'] for i in group])
+        # Sub-captions and labels between the graphics and the caption belong to the figure
+        labels = [b for b in blocks if b is not block and not b['role'] and b['bbox'][1] >= bbox[1] - 2
+                  and b['bbox'][3] <= caption_box[1] + 2 and overlaps_x(b['bbox'], bbox)]
+        for label in labels:
+            label['role'] = 'in_figure'
+        if labels:
+            bbox = union([bbox] + [label['bbox'] for label in labels])
+
+        single_image = len(group) == 1 and graphics[group[0]]['xref'] and not labels
+        figures.append({
+            'number': int(match.group(1)),
+            'caption': block['text'],
+            'anchor': index,
+            'xref': graphics[group[0]]['xref'] if single_image else None,
+            'clip': None if single_image else tuple(round(v, 1) for v in bbox),
+        })
+
+    # Large embedded images without a caption are still kept
+    for i, graphic in enumerate(graphics):
+        if i not in used and graphic['xref'] and min(graphic['bbox'][2] - graphic['bbox'][0],
+                                                      graphic['bbox'][3] - graphic['bbox'][1]) >= 2 * MIN_FIGURE_SIZE:
+            for block in blocks:
+                if not block['role'] and inside(block['bbox'], graphic['bbox']):
+                    block['role'] = 'in_figure'
+            figures.append({'number': None, 'caption': '', 'anchor': None, 'xref': graphic['xref'], 'clip': None})
+
+    return {
+        'page': page_number,
+        'height': page.rect.height,
+        'blocks': blocks,
+        'figures': figures,
+        'tables': tables,
+        'sizes': dict(sizes),
+        'seconds': time.perf_counter() - start,
+        'started': start,
+        'pid': os.getpid(),
+    }
+
+
+def export_graphic(task):
+    """Image bytes for ('xref', xref) or ('clip', page, bbox) (runs in a worker process)"""
+    start = time.perf_counter()
+    if task[0] == 'xref':
+        image = _DOC.extract_image(task[1])
+        ext, data = image['ext'], image['image']
+        if ext not in ('png', 'jpeg', 'jpg', 'gif'):
+            pixmap = fitz.Pixmap(_DOC, task[1])
+            if pixmap.alpha or pixmap.n - pixmap.alpha > 3:
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+            ext, data = 'png', pixmap.tobytes('png')
+    else:
+        _, page_number, bbox = task
+        ext, data = 'png', _DOC[page_number].get_pixmap(clip=fitz.Rect(bbox), dpi=RENDER_DPI).tobytes('png')
+    return task, ('jpg' if ext == 'jpeg' else ext), data, time.perf_counter() - start
+
+
+def heading_text(text):
+    """Collapse spacing and title-case ALL-CAPS headings ('4 DISCUSSION AND CONCLUSION' → '4 Discussion and Conclusion')"""
+    text = re.sub(r'\s+', ' ', text).strip()
+    if text.upper() != text:
+        return text
+    words = text.split(' ')
+    return ' '.join(w if not w[:1].isalpha() else
+                    (w.lower() if i > 0 and w.lower() in SMALL_WORDS and not words[i - 1].isdigit() else w.capitalize())
+                    for i, w in enumerate(words))
+
+
+def split_references(text):
+    """'[1] A. 2020. X. [2] B. ...' → [{'label', 'text', 'doi'}]"""
+    parts = REFERENCE_LABEL_PATTERN.split(text)
+    references = []
+    for label, body in zip(parts[1::2], parts[2::2]):
+        body = body.strip()
+        # URLs are broken across lines; in ACM references they run to the end of the entry
+        body = re.sub(r'(https?://.*)$', lambda m: m.group(1).replace(' ', ''), body)
+        references.append({'label': label, 'text': body, 'doi': normalize_doi(body)})
+    return references
+
+
+def assemble_paper(pages, paper_id, image_files):
+    """Walk laid-out pages in reading order and build parse_acm_html-style data"""
+    sizes = Counter()
+    for page in pages:
+        sizes.update({float(size): chars for size, chars in page['sizes'].items()})
+    body_size = sizes.most_common(1)[0][0] if sizes else 9.0
+
+    metadata = {
+        'paper_id': paper_id,
+        'title': '',
+        'year': None,
+        'doi': None,
+        'authors': [],
+        'abstract': '',
+        'sections': [],
+        'references': []
+    }
+    content, images, tables = [], [], []
+
+    # Title: the largest text on the first page
+    first_blocks = pages[0]['blocks'] if pages else []
+    if first_blocks:
+        title_size = max(block['size'] for block in first_blocks)
+        metadata['title'] = re.sub(r'\s+', ' ', ' '.join(
+            block['text'] for block in first_blocks if block['size'] >= title_size - 0.5)).strip()
+    for block in first_blocks:
+        doi_text = re.sub(r'(doi\.org/\S*)\s+(?=\d)', r'\1', block['text'])
+        if 'doi.org/' in doi_text and not metadata['doi']:
+            metadata['doi'] = normalize_doi(doi_text[doi_text.index('doi.org/'):])
+
+    state = 'front'
+    abstract_parts = []
+    reference_parts = []
+    last_paragraph = None
+
+    def add_section(title, level):
+        nonlocal last_paragraph
+        metadata['sections'].append({'title': title, 'level': level})
+        content.append({'type': 'section' if level == 2 else 'subsection', 'text': title, 'level': level})
+        last_paragraph = None
+        print(f"  {'  ' if level == 3 else ''}📑 {'Subsection' if level == 3 else 'Section'}: {title}")
+
+    for page in pages:
+        figures_at = {}
+        for figure in page['figures']:
+            figures_at.setdefault(figure['anchor'], []).append(('image', figure))
+        for table in page['tables']:
+            figures_at.setdefault(table['anchor'], []).append(('table', table))
+
+        def emit(kind, item):
+            if state != 'body':
+                return
+            if kind == 'table':
+                markup = table_html(item['rows'])
+                tables.append({'caption': item['caption'], 'html': markup})
+                content.append({'type': 'table', 'caption': item['caption'], 'html': markup})
+                print(f"  📋 Table{'' if markup else ' (caption only)'}: {item['caption'][:60]}...")
+            else:
+                key = ('xref', item['xref']) if item['xref'] else ('clip', page['page'], item['clip'])
+                filename = image_files[key]
+                images.append({'src': filename, 'filename': filename, 'caption': item['caption']})
+                content.append({'type': 'image', 'src': filename, 'filename': filename, 'caption': item['caption']})
+                print(f"  🖼️  Image: {filename}")
+
+        for index, block in enumerate(page['blocks']):
+            for kind, item in figures_at.get(index, []):
+                emit(kind, item)
+            if block['role']:
+                continue
+
+            text, size, y0, y1 = block['text'], block['size'], block['bbox'][1], block['bbox'][3]
+            if size < body_size - 0.5 and (y1 < TOP_MARGIN or y0 > page['height'] - BOTTOM_MARGIN):
+                continue
+
+            if block['bold'] and size >= body_size + 0.8 and len(text) < 200:
+                keyword = re.sub(r'\s+', ' ', text).strip().upper()
+                if keyword in section_keywords:
+                    role = section_keywords[keyword]
+                    if role == 'acknowledgments':
+                        state = 'body'
+                        add_section(heading_text(text).title(), 2)
+                    else:
+                        state = role
+                    continue
+                # A section and its first subsection can share one block ('4 Methods 4.1 Phase 1')
+                headings = HEADING_SPLIT_PATTERN.split(re.sub(r'\s+', ' ', text).strip())
+                matches = [(APPENDIX_PATTERN if state == 'references' else HEADING_PATTERN).match(h) for h in headings]
+                if all(matches) and state in ('front', 'abstract', 'body', 'references'):
+                    # Appendices follow the references ('A Appendix', 'A.1 ...')
+                    state = 'body'
+                    for heading, match in zip(headings, matches):
+                        add_section(heading_text(heading), 2 if '.' not in match.group(1) else 3)
+                    continue
+                if state == 'body':
+                    add_section(heading_text(text), 3)
+                    continue
+
+            if text.startswith('ACM Reference Format'):
+                reference_format = re.sub(r'\s+', ' ', text)
+                year = re.search(r'\.\s*((?:19|20)\d{2})\.', reference_format)
+                if year:
+                    metadata['year'] = int(year.group(1))
+                    names = reference_format[reference_format.index(':') + 1:year.start()]
+                    metadata['authors'] = [n.strip() for n in re.split(r',\s*(?:and\s+)?|\s+and\s+', names) if n.strip()]
+                continue
+
+            if state == 'abstract':
+                abstract_parts.append(text)
+            elif state == 'references':
+                reference_parts.append(text)
+            elif state == 'body' and size >= body_size - 1.2:
+                previous = last_paragraph['text'] if last_paragraph else ''
+                continues = previous and (previous.endswith('-') or (
+                    not re.search(r'[.!?:]["\')\]]*$', previous) and text[:1].islower()))
+                if continues:
+                    last_paragraph['text'] = join_lines([previous, text])
+                else:
+                    last_paragraph = {'type': 'paragraph', 'text': text}
+                    content.append(last_paragraph)
+
+        for kind, item in figures_at.get(None, []):
+            emit(kind, item)
+
+    # parse_acm_html keeps paragraphs longer than 30 characters
+    content = [item for item in content if item['type'] != 'paragraph' or len(item['text']) > 30]
+
+    metadata['abstract'] = join_lines(abstract_parts)
+    if metadata['abstract']:
+        metadata['sections'].insert(0, {'title': 'Abstract'})
+    metadata['references'] = split_references(join_lines(reference_parts))
+    return {'metadata': metadata, 'content': content, 'images': images, 'tables': tables}
+
+
+@span('convert_pdf')
+def convert_pdf(pdf_path, paper_id, project_dir=None, workers=None, show_timing=False):
+    """
+    Convert a PDF into parse_acm_html-style data and export its figures.
+
+    Args:
+        pdf_path: Path to the PDF file
+        paper_id: Paper identifier (papers_images/<paper_id>/...)
+        project_dir: Project root (default: parent of tools/)
+        workers: Worker processes (default: one per 4 pages, up to the CPU count)
+        show_timing: Print the time of every page, not only the slowest ones
+
+    Returns:
+        Dict with 'metadata', 'content', 'images', 'tables'
+    """
+    project_dir = Path(project_dir) if project_dir else Path(__file__).parent.parent
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    workers = workers or max(1, min(os.cpu_count() or 1, (page_count + 3) // 4))
+
+    start = time.perf_counter()
+    if workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=_open_document, initargs=(str(pdf_path),))
+        run = lambda fn, items: list(pool.map(fn, items, chunksize=max(1, len(items) // (workers * 4))))
+    else:
+        pool = None
+        _open_document(str(pdf_path))
+        run = lambda fn, items: [fn(item) for item in items]
+
+    try:
+        pages = run(extract_page_layout, list(range(page_count)))
+        layout_seconds = time.perf_counter() - start
+
+        # One export per xref / rendered region, however often it appears
+        tasks = []
+        for page in pages:
+            for figure in page['figures']:
+                key = ('xref', figure['xref']) if figure['xref'] else ('clip', page['page'], figure['clip'])
+                if key not in tasks:
+                    tasks.append(key)
+        references = sum(len(page['figures']) for page in pages)
+        export_start = time.perf_counter()
+        exported = run(export_graphic, tasks)
+        export_seconds = time.perf_counter() - export_start
+    finally:
+        if pool:
+            pool.shutdown()
+
+    image_dir = project_dir / 'papers_images' / paper_id
+    image_dir.mkdir(parents=True, exist_ok=True)
+    numbers = {}
+    for page in pages:
+        for figure in page['figures']:
+            key = ('xref', figure['xref']) if figure['xref'] else ('clip', page['page'], figure['clip'])
+            numbers.setdefault(key, figure['number'])
+    image_files = {}
+    for index, (key, ext, data, _) in enumerate(exported, 1):
+        name = f"{paper_id}-fig{numbers[key]}" if numbers[key] else f"{paper_id}-img{index}"
+        while f"{name}.{ext}" in image_files.values():
+            name += 'b'
+        image_files[key] = f"{name}.{ext}"
+        with open(image_dir / image_files[key], 'wb') as f:
+            f.write(data)
+
+    with span('assemble_paper'):
+        data = assemble_paper(pages, paper_id, image_files)
+
+    # Pages were laid out in worker processes: replay their timings into the trace
+    for page in pages:
+        record_span('page_layout', page['started'], page['seconds'], tid=page['pid'], page=page['page'] + 1)
+    count('pages_parsed', page_count)
+    count('pdf_bytes_read', Path(pdf_path).stat().st_size)
+    count('images_exported', len(tasks))
+    count('image_duplicates_skipped', references - len(tasks))
+
+    page_times = sorted(((page['seconds'], page['page'] + 1) for page in pages), reverse=True)
+    print(f"\n⏱️  Layout: {page_count} pages in {layout_seconds:.2f} s with {workers} worker(s) "
+          f"(mean {1000 * sum(t for t, _ in page_times) / max(page_count, 1):.1f} ms/page)")
+    shown = sorted(page_times, key=lambda item: item[1]) if show_timing else page_times[:5]
+    print('   ' + ', '.join(f"p{number} {1000 * seconds:.1f} ms" for seconds, number in shown)
+          + ('' if show_timing else '  (slowest)'))
+    print(f"⏱️  Images: {len(tasks)} exported for {references} figure(s) in {export_seconds:.2f} s "
+          f"({references - len(tasks)} duplicate(s) skipped)")
+
+    print(f"\n✓ Extracted {len(data['content'])} content items")
+    print(f"✓ Found {len(data['images'])} images")
+    print(f"✓ Found {len(data['tables'])} tables")
+    print(f"✓ Found {len(data['metadata']['sections'])} sections")
+    print(f"✓ Found {len(data['metadata']['references'])} references")
+    return data
+
+
+def main():
+    # --quiet / --trace=PATH / --metrics=PATH (see instrumentation.py)
+    configure()
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not args:
+        print("Usage: python convert_paper.py <pdf_file> [paper_id] [--workers=N] [--timing]")
+        print("\nExample:")
+        print("  python convert_paper.py ../papers_pdf/chi2025-lbw-02.pdf chi2025-lbw-02")
+        sys.exit(1)
+
+    pdf_path = Path(args[0])
+    paper_id = args[1] if len(args) > 1 else pdf_path.stem
+    workers = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--workers='):
+            workers = int(arg.split('=', 1)[1])
+
+    if not pdf_path.exists():
+        print(f"Error: File not found: {pdf_path}")
+        sys.exit(1)
+
+    data = convert_pdf(pdf_path, paper_id, workers=workers, show_timing='--timing' in sys.argv[1:])
+    if not data['metadata']['title']:
+        print("Failed to convert PDF")
+        sys.exit(1)
+
+    html_output, json_output, search_status = save_paper(data, paper_id)
+
+    print(f"\n{'='*60}")
+    print(f"✅ HTML: {html_output}")
+    print(f"✅ JSON: {json_output} (includes section_boundaries)")
+    print(f"🔎 Search index: {search_status}")
+    print(f"\n👉 Open {html_output} in browser to review")
+    print(f"{'='*60}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,13 @@ Automatically creates the papers list from available JSON files
 """
 
 import json
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from instrumentation import configure, count, span
+
+@span('generate_papers_data')
 def generate_papers_data():
     """Generate papers-data.js from papers_json folder"""
 
@@ -38,6 +43,7 @@ def generate_papers_data():
         try:
             with open(json_file, 'r', encoding='utf-8') as f:
                 metadata = json.load(f)
+            count('json_files_read')
 
             paper_id = metadata.get('paper_id', json_file.stem)
             title = metadata.get('title', 'Unknown Title')
@@ -56,6 +62,7 @@ def generate_papers_data():
             }
 
             papers.append(paper)
+            count('papers_listed')
             print(f"✓ Added: {paper_id}")
             print(f"  Title: {title[:60]}{'...' if len(title) > 60 else ''}")
 
@@ -104,5 +111,6 @@ const AVAILABLE_PAPERS = [\n'''
     return True
 
 if __name__ == "__main__":
+    configure()
     success = generate_papers_data()
     exit(0 if success else 1)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Harvest figure files from a saved ACM page's "_files" folder
+Places exactly the images referenced by the parsed paper into papers_images/<paper_id>/
+(hardlink, then reflink, then copy) and reports the vendor JS/CSS/fonts left behind
+"""
+
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from urllib.parse import unquote
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from instrumentation import configure, count, span
+
+# Linux FICLONE ioctl (_IOW(0x94, 9, int)): copy-on-write clone on btrfs/xfs
+FICLONE = 0x40049409
+
+LOCAL_ASSET_PATTERN = re.compile(r'(?:src|href)="\./([^"/]+_files)/')
+
+def format_size(n_bytes):
+    for unit in ('B', 'KB', 'MB'):
+        if n_bytes < 1024:
+            return f"{n_bytes:.0f} {unit}" if unit == 'B' else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} GB"
+
+def own_asset_dirs(html_path):
+    """The page's own "_files" folders: folders it links to, then <stem>_files"""
+    html_path = Path(html_path)
+    parent = html_path.parent
+    candidates = []
+
+    text = html_path.read_text(encoding='utf-8', errors='ignore')
+    for name in LOCAL_ASSET_PATTERN.findall(text):
+        candidates.append(parent / unquote(name))
+    candidates.append(parent / f"{html_path.stem}_files")
+    return _existing_dirs(candidates)
+
+def candidate_asset_dirs(html_path):
+    """
+    "_files" folders that may hold a saved page's assets, most specific first:
+    the page's own folders (own_asset_dirs), then any other "_files" folder next
+    to it (pages re-saved under a short name no longer link their folder). The
+    fallback folders may belong to other papers and are never pruned.
+    """
+    html_path = Path(html_path)
+    return _existing_dirs(own_asset_dirs(html_path) + sorted(html_path.parent.glob('*_files')))
+
+def _existing_dirs(candidates):
+    seen = set()
+    unique = []
+    for folder in candidates:
+        if folder.is_dir() and folder not in seen:
+            seen.add(folder)
+            unique.append(folder)
+    return unique
+
+def reflink(source, target):
+    """Copy-on-write clone; raises OSError where the filesystem does not support it"""
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(target)
+            raise
+
+def place_file(source, target):
+    """Hardlink, reflink or copy source to target; returns the method used"""
+    if target.exists():
+        if os.path.samefile(source, target):
+            return 'existing'
+        if target.stat().st_size == source.stat().st_size and target.read_bytes() == source.read_bytes():
+            return 'existing'
+        target.unlink()
+
+    try:
+        os.link(source, target)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        reflink(source, target)
+        return 'reflink'
+    except (OSError, ImportError):
+        pass
+    shutil.copy2(source, target)
+    return 'copy'
+
+@span('harvest_images')
+def harvest_images(html_path, images, paper_id, project_dir=None, prune=False):
+    """
+    Resolve the parsed images against the saved page's "_files" folder and place
+    them in papers_images/<paper_id>/.
+
+    Args:
+        html_path: Saved ACM page the images were parsed from
+        images: Parsed image entries ({'src', 'filename', 'caption'})
+        paper_id: Paper identifier (papers_images/<paper_id>/...)
+        project_dir: Project root (default: parent of tools/)
+        prune: Delete the unreferenced assets from the page's own "_files" folder
+            (folders found only through the sibling fallback are left alone)
+
+    Returns:
+        Dict with placed {filename: method}, missing filenames, the asset folder,
+        unreferenced asset paths and their total size in bytes
+    """
+    project_dir = Path(project_dir) if project_dir else Path(__file__).parent.parent
+    image_dir = project_dir / 'papers_images' / paper_id
+
+    wanted = list(dict.fromkeys(unquote(image['filename']) for image in images))
+    asset_dirs = candidate_asset_dirs(html_path)
+    own_dirs = own_asset_dirs(html_path)
+
+    placed = {}
+    missing = []
+    used_dirs = []
+    for filename in wanted:
+        source = next((folder / filename for folder in asset_dirs if (folder / filename).is_file()), None)
+        if source is None:
+            missing.append(filename)
+            continue
+        image_dir.mkdir(parents=True, exist_ok=True)
+        placed[filename] = place_file(source, image_dir / filename)
+        count(f"images_{placed[filename]}")
+        if source.parent not in used_dirs:
+            used_dirs.append(source.parent)
+
+    # Everything else in the page's own folder(s) the figures came from is page chrome;
+    # a sibling folder reached through the fallback may belong to another paper
+    prunable_dirs = [folder for folder in used_dirs if folder in own_dirs]
+    unreferenced = []
+    for folder in prunable_dirs:
+        for path in sorted(folder.rglob('*')):
+            if path.is_file() and not (path.parent == folder and path.name in placed):
+                unreferenced.append(path)
+    unreferenced_bytes = sum(path.stat().st_size for path in unreferenced)
+    count('unreferenced_asset_bytes', unreferenced_bytes)
+
+    if prune:
+        for path in unreferenced:
+            path.unlink()
+        for folder in prunable_dirs:
+            for sub in sorted((p for p in folder.rglob('*') if p.is_dir()), reverse=True):
+                if not any(sub.iterdir()):
+                    sub.rmdir()
+
+    return {
+        'image_dir': image_dir,
+        'asset_dirs': used_dirs,
+        'fallback_dirs': [folder for folder in used_dirs if folder not in own_dirs],
+        'placed': placed,
+        'missing': missing,
+        'unreferenced': unreferenced,
+        'unreferenced_bytes': unreferenced_bytes,
+        'pruned': prune,
+    }
+
+def print_harvest(result):
+    methods = {}
+    for method in result['placed'].values():
+        methods[method] = methods.get(method, 0) + 1
+    summary = ', '.join(f"{n} {method}" for method, n in sorted(methods.items())) or 'none'
+    print(f"🖼️  Images: {len(result['placed'])} placed in {result['image_dir']} ({summary})")
+    for filename in result['missing']:
+        print(f"  ⚠️  Not found in any _files folder: {filename}")
+    for folder in result['asset_dirs']:
+        fallback = folder in result['fallback_dirs']
+        print(f"  📁 Source: {folder.name}{' (sibling folder, not pruned)' if fallback else ''}")
+    if result['unreferenced']:
+        verb = "Pruned" if result['pruned'] else "Unreferenced"
+        print(f"  🗑️  {verb}: {len(result['unreferenced'])} assets, {format_size(result['unreferenced_bytes'])}")
+        if not result['pruned']:
+            print("     (run with --prune to delete them)")
+
+def main():
+    configure()
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    prune = '--prune' in sys.argv[1:]
+    if not args:
+        print("Usage: python harvest_assets.py <saved_html_file> [paper_id] [--prune]")
+        print("\nExample:")
+        print("  python harvest_assets.py ../papers_html/chi2025-lbw-02_origin.html chi2025-lbw-02")
+        sys.exit(1)
+
+    html_path = Path(args[0])
+    paper_id = args[1] if len(args) > 1 else html_path.stem
+    if not html_path.exists():
+        print(f"Error: File not found: {html_path}")
+        sys.exit(1)
+
+    sys.path.insert(0, str(Path(__file__).parent))
+    from parse_acm_html import parse_acm_html
+
+    data = parse_acm_html(html_path, paper_id)
+    if not data:
+        print("Failed to parse HTML")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print_harvest(harvest_images(html_path, data['images'], paper_id, prune=prune))
+    print(f"{'='*60}\n")
+
+if __name__ == "__main__":
+    main()
@@ -350,7 +350,67 @@ from pathlib import Path
 from bs4 import BeautifulSoup
 import json
 import re
+from urllib.parse import unquote
 
+from harvest_assets import harvest_images, print_harvest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from instrumentation import configure, count, span
+
+DOI_PATTERN = re.compile(r'10\.\d{4,9}/[^\s"<>&?#]+')
+
+def normalize_doi(value):
+    """'https://doi.org/10.1145/ABC.1', '/doi/10.1145/abc.1', 'doi:10.1145/abc.1' -> '10.1145/abc.1'"""
+    if not value:
+        return None
+    match = DOI_PATTERN.search(unquote(value))
+    if not match:
+        return None
+    doi = match.group(0).rstrip('.,;')
+    # Drop a trailing ')' only when it is not part of the DOI itself, e.g. S0191-8869(02)00244-1
+    while doi.endswith(')') and doi.count(')') > doi.count('('):
+        doi = doi[:-1]
+    return doi.lower()
+
+def extract_references(soup):
+    """Reference list from the bibliography section: [{'label', 'text', 'doi'}]"""
+    bibliography = soup.find('section', {'id': 'bibliography'})
+    if not bibliography:
+        return []
+
+    references = []
+    for item in bibliography.find_all(attrs={'role': 'listitem'}):
+        citation = item.find(class_='citation-content') or item
+        text = re.sub(r'\s+', ' ', citation.get_text(' ', strip=True))
+        label = item.find(class_='label')
+
+        # Prefer DL / Crossref links, then the DOI in the Google Scholar query, then the citation text
+        doi = None
+        # 'Go to Citation' links point back into the citing paper (its own DOI)
+        links = [a.get('href', '') for a in item.find_all('a') if 'to-citation' not in (a.get('class') or [])]
+        for href in links:
+            if '/doi/' in href or 'doi.org/' in href:
+                doi = normalize_doi(href)
+                if doi:
+                    break
+        if not doi:
+            for href in links:
+                match = re.search(r'[?&]doi=([^&]+)', href)
+                if match:
+                    doi = normalize_doi(match.group(1))
+                    if doi:
+                        break
+        if not doi:
+            doi = normalize_doi(text)
+
+        references.append({
+            'label': label.get_text(strip=True).strip('[]') if label else str(len(references) + 1),
+            'text': text,
+            'doi': doi
+        })
+    return references
+
+@span('parse_acm_html')
 def parse_acm_html(html_path, paper_id):
     """Parse ACM HTML and extract clean content"""
     
@@ -360,7 +420,10 @@ def parse_acm_html(html_path, paper_id):
     print(f"{'='*60}\n")
     
     with open(html_path, 'r', encoding='utf-8') as f:
-        soup = BeautifulSoup(f.read(), 'html.parser')
+        page = f.read()
+    count('html_bytes_read', len(page.encode('utf-8')))
+    with span('parse_html_tree'):
+        soup = BeautifulSoup(page, 'html.parser')
     
     # Find the main content wrapper
     content_wrapper = soup.find('div', {'data-core-wrapper': 'content'})
@@ -376,11 +439,19 @@ def parse_acm_html(html_path, paper_id):
         'paper_id': paper_id,
         'title': '',
         'year': None,
+        'doi': None,
         'authors': [],
         'abstract': '',
-        'sections': []
+        'sections': [],
+        'references': []
     }
 
+    # DOI of the paper itself
+    doi_meta = soup.find('meta', {'name': 'dc.Identifier', 'scheme': 'doi'})
+    if doi_meta:
+        metadata['doi'] = normalize_doi(doi_meta.get('content'))
+        print(f"✓ DOI: {metadata['doi']}")
+
     # Title and Year
     title_tag = soup.find('title')
     if title_tag:
@@ -508,6 +579,13 @@ def parse_acm_html(html_path, paper_id):
                         'text': text
                     })
     
+    # References (outside bodymatter, in backmatter > bibliography)
+    metadata['references'] = extract_references(soup)
+    with_doi = sum(1 for ref in metadata['references'] if ref['doi'])
+    print(f"✓ Found {len(metadata['references'])} references ({with_doi} with DOI)")
+
+    count('pages_parsed')
+    count('content_items', len(content))
     print(f"\n✓ Extracted {len(content)} content items")
     print(f"✓ Found {len(images)} images")
     print(f"✓ Found {len(tables)} tables")
@@ -669,7 +747,7 @@ def generate_clean_html(data, paper_id):
             <li>□ Images: {len(images)} found</li>
         </ul>
         <div class="mt-4 pt-4 border-t text-xs text-gray-600">
-            <strong>Next:</strong> Copy images from "_files" folder to papers_images/{paper_id}/
+            <strong>Images:</strong> harvested from the "_files" folder into papers_images/{paper_id}/ (harvest_assets.py)
         </div>
     </div>
 
@@ -699,33 +777,14 @@ def generate_clean_html(data, paper_id):
 '''
     return html_template
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python parse_acm_html.py <html_file> [paper_id]")
-        print("\nExample:")
-        print("  python parse_acm_html.py downloaded_paper.html chi2025-lbw-01")
-        sys.exit(1)
-    
-    html_path = Path(sys.argv[1])
-    paper_id = sys.argv[2] if len(sys.argv) > 2 else html_path.stem
-    
-    if not html_path.exists():
-        print(f"Error: File not found: {html_path}")
-        sys.exit(1)
-    
-    # Parse HTML
-    data = parse_acm_html(html_path, paper_id)
-    
-    if not data:
-        print("Failed to parse HTML")
-        sys.exit(1)
-    
+@span('save_paper')
+def save_paper(data, paper_id, project_dir=None):
+    """Write papers_html/<id>.html and papers_json/<id>.json and update the search index"""
     # Generate clean HTML
     clean_html = generate_clean_html(data, paper_id)
     
     # Get project directory
-    script_dir = Path(__file__).parent
-    project_dir = script_dir.parent
+    project_dir = Path(project_dir) if project_dir else Path(__file__).parent.parent
     
     # Save files
     html_dir = project_dir / 'papers_html'
@@ -742,10 +801,57 @@ def main():
     
     with open(json_output, 'w', encoding='utf-8') as f:
         json.dump(data['metadata'], f, indent=2, ensure_ascii=False)
+
+    # Update the full-text search index (corpus_search.py in the project root)
+    sys.path.insert(0, str(project_dir))
+    try:
+        from corpus_search import index_paper
+        with span('index_paper'):
+            indexed = index_paper(paper_id, data['metadata'], data['content'])
+        if indexed:
+            search_status = "updated"
+        else:
+            count('search_index_cache_hits')
+            search_status = "unchanged"
+    except ImportError as e:
+        search_status = f"skipped ({e})"
+
+    return html_output, json_output, search_status
+
+def main():
+    # --quiet / --trace=PATH / --metrics=PATH (see instrumentation.py)
+    configure()
+    if len(sys.argv) < 2:
+        print("Usage: python parse_acm_html.py <html_file> [paper_id] [--prune]")
+        print("\nExample:")
+        print("  python parse_acm_html.py downloaded_paper.html chi2025-lbw-01")
+        print("  (--prune deletes the unreferenced JS/CSS/font assets from the _files folder)")
+        sys.exit(1)
     
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    prune = '--prune' in sys.argv[1:]
+    html_path = Path(args[0])
+    paper_id = args[1] if len(args) > 1 else html_path.stem
+    
+    if not html_path.exists():
+        print(f"Error: File not found: {html_path}")
+        sys.exit(1)
+    
+    # Parse HTML
+    data = parse_acm_html(html_path, paper_id)
+    
+    if not data:
+        print("Failed to parse HTML")
+        sys.exit(1)
+    
+    html_output, json_output, search_status = save_paper(data, paper_id)
+    harvest = harvest_images(html_path, data['images'], paper_id, prune=prune)
+
     print(f"\n{'='*60}")
     print(f"✅ HTML: {html_output}")
     print(f"✅ JSON: {json_output} (includes section_boundaries)")
+    print(f"🔎 Search index: {search_status}")
+    print_harvest(harvest)
     print(f"\n👉 Open {html_output} in browser to review")
     print(f"{'='*60}\n")
 
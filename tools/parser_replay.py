@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Offline parser replay harness
+Runs the ACM parsers over saved pages in papers_html/ without network access,
+compares the extracted structure against a stored baseline and records
+parse time and peak memory per file.
+"""
+
+import sys
+import io
+import json
+import time
+import hashlib
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).parent))
+from parse_acm_html import parse_acm_html  # noqa: E402
+from extract_acm_content import extract_clean_content  # noqa: E402
+from scrape_acm import ACMScraper  # noqa: E402
+
+
+PROJECT_DIR = Path(__file__).parent.parent
+BASELINE_PATH = Path(__file__).parent / 'parser_replay_baseline.json'
+HISTORY_PATH = PROJECT_DIR / 'output' / 'parser_replay_history.jsonl'
+
+# Warn when a parser gets this much slower than the baseline
+SLOWDOWN_TOLERANCE = 1.5
+
+
+class OfflineACMScraper(ACMScraper):
+    """ACMScraper that resolves images by filename instead of downloading them"""
+
+    def download_image(self, url, img_dir):
+        return Path(urlparse(url).path).name or None
+
+
+def find_fixtures(project_dir=PROJECT_DIR):
+    """Saved ACM DL pages plus the standalone subsection test page"""
+    fixtures = []
+    for html_path in sorted((project_dir / 'papers_html').glob('*.html')):
+        with open(html_path, 'r', encoding='utf-8') as f:
+            if 'data-core-wrapper' in f.read():
+                fixtures.append(html_path)
+
+    subsection_page = project_dir / 'test_subsection.html'
+    if subsection_page.exists():
+        fixtures.append(subsection_page)
+
+    return fixtures
+
+
+def digest(value):
+    """Short stable hash of a JSON-serialisable value"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+def summarize_items(content):
+    """Structural summary of a parser's content list"""
+    sections = [item['text'] for item in content if item['type'] in ('section', 'subsection')]
+    paragraphs = [item['text'] for item in content if item['type'] == 'paragraph']
+    tables = [item.get('html', '') for item in content if item['type'] == 'table']
+    images = [item.get('filename') or Path(item.get('src', '')).name
+              for item in content if item['type'] == 'image']
+
+    return {
+        'sections': sections,
+        'paragraphs': {'count': len(paragraphs), 'digest': digest(paragraphs)},
+        'tables': {'count': len(tables), 'digest': digest(tables)},
+        'images': images,
+    }
+
+
+def summarize_html(html):
+    """Structural summary of generated HTML, counted by tag"""
+    soup = BeautifulSoup(html, 'html.parser')
+    paragraphs = [p.get_text(strip=True) for p in soup.find_all('p')]
+    paragraphs += [div.get_text(strip=True) for div in soup.find_all('div', attrs={'role': 'paragraph'})]
+    tables = [str(table) for table in soup.find_all('table')]
+    return {
+        'sections': [h.get_text(strip=True) for h in soup.find_all(['h2', 'h3'])],
+        'paragraphs': {'count': len(paragraphs), 'digest': digest(paragraphs)},
+        'tables': {'count': len(tables), 'digest': digest(tables)},
+        'images': [Path(img.get('src', '')).name for img in soup.find_all('img')],
+    }
+
+
+def measure(func, *args):
+    """Run func with stdout suppressed; return (result, seconds, peak_bytes)
+
+    Time and memory come from separate runs: tracemalloc hooks every allocation
+    and would inflate the wall time several-fold.
+    """
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run_parse_acm_html(html_path):
+    data = parse_acm_html(html_path, html_path.stem)
+    if data is None:
+        return None
+    return {
+        'title': data['metadata']['title'],
+        'abstract': digest(data['metadata']['abstract']),
+        'doi': data['metadata']['doi'],
+        'references': len(data['metadata']['references']),
+        'reference_dois': digest(' '.join(ref['doi'] or '' for ref in data['metadata']['references'])),
+        **summarize_items(data['content']),
+    }
+
+
+def run_extract_clean_content(html_path):
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / 'metadata.json'
+        output_path = Path(tmp) / 'output.html'
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({'title': html_path.stem, 'paper_id': html_path.stem}, f)
+
+        extract_clean_content(html_path, json_path, output_path)
+
+        with open(output_path, 'r', encoding='utf-8') as f:
+            return summarize_html(f.read())
+
+
+def run_scraper_extract_content(html_path):
+    with open(html_path, 'r', encoding='utf-8') as f:
+        soup = BeautifulSoup(f.read(), 'html.parser')
+
+    scraper = OfflineACMScraper()
+    content = scraper.extract_content(soup, Path(html_path.stem), 'https://dl.acm.org/')
+    return summarize_items(content)
+
+
+PARSERS = {
+    'parse_acm_html': run_parse_acm_html,
+    'extract_clean_content': run_extract_clean_content,
+    'ACMScraper.extract_content': run_scraper_extract_content,
+}
+
+
+def replay(fixtures):
+    """Run every parser over every fixture"""
+    results = {}
+    for html_path in fixtures:
+        key = str(html_path.relative_to(PROJECT_DIR))
+        results[key] = {}
+        for name, runner in PARSERS.items():
+            structure, elapsed, peak = measure(runner, html_path)
+            results[key][name] = {
+                'structure': structure,
+                'seconds': round(elapsed, 4),
+                'peak_bytes': peak,
+            }
+            print(f"  {name:28s} {elapsed * 1000:8.1f} ms  {peak / 1e6:6.1f} MB  {html_path.name[:40]}")
+    return results
+
+
+def compare(results, baseline):
+    """Return (problems, warnings) against the baseline
+
+    Structural differences are problems; slowdowns are only warnings because
+    timings vary between machines.
+    """
+    problems = []
+    warnings = []
+    for fixture, parsers in baseline.items():
+        if fixture not in results:
+            problems.append(f"{fixture}: fixture missing")
+            continue
+        for name, expected in parsers.items():
+            actual = results[fixture].get(name)
+            if actual is None:
+                problems.append(f"{fixture} [{name}]: parser not run")
+                continue
+            if actual['structure'] != expected['structure']:
+                fields = sorted(
+                    field for field in set(expected['structure'] or {}) | set(actual['structure'] or {})
+                    if (expected['structure'] or {}).get(field) != (actual['structure'] or {}).get(field)
+                ) or ['result']
+                problems.append(f"{fixture} [{name}]: structure changed ({', '.join(fields)})")
+            if actual['seconds'] > expected['seconds'] * SLOWDOWN_TOLERANCE + 0.05:
+                warnings.append(
+                    f"{fixture} [{name}]: slower ({expected['seconds']:.3f}s -> {actual['seconds']:.3f}s)"
+                )
+    return problems, warnings
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def append_history(results):
+    """Record timings for this commit so runs can be compared over time"""
+    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    record = {
+        'commit': current_commit(),
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'files': {
+            fixture: {name: {'seconds': r['seconds'], 'peak_bytes': r['peak_bytes']}
+                      for name, r in parsers.items()}
+            for fixture, parsers in results.items()
+        }
+    }
+    with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def main():
+    update = '--update' in sys.argv
+
+    fixtures = find_fixtures()
+    if not fixtures:
+        print("❌ No saved ACM pages found in papers_html/")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print(f"Parser replay over {len(fixtures)} fixture(s)")
+    print(f"{'='*60}\n")
+
+    results = replay(fixtures)
+    append_history(results)
+
+    if update or not BASELINE_PATH.exists():
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Baseline written: {BASELINE_PATH}")
+        return
+
+    with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    problems, warnings = compare(results, baseline)
+
+    print(f"\n{'='*60}")
+    for warning in warnings:
+        print(f"⚠️  {warning}")
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        print(f"{'='*60}\n")
+        sys.exit(1)
+
+    print("✅ All parsers match the baseline")
+    print(f"{'='*60}\n")
+
+
+if __name__ == "__main__":
+    main()
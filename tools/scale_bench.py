@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Scale benchmark for the paper pipeline and the analytics
+Generates (or reuses) synthetic corpora with synthetic_corpus.py and runs each
+stage at each size in a fresh process, recording wall time, peak RSS and
+throughput, then flags regressions against a stored baseline.
+
+The baseline gates on peak RSS and on the number of items processed. Wall time
+depends on the machine and its load, so each stage process also times a fixed
+calibration workload (fastest of several rounds) and slowdowns are reported as
+stage time relative to that calibration time; they only fail the run with
+--gate-time, on a quiet dedicated machine.
+
+Stages:
+    parse_html    parse_acm_html over every saved page
+    extract_pdf   paper_similarity title/abstract extraction over every PDF
+    similarity    sparse TF-IDF matrix + farthest pair (paper_similarity's offline
+                  backend; blocked farthest_pairs above FULL_MATRIX_LIMIT papers)
+    analytics     export_sessions flattening + Parquet tables + reading_analytics
+
+Usage:
+    python scale_bench.py [--sizes=1000,10000,100000] [--sessions=N]
+                          [--stages=parse_html,similarity] [--update] [--gate-time]
+
+    --sizes     paper counts (default 1000); each size gets min(size, 10000)
+                sessions unless --sessions is given
+    --update    write this run's results into the baseline
+    --gate-time fail on calibrated slowdowns as well (otherwise only reported)
+
+Corpora are cached in bench_corpus/ (delete to regenerate).
+"""
+
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+PROJECT_DIR = Path(__file__).parent.parent
+CORPUS_ROOT = PROJECT_DIR / 'bench_corpus'
+BASELINE_PATH = Path(__file__).parent / 'scale_bench_baseline.json'
+HISTORY_PATH = PROJECT_DIR / 'output' / 'scale_bench_history.jsonl'
+
+DEFAULT_SIZES = [1000]
+MAX_SESSIONS = 10000
+
+# A stage regresses when it gets this much bigger than the baseline; slowdowns past
+# SLOWDOWN_TOLERANCE are reported (and fail with --gate-time)
+SLOWDOWN_TOLERANCE = 1.5
+MEMORY_TOLERANCE = 1.25
+# Absolute slack so that sub-second stages and small heaps do not flap
+SLACK_SECONDS = 0.5
+SLACK_MB = 50
+
+# The calibration workload (~0.15 s) is timed this many times before each stage and
+# the fastest round kept: load only ever makes a round slower
+CALIBRATION_ROUNDS = 7
+
+RESULT_PREFIX = 'SCALE_BENCH_RESULT '
+
+
+def read_papers(corpus_dir):
+    with open(corpus_dir / 'papers.jsonl', 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def stage_parse_html(corpus_dir):
+    from parse_acm_html import parse_acm_html
+
+    pages = sorted((corpus_dir / 'papers_html').glob('*.html'))
+    for path in pages:
+        parse_acm_html(path, path.stem)
+    return len(pages)
+
+
+def stage_extract_pdf(corpus_dir):
+    from paper_similarity import extract_title_abstract_from_pdf
+
+    pdfs = sorted((corpus_dir / 'pdfs').glob('*.pdf'))
+    for path in pdfs:
+        extract_title_abstract_from_pdf(str(path))
+    return len(pdfs)
+
+
+def stage_similarity(corpus_dir):
+    from paper_similarity import find_max_distance_pair
+    from sparse_similarity import FULL_MATRIX_LIMIT, build_term_matrix, farthest_pairs, pairwise_distances
+
+    papers = read_papers(corpus_dir)
+    term_matrix, _ = build_term_matrix([f"{p['title']} {p['abstract']}" for p in papers], scheme='tfidf')
+    if len(papers) > FULL_MATRIX_LIMIT:
+        farthest_pairs(term_matrix, n_pairs=1)
+    else:
+        find_max_distance_pair(pairwise_distances(term_matrix), [p['id'] for p in papers])
+    return len(papers)
+
+
+def stage_analytics(corpus_dir):
+    from export_sessions import flatten_session, write_tables
+    from reading_analytics import analyze
+    from synthetic_corpus import load_sessions
+
+    sessions = load_sessions(corpus_dir)
+    rows_by_table = {}
+    for participant_id, session_id, data in sessions:
+        for table, rows in flatten_session(participant_id, session_id, data).items():
+            rows_by_table.setdefault(table, []).extend(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_tables(Path(tmp), rows_by_table, None)
+        analyze(tmp, Path(tmp) / 'analytics', participant_pattern=None)
+    return len(sessions)
+
+
+def calibration_workload():
+    """Fixed pure-Python work (tokenizing, counting, JSON) like the parsing stages"""
+    text = ' '.join(f'Word{i % 97} token{i % 13}' for i in range(20000))
+    for _ in range(15):
+        counts = Counter(re.findall(r'[a-z]+\d+', text.lower()))
+        json.loads(json.dumps(sorted(counts.items())))
+
+
+def calibrate():
+    """Fastest of CALIBRATION_ROUNDS runs of the calibration workload in this process"""
+    times = []
+    for _ in range(CALIBRATION_ROUNDS):
+        start = time.perf_counter()
+        calibration_workload()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+STAGES = {
+    'parse_html': (stage_parse_html, 'pages'),
+    'extract_pdf': (stage_extract_pdf, 'pdfs'),
+    'similarity': (stage_similarity, 'papers'),
+    'analytics': (stage_analytics, 'sessions'),
+}
+
+
+def run_stage_here(name, corpus_dir):
+    """Child process: run one stage with its output suppressed and report one JSON line"""
+    runner, unit = STAGES[name]
+    # Timed before the stage: afterwards a large heap would slow the workload down
+    calibration = calibrate()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        items = runner(Path(corpus_dir))
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    print(RESULT_PREFIX + json.dumps({
+        'items': items,
+        'unit': unit,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(peak_mb, 1),
+        'throughput': round(items / seconds, 2) if seconds else None,
+        'calibration_seconds': round(calibration, 4),
+        'relative_time': round(seconds / calibration, 2),
+    }))
+
+
+def run_stage(name, corpus_dir):
+    """Run a stage in a fresh interpreter so peak RSS belongs to that stage alone"""
+    process = subprocess.run(
+        [sys.executable, __file__, f'--run-stage={name}', f'--corpus={corpus_dir}'],
+        capture_output=True, text=True, cwd=PROJECT_DIR,
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    tail = (process.stderr or process.stdout).strip().splitlines()[-3:]
+    return {'error': ' | '.join(tail) or f'exit code {process.returncode}'}
+
+
+def ensure_corpus(papers, sessions):
+    """Cached synthetic corpus for (papers, sessions), generated on first use"""
+    from synthetic_corpus import generate_corpus
+
+    corpus_dir = CORPUS_ROOT / f'p{papers}_s{sessions}'
+    if not (corpus_dir / 'corpus.json').exists():
+        print(f"🏗️  Generating corpus: {papers} papers, {sessions} sessions → {corpus_dir}")
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            generate_corpus(corpus_dir, papers=papers, sessions=sessions)
+        print(f"   done in {time.perf_counter() - start:.1f} s")
+    return corpus_dir
+
+
+def machine_info():
+    return {'python': platform.python_version(), 'platform': platform.platform(terse=True),
+            'cpus': os.cpu_count()}
+
+
+def compare(results, baseline):
+    """Return (regressions, slowdowns, notes) against the baseline results"""
+    regressions = []
+    slowdowns = []
+    notes = []
+    for key, actual in results.items():
+        expected = baseline.get(key)
+        if 'error' in actual:
+            regressions.append(f"{key}: failed ({actual['error']})")
+            continue
+        if expected is None:
+            notes.append(f"{key}: no baseline")
+            continue
+        if actual['items'] != expected['items']:
+            regressions.append(f"{key}: processed {actual['items']} {actual['unit']} "
+                               f"(baseline {expected['items']})")
+        if 'relative_time' in expected:
+            # Time as a multiple of this machine's calibration run, so baselines carry across machines
+            limit = expected['relative_time'] * SLOWDOWN_TOLERANCE + SLACK_SECONDS / actual['calibration_seconds']
+            if actual['relative_time'] > limit:
+                slowdowns.append(f"{key}: slower ({expected['relative_time']:.0f}x -> "
+                                   f"{actual['relative_time']:.0f}x calibration; {actual['seconds']:.2f}s)")
+        else:
+            notes.append(f"{key}: baseline has no calibration, time not compared (re-record with --update)")
+        if actual['peak_rss_mb'] > expected['peak_rss_mb'] * MEMORY_TOLERANCE + SLACK_MB:
+            regressions.append(f"{key}: more memory ({expected['peak_rss_mb']:.0f} MB -> "
+                               f"{actual['peak_rss_mb']:.0f} MB)")
+    return regressions, slowdowns, notes
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def append_history(results):
+    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    record = {
+        'commit': current_commit(),
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'machine': machine_info(),
+        'results': results,
+    }
+    with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    return int(float(value[:-1]) * 1000) if value.endswith('k') else int(value)
+
+
+def main():
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    if 'run-stage' in options:
+        run_stage_here(options['run-stage'], options['corpus'])
+        return
+
+    sizes = [parse_size(size) for size in options['sizes'].split(',')] if 'sizes' in options else DEFAULT_SIZES
+    stages = options['stages'].split(',') if 'stages' in options else list(STAGES)
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        print(f"❌ Unknown stage(s): {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print(f"Scale benchmark: sizes {', '.join(map(str, sizes))} × {', '.join(stages)}")
+    print(f"{'='*60}\n")
+
+    results = {}
+    for size in sizes:
+        sessions = parse_size(options['sessions']) if 'sessions' in options else min(size, MAX_SESSIONS)
+        corpus_dir = ensure_corpus(size, sessions)
+        for stage in stages:
+            key = f"{stage}@{size}"
+            result = results[key] = run_stage(stage, corpus_dir)
+            if 'error' in result:
+                print(f"  ❌ {key:24s} {result['error']}")
+                continue
+            print(f"  {key:24s} {result['seconds']:9.2f} s  {result['relative_time']:7.0f}x cal  "
+                  f"{result['peak_rss_mb']:8.0f} MB  {result['throughput']:10.1f} {result['unit']}/s")
+    append_history(results)
+
+    baseline = {}
+    if BASELINE_PATH.exists():
+        with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if '--update' in sys.argv[1:] or not baseline:
+        merged = {**baseline.get('results', {}),
+                  **{key: result for key, result in results.items() if 'error' not in result}}
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'machine': machine_info(), 'results': dict(sorted(merged.items()))}, f, indent=2)
+        print(f"\n✓ Baseline written: {BASELINE_PATH}")
+        return
+
+    regressions, slowdowns, notes = compare(results, baseline['results'])
+    if '--gate-time' in sys.argv[1:]:
+        regressions += slowdowns
+        slowdowns = []
+    print(f"\n{'='*60}")
+    if baseline.get('machine') != machine_info():
+        print(f"ℹ️  Baseline was recorded on another machine ({baseline.get('machine')}); "
+              f"times are compared relative to the calibration workload")
+    for note in notes:
+        print(f"ℹ️  {note}")
+    for slowdown in slowdowns:
+        print(f"⚠️  {slowdown} (not gated; use --gate-time)")
+    if regressions:
+        for regression in regressions:
+            print(f"❌ {regression}")
+        print(f"{'='*60}\n")
+        sys.exit(1)
+
+    print("✅ No regressions against the baseline")
+    print(f"{'='*60}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,9 @@ import re
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from instrumentation import configure, count, span
+
 class ACMScraper:
     def __init__(self):
         self.session = requests.Session()
@@ -28,6 +31,7 @@ class ACMScraper:
             return match.group(1)
         return None
     
+    @span('scrape_paper')
     def scrape_paper(self, doi_or_url, output_dir, paper_id=None):
         """Scrape a paper from ACM Digital Library"""
         
@@ -66,13 +70,18 @@ class ACMScraper:
         # Fetch the page
         print("📥 Fetching page...")
         try:
-            response = self.session.get(url)
-            response.raise_for_status()
+            with span('fetch_page'):
+                response = self.session.get(url)
+                response.raise_for_status()
         except Exception as e:
+            count('fetch_errors')
             print(f"❌ Error fetching page: {e}")
             return None
+        count('pages_fetched')
+        count('bytes_fetched', len(response.content))
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        with span('parse_html_tree'):
+            soup = BeautifulSoup(response.content, 'html.parser')
         
         # Extract metadata
         print("📋 Extracting metadata...")
@@ -214,11 +223,15 @@ class ACMScraper:
             
             # Skip if already downloaded
             if filepath.exists():
+                count('image_cache_hits')
                 return filename
             
             # Download
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
+            with span('fetch_image'):
+                response = self.session.get(url, timeout=10)
+                response.raise_for_status()
+            count('images_fetched')
+            count('bytes_fetched', len(response.content))
             
             with open(filepath, 'wb') as f:
                 f.write(response.content)
@@ -228,6 +241,7 @@ class ACMScraper:
             return filename
             
         except Exception as e:
+            count('fetch_errors')
             print(f"   ⚠️ Failed to download image {url}: {e}")
             return None
     
@@ -331,6 +345,8 @@ class ACMScraper:
 
 
 def main():
+    # --quiet / --trace=PATH / --metrics=PATH (see instrumentation.py)
+    configure()
     if len(sys.argv) < 2:
         print("""
 ACM Digital Library Scraper
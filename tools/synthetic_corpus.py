@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpus generator for scale testing
+Writes ACM-style saved pages (the structure parse_acm_html.py reads), ACM-formatted
+PDFs (what paper_similarity.py extracts titles/abstracts from) and experiment
+session documents with event logs (what export_sessions.py flattens for
+reading_analytics.py), at sizes from a few hundred to 100k papers.
+
+Papers are drawn from topics over a Zipf-distributed vocabulary, so term
+statistics and distances look like a real proceedings rather than uniform noise;
+references cite a shared DOI pool (popular papers get cited more) and a small
+share of papers are near-duplicate copies of another paper.
+
+Usage:
+    python synthetic_corpus.py <output_dir> [--papers=N] [--pdfs=N] [--sessions=N] [--events=N] [--seed=S]
+
+Output:
+    <output_dir>/papers_html/<id>.html    saved ACM DL pages
+    <output_dir>/pdfs/<id>.pdf            ACM-formatted PDFs (first --pdfs papers)
+    <output_dir>/papers.jsonl             id, title, abstract, topic, duplicate_of
+    <output_dir>/sessions.jsonl           {participantId, sessionId, data} session documents
+    <output_dir>/corpus.json              generation parameters
+"""
+
+import html
+import json
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+VOCABULARY_SIZE = 20000
+TOPIC_COUNT = 60
+TOPIC_WORDS = 150
+# Share of body words drawn from the paper's topic (the rest follow the global Zipf law)
+TOPIC_SHARE = 0.35
+DUPLICATE_RATE = 0.01
+
+STOPWORDS = ['the', 'of', 'and', 'to', 'in', 'a', 'we', 'that', 'for', 'with', 'is', 'as', 'on', 'their', 'our']
+
+HCI_TERMS = [
+    'participants', 'study', 'interface', 'users', 'design', 'interaction', 'reading', 'llm',
+    'conversational', 'agent', 'older', 'adults', 'sensor', 'farmers', 'visualization', 'interview',
+    'qualitative', 'survey', 'prototype', 'workshop', 'accessibility', 'feedback', 'trust', 'privacy',
+    'wearable', 'haptic', 'gaze', 'mobile', 'game', 'learning', 'creativity', 'collaboration',
+]
+
+SECTION_TITLES = ['Introduction', 'Related Work', 'Method', 'Results', 'Discussion', 'Conclusion']
+SUBSECTION_TITLES = {
+    'Related Work': ['Prior Systems', 'Theoretical Background'],
+    'Method': ['Participants', 'Procedure', 'Analysis'],
+    'Results': ['Quantitative Findings', 'Qualitative Findings'],
+}
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'ta', 'sor', 'vi', 'ne', 'dra', 'pel', 'qu', 'ist', 'on', 'bex',
+             'ul', 'ch', 'ay', 'mor', 'zi', 'ten', 'gra', 'fo', 'li', 'sen']
+
+
+class CorpusText:
+    """Topic-structured word sampler over a shared vocabulary"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        words = list(dict.fromkeys(HCI_TERMS))
+        seen = set(words) | set(STOPWORDS)
+        while len(words) < VOCABULARY_SIZE:
+            word = ''.join(rng.choice(SYLLABLES, size=rng.integers(2, 5)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        self.words = np.array(words)
+        ranks = np.arange(1, len(words) + 1)
+        weights = 1.0 / ranks ** 1.05
+        self.cumulative = np.cumsum(weights / weights.sum())
+        self.topics = [rng.choice(len(words), size=TOPIC_WORDS, replace=False) for _ in range(TOPIC_COUNT)]
+
+    def words_for(self, topic, n):
+        from_topic = self.rng.random(n) < TOPIC_SHARE
+        indices = np.minimum(np.searchsorted(self.cumulative, self.rng.random(n)), len(self.words) - 1)
+        indices[from_topic] = self.rng.choice(self.topics[topic], size=int(from_topic.sum()))
+        return self.words[indices]
+
+    def sentence(self, topic, n_words=None):
+        n_words = n_words or int(self.rng.integers(8, 24))
+        words = list(self.words_for(topic, n_words))
+        for position in self.rng.integers(0, n_words, size=n_words // 3):
+            words.insert(int(position), STOPWORDS[int(self.rng.integers(len(STOPWORDS)))])
+        return ' '.join(words).capitalize() + '.'
+
+    def paragraph(self, topic, n_sentences=None):
+        n_sentences = n_sentences or int(self.rng.integers(3, 7))
+        return ' '.join(self.sentence(topic) for _ in range(n_sentences))
+
+    def title(self, topic):
+        words = self.words_for(topic, int(self.rng.integers(5, 10)))
+        return ' '.join(word.capitalize() for word in words)
+
+
+def synthetic_paper(index, text, rng, doi_pool):
+    """Paper dict: id, doi, year, title, abstract, sections, figures, tables, references"""
+    topic = int(rng.integers(TOPIC_COUNT))
+    paper_id = f"syn{index:06d}"
+    sections = []
+    for number, section_title in enumerate(SECTION_TITLES, 1):
+        section = {'title': f"{number} {section_title}", 'paragraphs': [text.paragraph(topic)
+                                                                        for _ in range(rng.integers(1, 4))],
+                   'subsections': []}
+        for sub_number, sub_title in enumerate(SUBSECTION_TITLES.get(section_title, []), 1):
+            if rng.random() < 0.7:
+                section['subsections'].append({
+                    'title': f"{number}.{sub_number} {sub_title}",
+                    'paragraphs': [text.paragraph(topic) for _ in range(rng.integers(1, 3))],
+                })
+        sections.append(section)
+
+    # Popular DOIs are cited far more often (Zipf over the pool)
+    n_references = int(rng.integers(10, 31))
+    cited = np.unique(np.minimum(rng.zipf(1.3, size=n_references) - 1, len(doi_pool) - 1))
+    references = [{'doi': doi_pool[i], 'text': f"{text.title(topic)}. {2000 + i % 25}. https://doi.org/{doi_pool[i]}"}
+                  for i in cited]
+
+    return {
+        'id': paper_id,
+        'doi': f"10.1145/9999999.{index:07d}",
+        'year': int(rng.integers(2015, 2026)),
+        'topic': topic,
+        'title': text.title(topic),
+        'abstract': text.paragraph(topic, int(rng.integers(5, 9))),
+        'sections': sections,
+        'figures': [{'filename': f"{paper_id}-fig{n}.jpg", 'caption': text.sentence(topic)}
+                    for n in range(1, rng.integers(1, 5))],
+        'tables': [{'caption': text.sentence(topic), 'rows': [[str(rng.integers(100)) for _ in range(3)]
+                                                              for _ in range(3)]}
+                   for _ in range(rng.integers(0, 3))],
+        'references': references,
+        'duplicate_of': None,
+    }
+
+
+def near_duplicate(paper, index, text, rng):
+    """Copy of a paper under another id with a few sentences reworded (preprint vs camera-ready)"""
+    copy = json.loads(json.dumps(paper))
+    copy['id'] = f"syn{index:06d}"
+    copy['doi'] = f"10.1145/9999999.{index:07d}"
+    copy['duplicate_of'] = paper['id']
+    for section in copy['sections']:
+        if rng.random() < 0.3:
+            section['paragraphs'][0] = text.paragraph(paper['topic'], 2)
+    return copy
+
+
+def render_acm_page(paper):
+    """Saved ACM DL page with the elements parse_acm_html.py looks for"""
+    esc = html.escape
+    body = []
+    for section_number, section in enumerate(paper['sections'], 1):
+        parts = [f'<section id="sec-{section_number}"><h2>{esc(section["title"])}</h2>']
+        parts += [f'<div role="paragraph">{esc(text)}</div>' for text in section['paragraphs']]
+        for sub_number, subsection in enumerate(section['subsections'], 1):
+            parts.append(f'<section id="sec-{section_number}-{sub_number}"><h3>{esc(subsection["title"])}</h3>')
+            parts += [f'<div role="paragraph">{esc(text)}</div>' for text in subsection['paragraphs']]
+            parts.append('</section>')
+        if section_number == 3:
+            for figure in paper['figures']:
+                parts.append(f'<figure><img src="/cms/{paper["doi"]}/asset/images/medium/{figure["filename"]}">'
+                             f'<figcaption>{esc(figure["caption"])}</figcaption></figure>')
+        if section_number == 4:
+            for table in paper['tables']:
+                rows = ''.join('<tr>' + ''.join(f'<td>{cell}</td>' for cell in row) + '</tr>' for row in table['rows'])
+                parts.append(f'<figure><figcaption>{esc(table["caption"])}</figcaption><table>{rows}</table></figure>')
+        parts.append('</section>')
+        body.append(''.join(parts))
+
+    references = ''.join(
+        f'<div role="listitem"><span class="label">[{n}]</span><div class="citation-content">{esc(ref["text"])}'
+        f'</div><a href="https://doi.org/{ref["doi"]}">Digital Library</a></div>'
+        for n, ref in enumerate(paper['references'], 1)
+    )
+    return f'''<!DOCTYPE html>
+<html lang="en"><head><meta charset="UTF-8">
+<meta name="dc.Identifier" scheme="doi" content="{paper["doi"]}">
+<title>{esc(paper["title"])} | Proceedings of the {paper["year"]} CHI Conference on Human Factors in Computing Systems</title>
+<script src="./vendor_files/bundle.js"></script></head>
+<body><div data-core-wrapper="content">
+<section id="summary-abstract"><h2>Abstract</h2><div role="paragraph">{esc(paper["abstract"])}</div></section>
+<section id="bodymatter">{''.join(body)}</section>
+<section id="bibliography"><h2>References</h2><div role="list">{references}</div></section>
+</div></body></html>
+'''
+
+
+_GLYPH_WIDTHS = {}
+
+
+def wrap_lines(text, fontsize, width, fontname='helv'):
+    """Greedy word wrap using the base-14 font's glyph advances (measured once per character)"""
+    import fitz
+
+    widths = _GLYPH_WIDTHS.setdefault(fontname, {'font': fitz.Font(fontname)})
+    def advance(word):
+        total = 0.0
+        for ch in word:
+            if ch not in widths:
+                widths[ch] = widths['font'].glyph_advance(ord(ch))
+            total += widths[ch]
+        return total * fontsize
+
+    space = advance(' ')
+    lines, line, used = [], [], 0.0
+    for word in text.split():
+        length = advance(word)
+        if line and used + space + length > width:
+            lines.append(' '.join(line))
+            line, used = [], 0.0
+        used += (space if line else 0) + length
+        line.append(word)
+    if line:
+        lines.append(' '.join(line))
+    return lines
+
+
+def render_pdf(paper, path, max_pages=3):
+    """
+    ACM-style PDF: large title, ABSTRACT, CCS CONCEPTS, numbered sections.
+    Text is wrapped here and written with one insert_text call per page block,
+    which keeps generation at a few ms per PDF.
+    """
+    import fitz
+
+    width, height, margin, size, leading = 612, 792, 54, 9, 11
+    text_width = width - 2 * margin
+
+    body = ['ABSTRACT'] + wrap_lines(paper['abstract'], size, text_width)
+    body += ['', 'CCS CONCEPTS', 'Human-centered computing; Empirical studies in HCI.']
+    for section in paper['sections']:
+        body += ['', section['title'].upper()]
+        for paragraph in section['paragraphs'] + [p for sub in section['subsections'] for p in sub['paragraphs']]:
+            body += wrap_lines(paragraph, size, text_width)
+
+    doc = fitz.open()
+    page = doc.new_page(width=width, height=height)
+    title = wrap_lines(paper['title'], 18, text_width, 'hebo')
+    page.insert_text((margin, 90), title, fontsize=18, fontname='hebo', lineheight=1.2)
+    top = 90 + 22 * len(title) + 10
+    page.insert_text((margin, top), 'Anonymous Author, Another Author', fontsize=11, fontname='helv')
+    top += 30
+
+    while body and len(doc) <= max_pages:
+        per_page = int((height - margin - top) // leading)
+        page.insert_text((margin, top), body[:per_page], fontsize=size, fontname='helv',
+                         lineheight=leading / size)
+        body = body[per_page:]
+        if body and len(doc) < max_pages:
+            page = doc.new_page(width=width, height=height)
+            top = margin
+        else:
+            break
+
+    doc.save(str(path), deflate=True)
+    doc.close()
+
+
+def synthetic_session_document(participant_id, session_id, rng, answer_keys, n_events):
+    """Firestore-style experiment document (reading.events, focusTimes, quiz answers)"""
+    from event_archive import synthetic_session
+    from datetime import datetime, timezone
+
+    events = synthetic_session(participant_id, session_id, rng, n_events=n_events)
+    first, last = events[0]['timestamp'], events[-1]['timestamp']
+    paper = events[0]['paper']
+    chat = sum(event.get('timeOnPreviousFocus') or 0 for event in events if event['eventType'] == 'focus_switch')
+    answers = {}
+    for question_id, correct_answer in answer_keys.get(paper, []):
+        answers[question_id] = correct_answer if rng.random() < 0.7 else 'wrong answer'
+    completed = datetime.fromtimestamp(last / 1000, tz=timezone.utc)
+    return {
+        'condition': events[0]['condition'],
+        'paper': paper,
+        'status': 'completed',
+        'startedAt': datetime.fromtimestamp(first / 1000, tz=timezone.utc).isoformat(),
+        'completedAt': completed.isoformat(),
+        'reading': {
+            'events': events,
+            'duration': last - first,
+            'focusTimes': {'reading': last - first - chat, 'chat': chat},
+        },
+        'quiz': {'answers': answers, 'duration': rng.randint(60000, 600000)},
+    }
+
+
+def load_answer_keys(project_dir):
+    """{paper: [(questionId, correctAnswer)]} from questions_data/"""
+    keys = {}
+    for json_file in sorted((Path(project_dir) / 'questions_data').glob('*.json')):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        keys[data.get('paperId', json_file.stem)] = [(str(q['id']), q.get('correctAnswer'))
+                                                     for q in data.get('questions', [])]
+    return keys
+
+
+def generate_corpus(output_dir, papers=1000, pdfs=None, sessions=1000, seed=0, events_per_session=400):
+    """
+    Write a synthetic corpus.
+
+    Args:
+        output_dir: Target directory (created)
+        papers: Saved ACM pages to write
+        pdfs: PDFs to write (default: one per paper)
+        sessions: Experiment session documents to write
+        seed: Random seed (same seed and sizes give the same corpus)
+        events_per_session: Events in each session's reading log
+
+    Returns:
+        Dict of generation parameters (also written to corpus.json)
+    """
+    output_dir = Path(output_dir)
+    pdfs = papers if pdfs is None else min(pdfs, papers)
+    (output_dir / 'papers_html').mkdir(parents=True, exist_ok=True)
+    (output_dir / 'pdfs').mkdir(parents=True, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    text = CorpusText(rng)
+    doi_pool = [f"10.1145/{3000000 + i // 50}.{3000000 + i}" for i in range(max(papers * 2, 100))]
+
+    generated = []
+    with open(output_dir / 'papers.jsonl', 'w', encoding='utf-8') as index:
+        for i in range(papers):
+            if generated and rng.random() < DUPLICATE_RATE:
+                paper = near_duplicate(generated[int(rng.integers(len(generated)))], i, text, rng)
+            else:
+                paper = synthetic_paper(i, text, rng, doi_pool)
+            # Keep only what near_duplicate may copy later (bounded memory at 100k papers)
+            if len(generated) < 5000:
+                generated.append(paper)
+
+            with open(output_dir / 'papers_html' / f"{paper['id']}.html", 'w', encoding='utf-8') as f:
+                f.write(render_acm_page(paper))
+            if i < pdfs:
+                render_pdf(paper, output_dir / 'pdfs' / f"{paper['id']}.pdf")
+            index.write(json.dumps({key: paper[key] for key in ('id', 'title', 'abstract', 'topic', 'duplicate_of')})
+                        + '\n')
+            if (i + 1) % 1000 == 0:
+                print(f"  📄 {i + 1}/{papers} papers")
+
+    session_rng = random.Random(seed)
+    answer_keys = load_answer_keys(Path(__file__).parent.parent)
+    with open(output_dir / 'sessions.jsonl', 'w', encoding='utf-8') as f:
+        for i in range(sessions):
+            participant_id, session_id = f"P{i % 1000:03d}", f"session_{i}"
+            data = synthetic_session_document(participant_id, session_id, session_rng, answer_keys,
+                                              events_per_session)
+            f.write(json.dumps({'participantId': participant_id, 'sessionId': session_id, 'data': data}) + '\n')
+            if (i + 1) % 1000 == 0:
+                print(f"  🧪 {i + 1}/{sessions} sessions")
+
+    params = {'papers': papers, 'pdfs': pdfs, 'sessions': sessions, 'seed': seed,
+              'events_per_session': events_per_session}
+    with open(output_dir / 'corpus.json', 'w', encoding='utf-8') as f:
+        json.dump(params, f, indent=2)
+    return params
+
+
+def load_sessions(corpus_dir):
+    """(participant_id, session_id, data) tuples as export_sessions.read_all_sessions returns them"""
+    from datetime import datetime
+
+    sessions = []
+    with open(Path(corpus_dir) / 'sessions.jsonl', 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            data = record['data']
+            for field in ('startedAt', 'completedAt'):
+                data[field] = datetime.fromisoformat(data[field])
+            sessions.append((record['participantId'], record['sessionId'], data))
+    return sessions
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    options = {'papers': 1000, 'pdfs': None, 'sessions': 1000, 'seed': 0, 'events_per_session': 400}
+    flags = {'--events': 'events_per_session'}
+    for arg in sys.argv[1:]:
+        if '=' in arg:
+            flag, value = arg.split('=', 1)
+            name = flags.get(flag, flag[2:])
+            if name in options:
+                options[name] = int(value)
+
+    print(f"\n{'='*60}")
+    print(f"Generating synthetic corpus in {args[0]}")
+    print(f"{'='*60}")
+    params = generate_corpus(args[0], **options)
+    print(f"\n✅ {params['papers']} pages, {params['pdfs']} PDFs, {params['sessions']} sessions")
+
+
+if __name__ == "__main__":
+    main()